@@ -25,34 +25,49 @@ from zipfile import BadZipfile
 
 from ftp_client import FtpClient
 from sftp_client import SFtpClient
-from utils import setupLogger, dataDir, is_event_id
+from utils import setupLogger, dataDir, logDir, is_event_id
 from shake_event import ShakeEvent
+from pipeline import shakeEventPipeline
 # Loading from package __init__ not working in this context so manually doing
 setupLogger()
 LOGGER = logging.getLogger('InaSAFE')
 
 
-def processEvent(theEventId=None, theLocale='en'):
-    """Launcher that actually runs the event processing."""
-    myPopulationPath = os.path.join(
+def populationPath():
+    """Path to the population raster used for impacts."""
+    return os.path.join(
         dataDir(),
         'exposure',
         'IDN_mosaic',
         'popmap10_all.tif')
 
+
+def forceFlag():
+    """Whether we should always regenerate the products."""
     # Use cached data where available
-    # Whether we should always regenerate the products
     myForceFlag = False
     if 'INASAFE_FORCE' in os.environ:
         myForceString = os.environ['INASAFE_FORCE']
         if str(myForceString).capitalize() == 'Y':
             myForceFlag = True
+    return myForceFlag
 
+
+def localeList(theLocale):
+    """Locales to generate products for."""
     # We always want to generate en products too so we manipulate the locale
     # list and loop through them:
     myLocaleList = [theLocale]
     if 'en' not in myLocaleList:
         myLocaleList.append('en')
+    return myLocaleList
+
+
+def processEvent(theEventId=None, theLocale='en'):
+    """Launcher that actually runs the event processing."""
+    myPopulationPath = populationPath()
+    myForceFlag = forceFlag()
+    myLocaleList = localeList(theLocale)
 
     # Now generate the products
     for myLoc in myLocaleList:
@@ -92,6 +107,37 @@ def processEvent(theEventId=None, theLocale='en'):
 
         myShakeEvent.renderMap(myForceFlag)
 
+
+def processEvents(theEventIds, theLocale='en'):
+    """Launcher processing events in a pipeline.
+
+    The next events are downloaded and parsed and their impacts computed
+    while the map of the current one is rendered. Timings of each stage
+    are written to pipeline-timings.json in the log dir.
+    """
+    myPopulationPath = populationPath()
+    if not os.path.exists(myPopulationPath):
+        myPopulationPath = None
+
+    myPipeline = shakeEventPipeline(theLocales=localeList(theLocale),
+                                    thePopulationPath=myPopulationPath,
+                                    theForceFlag=forceFlag())
+    for myResult in myPipeline.run(theEventIds):
+        if myResult['error'] is not None:
+            LOGGER.error('Failed to process %s: %s' % (myResult['item'],
+                                                       myResult['error']))
+        else:
+            LOGGER.info('Processed %s: %s' % (myResult['item'],
+                                              myResult['result']))
+
+    myTimingsPath = os.path.join(logDir(), 'pipeline-timings.json')
+    myPipeline.writeTimings(myTimingsPath)
+    for myStage, mySummary in myPipeline.stageSummary().items():
+        LOGGER.info('Stage %s: %i events, %.2f s mean, %.2f s max' % (
+            myStage, mySummary['count'], mySummary['mean'],
+            mySummary['max']))
+    LOGGER.info('Wrote stage timings to %s' % myTimingsPath)
+
 LOGGER.info('-------------------------------------------')
 
 if 'INASAFE_LOCALE' in os.environ:
@@ -121,17 +167,19 @@ elif len(sys.argv) == 2:
         #
         myFtpClient = FtpClient()
         myListing = myFtpClient.getListing()
+        myEventIds = []
         for myEvent in myListing:
             if 'out' not in myEvent:
                 continue
             myEvent = myEvent.replace('ftp://118.97.83.243/', '')
             myEvent = myEvent.replace('.out.zip', '')
-            print 'Processing %s' % myEvent
-            # noinspection PyBroadException
-            try:
-                processEvent(myEvent, myLocale)
-            except:  # pylint: disable=W0702
-                LOGGER.exception('Failed to process %s' % myEvent)
+            print 'Queueing %s' % myEvent
+            myEventIds.append(myEvent)
+        # noinspection PyBroadException
+        try:
+            processEvents(myEventIds, myLocale)
+        except:  # pylint: disable=W0702
+            LOGGER.exception('Failed to process events')
         sys.exit(0)
     else:
         processEvent(myEventId, myLocale)
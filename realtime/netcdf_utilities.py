@@ -81,7 +81,8 @@ def convert_netcdf2tif(filename, n, verbose=False, output_dir=None):
     x = fid.variables['x'][:]
     y = fid.variables['y'][:]
     # t = fid.variables['time'][:]
-    inundation_depth = fid.variables['Inundation_Depth'][:]
+    # Time steps are read one at a time below rather than all at once
+    inundation_depth = fid.variables['Inundation_Depth']
 
     T = inundation_depth.shape[0]  # Number of time steps
     M = inundation_depth.shape[1]  # Steps in the y direction
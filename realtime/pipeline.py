@@ -0,0 +1,480 @@
+"""
+InaSAFE Disaster risk assessment tool developed by AusAid and World Bank
+- **Staged processing of shake events.**
+
+Contact : ole.moller.nielsen@gmail.com
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+Events are passed through a series of stages connected by queues, each
+stage with its own worker threads, so that while one event is being
+rendered the next one is already being computed and the one after that
+downloaded and parsed. Every stage of every event is timed.
+
+Example::
+
+    myPipeline = shakeEventPipeline(theLocales=['id', 'en'])
+    myPipeline.run(['20130224063542', '20130223124337'])
+    myPipeline.writeTimings('timings.json')
+
+.. note:: The render stage runs in the calling thread as QGIS map rendering
+   must stay in the thread of the application.
+"""
+
+__version__ = '0.5.0'
+__date__ = '18/10/2026'
+__copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
+                 'Disaster Reduction')
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from Queue import Queue
+from urllib2 import URLError
+from zipfile import BadZipfile
+
+# The logger is intialised in utils.py by init
+LOGGER = logging.getLogger('InaSAFE')
+
+# Marks the end of the items put on a queue
+END = object()
+
+
+def runConcurrently(theTasks, theParallelFlag=True):
+    """Run independent tasks, each in its own thread.
+
+    Args:
+        * theTasks - list of (name, callable) tuples. Callables are called
+          without arguments.
+        * theParallelFlag - (Optional) if False the tasks are run one after
+          the other in the calling thread. Defaults to True.
+
+    Returns:
+        two tuple of:
+            dict - value returned by each task keyed by name.
+            dict - seconds taken by each task keyed by name.
+
+    Raises:
+        The first exception raised by a task, after all tasks have ended.
+    """
+    myResults = {}
+    myTimings = {}
+    myErrors = []
+
+    def runTask(theName, theTask):
+        """Run and time one task"""
+        myStartTime = time.time()
+        try:
+            myResults[theName] = theTask()
+        except:  # pylint: disable=W0702
+            myErrors.append(sys.exc_info())
+        myTimings[theName] = time.time() - myStartTime
+
+    if not theParallelFlag:
+        for myName, myTask in theTasks:
+            runTask(myName, myTask)
+            if myErrors:
+                break
+    else:
+        myThreads = []
+        for myName, myTask in theTasks:
+            myThread = threading.Thread(target=runTask,
+                                        args=(myName, myTask),
+                                        name=myName)
+            myThread.start()
+            myThreads.append(myThread)
+        for myThread in myThreads:
+            myThread.join()
+
+    if myErrors:
+        myType, myValue, myTraceback = myErrors[0]
+        raise myType, myValue, myTraceback
+    return myResults, myTimings
+
+
+class Stage(object):
+    """A step of a :class:`Pipeline`."""
+
+    def __init__(self, theName, theFunction, theWorkers=1):
+        """Constructor for the Stage class.
+
+        Args:
+            * theName - name of the stage used in timings and logs.
+            * theFunction - callable taking the output of the previous
+              stage (or an input item for the first stage) and returning
+              the input for the next stage.
+            * theWorkers - (Optional) number of threads running the stage.
+              Defaults to 1. If 0 the stage is run in the thread calling
+              :func:`Pipeline.run`, which is only possible for the last
+              stage.
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.name = theName
+        self.function = theFunction
+        self.workers = theWorkers
+
+
+class Pipeline(object):
+    """Run items through stages with a queue in front of each stage."""
+
+    def __init__(self, theStages, theQueueSize=2):
+        """Constructor for the Pipeline class.
+
+        Args:
+            * theStages - list of :class:`Stage` in order of processing.
+            * theQueueSize - (Optional) number of items that may wait in
+              front of a stage. A stage that is ahead of the next one stops
+              once that many items are waiting. 0 means no limit.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError if a stage other than the last has no workers.
+        """
+        for myStage in theStages[:-1]:
+            if myStage.workers < 1:
+                raise ValueError('Only the last stage may run in the calling '
+                                 'thread. Stage %s has no workers.'
+                                 % myStage.name)
+        self.stages = theStages
+        self.queueSize = theQueueSize
+        # One entry per stage per item, see runStage
+        self.timings = []
+        self.timingsLock = threading.Lock()
+
+    def run(self, theItems):
+        """Process items through all stages.
+
+        An item for which a stage raises an exception is logged and not
+        passed on to the next stages.
+
+        Args:
+            theItems - iterable of input items for the first stage.
+
+        Returns:
+            list - dicts with 'item' (the input item), 'result' (the output
+                of the last stage or None) and 'error' (message of exception
+                or None) in the order items completed.
+
+        Raises:
+            None
+        """
+        myQueues = [Queue(self.queueSize) for _ in self.stages]
+        myOutput = Queue()
+        myResults = []
+        myThreads = []
+
+        for myIndex, myStage in enumerate(self.stages):
+            myInput = myQueues[myIndex]
+            if myIndex + 1 < len(self.stages):
+                myNext = myQueues[myIndex + 1]
+                myNextWorkers = max(self.stages[myIndex + 1].workers, 1)
+            else:
+                myNext = myOutput
+                myNextWorkers = 1
+
+            # The last worker of a stage to finish tells the next stage
+            myRunning = [myStage.workers]
+            myLock = threading.Lock()
+
+            def work(theStage=myStage, theInput=myInput, theNext=myNext,
+                     theNextWorkers=myNextWorkers, theRunning=myRunning,
+                     theLock=myLock):
+                """Worker thread of a stage"""
+                self.runStage(theStage, theInput, theNext, myResults)
+                theLock.acquire()
+                try:
+                    theRunning[0] -= 1
+                    myLastFlag = theRunning[0] == 0
+                finally:
+                    theLock.release()
+                if myLastFlag:
+                    for _ in range(theNextWorkers):
+                        theNext.put(END)
+
+            for myWorker in range(myStage.workers):
+                myThread = threading.Thread(
+                    target=work,
+                    name='%s-%i' % (myStage.name, myWorker))
+                myThread.daemon = True
+                myThread.start()
+                myThreads.append(myThread)
+
+        # Feed the first stage from a thread of its own so that a bounded
+        # queue does not hold up the stage run by this thread.
+        def feed():
+            """Put items on the queue of the first stage"""
+            for myItem in theItems:
+                myQueues[0].put((myItem, myItem))
+            for _ in range(max(self.stages[0].workers, 1)):
+                myQueues[0].put(END)
+
+        myFeeder = threading.Thread(target=feed, name='feed')
+        myFeeder.daemon = True
+        myFeeder.start()
+
+        myLastStage = self.stages[-1]
+        if myLastStage.workers < 1:
+            self.runStage(myLastStage, myQueues[-1], myOutput, myResults)
+        else:
+            myOutput.get()
+        myFeeder.join()
+        for myThread in myThreads:
+            myThread.join()
+
+        return myResults
+
+    def runStage(self, theStage, theInput, theOutput, theResults):
+        """Process items from a queue until the end marker is found.
+
+        Args:
+            * theStage - :class:`Stage` to run.
+            * theInput - Queue of (item, value) tuples for the stage.
+            * theOutput - Queue of the next stage, only used for items
+              when the stage is not the last one.
+            * theResults - list that results of the last stage and errors
+              are appended to.
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        myLastFlag = theStage is self.stages[-1]
+        while True:
+            myEntry = theInput.get()
+            if myEntry is END:
+                return
+            myItem, myValue = myEntry
+
+            myStartTime = time.time()
+            myError = None
+            try:
+                myValue = theStage.function(myValue)
+            except Exception, e:  # pylint: disable=W0703
+                LOGGER.exception('Stage %s failed for %s' %
+                                 (theStage.name, myItem))
+                myError = '%s: %s' % (e.__class__.__name__, e)
+            myEndTime = time.time()
+
+            self.timingsLock.acquire()
+            try:
+                self.timings.append({'item': str(myItem),
+                                     'stage': theStage.name,
+                                     'thread': threading.currentThread().name,
+                                     'start': myStartTime,
+                                     'end': myEndTime,
+                                     'seconds': myEndTime - myStartTime,
+                                     'error': myError})
+            finally:
+                self.timingsLock.release()
+            LOGGER.info('Stage %s of %s took %.2f s' %
+                        (theStage.name, myItem, myEndTime - myStartTime))
+
+            if myError is not None:
+                theResults.append({'item': myItem,
+                                   'result': None,
+                                   'error': myError})
+            elif myLastFlag:
+                theResults.append({'item': myItem,
+                                   'result': myValue,
+                                   'error': None})
+            else:
+                theOutput.put((myItem, myValue))
+
+    def stageSummary(self):
+        """Summarise the timings of each stage.
+
+        Args:
+            None
+
+        Returns:
+            dict - keyed by stage name, of dicts with 'count' (number of
+                items), 'total', 'mean' and 'max' seconds and 'errors'.
+
+        Raises:
+            None
+        """
+        mySummary = {}
+        for myStage in self.stages:
+            myTimes = [myTiming['seconds'] for myTiming in self.timings
+                       if myTiming['stage'] == myStage.name]
+            myErrors = [myTiming for myTiming in self.timings
+                        if myTiming['stage'] == myStage.name and
+                        myTiming['error'] is not None]
+            myTotal = sum(myTimes)
+            mySummary[myStage.name] = {
+                'count': len(myTimes),
+                'total': myTotal,
+                'mean': myTotal / len(myTimes) if myTimes else 0.0,
+                'max': max(myTimes) if myTimes else 0.0,
+                'errors': len(myErrors)}
+        return mySummary
+
+    def writeTimings(self, thePath):
+        """Write timings of all stages and their summary as json.
+
+        Args:
+            thePath - path of file to write.
+
+        Returns:
+            None
+
+        Raises:
+            IOError if the file can not be written.
+        """
+        myFile = file(thePath, 'wt')
+        try:
+            json.dump({'stages': [myStage.name for myStage in self.stages],
+                       'summary': self.stageSummary(),
+                       'timings': self.timings},
+                      myFile, indent=2, sort_keys=True)
+        finally:
+            myFile.close()
+
+
+def fetchEvent(theEventId, theLocales, thePopulationPath=None,
+               theForceFlag=False):
+    """Download, extract and parse an event for each locale.
+
+    Args:
+        * theEventId - id of event, None for the latest one.
+        * theLocales - list of locales to make products for.
+        * thePopulationPath - (Optional) path to population raster.
+        * theForceFlag - (Optional) whether to download the event again.
+
+    Returns:
+        list - a ShakeEvent for each locale.
+
+    Raises:
+        Propagates any exceptions.
+    """
+    from sftp_shake_data import SftpShakeData
+    from shake_event import ShakeEvent
+
+    try:
+        myData = SftpShakeData(theEvent=theEventId, theForceFlag=theForceFlag)
+        myData.extract()
+    except (BadZipfile, URLError):
+        # retry with force flag true
+        myData = SftpShakeData(theEvent=theEventId, theForceFlag=True)
+        myData.extract()
+
+    myEvents = []
+    for myLocale in theLocales:
+        myEvents.append(ShakeEvent(theEventId=myData.eventId,
+                                   theLocale=myLocale,
+                                   thePopulationRasterPath=thePopulationPath,
+                                   theForceFlag=theForceFlag,
+                                   theDataIsLocalFlag=True))
+    return myEvents
+
+
+def createEventProducts(theEvents, theForceFlag=False):
+    """Make products of events unless their maps exist already.
+
+    Args:
+        * theEvents - list of ShakeEvent as returned by :func:`fetchEvent`.
+        * theForceFlag - (Optional) whether to make existing products again.
+
+    Returns:
+        list - (event, products) tuples where products are as returned by
+            ShakeEvent.createProducts or None if the maps exist.
+
+    Raises:
+        Propagates any exceptions.
+    """
+    myProducts = []
+    for myEvent in theEvents:
+        myExistsFlag = True
+        for myPath in myEvent.mapPaths():
+            if not os.path.exists(myPath):
+                myExistsFlag = False
+        if myExistsFlag and not theForceFlag:
+            LOGGER.info('%s (already exists)' % myEvent.mapPaths()[0])
+            myProducts.append((myEvent, None))
+        else:
+            # Events of other locales may have switched LANG since
+            myEvent.activateLocale()
+            myProducts.append((myEvent, myEvent.createProducts(
+                theForceFlag=theForceFlag, theParallelFlag=True)))
+    return myProducts
+
+
+def renderEventMaps(theProducts):
+    """Render maps of events.
+
+    Args:
+        theProducts - list as returned by :func:`createEventProducts`.
+
+    Returns:
+        list - path to pdf of each event.
+
+    Raises:
+        Propagates any exceptions.
+    """
+    myPaths = []
+    for myEvent, myProducts in theProducts:
+        if myProducts is None:
+            myPaths.append(myEvent.mapPaths()[0])
+        else:
+            myEvent.activateLocale()
+            myPaths.append(myEvent.composeMap(myProducts))
+    return myPaths
+
+
+def shakeEventPipeline(theLocales=None, thePopulationPath=None,
+                       theForceFlag=False, theFetchWorkers=2,
+                       theProductWorkers=1):
+    """Create the pipeline producing maps of shake events.
+
+    Stages are:
+        * fetch - download, extract and parse grid.xml
+        * products - mmi raster and then contours, cities and impacts
+          concurrently
+        * render - map composition, run in the calling thread
+
+    Args:
+        * theLocales - (Optional) list of locales to make maps for.
+          Defaults to ['en'].
+        * thePopulationPath - (Optional) path to population raster.
+        * theForceFlag - (Optional) whether to download and make all
+          products again.
+        * theFetchWorkers - (Optional) number of events fetched at a time.
+        * theProductWorkers - (Optional) number of events whose products
+          are made at a time.
+
+    Returns:
+        Pipeline - to run with event ids as items.
+
+    Raises:
+        None
+    """
+    if theLocales is None:
+        theLocales = ['en']
+
+    def fetch(theEventId):
+        """Fetch stage"""
+        return fetchEvent(theEventId, theLocales, thePopulationPath,
+                          theForceFlag)
+
+    def products(theEvents):
+        """Products stage"""
+        return createEventProducts(theEvents, theForceFlag)
+
+    return Pipeline([Stage('fetch', fetch, theFetchWorkers),
+                     Stage('products', products, theProductWorkers),
+                     Stage('render', renderEventMaps, 0)])
@@ -21,6 +21,7 @@ __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
 import os
 import sys
 import shutil
+import threading
 from xml.dom import minidom
 import math
 from subprocess import call, CalledProcessError
@@ -35,9 +36,7 @@ from gdalconst import GA_ReadOnly
 
 from sftp_shake_data import SftpShakeData
 
-# TODO I think QCoreApplication is needed for tr() check hefore removing
-from PyQt4.QtCore import (QCoreApplication,
-                          QObject,
+from PyQt4.QtCore import (QObject,
                           QVariant,
                           QFileInfo,
                           QString,
@@ -80,6 +79,7 @@ from safe.api import Table, TableCell, TableRow
 from safe_qgis.utilities import getWGS84resolution
 from safe_qgis.clipper import extentToGeoArray, clipLayer
 from utils import shakemapExtractDir, dataDir
+from pipeline import runConcurrently
 from rt_exceptions import (GridXmlFileNotFoundError,
                            GridXmlParseError,
                            ContourCreationError,
@@ -92,6 +92,8 @@ from rt_exceptions import (GridXmlFileNotFoundError,
 
 # The logger is intialised in utils.py by init
 LOGGER = logging.getLogger('InaSAFE')
+# LANG is process wide so events in different locales must take turns
+LOCALE_LOCK = threading.RLock()
 QGISAPP, CANVAS, IFACE, PARENT = getQgisTestApp()
 
 
@@ -197,6 +199,10 @@ class ShakeEvent(QObject):
         #'id': 57,
         #'population': 33317}
         self.mostAffectedCity = None
+        # Rasters made by mmiDataToRaster for this event. They are made at
+        # most once so that products can be made concurrently from them.
+        self.rasterPaths = set()
+        self.rasterLock = threading.Lock()
         # for localization
         self.translator = None
         self.locale = theLocale
@@ -639,10 +645,34 @@ class ShakeEvent(QObject):
         myTifPath = os.path.join(shakemapExtractDir(),
                                  self.eventId,
                                  'mmi-%s.tif' % theAlgorithm)
-        #short circuit if the tif is already created.
-        if os.path.exists(myTifPath) and theForceFlag is not True:
-            return myTifPath
+        # Grid data do not change after parsing so a raster made by this
+        # event is not made again, even if forced. The lock keeps other
+        # threads from reading the tif while it is being written.
+        self.rasterLock.acquire()
+        try:
+            #short circuit if the tif is already created.
+            if myTifPath in self.rasterPaths or (
+                    os.path.exists(myTifPath) and theForceFlag is not True):
+                return myTifPath
+            self._createRaster(myTifPath, theForceFlag, theAlgorithm)
+            self.rasterPaths.add(myTifPath)
+        finally:
+            self.rasterLock.release()
+        return myTifPath
+
+    def _createRaster(self, theTifPath, theForceFlag, theAlgorithm):
+        """Run gdal_grid for :func:`mmiDataToRaster`.
+
+        Args:
+          theTifPath str - Path of tif file to create.
+          theForceFlag bool - Whether to force the regeneration of the
+            csv and vrt files the raster is made from.
+          theAlgorithm str - Which resampling algorithm to use.
 
+        Returns: None
+
+        Raises: None
+        """
         # Ensure the vrt mmi file exists (it will generate csv too if needed)
         myVrtPath = self.mmiDataToVrt(theForceFlag)
 
@@ -664,7 +694,7 @@ class ShakeEvent(QObject):
             'dimX': self.columns,
             'dimY': self.rows,
             'vrt': myVrtPath,
-            'tif': myTifPath}
+            'tif': theTifPath}
 
         myCommand = (('gdal_grid -a %(alg)s -zfield "mmi" -txe %(xMin)s '
                       '%(xMax)s -tye %(yMin)s %(yMax)s -outsize %(dimX)i '
@@ -688,7 +718,6 @@ class ShakeEvent(QObject):
                                  'mmi-%s.qml' % theAlgorithm)
         mySourceQml = os.path.join(dataDir(), 'mmi.qml')
         shutil.copyfile(mySourceQml, myQmlPath)
-        return myTifPath
 
     def mmiDataToContours(self, theForceFlag=True, theAlgorithm='nearest'):
         """Extract contours from the event's tif file.
@@ -1733,58 +1762,67 @@ class ShakeEvent(QObject):
             theForceFlag=theForceFlag,
             theAlgorithm=theAlgorithm)
 
-        myClippedHazardPath, myClippedExposurePath = self.clipLayers(
+        myClippedHazardLayer, myClippedExposureLayer = self.clipLayers(
             theShakeRasterPath=myHazardPath,
-            thePopulationRasterPath=myExposurePath)
-
-        myClippedHazardLayer = safe_read_layer(myClippedHazardPath)
-        myClippedExposureLayer = safe_read_layer(myClippedExposurePath)
+            thePopulationRasterPath=myExposurePath,
+            theInMemoryFlag=True)
+
+        # Layers that could not be clipped in memory come back as paths
+        if isinstance(myClippedHazardLayer, basestring):
+            myClippedHazardLayer = safe_read_layer(myClippedHazardLayer)
+        if isinstance(myClippedExposureLayer, basestring):
+            myClippedExposureLayer = safe_read_layer(myClippedExposureLayer)
         myLayers = [myClippedHazardLayer, myClippedExposureLayer]
 
-        myFunctionId = 'I T B Fatality Function'
-        myFunction = safe_get_plugins(myFunctionId)[0][myFunctionId]
-
-        myResult = safe_calculate_impact(myLayers, myFunction)
+        # SAFE translates with gettext, which reads LANG on every call, so
+        # hold the locale of this event until its report is written.
+        LOCALE_LOCK.acquire()
         try:
-            myFatalities = myResult.keywords['fatalites_per_mmi']
-            myAffected = myResult.keywords['exposed_per_mmi']
-            myDisplaced = myResult.keywords['displaced_per_mmi']
-            myTotalFatalities = myResult.keywords['total_fatalities']
-        except:
-            LOGGER.exception(
-                'Fatalities_per_mmi key not found in:\n%s' %
-                myResult.keywords)
-            raise
-        # Copy the impact layer into our extract dir.
-        myTifPath = os.path.join(shakemapExtractDir(),
-                                 self.eventId,
-                                 'impact-%s.tif' % theAlgorithm)
-        shutil.copyfile(myResult.filename, myTifPath)
-        LOGGER.debug('Copied impact result to:\n%s\n' % myTifPath)
-        # Copy the impact keywords layer into our extract dir.
-        myKeywordsPath = os.path.join(
-            shakemapExtractDir(),
-            self.eventId,
-            'impact-%s.keywords' % theAlgorithm)
-        myKeywordsSource = os.path.splitext(myResult.filename)[0]
-        myKeywordsSource = '%s.keywords' % myKeywordsSource
-        shutil.copyfile(myKeywordsSource, myKeywordsPath)
-        LOGGER.debug('Copied impact keywords to:\n%s\n' % myKeywordsPath)
-
-        self.impactFile = myTifPath
-        self.impactKeywordsFile = myKeywordsPath
-        self.fatalityCounts = myFatalities
-        self.fatalityTotal = myTotalFatalities
-        self.displacedCounts = myDisplaced
-        self.affectedCounts = myAffected
-        LOGGER.info('***** Fatalities: %s ********' % self.fatalityCounts)
-        LOGGER.info('***** Displaced: %s ********' % self.displacedCounts)
-        LOGGER.info('***** Affected: %s ********' % self.affectedCounts)
-
-        myImpactTablePath = self.impactTable()
+            self.activateLocale()
+            myFunctionId = 'I T B Fatality Function'
+            myFunction = safe_get_plugins(myFunctionId)[0][myFunctionId]
+
+            # The result is written straight into the extract dir below
+            myResult = safe_calculate_impact(myLayers, myFunction,
+                                             write_result=False)
+            try:
+                myFatalities = myResult.keywords['fatalites_per_mmi']
+                myAffected = myResult.keywords['exposed_per_mmi']
+                myDisplaced = myResult.keywords['displaced_per_mmi']
+                myTotalFatalities = myResult.keywords['total_fatalities']
+            except:
+                LOGGER.exception(
+                    'Fatalities_per_mmi key not found in:\n%s' %
+                    myResult.keywords)
+                raise
+            # Write the impact layer and its keywords into our extract dir.
+            myTifPath = os.path.join(shakemapExtractDir(),
+                                     self.eventId,
+                                     'impact-%s.tif' % theAlgorithm)
+            myResult.write_to_file(myTifPath)
+            LOGGER.debug('Wrote impact result to:\n%s\n' % myTifPath)
+            myKeywordsPath = os.path.join(
+                shakemapExtractDir(),
+                self.eventId,
+                'impact-%s.keywords' % theAlgorithm)
+
+            self.impactFile = myTifPath
+            self.impactKeywordsFile = myKeywordsPath
+            self.fatalityCounts = myFatalities
+            self.fatalityTotal = myTotalFatalities
+            self.displacedCounts = myDisplaced
+            self.affectedCounts = myAffected
+            LOGGER.info('***** Fatalities: %s ********' % self.fatalityCounts)
+            LOGGER.info('***** Displaced: %s ********' % self.displacedCounts)
+            LOGGER.info('***** Affected: %s ********' % self.affectedCounts)
+
+            myImpactTablePath = self.impactTable()
+        finally:
+            LOCALE_LOCK.release()
         return self.impactFile, myImpactTablePath
 
-    def clipLayers(self, theShakeRasterPath, thePopulationRasterPath):
+    def clipLayers(self, theShakeRasterPath, thePopulationRasterPath,
+                   theInMemoryFlag=False):
         """Clip population (exposure) layer to dimensions of shake data.
 
         It is possible (though unlikely) that the shake may be clipped too.
@@ -1792,10 +1830,12 @@ class ShakeEvent(QObject):
         Args:
             theShakeRasterPath: Path to the shake raster.
             thePopulationRasterPath: Path to the population raster.
+            theInMemoryFlag: If True, layers that can be clipped in process
+                are returned as SAFE layers rather than written to disk.
 
         Returns:
             str, str: Path to the clipped datasets (clipped shake, clipped
-            pop).
+            pop) or SAFE layers if theInMemoryFlag is True (see clipLayer).
 
         Raises:
             FileNotFoundError
@@ -1850,13 +1890,15 @@ class ShakeEvent(QObject):
         myClippedHazardPath = clipLayer(
             theLayer=myHazardLayer,
             theExtent=myHazardGeoExtent,
-            theCellSize=myCellSize)
+            theCellSize=myCellSize,
+            theInMemoryFlag=theInMemoryFlag)
 
         myClippedExposurePath = clipLayer(
             theLayer=myExposureLayer,
             theExtent=myHazardGeoExtent,
             theCellSize=myCellSize,
-            theExtraKeywords=extraExposureKeywords)
+            theExtraKeywords=extraExposureKeywords,
+            theInMemoryFlag=theInMemoryFlag)
 
         return myClippedHazardPath, myClippedExposurePath
 
@@ -1904,18 +1946,15 @@ class ShakeEvent(QObject):
         else:
             raise FileNotFoundError('Population file could not be found')
 
-    def renderMap(self, theForceFlag=False):
-        """This is the 'do it all' method to render a pdf.
+    def mapPaths(self):
+        """Paths of the pdf, image and thumbnail made by :func:`renderMap`.
 
-        Args:
-            theForceFlag bool - (Optional). Whether to force the regeneration
-                of map product. Defaults to False.
+        Args: None
 
         Returns:
-            str - path to rendered pdf.
+            tuple of str - paths to pdf, png image and png thumbnail.
 
-        Raises:
-            Propagates any exceptions.
+        Raises: None
         """
         myPdfPath = os.path.join(shakemapExtractDir(),
                                  self.eventId,
@@ -1927,6 +1966,25 @@ class ShakeEvent(QObject):
                                             self.eventId,
                                             '%s-thumb-%s.png' % (
                                             self.eventId, self.locale))
+        return myPdfPath, myImagePath, myThumbnailImagePath
+
+    def renderMap(self, theForceFlag=False, theParallelFlag=False):
+        """This is the 'do it all' method to render a pdf.
+
+        Args:
+            theForceFlag bool - (Optional). Whether to force the regeneration
+                of map product. Defaults to False.
+            theParallelFlag bool - (Optional). Whether to make the contours,
+                cities and impacts concurrently. See
+                :func:`createProducts`. Defaults to False.
+
+        Returns:
+            str - path to rendered pdf.
+
+        Raises:
+            Propagates any exceptions.
+        """
+        myPdfPath, myImagePath, myThumbnailImagePath = self.mapPaths()
 
         if not theForceFlag:
             # Check if the images already exist and if so
@@ -1944,39 +2002,104 @@ class ShakeEvent(QObject):
                 LOGGER.info('%s (already exists)' % myThumbnailImagePath)
                 return myPdfPath
 
-        # Make sure the map layers have all been removed before we
-        # start otherwise in batch mode we will get overdraws.
-        # noinspection PyArgumentList
-        QgsMapLayerRegistry.instance().removeAllMapLayers()
+        myProducts = self.createProducts(theForceFlag=theForceFlag,
+                                         theParallelFlag=theParallelFlag)
+        return self.composeMap(myProducts)
 
+    def createProducts(self, theForceFlag=False, theParallelFlag=False):
+        """Make the files shown on the map by :func:`composeMap`.
+
+        The mmi shapefile and raster are made first. The contours, the
+        cities near the event and the impacts each only need those and are
+        made concurrently in threads if theParallelFlag is True. Most of
+        their time is spent in gdal and numpy which let other threads run.
+
+        Args:
+            theForceFlag bool - (Optional). Whether to force the regeneration
+                of products. Defaults to False.
+            theParallelFlag bool - (Optional). Whether to make the contours,
+                cities and impacts concurrently. Defaults to False.
+
+        Returns:
+            dict - with paths 'contours', 'cities', 'cities_html' and
+                'impacts_html' ('cities' and 'cities_html' are None if no
+                cities were found) and 'timings', a dict of seconds spent on
+                each product.
+
+        Raises:
+            Propagates any exceptions.
+        """
         myMmiShapeFile = self.mmiDataToShapefile(theForceFlag=theForceFlag)
         logging.info('Created: %s', myMmiShapeFile)
-        myCitiesHtmlPath = None
-        myCitiesShapeFile = None
 
         # 'average', 'invdist', 'nearest' - currently only nearest works
         myAlgorithm = 'nearest'
-        try:
-            myContoursShapeFile = self.mmiDataToContours(
-                theForceFlag=theForceFlag,
-                theAlgorithm=myAlgorithm)
-        except:
-            raise
-        logging.info('Created: %s', myContoursShapeFile)
-        try:
-            myCitiesShapeFile = self.citiesToShapefile(
-                theForceFlag=theForceFlag)
-            logging.info('Created: %s', myCitiesShapeFile)
-            mySearchBoxFile = self.citySearchBoxesToShapefile(
-                theForceFlag=theForceFlag)
-            logging.info('Created: %s', mySearchBoxFile)
-            _, myCitiesHtmlPath = self.impactedCitiesTable()
-            logging.info('Created: %s', myCitiesHtmlPath)
-        except:  # pylint: disable=W0702
-            logging.exception('No nearby cities found!')
+        myRasterPath = self.mmiDataToRaster(theForceFlag=theForceFlag,
+                                            theAlgorithm=myAlgorithm)
+        logging.info('Created: %s', myRasterPath)
+
+        def contours():
+            """Make contours"""
+            return self.mmiDataToContours(theForceFlag=theForceFlag,
+                                          theAlgorithm=myAlgorithm)
+
+        def cities():
+            """Make cities shapefile and table, None if no cities found"""
+            myCitiesShapeFile = None
+            myCitiesHtmlPath = None
+            try:
+                myCitiesShapeFile = self.citiesToShapefile(
+                    theForceFlag=theForceFlag)
+                logging.info('Created: %s', myCitiesShapeFile)
+                mySearchBoxFile = self.citySearchBoxesToShapefile(
+                    theForceFlag=theForceFlag)
+                logging.info('Created: %s', mySearchBoxFile)
+                _, myCitiesHtmlPath = self.impactedCitiesTable()
+                logging.info('Created: %s', myCitiesHtmlPath)
+            except:  # pylint: disable=W0702
+                logging.exception('No nearby cities found!')
+            return myCitiesShapeFile, myCitiesHtmlPath
+
+        def impacts():
+            """Calculate impacts"""
+            return self.calculateImpacts()[1]
+
+        myTasks = [('contours', contours),
+                   ('cities', cities),
+                   ('impacts', impacts)]
+        myResults, myTimings = runConcurrently(myTasks, theParallelFlag)
+        logging.info('Created: %s', myResults['contours'])
+        logging.info('Created: %s', myResults['impacts'])
+
+        myCitiesShapeFile, myCitiesHtmlPath = myResults['cities']
+        return {'contours': myResults['contours'],
+                'cities': myCitiesShapeFile,
+                'cities_html': myCitiesHtmlPath,
+                'impacts_html': myResults['impacts'],
+                'timings': myTimings}
+
+    def composeMap(self, theProducts):
+        """Render the pdf, image and thumbnail of the map of this event.
+
+        Args:
+            theProducts dict - as returned by :func:`createProducts`.
+
+        Returns:
+            str - path to rendered pdf.
+
+        Raises:
+            Propagates any exceptions.
+        """
+        myPdfPath, myImagePath, myThumbnailImagePath = self.mapPaths()
+        myContoursShapeFile = theProducts['contours']
+        myCitiesShapeFile = theProducts['cities']
+        myCitiesHtmlPath = theProducts['cities_html']
+        myImpactsHtmlPath = theProducts['impacts_html']
 
-        _, myImpactsHtmlPath = self.calculateImpacts()
-        logging.info('Created: %s', myImpactsHtmlPath)
+        # Make sure the map layers have all been removed before we
+        # start otherwise in batch mode we will get overdraws.
+        # noinspection PyArgumentList
+        QgsMapLayerRegistry.instance().removeAllMapLayers()
 
         # Load our project
         if 'INSAFE_REALTIME_PROJECT' in os.environ:
@@ -2135,6 +2258,7 @@ class ShakeEvent(QObject):
             self.eventId,
             'project.qgs')
         myProject.write(QFileInfo(myProjectPath))
+        return myPdfPath
 
     def bearingToCardinal(self, theBearing):
         """Given a bearing in degrees return it as compass units e.g. SSE.
@@ -2477,6 +2601,10 @@ class ShakeEvent(QObject):
     def setupI18n(self):
         """Setup internationalisation for the reports.
 
+        The translator is kept by this event for :meth:`tr` and is not
+        installed on the application, where it would outlive the event and
+        affect events in other locales processed at the same time.
+
         Args:
            None
         Returns:
@@ -2485,10 +2613,7 @@ class ShakeEvent(QObject):
            TranslationLoadException
         """
         myLocaleName = self.locale
-        # Also set the system locale to the user overridden local
-        # so that the inasafe library functions gettext will work
-        # .. see:: :py:func:`common.utilities`
-        os.environ['LANG'] = str(myLocaleName)
+        self.activateLocale()
 
         myRoot = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
         myTranslationPath = os.path.join(
@@ -2502,8 +2627,51 @@ class ShakeEvent(QObject):
                 myMessage = 'Failed to load translation for %s' % myLocaleName
                 LOGGER.exception(myMessage)
                 raise TranslationLoadError(myMessage)
-            QCoreApplication.installTranslator(self.translator)
         else:
             if myLocaleName != 'en':
                 myMessage = 'No translation exists for %s' % myLocaleName
                 LOGGER.exception(myMessage)
+
+    def activateLocale(self):
+        """Set the system locale to the locale of this event.
+
+        The inasafe library functions translate with gettext, which reads
+        LANG on every call (see :py:func:`common.utilities`), so this must
+        be called again whenever another event may have switched it.
+        Callers that need the locale to stay in place should hold
+        LOCALE_LOCK.
+
+        Args:
+           None
+        Returns:
+           None.
+        Raises:
+           None
+        """
+        LOCALE_LOCK.acquire()
+        try:
+            os.environ['LANG'] = str(self.locale)
+        finally:
+            LOCALE_LOCK.release()
+
+    def tr(self, theString):
+        """Translate a string using the translator of this event.
+
+        Translators installed on the application are shared by all events
+        so with events in other locales being processed at the same time
+        (see :mod:`pipeline`) only the translator of this event is used.
+
+        Args:
+           theString: str - string to translate.
+        Returns:
+           QString - translated string, or theString if there is no
+           translation.
+        Raises:
+           None
+        """
+        if self.translator is not None:
+            myTranslation = self.translator.translate(
+                self.__class__.__name__, theString)
+            if not myTranslation.isEmpty():
+                return myTranslation
+        return QString(theString)
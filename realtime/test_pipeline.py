@@ -0,0 +1,162 @@
+"""
+InaSAFE Disaster risk assessment tool developed by AusAid and World Bank
+- **Tests for staged processing of shake events.**
+
+Contact : ole.moller.nielsen@gmail.com
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__version__ = '0.5.0'
+__date__ = '18/10/2026'
+__copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
+                 'Disaster Reduction')
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+
+from pipeline import (Pipeline, Stage, runConcurrently, createEventProducts,
+                      renderEventMaps)
+
+
+def slowDouble(theValue):
+    """Stage function taking some time"""
+    time.sleep(0.05)
+    return 2 * theValue
+
+
+def slowIncrement(theValue):
+    """Stage function failing for some values"""
+    time.sleep(0.05)
+    if theValue == 6:
+        raise ValueError('Bad value %s' % theValue)
+    return theValue + 1
+
+
+class LocaleEvent(object):
+    """Stand in for a ShakeEvent recording the locale its products got"""
+    def __init__(self, theLocale):
+        self.locale = theLocale
+        self.productLocale = None
+        self.mapLocale = None
+
+    def activateLocale(self):
+        os.environ['LANG'] = self.locale
+
+    def mapPaths(self):
+        return ['/nonexistent/%s.pdf' % self.locale]
+
+    def createProducts(self, theForceFlag=False, theParallelFlag=True):
+        self.productLocale = os.environ['LANG']
+        return {}
+
+    def composeMap(self, theProducts):
+        self.mapLocale = os.environ['LANG']
+        return self.mapPaths()[0]
+
+
+class Test(unittest.TestCase):
+
+    def test_runConcurrently(self):
+        """Test tasks are run concurrently and errors are raised"""
+        myTasks = [('a', lambda: time.sleep(0.2) or 1),
+                   ('b', lambda: time.sleep(0.2) or 2)]
+        myStartTime = time.time()
+        myResults, myTimings = runConcurrently(myTasks)
+        myTime = time.time() - myStartTime
+        self.assertEqual(myResults, {'a': 1, 'b': 2})
+        self.assertEqual(sorted(myTimings.keys()), ['a', 'b'])
+        assert myTime < 0.35, 'Tasks took %f s' % myTime
+
+        myResults, _ = runConcurrently(myTasks, theParallelFlag=False)
+        self.assertEqual(myResults, {'a': 1, 'b': 2})
+
+        myTasks.append(('c', lambda: 1 / 0))
+        self.assertRaises(ZeroDivisionError, runConcurrently, myTasks)
+
+    def test_pipeline(self):
+        """Test items pass through all stages and stages overlap"""
+        myPipeline = Pipeline([Stage('double', slowDouble),
+                               Stage('increment', slowIncrement, 2),
+                               Stage('last', str, 0)])
+        myResults = myPipeline.run(range(6))
+
+        myValues = dict((myResult['item'], myResult['result'])
+                        for myResult in myResults)
+        self.assertEqual(myValues, {0: '1', 1: '3', 2: '5', 3: None,
+                                    4: '9', 5: '11'})
+        myErrors = [myResult['item'] for myResult in myResults
+                    if myResult['error'] is not None]
+        self.assertEqual(myErrors, [3])
+
+        # One timing per stage for each item that got there
+        self.assertEqual(len(myPipeline.timings), 6 + 6 + 5)
+        mySummary = myPipeline.stageSummary()
+        self.assertEqual(mySummary['double']['count'], 6)
+        self.assertEqual(mySummary['increment']['errors'], 1)
+        self.assertEqual(mySummary['last']['count'], 5)
+
+        # Later items were doubled while earlier ones were incremented
+        myDoubled = [myTiming for myTiming in myPipeline.timings
+                     if myTiming['stage'] == 'double']
+        myIncremented = [myTiming for myTiming in myPipeline.timings
+                         if myTiming['stage'] == 'increment']
+        myOverlapFlag = False
+        for myFirst in myDoubled:
+            for mySecond in myIncremented:
+                if (mySecond['start'] < myFirst['end'] and
+                        myFirst['start'] < mySecond['end']):
+                    myOverlapFlag = True
+        assert myOverlapFlag, 'Stages did not overlap'
+
+        # Stages other than the last must have workers
+        self.assertRaises(ValueError, Pipeline,
+                          [Stage('first', str, 0), Stage('last', str)])
+
+    def test_writeTimings(self):
+        """Test timings are written as json"""
+        myPipeline = Pipeline([Stage('double', slowDouble)])
+        myPipeline.run([1, 2])
+        myDir = tempfile.mkdtemp()
+        try:
+            myPath = os.path.join(myDir, 'timings.json')
+            myPipeline.writeTimings(myPath)
+            myFile = file(myPath, 'rt')
+            myTimings = json.load(myFile)
+            myFile.close()
+        finally:
+            shutil.rmtree(myDir)
+        self.assertEqual(myTimings['stages'], ['double'])
+        self.assertEqual(myTimings['summary']['double']['count'], 2)
+        self.assertEqual(len(myTimings['timings']), 2)
+
+    def test_eventLocales(self):
+        """Test products and maps are made in the locale of their event"""
+        myOldLang = os.environ.get('LANG')
+        try:
+            # Events are created in all locales before any products are
+            # made, so LANG is left at the last one
+            myEvents = [LocaleEvent('id'), LocaleEvent('en')]
+            os.environ['LANG'] = 'en'
+            myProducts = createEventProducts(myEvents)
+            for myEvent in myEvents:
+                self.assertEqual(myEvent.productLocale, myEvent.locale)
+            renderEventMaps(myProducts)
+            for myEvent in myEvents:
+                self.assertEqual(myEvent.mapLocale, myEvent.locale)
+        finally:
+            if myOldLang is None:
+                del os.environ['LANG']
+            else:
+                os.environ['LANG'] = myOldLang
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,6 +22,7 @@ __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
 
 # pylint: disable=W0611
 from safe.storage.vector import Vector
+from safe.storage.geometry import Polygon
 from safe.defaults import DEFAULTS
 from safe.storage.utilities import (bbox_intersection,
                                     buffered_bounding_box,
@@ -31,6 +32,8 @@ from safe.storage.utilities import (bbox_intersection,
                                     calculate_polygon_centroid)
 
 from safe.storage.core import read_layer
+from safe.storage.clipping import clip_raster, get_resampling_method
+from safe.storage.overlay import overlay_polygon_layers
 
 from safe.impact_functions import (get_plugins,
                                    get_function_title,
@@ -40,8 +43,23 @@ from safe.impact_functions import (get_plugins,
 from safe.impact_functions.core import (get_doc_string,
                                         get_unique_values,
                                         get_plugins_as_table)
+from safe.impact_functions.utilities import (zone_sums,
+                                             zone_class_counts,
+                                             zone_members)
 
-from safe.engine.core import calculate_impact
+from safe.engine.core import (calculate_impact,
+                              calculate_impacts,
+                              iterate_impacts)
+from safe.engine.interpolation_cache import (interpolation_cache,
+                                             enable_interpolation_cache)
+from safe.engine.memory import (plan_memory,
+                                plan_layers,
+                                describe_plan)
+from safe.engine.aggregation import (aggregate,
+                                    aggregate_vector,
+                                    aggregate_raster,
+                                    get_postprocessor_params,
+                                    run_postprocessors)
 
 from safe.common.numerics import nanallclose
 from safe.common.exceptions import (InaSAFEError,
@@ -57,7 +75,8 @@ from safe.common.utilities import (VerificationError,
                                    format_int)
 from safe.common.converter import convert_mmi_data
 from safe.common.version import get_version
-from safe.common.polygon import in_and_outside_polygon
+from safe.common.polygon import (in_and_outside_polygon,
+                                 assign_points_to_polygons)
 from safe.common.tables import Table, TableCell, TableRow
 from safe.postprocessors import (get_postprocessors,
                                  get_postprocessor_human_name)
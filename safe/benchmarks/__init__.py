@@ -0,0 +1,13 @@
+"""Performance benchmarks for the SAFE engine.
+
+Benchmarks are plain scripts that can be run as modules, e.g.::
+
+    python -m safe.benchmarks.benchmark_plugins
+
+They are not collected by the unit test runner. To run all of them and
+keep the results for comparison with another commit use::
+
+    python -m safe.benchmarks.suite --output results.json
+
+Synthetic layers for benchmarks are made by the generators module.
+"""
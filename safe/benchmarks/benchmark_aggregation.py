@@ -0,0 +1,143 @@
+"""Benchmark of aggregation of impact layers by zones.
+
+The headless aggregation in safe.engine.aggregation is compared with the
+path the dock used to take on the same data:
+
+* Vector impact layers: every zone tested against all impact points
+  followed by a loop over the features inside it, as in the former
+  Dock._aggregateResultsVector.
+* Raster impact layers: QgsZonalStatistics is not available outside
+  QGIS, so the grid is clipped by each zone in turn with
+  clip_grid_by_polygons which tests every cell against every zone the
+  same way.
+"""
+
+import sys
+import time
+
+import numpy
+
+from safe.storage.vector import Vector
+from safe.storage.raster import Raster
+from safe.common.polygon import in_and_outside_polygon
+from safe.common.polygon import clip_grid_by_polygons
+from safe.engine.aggregation import aggregate_vector, aggregate_raster
+
+
+def make_zones(zones_per_side):
+    """Square grid of square zones covering the unit square
+
+    Output
+        Polygon layer with zones_per_side ** 2 zones
+    """
+
+    size = 1.0 / zones_per_side
+    geometry = []
+    data = []
+    for i in range(zones_per_side):
+        for j in range(zones_per_side):
+            west, south = i * size, j * size
+            geometry.append(numpy.array([[west, south],
+                                         [west, south + size],
+                                         [west + size, south + size],
+                                         [west + size, south],
+                                         [west, south]]))
+            data.append({'name': 'zone %i %i' % (i, j)})
+    return Vector(geometry=geometry, data=data)
+
+
+def dock_aggregate_points(points, values, zones):
+    """Sum values of points in each zone feature by feature
+
+    Input
+        points: Nx2 array of points
+        values: List of N attribute dictionaries with key 'population'
+        zones: List of zone polygons
+
+    Output
+        List of sums, one for each zone
+    """
+
+    sums = []
+    for zone in zones:
+        inside, _ = in_and_outside_polygon(points, zone.outer_ring,
+                                           holes=zone.inner_rings,
+                                           closed=True,
+                                           check_input=True)
+        total = 0
+        for i in inside:
+            try:
+                total += values[i]['population']
+            except TypeError:
+                pass
+        sums.append(total)
+    return sums
+
+
+def time_call(function, *args, **kwargs):
+    """Run function once and return elapsed time and result
+    """
+
+    t0 = time.time()
+    result = function(*args, **kwargs)
+    return time.time() - t0, result
+
+
+def run(zones_per_side=10, points=100000, cells=1000):
+    """Run benchmark and print results
+
+    Input
+        zones_per_side: Zones are laid out in a square grid of this size
+        points: Number of points in the vector impact layer
+        cells: Number of raster cells along each side of the raster impact
+            layer
+    """
+
+    numpy.random.seed(17)
+    zone_layer = make_zones(zones_per_side)
+    zones = zone_layer.get_geometry(as_geometry_objects=True)
+    print 'Zones: %i' % len(zones)
+
+    # Vector impact layer
+    P = numpy.random.uniform(0, 1, (points, 2))
+    data = [{'population': int(x)}
+            for x in numpy.random.uniform(0, 100, points)]
+    layer = Vector(geometry=P, data=data)
+
+    dock, expected = time_call(dock_aggregate_points, P, data, zones)
+    engine, result = time_call(aggregate_vector, layer, zone_layer,
+                               'population')
+    msg = 'Vector aggregation results differ'
+    assert numpy.allclose(result['sums'], expected), msg
+    print 'Points: %i' % points
+    print 'Vector aggregation (dock):   %.4f s' % dock
+    print 'Vector aggregation (engine): %.4f s' % engine
+    if engine > 0:
+        print 'Speedup: %.1fx' % (dock / engine)
+    results = {'vector_dock': dock, 'vector_engine': engine}
+
+    # Raster impact layer
+    A = numpy.random.uniform(0, 10, (cells, cells))
+    geotransform = (0.0, 1.0 / cells, 0, 1.0, 0, -1.0 / cells)
+    raster = Raster(A, projection=None, geotransform=geotransform)
+
+    dock, covered = time_call(clip_grid_by_polygons, A, geotransform, zones)
+    engine, result = time_call(aggregate_raster, raster, zone_layer)
+    msg = 'Raster aggregation results differ'
+    assert numpy.allclose(result['sum'],
+                          [numpy.sum(x) for _, x in covered]), msg
+    print 'Cells: %i' % A.size
+    print 'Raster aggregation (dock):   %.4f s' % dock
+    print 'Raster aggregation (engine): %.4f s' % engine
+    if engine > 0:
+        print 'Speedup: %.1fx' % (dock / engine)
+    results.update({'raster_dock': dock, 'raster_engine': engine})
+
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
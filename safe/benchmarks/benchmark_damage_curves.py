@@ -0,0 +1,72 @@
+"""Benchmark of damage curve evaluation.
+
+Damage for synthetic building depths and wall types is evaluated with
+the curves of the NEXIS tsunami building model, first one building at
+a time through interpolate1d as Damage_curve used to do, and then for
+all buildings at once grouped by wall type.
+"""
+
+import sys
+
+import numpy
+
+from safe.common.interpolation1d import interpolate1d
+from safe.engine.impact_functions_for_testing.NEXIS_building_impact_model \
+    import struct_damage_curves
+from safe.benchmarks.utilities import measure, report
+
+
+def scalar_damage(curves, depth, classes):
+    """Damage one value at a time as evaluated before vectorisation
+    """
+
+    damage = []
+    for i in range(len(depth)):
+        curve = curves.get_curve(classes[i])
+        damage.append(interpolate1d(curve.x, curve.y, [depth[i]],
+                                    mode='linear')[0])
+    return float(numpy.nansum(damage))
+
+
+def vector_damage(curves, depth, classes, out):
+    """Damage for all values in one call
+    """
+
+    return float(numpy.nansum(curves(depth, classes, out=out)))
+
+
+def run(size=1, seed=17):
+    """Run benchmark and print results
+
+    Input
+        size: Scale factor for the number of buildings
+        seed: Seed for random number generator
+
+    Output
+        Dictionary of measurements (see utilities.measure) by case
+    """
+
+    N = 10000 * size
+    numpy.random.seed(seed)
+    depth = numpy.random.uniform(-0.5, 4.0, N)
+    types = sorted(struct_damage_curves.curves.keys()) + ['Unknown']
+    classes = numpy.array(types)[numpy.random.randint(0, len(types), N)]
+    out = numpy.empty(N)
+
+    results = {}
+    for name, function, args in [('scalar', scalar_damage,
+                                  (struct_damage_curves, depth, classes)),
+                                 ('vectorised', vector_damage,
+                                  (struct_damage_curves, depth, classes,
+                                   out))]:
+        results[name] = measure(function, *args)
+        report(name, results[name])
+
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
@@ -0,0 +1,127 @@
+"""Benchmark of the impact functions bundled with SAFE.
+
+Synthetic hazard and exposure layers are made for each scenario below
+and every impact function admissible for their keywords is timed with
+calculate_impact without writing the result. Functions that are not
+admissible for any scenario (e.g. disabled ones) are listed at the end.
+"""
+
+import sys
+
+from safe.impact_functions import get_plugins, get_admissible_plugins
+from safe.engine.core import calculate_impact
+from safe.benchmarks.generators import (make_raster, make_buildings,
+                                        make_lines, make_hazard_polygons)
+from safe.benchmarks.utilities import measure, report
+
+# Keywords of synthetic layers
+FLOOD_DEPTH = {'category': 'hazard', 'subcategory': 'flood',
+               'unit': 'm', 'layertype': 'raster'}
+FLOOD_ZONES = {'category': 'hazard', 'subcategory': 'flood',
+               'layertype': 'vector'}
+EARTHQUAKE = {'category': 'hazard', 'subcategory': 'earthquake',
+              'unit': 'MMI', 'layertype': 'raster'}
+VOLCANO_ZONES = {'category': 'hazard', 'subcategory': 'volcano',
+                 'layertype': 'vector'}
+CATEGORISED = {'category': 'hazard', 'subcategory': 'tsunami',
+               'unit': 'normalised', 'layertype': 'raster'}
+POPULATION = {'category': 'exposure', 'subcategory': 'population',
+              'datatype': 'density', 'unit': 'people per pixel',
+              'layertype': 'raster'}
+STRUCTURES = {'category': 'exposure', 'subcategory': 'structure',
+              'datatype': 'osm', 'layertype': 'vector'}
+ROADS = {'category': 'exposure', 'subcategory': 'road',
+         'layertype': 'vector'}
+
+# Range of values of hazard rasters
+HAZARD_RANGES = {'m': (0.0, 3.0),
+                 'MMI': (2.0, 9.0),
+                 'normalised': (0.0, 1.2)}
+
+
+def make_layer(keywords, size=1, seed=17):
+    """Synthetic layer for keywords
+
+    Input
+        keywords: One of the keyword dictionaries of this module
+        size: Scale factor for the number of features and cells
+        seed: Seed for random number generator
+
+    Output
+        Layer with a copy of keywords. All rasters share the same grid.
+    """
+
+    keywords = dict(keywords)
+    name = '%s %s' % (keywords['subcategory'], keywords['layertype'])
+    keywords['title'] = name
+    cells = 200 * size
+
+    if keywords['category'] == 'exposure':
+        if keywords['layertype'] == 'raster':
+            return make_raster(cells, cells, low=0.0, high=100.0,
+                               name=name, keywords=keywords, seed=seed)
+        if keywords['subcategory'] == 'road':
+            return make_lines(1000 * size, name=name, keywords=keywords,
+                              seed=seed)
+        return make_buildings(10000 * size, name=name, keywords=keywords,
+                              seed=seed)
+
+    if keywords['layertype'] == 'raster':
+        low, high = HAZARD_RANGES[keywords['unit']]
+        return make_raster(cells, cells, low=low, high=high,
+                           name=name, keywords=keywords, seed=seed)
+    return make_hazard_polygons(20 * size, name=name, keywords=keywords,
+                                seed=seed)
+
+
+SCENARIOS = [(FLOOD_DEPTH, POPULATION),
+             (FLOOD_DEPTH, STRUCTURES),
+             (FLOOD_ZONES, POPULATION),
+             (FLOOD_ZONES, STRUCTURES),
+             (FLOOD_DEPTH, ROADS),
+             (FLOOD_ZONES, ROADS),
+             (EARTHQUAKE, POPULATION),
+             (EARTHQUAKE, STRUCTURES),
+             (VOLCANO_ZONES, POPULATION),
+             (VOLCANO_ZONES, STRUCTURES),
+             (CATEGORISED, POPULATION)]
+
+
+def run(size=1):
+    """Run benchmark and print results
+
+    Input
+        size: Scale factor for the number of features and cells
+
+    Output
+        Dictionary of measurements (see utilities.measure) by impact
+        function and scenario
+    """
+
+    results = {}
+    for hazard_keywords, exposure_keywords in SCENARIOS:
+        hazard = make_layer(hazard_keywords, size)
+        exposure = make_layer(exposure_keywords, size)
+        functions = get_admissible_plugins([hazard.get_keywords(),
+                                            exposure.get_keywords()])
+        for function_name in sorted(functions):
+            name = '%s (%s on %s)' % (function_name, hazard.get_name(),
+                                      exposure.get_name())
+            results[name] = measure(calculate_impact,
+                                    [hazard, exposure],
+                                    functions[function_name],
+                                    write_result=False)
+            report(name, results[name])
+
+    covered = set([x.split(' (')[0] for x in results])
+    for function_name in sorted(set(get_plugins()) - covered):
+        print '%-40s not admissible for any scenario' % function_name
+
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
@@ -0,0 +1,71 @@
+"""Import-time benchmark.
+
+Each module is imported in a fresh Python process so that the measured
+time includes everything the import pulls in, as paid by CLI tools and
+realtime workers on every invocation.
+"""
+
+import os
+import sys
+import subprocess
+
+MODULES = ['safe.impact_functions',
+           'safe.impact_functions.core',
+           'safe.api']
+
+TIMING_SCRIPT = ('import time; t0 = time.time(); import %s; '
+                 'import sys; sys.stdout.write(repr(time.time() - t0))')
+
+
+def time_import(module_name, repeats=3):
+    """Time import of module in fresh interpreters
+
+    Input
+        module_name: Dotted name of module to import
+        repeats: Number of fresh interpreters to average over
+
+    Output
+        Average import time in seconds or None if the import failed
+    """
+
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                        '..', '..'))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([root, env.get('PYTHONPATH', '')])
+
+    total = 0.0
+    for _ in range(repeats):
+        process = subprocess.Popen([sys.executable, '-c',
+                                    TIMING_SCRIPT % module_name],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   env=env)
+        stdout, _ = process.communicate()
+        if process.returncode != 0:
+            return None
+        total += float(stdout)
+
+    return total / repeats
+
+
+def run(repeats=3):
+    """Run benchmark and print results
+    """
+
+    results = {}
+    for module_name in MODULES:
+        elapsed = time_import(module_name, repeats)
+        results[module_name] = elapsed
+        if elapsed is None:
+            print '%-40s import failed' % module_name
+        else:
+            print '%-40s %.4f s' % (module_name, elapsed)
+
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
@@ -0,0 +1,87 @@
+"""Benchmark of assigning hazard values to exposure data.
+
+Every combination of hazard (raster, polygon) and exposure (point, line,
+polygon, raster) layers supported by assign_hazard_values_to_exposure_data
+is timed on synthetic layers. The interpolation cache is off unless it is
+enabled, as in the analysis service, and every case runs in a process of
+its own (see utilities.measure), so every case does the full work.
+"""
+
+import sys
+
+from safe.engine.interpolation import assign_hazard_values_to_exposure_data
+from safe.benchmarks.generators import (make_raster, make_points,
+                                        make_lines, make_buildings,
+                                        make_hazard_polygons)
+from safe.benchmarks.utilities import measure, report
+
+# Combinations of hazard and exposure types. Raster hazard on line
+# exposure is not implemented by assign_hazard_values_to_exposure_data.
+CASES = [('raster', 'point'),
+         ('raster', 'polygon'),
+         ('raster', 'raster'),
+         ('polygon', 'point'),
+         ('polygon', 'line'),
+         ('polygon', 'polygon'),
+         ('polygon', 'raster')]
+
+
+def make_layers(size=1, seed=17):
+    """Synthetic hazard and exposure layers for the interpolation matrix
+
+    Input
+        size: Scale factor for the number of features and cells
+        seed: Seed for random number generator
+
+    Output
+        hazards: Dictionary of hazard layers by type
+        exposures: Dictionary of exposure layers by type
+    """
+
+    hazards = {'raster': make_raster(200 * size, 200 * size,
+                                     high=5.0, seed=seed),
+               'polygon': make_hazard_polygons(20 * size, seed=seed)}
+    exposures = {'point': make_points(10000 * size, seed=seed),
+                 'line': make_lines(1000 * size, seed=seed),
+                 'polygon': make_buildings(10000 * size, seed=seed),
+                 'raster': make_raster(100 * size, 100 * size,
+                                       high=100.0, seed=seed + 1)}
+
+    # Raster on raster requires identical grids
+    exposures['raster on raster'] = make_raster(200 * size, 200 * size,
+                                                high=100.0, seed=seed + 2)
+    return hazards, exposures
+
+
+def run(size=1):
+    """Run benchmark and print results
+
+    Input
+        size: Scale factor for the number of features and cells
+
+    Output
+        Dictionary of measurements (see utilities.measure) by case
+    """
+
+    hazards, exposures = make_layers(size)
+
+    results = {}
+    for hazard_type, exposure_type in CASES:
+        exposure = exposures[exposure_type]
+        if hazard_type == 'raster' and exposure_type == 'raster':
+            exposure = exposures['raster on raster']
+
+        name = '%s hazard on %s exposure' % (hazard_type, exposure_type)
+        results[name] = measure(assign_hazard_values_to_exposure_data,
+                                hazards[hazard_type], exposure,
+                                attribute_name='depth')
+        report(name, results[name])
+
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
@@ -0,0 +1,60 @@
+"""Benchmark of reading and writing layers.
+
+Synthetic raster, point, line and polygon layers are written to GeoTIFF
+and shapefiles in the InaSAFE temporary directory and read back with
+read_layer.
+"""
+
+import sys
+
+from safe.storage.core import read_layer
+from safe.common.utilities import temp_dir, unique_filename
+from safe.benchmarks.generators import (make_raster, make_points,
+                                        make_lines, make_buildings)
+from safe.benchmarks.utilities import measure, report
+
+
+def write_layer(layer, filename):
+    """Write layer to file (for measure which needs a function)
+    """
+
+    layer.write_to_file(filename)
+
+
+def run(size=1):
+    """Run benchmark and print results
+
+    Input
+        size: Scale factor for the number of features and cells
+
+    Output
+        Dictionary of measurements (see utilities.measure) by case
+    """
+
+    layers = [('raster', make_raster(500 * size, 500 * size, seed=17),
+               '.tif'),
+              ('points', make_points(20000 * size, seed=17), '.shp'),
+              ('lines', make_lines(2000 * size, seed=17), '.shp'),
+              ('polygons', make_buildings(20000 * size, seed=17), '.shp')]
+
+    directory = temp_dir('benchmarks')
+    results = {}
+    for layer_type, layer, extension in layers:
+        filename = unique_filename(suffix=extension, dir=directory)
+
+        name = 'write %s' % layer_type
+        results[name] = measure(write_layer, layer, filename)
+        report(name, results[name])
+
+        name = 'read %s' % layer_type
+        results[name] = measure(read_layer, filename)
+        report(name, results[name])
+
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
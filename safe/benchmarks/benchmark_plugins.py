@@ -0,0 +1,85 @@
+"""Microbenchmark for impact function discovery.
+
+This times the path taken by the dock (Dock.getFunctions ->
+availableFunctions -> get_admissible_plugins) every time the hazard or
+exposure combo changes, both with cold caches and with warm caches.
+"""
+
+import sys
+import time
+
+import safe.impact_functions
+from safe.impact_functions import core
+
+# Typical keyword combinations as read by the dock
+KEYWORD_COMBINATIONS = [
+    [{'category': 'hazard', 'subcategory': 'flood',
+      'unit': 'm', 'layertype': 'raster'},
+     {'category': 'exposure', 'subcategory': 'population',
+      'datatype': 'density', 'layertype': 'raster'}],
+    [{'category': 'hazard', 'subcategory': 'earthquake',
+      'unit': 'MMI', 'layertype': 'raster'},
+     {'category': 'exposure', 'subcategory': 'structure',
+      'datatype': 'osm', 'layertype': 'vector'}],
+    [{'category': 'hazard', 'subcategory': 'volcano',
+      'layertype': 'vector'},
+     {'category': 'exposure', 'subcategory': 'population',
+      'datatype': 'density', 'layertype': 'raster'}]]
+
+
+def clear_caches():
+    """Reset all requirement caches in safe.impact_functions.core
+    """
+    # pylint: disable=W0212
+    core._requirements_cache.clear()
+    core._compiled_requirements.clear()
+    core._requirement_check_cache.clear()
+    # pylint: enable=W0212
+
+
+def time_get_functions(iterations=100, cold=False):
+    """Time repeated discovery of admissible impact functions
+
+    Input
+        iterations: Number of times each keyword combination is evaluated
+        cold: If True, caches are cleared before every evaluation
+
+    Output
+        Average time in seconds per call to get_admissible_plugins
+    """
+
+    calls = 0
+    elapsed = 0.0
+    for _ in range(iterations):
+        for keywords in KEYWORD_COMBINATIONS:
+            if cold:
+                clear_caches()
+            t0 = time.time()
+            core.get_admissible_plugins(keywords)
+            elapsed += time.time() - t0
+            calls += 1
+
+    return elapsed / calls
+
+
+def run(iterations=100):
+    """Run benchmark and print results
+    """
+
+    print 'Registered impact functions: %i' % len(
+        safe.impact_functions.get_plugins())
+    cold = time_get_functions(iterations, cold=True)
+    warm = time_get_functions(iterations, cold=False)
+    print 'get_admissible_plugins (cold caches): %.6f s/call' % cold
+    print 'get_admissible_plugins (warm caches): %.6f s/call' % warm
+    if warm > 0:
+        print 'Speedup: %.1fx' % (cold / warm)
+
+    return {'cold': cold, 'warm': warm}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
@@ -0,0 +1,114 @@
+"""Benchmark of the realtime ShakeMap chain.
+
+A synthetic grid.xml and population raster are written to a temporary
+realtime work directory and the stages run by realtime for each event
+are timed in order: parsing the grid, gridding MMI to a raster,
+contouring it and calculating the impact on population.
+
+The realtime package needs QGIS, PyQt4 and the GDAL command line tools.
+If they are not available the benchmark reports that and returns no
+results.
+"""
+
+import os
+import sys
+
+from safe.common.utilities import temp_dir
+from safe.benchmarks.generators import make_raster, write_shakemap_grid
+from safe.benchmarks.generators import DEFAULT_BBOX
+from safe.benchmarks.utilities import measure, report
+
+EVENT_ID = 'benchmark'
+
+
+def parse_event(event_class):
+    """Make shake event from grid.xml (for measure which needs a function)
+    """
+
+    event_class(theEventId=EVENT_ID, theDataIsLocalFlag=True)
+
+
+def run(size=1):
+    """Run benchmark and print results
+
+    Input
+        size: Scale factor for the number of grid points
+
+    Output
+        Dictionary of measurements (see utilities.measure) by stage
+    """
+
+    try:
+        from safe_qgis.utilities_test import getQgisTestApp
+        from realtime.shake_event import ShakeEvent
+        from realtime.utils import shakemapExtractDir
+    except ImportError, e:
+        print 'Realtime benchmark skipped: %s' % e
+        return {}
+
+    getQgisTestApp()
+
+    # Realtime finds its data through INASAFE_WORK_DIR
+    work_dir = temp_dir('benchmarks-realtime')
+    old_work_dir = os.environ.get('INASAFE_WORK_DIR')
+    os.environ['INASAFE_WORK_DIR'] = work_dir
+    try:
+        return run_stages(ShakeEvent, shakemapExtractDir(), work_dir, size)
+    finally:
+        if old_work_dir is None:
+            del os.environ['INASAFE_WORK_DIR']
+        else:
+            os.environ['INASAFE_WORK_DIR'] = old_work_dir
+
+
+def run_stages(event_class, extract_dir, work_dir, size):
+    """Write synthetic event data and time the realtime stages
+
+    Input
+        event_class: realtime.shake_event.ShakeEvent
+        extract_dir: Directory where realtime looks for extracted events
+        work_dir: Directory for the synthetic population raster
+        size: Scale factor for the number of grid points
+
+    Output
+        Dictionary of measurements by stage
+    """
+
+    event_dir = os.path.join(extract_dir, EVENT_ID)
+    if not os.path.exists(event_dir):
+        os.makedirs(event_dir)
+    write_shakemap_grid(os.path.join(event_dir, 'grid.xml'),
+                        161 * size, 161 * size, seed=17)
+
+    population_path = os.path.join(work_dir, 'population.tif')
+    make_raster(400 * size, 400 * size, bbox=DEFAULT_BBOX, high=100.0,
+                name='Synthetic population', seed=17,
+                keywords={'category': 'exposure',
+                          'subcategory': 'population',
+                          'datatype': 'density',
+                          'title': 'Synthetic population'}
+                ).write_to_file(population_path)
+
+    results = {}
+    results['parse grid'] = measure(parse_event, event_class)
+    report('parse grid', results['parse grid'])
+
+    # Later stages read the files written by the earlier ones
+    event = event_class(theEventId=EVENT_ID, theDataIsLocalFlag=True)
+    stages = [('raster', event.mmiDataToRaster, {'theForceFlag': True}),
+              ('contours', event.mmiDataToContours, {'theForceFlag': True}),
+              ('impacts', event.calculateImpacts,
+               {'thePopulationRasterPath': population_path,
+                'theForceFlag': True})]
+    for name, method, kwargs in stages:
+        results[name] = measure(method, **kwargs)
+        report(name, results[name])
+
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
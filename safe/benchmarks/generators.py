@@ -0,0 +1,378 @@
+"""Synthetic scenario generators for benchmarks.
+
+All generators are vectorised so that layers with millions of features
+can be made in seconds, and they take a seed so that the same scenario
+can be made again to compare timings between commits. Coordinates are
+geographic (WGS84) and default to an area around Jakarta with sizes of
+features typical of the data sets used with InaSAFE.
+"""
+
+import numpy
+
+from safe.storage.raster import Raster
+from safe.storage.vector import Vector
+from safe.storage.projection import DEFAULT_PROJECTION
+from safe.common.polygon import inside_polygon
+from safe.common.utilities import verify
+
+# [West, South, East, North] of scenarios unless specified
+DEFAULT_BBOX = [106.6, -6.4, 107.0, -6.0]
+
+# Attribute values of synthetic features
+ROAD_TYPES = ['primary', 'secondary', 'residential', 'track']
+STRUCTURE_TYPES = ['school', 'hospital', 'residential', 'commercial']
+VOLCANO_ZONES = ['Kawasan Rawan Bencana III',
+                 'Kawasan Rawan Bencana II',
+                 'Kawasan Rawan Bencana I']
+
+
+def _get_bbox(bbox):
+    """Check bounding box or return the default one
+    """
+
+    if bbox is None:
+        bbox = DEFAULT_BBOX
+    bbox = numpy.array(bbox, dtype='float64')
+
+    msg = ('Bounding box must be [West, South, East, North] with West < '
+           'East and South < North. I got %s' % str(bbox.tolist()))
+    verify(len(bbox) == 4 and bbox[0] < bbox[2] and bbox[1] < bbox[3], msg)
+    return bbox
+
+
+def random_points_in_bbox(number_of_points, bbox=None, seed=None):
+    """Uniformly distributed points in bounding box
+
+    Args:
+        * number_of_points: Number of points
+        * bbox: [West, South, East, North]. Default is DEFAULT_BBOX.
+        * seed: Seed for random number generator
+
+    Returns:
+        * Nx2 array of points
+    """
+
+    bbox = _get_bbox(bbox)
+    random = numpy.random.RandomState(seed)
+    return random.uniform(bbox[:2], bbox[2:], (number_of_points, 2))
+
+
+def random_points_in_polygon(polygon, number_of_points, seed=None,
+                             exclude=None):
+    """Uniformly distributed points inside polygon
+
+    Args:
+        * polygon: Nx2 array of vertices
+        * number_of_points: Number of points
+        * seed: Seed for random number generator
+        * exclude: Optional list of polygons inside the main polygon where
+              no points should be
+
+    Returns:
+        * Nx2 array of points
+
+    Note:
+        This does the same as safe.common.polygon.populate_polygon but
+        draws and tests candidate points in batches rather than one by
+        one.
+    """
+
+    polygon = numpy.array(polygon, dtype='float64')
+    bbox = [polygon[:, 0].min(), polygon[:, 1].min(),
+            polygon[:, 0].max(), polygon[:, 1].max()]
+    random = numpy.random.RandomState(seed)
+
+    points = numpy.zeros((0, 2))
+    while len(points) < number_of_points:
+        # Draw as many candidates as are likely to be needed
+        missing = number_of_points - len(points)
+        candidates = random.uniform(bbox[:2], bbox[2:],
+                                    (2 * missing + 10, 2))
+        inside = inside_polygon(candidates, polygon, holes=exclude,
+                                check_input=False)
+        points = numpy.concatenate([points, candidates[inside]])
+
+    return points[:number_of_points]
+
+
+def make_raster(rows, cols, bbox=None, low=0.0, high=1.0,
+                nodata_fraction=0.0, name='Synthetic raster',
+                keywords=None, seed=None):
+    """Raster with a smooth random field
+
+    Args:
+        * rows, cols: Size of grid
+        * bbox: [West, South, East, North]. Default is DEFAULT_BBOX.
+        * low, high: Range of values
+        * nodata_fraction: Fraction of cells set to NaN
+        * name: Name of layer
+        * keywords: Dictionary of keywords of layer
+        * seed: Seed for random number generator
+
+    Returns:
+        * Raster layer
+
+    Note:
+        Values are a sum of a few waves with random direction and phase
+        so that hazard levels vary smoothly in space like real hazard
+        maps do.
+    """
+
+    bbox = _get_bbox(bbox)
+    random = numpy.random.RandomState(seed)
+
+    y = numpy.linspace(0, 1, rows)[:, numpy.newaxis]
+    x = numpy.linspace(0, 1, cols)[numpy.newaxis, :]
+    A = numpy.zeros((rows, cols))
+    for _ in range(4):
+        kx, ky = random.uniform(-6, 6, 2)
+        A += numpy.sin(kx * x + ky * y + random.uniform(0, 2 * numpy.pi))
+    A = low + (high - low) * (A - A.min()) / max(A.max() - A.min(), 1.0e-12)
+
+    if nodata_fraction > 0:
+        A[random.uniform(0, 1, A.shape) < nodata_fraction] = numpy.nan
+
+    geotransform = (bbox[0], (bbox[2] - bbox[0]) / cols, 0,
+                    bbox[3], 0, -(bbox[3] - bbox[1]) / rows)
+    return Raster(A, projection=DEFAULT_PROJECTION,
+                  geotransform=geotransform,
+                  name=name,
+                  keywords=keywords)
+
+
+def make_points(number_of_points, bbox=None, name='Synthetic points',
+                keywords=None, seed=None):
+    """Point layer with structure attributes
+
+    Args:
+        * number_of_points: Number of points
+        * bbox: [West, South, East, North]. Default is DEFAULT_BBOX.
+        * name: Name of layer
+        * keywords: Dictionary of keywords of layer
+        * seed: Seed for random number generator
+
+    Returns:
+        * Point vector layer
+    """
+
+    random = numpy.random.RandomState(seed)
+    points = random_points_in_bbox(number_of_points, bbox,
+                                   seed=random.randint(2 ** 30))
+    data = _make_structure_attributes(number_of_points, random)
+    return Vector(data=data,
+                  projection=DEFAULT_PROJECTION,
+                  geometry=points,
+                  name=name,
+                  keywords=keywords)
+
+
+def make_lines(number_of_lines, vertices=10, step=0.001, bbox=None,
+               name='Synthetic lines', keywords=None, seed=None):
+    """Line layer like a road network
+
+    Args:
+        * number_of_lines: Number of lines
+        * vertices: Number of vertices of each line
+        * step: Distance between vertices in degrees
+        * bbox: [West, South, East, North] of the first vertices
+        * name: Name of layer
+        * keywords: Dictionary of keywords of layer
+        * seed: Seed for random number generator
+
+    Returns:
+        * Line vector layer
+
+    Note:
+        Lines are random walks that turn by up to 30 degrees at each
+        vertex.
+    """
+
+    msg = 'Lines must have at least two vertices. I got %s' % vertices
+    verify(vertices >= 2, msg)
+
+    random = numpy.random.RandomState(seed)
+    starts = random_points_in_bbox(number_of_lines, bbox,
+                                   seed=random.randint(2 ** 30))
+    headings = (random.uniform(0, 2 * numpy.pi, (number_of_lines, 1)) +
+                numpy.cumsum(random.uniform(-numpy.pi / 6, numpy.pi / 6,
+                                            (number_of_lines,
+                                             vertices - 1)), axis=1))
+    steps = numpy.zeros((number_of_lines, vertices, 2))
+    steps[:, 1:, 0] = step * numpy.cos(headings)
+    steps[:, 1:, 1] = step * numpy.sin(headings)
+    lines = starts[:, numpy.newaxis, :] + numpy.cumsum(steps, axis=1)
+
+    types = random.randint(len(ROAD_TYPES), size=number_of_lines)
+    data = [{'TYPE': ROAD_TYPES[x]} for x in types]
+    return Vector(data=data,
+                  projection=DEFAULT_PROJECTION,
+                  geometry=list(lines),
+                  geometry_type='line',
+                  name=name,
+                  keywords=keywords)
+
+
+def make_buildings(number_of_buildings, size=0.0002, bbox=None,
+                   name='Synthetic buildings', keywords=None, seed=None):
+    """Polygon layer of building footprints
+
+    Args:
+        * number_of_buildings: Number of polygons
+        * size: Typical side of buildings in degrees
+        * bbox: [West, South, East, North]. Default is DEFAULT_BBOX.
+        * name: Name of layer
+        * keywords: Dictionary of keywords of layer
+        * seed: Seed for random number generator
+
+    Returns:
+        * Polygon vector layer with closed rotated rectangles
+    """
+
+    random = numpy.random.RandomState(seed)
+    N = number_of_buildings
+    centres = random_points_in_bbox(N, bbox, seed=random.randint(2 ** 30))
+
+    # Rectangles with random sides and orientation
+    half = random.uniform(0.5, 1.5, (N, 1, 2)) * size / 2
+    corners = numpy.array([[-1, -1], [1, -1], [1, 1], [-1, 1], [-1, -1]])
+    angles = random.uniform(0, numpy.pi / 2, N)
+    cos = numpy.cos(angles)[:, numpy.newaxis]
+    sin = numpy.sin(angles)[:, numpy.newaxis]
+    X = corners[numpy.newaxis, :, 0] * half[:, :, 0]
+    Y = corners[numpy.newaxis, :, 1] * half[:, :, 1]
+    polygons = numpy.zeros((N, len(corners), 2))
+    polygons[:, :, 0] = centres[:, 0:1] + cos * X - sin * Y
+    polygons[:, :, 1] = centres[:, 1:2] + sin * X + cos * Y
+
+    data = _make_structure_attributes(N, random)
+    return Vector(data=data,
+                  projection=DEFAULT_PROJECTION,
+                  geometry=list(polygons),
+                  geometry_type='polygon',
+                  name=name,
+                  keywords=keywords)
+
+
+def make_hazard_polygons(number_of_polygons, radius=0.05, vertices=32,
+                         bbox=None, name='Synthetic hazard zones',
+                         keywords=None, seed=None):
+    """Polygon layer of hazard zones
+
+    Args:
+        * number_of_polygons: Number of polygons
+        * radius: Typical radius of polygons in degrees
+        * vertices: Number of vertices of each polygon
+        * bbox: [West, South, East, North] of the centres of polygons
+        * name: Name of layer
+        * keywords: Dictionary of keywords of layer
+        * seed: Seed for random number generator
+
+    Returns:
+        * Polygon vector layer
+
+    Note:
+        Polygons are star shaped around random centres and have the
+        attributes read by the flood and volcano impact functions
+        (FLOODPRONE, affected, KRB and GUNUNG).
+    """
+
+    random = numpy.random.RandomState(seed)
+    N = number_of_polygons
+    centres = random_points_in_bbox(N, bbox, seed=random.randint(2 ** 30))
+
+    angles = numpy.linspace(0, 2 * numpy.pi, vertices + 1)
+    radii = radius * random.uniform(0.6, 1.4, (N, vertices + 1))
+    radii[:, -1] = radii[:, 0]
+    polygons = numpy.zeros((N, vertices + 1, 2))
+    polygons[:, :, 0] = centres[:, 0:1] + radii * numpy.cos(angles)
+    polygons[:, :, 1] = centres[:, 1:2] + radii * numpy.sin(angles)
+
+    flooded = random.uniform(0, 1, N) < 0.5
+    zones = random.randint(len(VOLCANO_ZONES), size=N)
+    data = []
+    for i in range(N):
+        data.append({'FLOODPRONE': 'YES' if flooded[i] else 'NO',
+                     'affected': bool(flooded[i]),
+                     'KRB': VOLCANO_ZONES[zones[i]],
+                     'GUNUNG': 'Volcano %i' % (i % 3)})
+    return Vector(data=data,
+                  projection=DEFAULT_PROJECTION,
+                  geometry=list(polygons),
+                  geometry_type='polygon',
+                  name=name,
+                  keywords=keywords)
+
+
+def _make_structure_attributes(number_of_features, random):
+    """Attributes of synthetic structures as read by impact functions
+    """
+
+    types = random.randint(len(STRUCTURE_TYPES), size=number_of_features)
+    areas = random.uniform(20, 500, number_of_features)
+    data = []
+    for i in range(number_of_features):
+        data.append({'TYPE': STRUCTURE_TYPES[types[i]],
+                     'FLOOR_AREA': float(areas[i]),
+                     'BUILDING_C': 1000.0,
+                     'CONTENTS_C': 500.0})
+    return data
+
+
+def write_shakemap_grid(filename, rows, cols, bbox=None, magnitude=6.5,
+                        seed=None):
+    """Write a ShakeMap grid.xml file with a synthetic event
+
+    Args:
+        * filename: Name of grid.xml file to write
+        * rows, cols: Number of grid points along latitude and longitude
+        * bbox: [West, South, East, North]. Default is DEFAULT_BBOX.
+        * magnitude: Magnitude of event
+        * seed: Seed for random number generator
+
+    Returns:
+        * Longitude and latitude of the epicentre
+
+    Note:
+        MMI decreases with distance from a random epicentre inside the
+        bounding box. Other fields of the grid are filled with constants
+        as only MMI is read by the realtime package.
+    """
+
+    bbox = _get_bbox(bbox)
+    random = numpy.random.RandomState(seed)
+    epicentre = random.uniform(bbox[:2], bbox[2:])
+
+    longitudes = numpy.linspace(bbox[0], bbox[2], cols)
+    latitudes = numpy.linspace(bbox[3], bbox[1], rows)
+    X, Y = numpy.meshgrid(longitudes, latitudes)
+    distances = numpy.hypot(X - epicentre[0], Y - epicentre[1])
+    mmi = numpy.clip(magnitude + 2.5 - 3 * numpy.log10(1 + 20 * distances),
+                     1, 10)
+
+    lines = ['%.4f %.4f 0.01 0.02 %.2f 0.05 0.02 0 0.5 1 600' % x
+             for x in zip(X.ravel(), Y.ravel(), mmi.ravel())]
+    fields = ['LON', 'LAT', 'PGA', 'PGV', 'MMI', 'PSA03', 'PSA10',
+              'PSA30', 'STDPGA', 'URAT', 'SVEL']
+
+    fid = open(filename, 'w')
+    try:
+        fid.write('<?xml version="1.0" encoding="US-ASCII" '
+                  'standalone="yes"?>\n'
+                  '<shakemap_grid event_id="benchmark" '
+                  'shakemap_id="benchmark" shakemap_version="1">\n')
+        fid.write('<event magnitude="%.1f" depth="10" lat="%f" lon="%f" '
+                  'event_timestamp="2012-08-07T01:55:12WIB" '
+                  'event_network="" event_description="Synthetic event" '
+                  '/>\n' % (magnitude, epicentre[1], epicentre[0]))
+        fid.write('<grid_specification lon_min="%f" lat_min="%f" '
+                  'lon_max="%f" lat_max="%f" nlon="%i" nlat="%i" />\n'
+                  % (bbox[0], bbox[1], bbox[2], bbox[3], cols, rows))
+        for i, field in enumerate(fields):
+            fid.write('<grid_field index="%i" name="%s" units="" />\n'
+                      % (i + 1, field))
+        fid.write('<grid_data>\n%s\n</grid_data>\n</shakemap_grid>\n'
+                  % '\n'.join(lines))
+    finally:
+        fid.close()
+
+    return epicentre
@@ -0,0 +1,115 @@
+"""Run all benchmarks and keep their results for comparison.
+
+Usage::
+
+    python -m safe.benchmarks.suite [--size N] [--output FILE]
+                                    [--compare FILE] [name ...]
+
+Results are written as JSON (default benchmarks.json) with the commit
+they were run on. With --compare the times are set against those of an
+earlier results file, e.g. one made on the master branch. Names select
+benchmarks to run, e.g. ``interpolation io``; all are run by default.
+"""
+
+import sys
+import importlib
+from optparse import OptionParser
+
+from safe.benchmarks.utilities import (measure, report, write_results,
+                                       read_results, compare_results,
+                                       DEFAULT_TOLERANCE)
+
+# Benchmark modules (safe.benchmarks.benchmark_<name>) in order of running
+BENCHMARKS = ['imports',
+              'plugins',
+              'interpolation',
+              'impact_functions',
+              'damage_curves',
+              'aggregation',
+              'io',
+              'realtime']
+
+# Benchmarks whose run function scales with argument size
+SCALABLE = ['interpolation', 'impact_functions', 'damage_curves', 'io',
+            'realtime']
+
+
+def run_benchmark(name, size=1):
+    """Run one benchmark module
+
+    Input
+        name: Name of benchmark, one of BENCHMARKS
+        size: Scale factor passed to benchmarks in SCALABLE
+
+    Output
+        Dictionary with the results returned by the run function of the
+        module. For benchmarks measuring only time it is the measurement
+        of the whole run with the times returned kept as 'times'.
+    """
+
+    module = importlib.import_module('safe.benchmarks.benchmark_%s' % name)
+    print
+    print '%s benchmark' % name.replace('_', ' ').capitalize()
+
+    if name in SCALABLE:
+        return module.run(size)
+
+    # Older benchmarks return times only. Track memory of the whole run.
+    measurement = measure(module.run)
+    report('total', measurement)
+    measurement['times'] = measurement.pop('result', None)
+    return measurement
+
+
+def print_comparison(rows):
+    """Print rows as returned by compare_results
+    """
+
+    print
+    print '%-60s %9s %9s %7s' % ('Benchmark', 'Old [s]', 'New [s]', 'Ratio')
+    for name, t0, t1, ratio, verdict in rows:
+        print '%-60s %9.4f %9.4f %7.2f %s' % (name[:60], t0, t1,
+                                              ratio, verdict)
+
+
+def main(argv=None):
+    """Run benchmarks as given on the command line
+    """
+
+    parser = OptionParser(usage='%prog [options] [benchmark ...]')
+    parser.add_option('--size', type='int', default=1,
+                      help='Scale factor for synthetic data')
+    parser.add_option('--output', default='benchmarks.json',
+                      help='JSON file to write results to')
+    parser.add_option('--compare', default=None,
+                      help='JSON file with earlier results to compare with')
+    parser.add_option('--tolerance', type='float',
+                      default=DEFAULT_TOLERANCE,
+                      help='Relative change in time reported as unchanged')
+    options, names = parser.parse_args(argv)
+
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error('Unknown benchmark %s. Choose from %s'
+                         % (name, ', '.join(BENCHMARKS)))
+    if not names:
+        names = BENCHMARKS
+
+    benchmarks = {}
+    for name in names:
+        benchmarks[name] = run_benchmark(name, options.size)
+
+    results = write_results(options.output, benchmarks)
+    print
+    print 'Results written to %s' % options.output
+
+    if options.compare is not None:
+        rows = compare_results(read_results(options.compare), results,
+                               tolerance=options.tolerance)
+        print_comparison(rows)
+
+    return results
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,129 @@
+import unittest
+import numpy
+
+from safe.common.polygon import is_inside_polygon
+from safe.benchmarks.generators import (random_points_in_polygon,
+                                        make_raster, make_points,
+                                        make_lines, make_buildings,
+                                        make_hazard_polygons)
+from safe.benchmarks.utilities import measure, compare_results
+
+
+def allocate(megabytes):
+    """Allocate and fill array of given size
+    """
+
+    A = numpy.ones(megabytes * 1024 * 1024 / 8)
+    return float(numpy.sum(A))
+
+
+def fail():
+    """Raise exception for measure to report
+    """
+
+    raise ValueError('Expected failure')
+
+
+class Test_Benchmarks(unittest.TestCase):
+    """Tests of synthetic data and measurements for benchmarks
+    """
+
+    def test_generators(self):
+        """Synthetic layers have the requested size and extent
+        """
+
+        bbox = [100, -10, 101, -9]
+        R = make_raster(30, 40, bbox=bbox, low=2, high=5,
+                        nodata_fraction=0.1, seed=17)
+        A = R.get_data(nan=True)
+        assert A.shape == (30, 40)
+        assert numpy.nanmin(A) >= 2 and numpy.nanmax(A) <= 5
+        assert 0 < numpy.sum(numpy.isnan(A)) < 0.2 * A.size
+        assert numpy.allclose(R.get_bounding_box(), bbox)
+
+        # Same seed gives same data
+        A = make_raster(30, 40, low=2, high=5, seed=17).get_data()
+        assert numpy.allclose([A.min(), A.max()], [2, 5])
+        assert numpy.allclose(A, make_raster(30, 40, low=2, high=5,
+                                             seed=17).get_data())
+
+        P = make_points(100, bbox=bbox, seed=17)
+        assert P.is_point_data and len(P) == 100
+        assert 'FLOOR_AREA' in P.get_data()[0]
+
+        L = make_lines(20, vertices=5, seed=17)
+        assert L.is_line_data and len(L) == 20
+        assert L.get_geometry()[0].shape == (5, 2)
+
+        B = make_buildings(50, seed=17)
+        assert B.is_polygon_data and len(B) == 50
+        for polygon in B.get_geometry():
+            assert numpy.allclose(polygon[0], polygon[-1])
+
+        H = make_hazard_polygons(5, vertices=16, seed=17)
+        assert H.is_polygon_data and len(H) == 5
+        assert H.get_data()[0]['FLOODPRONE'] in ['YES', 'NO']
+
+    def test_random_points_in_polygon(self):
+        """Points are inside polygon and outside excluded areas
+        """
+
+        polygon = numpy.array([[0, 0], [2, 0], [2, 2], [0, 2]])
+        hole = numpy.array([[0.5, 0.5], [1.5, 0.5], [1.5, 1.5],
+                            [0.5, 1.5]])
+        points = random_points_in_polygon(polygon, 1000, seed=17,
+                                          exclude=[hole])
+        assert len(points) == 1000
+        for point in points:
+            assert is_inside_polygon(point, polygon)
+            assert not is_inside_polygon(point, hole)
+
+    def test_measure(self):
+        """Time, memory and errors are measured
+        """
+
+        result = measure(allocate, 50)
+        assert result['result'] == 50 * 1024 * 1024 / 8
+        assert result['time'] >= 0
+
+        # Not all platforms report memory freed before the call
+        assert result['memory'] > 40 * 1024 or result['memory'] == 0
+
+        result = measure(fail)
+        assert 'Expected failure' in result['error']
+
+    def test_compare_results(self):
+        """Times of nested results are compared by name
+        """
+
+        old = {'benchmarks': {'plugins': {'time': 4.0, 'memory': 10,
+                                          'times': {'cold': 2.0,
+                                                    'warm': 1.0}},
+                              'io': {'read raster': {'time': 1.0,
+                                                     'memory': 10,
+                                                     'result': 3},
+                                     'read points': {'error': 'failed'}},
+                              'imports': {'time': 1.0,
+                                          'times': {'safe.api': None}}}}
+        new = {'benchmarks': {'plugins': {'time': 4.0, 'memory': 20,
+                                          'times': {'cold': 1.0,
+                                                    'warm': 1.05}},
+                              'io': {'read raster': {'time': 1.5,
+                                                     'memory': 10,
+                                                     'result': 5},
+                                     'points': 1000}}}
+        rows = compare_results(old, new)
+
+        # Memory, results and other numbers are not taken as times
+        assert [x[0] for x in rows] == ['io.read raster',
+                                        'plugins',
+                                        'plugins.cold',
+                                        'plugins.warm']
+        assert [x[4] for x in rows] == ['slower', '', 'faster', '']
+        assert numpy.allclose([x[3] for x in rows], [1.5, 1.0, 0.5, 1.05])
+
+
+if __name__ == '__main__':
+    suite = unittest.makeSuite(Test_Benchmarks, 'test')
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,276 @@
+"""Timing, memory tracking and result files for benchmarks.
+
+Each benchmark case is run by measure in a forked child process so that
+its peak memory is not hidden by what earlier cases allocated and so
+that caches filled by one case do not speed up the next one. Results
+are kept as JSON files which compare_results reads back to show the
+change between two commits.
+"""
+
+import os
+import sys
+import time
+import json
+import resource
+import subprocess
+from datetime import datetime
+
+import numpy
+
+# Relative change in time below which results are reported as unchanged
+DEFAULT_TOLERANCE = 0.1
+
+
+def _read_memory_status(key):
+    """Memory figure from /proc/self/status in kB or None if unavailable
+    """
+
+    try:
+        fid = open('/proc/self/status')
+    except IOError:
+        return None
+
+    try:
+        for line in fid:
+            if line.startswith(key + ':'):
+                return int(line.split()[1])
+    finally:
+        fid.close()
+    return None
+
+
+def _reset_peak_memory():
+    """Make the kernel restart tracking peak memory from now (Linux only)
+
+    Output
+        True if the peak was reset
+    """
+
+    try:
+        fid = open('/proc/self/clear_refs', 'w')
+        try:
+            fid.write('5')
+        finally:
+            fid.close()
+    except IOError:
+        return False
+    return True
+
+
+def _measure(function, args, kwargs):
+    """Run function once in this process and return time and memory
+    """
+
+    baseline = _read_memory_status('VmRSS')
+    if baseline is None or not _reset_peak_memory():
+        # Peak over the life of the process is all we can get
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    t0 = time.time()
+    result = function(*args, **kwargs)
+    elapsed = time.time() - t0
+
+    peak = _read_memory_status('VmHWM')
+    if peak is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    try:
+        json.dumps(result)
+    except (TypeError, ValueError):
+        result = None
+
+    return {'time': elapsed,
+            'memory': max(peak - baseline, 0),
+            'result': result}
+
+
+def measure(function, *args, **kwargs):
+    """Time function and track the memory it needs
+
+    Input
+        function: Function to benchmark
+        args, kwargs: Arguments passed to function
+
+    Output
+        Dictionary with
+            time: Elapsed time in seconds
+            memory: Peak resident memory above that at the start in kB
+            result: Value returned by function if it can be stored as
+                JSON, otherwise None
+            error: Message of exception raised by function, if any
+
+    Note
+        Where os.fork is available the function runs in a child process
+        so that memory and caches are those of the function alone.
+        Layers and other input should be created before calling measure
+        so that they are not counted.
+    """
+
+    if not hasattr(os, 'fork'):
+        try:
+            return _measure(function, args, kwargs)
+        except Exception, e:
+            return {'error': '%s: %s' % (e.__class__.__name__, e)}
+
+    sys.stdout.flush()
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Child process
+        os.close(read_end)
+        try:
+            try:
+                output = _measure(function, args, kwargs)
+            except Exception, e:
+                output = {'error': '%s: %s' % (e.__class__.__name__, e)}
+            message = json.dumps(output)
+            while message:
+                message = message[os.write(write_end, message):]
+            sys.stdout.flush()
+        finally:
+            os._exit(0)
+
+    os.close(write_end)
+    chunks = []
+    while True:
+        chunk = os.read(read_end, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.close(read_end)
+    os.waitpid(pid, 0)
+
+    if not chunks:
+        return {'error': 'Benchmark process ended without a result'}
+    return json.loads(''.join(chunks))
+
+
+def report(name, measurement):
+    """Print one line for a measured case
+    """
+
+    if 'error' in measurement:
+        print '%-40s failed: %s' % (name, measurement['error'])
+    else:
+        print '%-40s %9.4f s %10i kB' % (name, measurement['time'],
+                                          measurement['memory'])
+
+
+def get_commit():
+    """Git commit of the source tree or None if unknown
+    """
+
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                        '..', '..'))
+    try:
+        process = subprocess.Popen(['git', 'rev-parse', 'HEAD'],
+                                   cwd=root,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        stdout, _ = process.communicate()
+    except OSError:
+        return None
+
+    if process.returncode != 0:
+        return None
+    return stdout.strip()
+
+
+def write_results(filename, benchmarks):
+    """Write benchmark results to JSON file
+
+    Input
+        filename: Name of file to write
+        benchmarks: Dictionary of results by benchmark name as returned
+            by the run functions of benchmark modules
+
+    Output
+        Dictionary as written including the commit and versions used
+    """
+
+    results = {'commit': get_commit(),
+               'date': datetime.now().isoformat(),
+               'python': sys.version.split()[0],
+               'numpy': numpy.__version__,
+               'benchmarks': benchmarks}
+
+    fid = open(filename, 'w')
+    try:
+        json.dump(results, fid, indent=2, sort_keys=True)
+    finally:
+        fid.close()
+    return results
+
+
+def read_results(filename):
+    """Read benchmark results written by write_results
+    """
+
+    fid = open(filename)
+    try:
+        return json.load(fid)
+    finally:
+        fid.close()
+
+
+def _get_times(results, prefix=''):
+    """Flatten nested benchmark results to a dictionary of times
+
+    Times are the 'time' of measurements made with measure and the
+    numbers in a dictionary under key 'times', where benchmarks that
+    measure time only keep theirs (see suite.run_benchmark). Other
+    numbers, such as memory or the results of measured functions, are
+    left out. Dictionaries with neither key are searched as groups of
+    results. Names of nested results are joined by dots.
+    """
+
+    times = {}
+    for key, value in results.items():
+        if not isinstance(value, dict):
+            continue
+
+        name = prefix + key
+        if 'time' in value:
+            times[name] = value['time']
+        if isinstance(value.get('times'), dict):
+            for time_name, elapsed in value['times'].items():
+                if (isinstance(elapsed, (int, float)) and
+                        not isinstance(elapsed, bool)):
+                    times[name + '.' + time_name] = elapsed
+        if 'time' not in value and 'times' not in value:
+            times.update(_get_times(value, name + '.'))
+    return times
+
+
+def compare_results(old, new, tolerance=DEFAULT_TOLERANCE):
+    """Compare times of two benchmark result files
+
+    Input
+        old, new: Results as returned by read_results
+        tolerance: Relative change in time reported as unchanged
+
+    Output
+        List of tuples (name, old time, new time, ratio, verdict) sorted by
+        name where verdict is 'faster', 'slower' or '' and ratio is new
+        time over old time. Cases missing in either file are left out.
+    """
+
+    old_times = _get_times(old['benchmarks'])
+    new_times = _get_times(new['benchmarks'])
+
+    rows = []
+    for name in sorted(set(old_times) & set(new_times)):
+        t0 = old_times[name]
+        t1 = new_times[name]
+        if t0 > 0:
+            ratio = t1 / t0
+        else:
+            ratio = float('nan')
+
+        verdict = ''
+        if ratio < 1 - tolerance:
+            verdict = 'faster'
+        elif ratio > 1 + tolerance:
+            verdict = 'slower'
+        rows.append((name, t0, t1, ratio, verdict))
+    return rows
@@ -61,6 +61,11 @@ class GetDataError(InaSAFEError):
     pass
 
 
+class QueueFullError(InaSAFEError):
+    """Raised when the analysis service has too many jobs waiting"""
+    pass
+
+
 class PostProcessorError(Exception):
     """Raised when requested import cannot be performed if QGIS is too old."""
     pass
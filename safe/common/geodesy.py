@@ -205,3 +205,30 @@ class Point:
         P.append(P[0])
 
         return numpy.array(P)
+
+
+def great_circle_distances(start, end):
+    """Distances between many pairs of points on the sphere
+
+    Input
+        start: Nx2 array of (longitude, latitude) in degrees
+        end: Nx2 array of (longitude, latitude) in degrees
+
+    Output
+        Array of N distances in metres along great circles. The haversine
+        formula is used as it stays accurate for the short distances
+        between consecutive vertices of lines.
+    """
+
+    start = numpy.asarray(start, dtype='float64').reshape((-1, 2))
+    end = numpy.asarray(end, dtype='float64').reshape((-1, 2))
+
+    lon0 = start[:, 0] * Point.degrees2radians
+    lat0 = start[:, 1] * Point.degrees2radians
+    lon1 = end[:, 0] * Point.degrees2radians
+    lat1 = end[:, 1] * Point.degrees2radians
+
+    a = (numpy.sin((lat1 - lat0) / 2) ** 2 +
+         numpy.cos(lat0) * numpy.cos(lat1) *
+         numpy.sin((lon1 - lon0) / 2) ** 2)
+    return 2 * Point.R * numpy.arcsin(numpy.sqrt(numpy.clip(a, 0, 1)))
@@ -28,7 +28,8 @@ LOGGER = logging.getLogger('InaSAFE')
 # pylint: disable=W0105
 
 
-def interpolate2d(x, y, Z, points, mode='linear', bounds_error=False):
+def interpolate2d(x, y, Z, points, mode='linear', bounds_error=False,
+                  weights=None):
     """Fundamental 2D interpolation routine
 
     Args:
@@ -46,6 +47,9 @@ def interpolate2d(x, y, Z, points, mode='linear', bounds_error=False):
               will be raised when interpolated values are requested
               outside the domain of the input data. If False, nan
               is returned for those values
+        * weights: Optional weights for points as returned by
+              get_interpolation_weights. They only depend on x, y and
+              points and can be reused for any Z on the same mesh.
 
     Returns:
         * 1D array with same length as points with interpolated values
@@ -71,6 +75,33 @@ def interpolate2d(x, y, Z, points, mode='linear', bounds_error=False):
     # Input checks
     x, y, Z, xi, eta = check_inputs(x, y, Z, points, mode, bounds_error)
 
+    if weights is None:
+        weights = get_interpolation_weights(x, y, xi, eta)
+
+    return interpolate_with_weights(Z, weights, mode=mode)
+
+
+def get_interpolation_weights(x, y, xi, eta):
+    """Neighbours and weights of points for interpolation over a mesh
+
+    Args:
+        * x: 1D array of x-coordinates of the mesh (increasing)
+        * y: 1D array of y-coordinates of the mesh (increasing)
+        * xi: 1D array of x-coordinates of interpolation points
+        * eta: 1D array of y-coordinates of interpolation points
+
+    Returns:
+        * Tuple (outside, idx, idy, alpha, beta) where outside flags
+          points outside the mesh or with NaN coordinates, idx and idy
+          are the indices of the upper neighbours of the other points and
+          alpha and beta their relative distances to the lower neighbours.
+
+    Note:
+        The weights do not depend on the values on the mesh, so they can
+        be used with interpolate_with_weights for any number of grids
+        on the same mesh.
+    """
+
     # Identify elements that are outside interpolation domain or NaN
     outside = (xi < x[0]) + (eta < y[0]) + (xi > x[-1]) + (eta > y[-1])
     outside += numpy.isnan(xi) + numpy.isnan(eta)
@@ -93,23 +124,42 @@ def interpolate2d(x, y, Z, points, mode='linear', bounds_error=False):
         if not max(idy) < len(y):
             raise InaSAFEError(msg)
 
-    # Get the four neighbours for each interpolation point
+    # Get the coordinates of the four neighbours for each interpolation point
     x0 = x[idx - 1]
     x1 = x[idx]
     y0 = y[idy - 1]
     y1 = y[idy]
 
-    z00 = Z[idx - 1, idy - 1]
-    z01 = Z[idx - 1, idy]
-    z10 = Z[idx, idy - 1]
-    z11 = Z[idx, idy]
-
     # Coefficients for weighting between lower and upper bounds
     oldset = numpy.seterr(invalid='ignore')  # Suppress warnings
     alpha = (xi - x0) / (x1 - x0)
     beta = (eta - y0) / (y1 - y0)
     numpy.seterr(**oldset)  # Restore
 
+    return outside, idx, idy, alpha, beta
+
+
+def interpolate_with_weights(Z, weights, mode='linear'):
+    """Interpolate values on a mesh using precomputed weights
+
+    Args:
+        * Z: 2D array of values on the mesh (see interpolate2d)
+        * weights: Weights as returned by get_interpolation_weights
+        * mode: 'linear' or 'constant' (see interpolate2d)
+
+    Returns:
+        * 1D array with interpolated values for each point. Points
+          outside the mesh get NaN.
+    """
+
+    outside, idx, idy, alpha, beta = weights
+
+    # Get the four neighbours for each interpolation point
+    z00 = Z[idx - 1, idy - 1]
+    z01 = Z[idx - 1, idy]
+    z10 = Z[idx, idy - 1]
+    z11 = Z[idx, idy]
+
     if mode == 'linear':
         # Bilinear interpolation formula
         dx = z10 - z00
@@ -148,14 +198,15 @@ def interpolate2d(x, y, Z, points, mode='linear', bounds_error=False):
 
     # Populate result with interpolated values for points inside domain
     # and NaN for values outside
-    r = numpy.zeros(len(points))
-    r[inside] = z
+    r = numpy.zeros(len(outside))
+    r[-outside] = z
     r[outside] = numpy.nan
 
     return r
 
 
-def interpolate_raster(x, y, Z, points, mode='linear', bounds_error=False):
+def interpolate_raster(x, y, Z, points, mode='linear', bounds_error=False,
+                       weights=None):
     """2D interpolation of raster data
 
     It is assumed that data is organised in matrix Z as latitudes from
@@ -165,7 +216,9 @@ def interpolate_raster(x, y, Z, points, mode='linear', bounds_error=False):
     Further it is assumed that x is the vector of longitudes and y the
     vector of latitudes.
 
-    See interpolate2d for details of the interpolation routine
+    See interpolate2d for details of the interpolation routine. Optional
+    weights are as returned by get_interpolation_weights(x, y, xi, eta)
+    where xi and eta are the longitudes and latitudes of points.
     """
 
     # Flip matrix Z up-down to interpret latitudes ordered from south to north
@@ -176,7 +229,8 @@ def interpolate_raster(x, y, Z, points, mode='linear', bounds_error=False):
     Z = Z.transpose()
 
     # Call underlying interpolation routine and return
-    res = interpolate2d(x, y, Z, points, mode=mode, bounds_error=bounds_error)
+    res = interpolate2d(x, y, Z, points, mode=mode, bounds_error=bounds_error,
+                        weights=weights)
     return res
 
 
@@ -0,0 +1,190 @@
+"""**Vectorised operations on many lines**
+
+Lines (e.g. roads) are packed into one array of segments with the index
+of the line each segment belongs to. Densification, splitting and
+length measurement then work on all segments at once and results are
+related back to their lines through these indices rather than through
+copies of per line attributes.
+"""
+
+import numpy
+
+from safe.common.geodesy import great_circle_distances
+from safe.common.utilities import verify
+
+
+def get_segments(lines):
+    """Pack all segments of lines into arrays
+
+    Args:
+        * lines: List of Nx2 arrays of vertices
+
+    Returns:
+        * starts: Mx2 array with the first vertex of each segment
+        * ends: Mx2 array with the second vertex of each segment
+        * line_ids: Array of M indices of the line of each segment
+
+    Segments are ordered by line and along each line. Lines with fewer
+    than two vertices have no segments.
+    """
+
+    arrays = [numpy.asarray(line, dtype='float64').reshape((-1, 2))
+              for line in lines]
+    sizes = numpy.array([len(A) for A in arrays], dtype=int)
+    if numpy.sum(sizes) == 0:
+        return numpy.zeros((0, 2)), numpy.zeros((0, 2)), numpy.zeros(0, int)
+
+    vertices = numpy.concatenate(arrays)
+    vertex_line_ids = numpy.repeat(numpy.arange(len(arrays)), sizes)
+
+    # A segment joins each vertex to the next one on the same line
+    same_line = vertex_line_ids[:-1] == vertex_line_ids[1:]
+    return (vertices[:-1][same_line],
+            vertices[1:][same_line],
+            vertex_line_ids[:-1][same_line])
+
+
+def _get_piece_indices(pieces):
+    """Segment index and step number of each point of pieced segments
+    """
+
+    counts = pieces + 1
+    segment_ids = numpy.repeat(numpy.arange(len(pieces)), counts)
+    first = numpy.cumsum(counts) - counts
+    steps = numpy.arange(numpy.sum(counts)) - first[segment_ids]
+    return segment_ids, steps, first
+
+
+def densify_lines(lines, delta):
+    """Points along lines at regular intervals
+
+    Args:
+        * lines: List of Nx2 arrays of vertices
+        * delta: Distance between points in the units of the coordinates
+
+    Returns:
+        * points: Kx2 array of points
+        * line_ids: Array of K indices of the line of each point
+
+    Note:
+        Points start at the first vertex of each segment and are spaced
+        delta apart along it as long as they do not pass its end. The
+        first point of a segment is left out if it coincides with the
+        last point of the segment before. This is the same as calling
+        points_along_line for each line, but all segments are processed
+        at once.
+    """
+
+    msg = 'Distance between points must be positive. I got %s' % delta
+    verify(delta > 0, msg)
+
+    starts, ends, line_ids = get_segments(lines)
+    if len(starts) == 0:
+        return numpy.zeros((0, 2)), numpy.zeros(0, int)
+
+    vectors = ends - starts
+    lengths = numpy.sqrt(numpy.sum(vectors ** 2, axis=1))
+    pieces = (lengths / delta).astype(int)
+
+    # Unit vectors. Segments of zero length only contribute their start.
+    units = numpy.zeros(vectors.shape)
+    nonzero = lengths > 0
+    units[nonzero] = vectors[nonzero] / lengths[nonzero][:, numpy.newaxis]
+
+    segment_ids, steps, first = _get_piece_indices(pieces)
+    points = (starts[segment_ids] +
+              units[segment_ids] * (steps * delta)[:, numpy.newaxis])
+
+    # Drop the first point of a segment if it repeats the last point of
+    # the segment before on the same line (compared as numpy.allclose)
+    last = starts[:-1] + units[:-1] * (pieces[:-1] * delta)[:, numpy.newaxis]
+    repeated = numpy.all(numpy.abs(starts[1:] - last) <=
+                         1.0e-8 + 1.0e-5 * numpy.abs(last), axis=1)
+    repeated &= line_ids[1:] == line_ids[:-1]
+
+    keep = numpy.ones(len(points), dtype=bool)
+    keep[first[1:][repeated]] = False
+    return points[keep], line_ids[segment_ids[keep]]
+
+
+def split_lines(lines, delta):
+    """Split lines into pieces no longer than delta
+
+    Args:
+        * lines: List of Nx2 arrays of vertices
+        * delta: Maximal length of pieces in the units of the coordinates
+
+    Returns:
+        * starts: Kx2 array with the first point of each piece
+        * ends: Kx2 array with the second point of each piece
+        * line_ids: Array of K indices of the line of each piece
+
+    Note:
+        Each segment is split into the smallest number of pieces of equal
+        length no longer than delta, so the pieces cover the lines exactly.
+    """
+
+    msg = 'Length of pieces must be positive. I got %s' % delta
+    verify(delta > 0, msg)
+
+    starts, ends, line_ids = get_segments(lines)
+    vectors = ends - starts
+    lengths = numpy.sqrt(numpy.sum(vectors ** 2, axis=1))
+    pieces = numpy.maximum(numpy.ceil(lengths / delta).astype(int), 1)
+
+    # One piece for each step of each segment
+    segment_ids, steps, _ = _get_piece_indices(pieces - 1)
+    fractions = steps / pieces[segment_ids].astype(float)
+    step = vectors[segment_ids] / pieces[segment_ids][:, numpy.newaxis]
+
+    piece_starts = (starts[segment_ids] +
+                    vectors[segment_ids] * fractions[:, numpy.newaxis])
+    return piece_starts, piece_starts + step, line_ids[segment_ids]
+
+
+def line_lengths(lines):
+    """Length of each line along the surface of the Earth
+
+    Args:
+        * lines: List of Nx2 arrays of (longitude, latitude) vertices
+
+    Returns:
+        * Array with the length of each line in metres
+    """
+
+    starts, ends, line_ids = get_segments(lines)
+    lengths = great_circle_distances(starts, ends)
+    return numpy.bincount(line_ids, weights=lengths,
+                          minlength=len(lines))[:len(lines)]
+
+
+def lengths_by_class(lengths, classes):
+    """Total length for each class of lines
+
+    Args:
+        * lengths: Sequence of lengths (e.g. flooded length of each line)
+        * classes: Sequence of the same length with the class of each line
+              (e.g. road type). Any hashable value can be a class.
+
+    Returns:
+        * classes: List of classes in order of first appearance
+        * totals: Array with the total length of each class
+    """
+
+    lengths = numpy.asarray(lengths, dtype='float64')
+    msg = ('There must be one class for each length. I got %i lengths and '
+           '%i classes' % (len(lengths), len(classes)))
+    verify(len(lengths) == len(classes), msg)
+
+    lookup = {}
+    names = []
+    codes = numpy.empty(len(classes), dtype=int)
+    for i, value in enumerate(classes):
+        try:
+            codes[i] = lookup[value]
+        except KeyError:
+            lookup[value] = codes[i] = len(names)
+            names.append(value)
+
+    totals = numpy.bincount(codes, weights=lengths, minlength=len(names))
+    return names, totals[:len(names)]
@@ -312,3 +312,22 @@ def geotransform2axes(G, nx, ny):
 
     # Return
     return x, y
+
+
+def block_footprint(A, background=0.0):
+    """Columns of a block holding values other than background
+
+    Args:
+        * A: Two dimensional array. NaN counts as background.
+        * background: Value regarded as empty
+
+    Returns:
+        * None if all of A is background, otherwise the range
+          (first_column, end_column) of columns holding other values
+    """
+
+    occupied = numpy.any((A != background) & ~numpy.isnan(A), axis=0)
+    columns = numpy.nonzero(occupied)[0]
+    if len(columns) == 0:
+        return None
+    return int(columns[0]), int(columns[-1]) + 1
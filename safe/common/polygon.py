@@ -1314,6 +1314,88 @@ def clip_grid_by_polygons(A, geotransform, polygons):
     return points_covered
 
 
+def assign_points_to_polygons(points, polygons, closed=True, bboxes=None,
+                              candidates=None, check_input=True):
+    """Find the polygon containing each point (spatial join).
+
+    Args:
+        * points: Nx2 array of point coordinates
+        * polygons: list of polygon geometry objects or list of polygon arrays
+        * closed: (optional) determine whether points on boundary should be
+              regarded as belonging to the polygon
+        * bboxes: (optional) array with [west, south, east, north] of the
+              outer ring of each polygon. Computed if not given.
+        * candidates: (optional) array of indices of the points to assign.
+              Default is all points.
+        * check_input: (optional) passed on to in_and_outside_polygon
+
+    Returns:
+        polygon_ids: Array of length N with the index of the polygon
+            containing each point or -1 for points outside all polygons
+            (or not among the candidates).
+
+    .. note:: Each polygon only tests the points within its bounding box
+        that no earlier polygon has claimed, so the work is proportional
+        to the number of points near each polygon rather than to the
+        number of points times the number of polygons. If multiple
+        polygons overlap, the one first encountered will be used and
+        points are never counted twice.
+    """
+
+    points = ensure_numeric(points, numpy.float)
+    if len(points.shape) == 1:
+        points = numpy.reshape(points, (-1, 2))
+
+    polygon_ids = -numpy.ones(points.shape[0], dtype=numpy.int)
+
+    # Indices into points of those not yet assigned to a polygon
+    if candidates is None:
+        remaining = numpy.arange(points.shape[0])
+    else:
+        remaining = numpy.asarray(candidates, dtype=numpy.int)
+
+    x = points[:, 0]
+    y = points[:, 1]
+    claimed = numpy.zeros(points.shape[0], dtype=bool)
+    for i, polygon in enumerate(polygons):
+        if len(remaining) == 0:
+            break
+
+        if hasattr(polygon, 'outer_ring'):
+            outer_ring = polygon.outer_ring
+            inner_rings = polygon.inner_rings
+            if len(inner_rings) == 0:
+                inner_rings = None
+        else:
+            # Assume it is an array
+            outer_ring = polygon
+            inner_rings = None
+
+        # Only points within the bounding box can be inside
+        if bboxes is None:
+            ring = ensure_numeric(outer_ring, numpy.float)
+            west, south = numpy.min(ring, axis=0)
+            east, north = numpy.max(ring, axis=0)
+        else:
+            west, south, east, north = bboxes[i]
+        in_bbox = ((x[remaining] >= west) & (x[remaining] <= east) &
+                   (y[remaining] >= south) & (y[remaining] <= north))
+        selected = remaining[in_bbox]
+        if len(selected) == 0:
+            continue
+
+        inside, _ = in_and_outside_polygon(points[selected],
+                                           outer_ring,
+                                           holes=inner_rings,
+                                           closed=closed,
+                                           check_input=check_input)
+        polygon_ids[selected[inside]] = i
+        claimed[selected[inside]] = True
+        remaining = remaining[~claimed[remaining]]
+
+    return polygon_ids
+
+
 def clip_lines_by_polygons(lines, polygons, check_input=True, closed=True):
     """Clip multiple lines by multiple polygons
 
@@ -0,0 +1,136 @@
+import unittest
+import numpy
+
+from safe.common.geodesy import Point, great_circle_distances
+from safe.common.lines import (get_segments, densify_lines, split_lines,
+                               line_lengths, lengths_by_class)
+
+
+def points_along_line_reference(line, delta):
+    """Points along line as computed one segment at a time
+
+    This is the original loop based algorithm which densify_lines must
+    reproduce.
+    """
+
+    V = []
+    for i in range(len(line) - 1):
+        start, end = line[i], line[i + 1]
+        length = numpy.sqrt(numpy.sum((end - start) ** 2))
+        pieces = int(length / delta)
+        points = [start]
+        if pieces > 0:
+            unit = (end - start) / length
+            points = [start + unit * delta * k for k in range(pieces + 1)]
+        if len(V) > 0 and numpy.allclose(V[-1], points[0]):
+            points = points[1:]
+        V.extend(points)
+    return numpy.array(V)
+
+
+class TestLines(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(17)
+        self.lines = [numpy.array([[0, 0], [2, 0]], dtype='float64'),
+                      numpy.array([[168, -2], [170, -2], [170, 0]],
+                                  dtype='float64'),
+                      numpy.array([[5, 5]], dtype='float64'),
+                      numpy.cumsum(numpy.random.uniform(-1, 1, (20, 2)),
+                                   axis=0)]
+
+    def test_get_segments(self):
+        """Segments are packed line by line
+        """
+
+        starts, ends, line_ids = get_segments(self.lines)
+        assert len(starts) == 1 + 2 + 0 + 19
+        assert line_ids.tolist() == [0, 1, 1] + [3] * 19
+        assert numpy.allclose(starts[1:3], self.lines[1][:2])
+        assert numpy.allclose(ends[1:3], self.lines[1][1:])
+
+        starts, ends, line_ids = get_segments([])
+        assert starts.shape == (0, 2)
+        assert len(line_ids) == 0
+
+    def test_densify_lines(self):
+        """Densified lines match points along each line
+        """
+
+        points, line_ids = densify_lines(self.lines[:2], 1)
+        expected = [[0, 0], [1, 0], [2, 0],
+                    [168, -2], [169, -2], [170, -2], [170, -1], [170, 0]]
+        msg = 'Calculated points were %s, expected %s' % (points, expected)
+        assert numpy.allclose(points, expected), msg
+        assert line_ids.tolist() == [0] * 3 + [1] * 5
+
+        for delta in [0.05, 0.3, 1.7]:
+            points, line_ids = densify_lines(self.lines, delta)
+            for i, line in enumerate(self.lines):
+                if len(line) < 2:
+                    assert numpy.sum(line_ids == i) == 0
+                    continue
+                expected = points_along_line_reference(line, delta)
+                assert numpy.allclose(points[line_ids == i], expected)
+
+    def test_split_lines(self):
+        """Pieces cover lines exactly and are no longer than delta
+        """
+
+        for delta in [0.05, 0.3, 1.7]:
+            starts, ends, line_ids = split_lines(self.lines, delta)
+            lengths = numpy.sqrt(numpy.sum((ends - starts) ** 2, axis=1))
+            assert numpy.all(lengths <= delta * (1 + 1.0e-12))
+
+            for i, line in enumerate(self.lines):
+                pieces = line_ids == i
+                if len(line) < 2:
+                    assert numpy.sum(pieces) == 0
+                    continue
+                total = numpy.sum(numpy.sqrt(numpy.sum(
+                    (line[1:] - line[:-1]) ** 2, axis=1)))
+                assert numpy.allclose(numpy.sum(lengths[pieces]), total)
+                assert numpy.allclose(starts[pieces][0], line[0])
+                assert numpy.allclose(ends[pieces][-1], line[-1])
+
+    def test_line_lengths(self):
+        """Line lengths agree with distances between geodesy points
+        """
+
+        road = numpy.array([[106.8, -6.2], [106.9, -6.25], [107.0, -6.1]])
+        lengths = line_lengths([road, road[:2], road[:1]])
+
+        expected = 0
+        for i in range(len(road) - 1):
+            p1 = Point(latitude=road[i, 1], longitude=road[i, 0])
+            p2 = Point(latitude=road[i + 1, 1], longitude=road[i + 1, 0])
+            d = p1.distance_to(p2)
+            assert numpy.allclose(great_circle_distances(road[i:i + 1],
+                                                         road[i + 1:i + 2]),
+                                  d)
+            expected += d
+            if i == 0:
+                assert numpy.allclose(lengths[1], d)
+
+        assert numpy.allclose(lengths[0], expected)
+        assert lengths[2] == 0
+
+    def test_lengths_by_class(self):
+        """Lengths are totalled by class in order of appearance
+        """
+
+        names, totals = lengths_by_class([1.0, 2.0, 3.0, 4.5],
+                                         ['primary', 'track',
+                                          'primary', None])
+        assert names == ['primary', 'track', None]
+        assert numpy.allclose(totals, [4.0, 2.0, 4.5])
+
+        names, totals = lengths_by_class([], [])
+        assert names == []
+        assert len(totals) == 0
+
+
+if __name__ == '__main__':
+    suite = unittest.makeSuite(TestLines, 'test')
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -11,6 +11,7 @@ import numpy
 #from safe.common.numerics import erf
 from safe.common.numerics import axes2points
 from safe.common.numerics import grid2points
+from safe.common.numerics import block_footprint
 #from safe.common.numerics import geotransform2axes
 
 
@@ -76,6 +77,21 @@ class Test_Numerics(unittest.TestCase):
         assert numpy.allclose(P[:L:N, 1], latitudes[::-1])
         assert numpy.allclose(V, A.flat[:])
 
+    def test_block_footprint(self):
+        """Columns holding other than background are found
+        """
+
+        A = numpy.zeros((3, 6))
+        assert block_footprint(A) is None
+
+        A[0, 1] = numpy.nan
+        assert block_footprint(A) is None
+
+        A[2, 2] = 0.5
+        A[1, 4] = -1
+        assert block_footprint(A) == (2, 5)
+        assert block_footprint(A, background=0.5) == (0, 6)
+
 
 if __name__ == '__main__':
     suite = unittest.makeSuite(Test_Numerics, 'test')
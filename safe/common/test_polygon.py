@@ -17,6 +17,7 @@ from safe.common.polygon import (separate_points_by_polygon,
                                  join_line_segments,
                                  clip_line_by_polygon,
                                  clip_grid_by_polygons,
+                                 assign_points_to_polygons,
                                  populate_polygon,
                                  generate_random_points_in_bbox,
                                  PolygonInputError,
@@ -1682,6 +1683,51 @@ class Test_Polygon(unittest.TestCase):
         for i in range(len(lines)):
             assert numpy.allclose(lines[i], segments[i])
 
+    def test_assign_points_to_polygons(self):
+        """Points can be assigned to the polygons containing them
+        """
+
+        # Two overlapping squares and one square with a hole
+        polygons = [[[0, 0], [2, 0], [2, 2], [0, 2]],
+                    [[1, 0], [3, 0], [3, 2], [1, 2]],
+                    Polygon(outer_ring=[[4, 0], [8, 0], [8, 4], [4, 4]],
+                            inner_rings=[[[5, 1], [7, 1], [7, 3], [5, 3]]])]
+        points = [[0.5, 0.5], [1.5, 1.5], [2.5, 0.5], [4.5, 0.5],
+                  [6, 2], [10, 10], [2, 1]]
+
+        ids = assign_points_to_polygons(points, polygons)
+
+        # Overlaps are resolved in favour of the first polygon and
+        # points in holes or outside all polygons get -1
+        assert numpy.all(ids == [0, 0, 1, 2, -1, -1, 0])
+
+        # Agrees with clipping polygon by polygon
+        numpy.random.seed(5)
+        points = numpy.random.uniform(-1, 9, size=(500, 2))
+        ids = assign_points_to_polygons(points, polygons)
+        remaining = numpy.arange(len(points))
+        for i, polygon in enumerate(polygons):
+            if hasattr(polygon, 'outer_ring'):
+                inside, outside = in_and_outside_polygon(
+                    points[remaining], polygon.outer_ring,
+                    holes=polygon.inner_rings)
+            else:
+                inside, outside = in_and_outside_polygon(points[remaining],
+                                                         polygon)
+            assert numpy.all(ids[remaining[inside]] == i)
+            remaining = remaining[outside]
+        assert numpy.all(ids[remaining] == -1)
+
+        # Given bounding boxes and candidates give the same result for
+        # the candidates and -1 for the others
+        bboxes = [[0, 0, 2, 2], [1, 0, 3, 2], [4, 0, 8, 4]]
+        candidates = numpy.arange(0, len(points), 3)
+        ids2 = assign_points_to_polygons(points, polygons, bboxes=bboxes,
+                                         candidates=candidates)
+        assert numpy.all(ids2[candidates] == ids[candidates])
+        others = numpy.setdiff1d(numpy.arange(len(points)), candidates)
+        assert numpy.all(ids2[others] == -1)
+
 if __name__ == '__main__':
     suite = unittest.makeSuite(Test_Polygon, 'test')
     runner = unittest.TextTestRunner(verbosity=2)
@@ -254,19 +254,36 @@ def get_free_memory_win():
     return int(stat.ullAvailPhys / 1024 / 1024)
 
 
-def get_free_memory_linux():
+def get_free_memory_linux(meminfo='/proc/meminfo'):
     """Return current free memory on the machine for linux.
-    Warning : this script is really not robust
-    Return in MB unit
+
+    Reads /proc/meminfo rather than running free, so it is cheap to call
+    e.g. whenever the extent of an analysis changes.
+
+    Input
+        meminfo: File in the format of /proc/meminfo
+
+    Return in MB unit: MemAvailable or, for kernels without it, the sum
+    of MemFree, Buffers and Cached
     """
+    values = {}
+    fid = open(meminfo)
     try:
-        p = Popen('free -m', shell=True, stdout=PIPE)
-        stdout_string = p.communicate()[0].split('\n')[2]
-    except OSError:
-        raise OSError
-    stdout_list = stdout_string.split(' ')
-    stdout_list = [x for x in stdout_list if x != '']
-    return int(stdout_list[3])
+        for line in fid:
+            fields = line.split()
+            if len(fields) >= 2:
+                values[fields[0].rstrip(':')] = int(fields[1])
+    finally:
+        fid.close()
+
+    if 'MemAvailable' in values:
+        kilobytes = values['MemAvailable']
+    else:
+        if 'MemFree' not in values:
+            raise ValueError('No free memory found in %s' % meminfo)
+        kilobytes = (values['MemFree'] + values.get('Buffers', 0) +
+                     values.get('Cached', 0))
+    return int(kilobytes / 1024)
 
 
 def get_free_memory_osx():
@@ -488,9 +505,15 @@ def create_classes(my_list, num_classes):
     It will extend from min and max of elements in my_list. If min == 0,
     it won't be included. The number of classes is equal to num_classes.
     Please see the unit test for this function for more explanation
+
+    my_list may also be a raster layer in which case its cached statistics
+    are used instead of scanning the data (see Raster.get_statistics).
     """
-    min_value = numpy.nanmin(my_list)
-    max_value = numpy.nanmax(my_list)
+    if getattr(my_list, 'is_raster', False):
+        min_value, max_value = my_list.get_extrema()
+    else:
+        min_value = numpy.nanmin(my_list)
+        max_value = numpy.nanmax(my_list)
     print 'min_value, max_value: ', min_value, max_value
     if min_value == 0:
         num_classes += 1
@@ -0,0 +1,371 @@
+"""Aggregation of impact layers by zones
+
+Impact layers are summarised for each polygon of an aggregation layer
+(e.g. districts) without QGIS. Vector impact features are assigned to
+zones in one spatial join and summed or counted by class with grouped
+array operations. Polygons which are summed are split along the zones
+first and their values apportioned by area. Raster impact layers are
+summed over the cells whose centres fall inside each zone, a block of
+rows at a time.
+
+The results are turned into the parameters passed to postprocessors for
+each zone.
+
+If no aggregation layer is given the whole impact layer is treated as
+one zone.
+"""
+
+import numpy
+
+from safe.common.utilities import verify
+from safe.common.polygon import assign_points_to_polygons
+from safe.storage.utilities import (calculate_polygon_centroids,
+                                    calculate_polygon_bounding_boxes)
+from safe.storage.overlay import overlay_polygon_layers, ZONE_ATTRIBUTE
+from safe.impact_functions.utilities import (zone_sums,
+                                             zone_class_counts,
+                                             zone_members)
+from third_party.odict import OrderedDict
+
+# Number of raster rows aggregated at a time
+AGGREGATION_BLOCK_ROWS = 256
+
+# Admissible statistics types (keyword statistics_type of impact layers)
+STATISTICS_TYPES = ['sum', 'class_count']
+
+
+def get_feature_points(layer):
+    """Representative point of each feature of vector layer
+
+    Args:
+        * layer: Point or polygon vector layer
+
+    Returns:
+        * Nx2 array with the point itself for point data and the centroid
+          for polygon data
+
+    Note:
+        Polygons spanning several zones must be split along the zone
+        boundaries first (see overlay_polygon_layers) for their
+        centroids to represent them.
+    """
+
+    msg = ('Only point and polygon layers can be aggregated by zones. '
+           'Layer %s has geometry type %s'
+           % (layer.get_name(), layer.get_geometry_type()))
+    verify(layer.is_point_data or layer.is_polygon_data, msg)
+
+    geometry = layer.get_geometry()
+    if layer.is_point_data:
+        return numpy.array(geometry, dtype='float64').reshape((-1, 2))
+
+    return calculate_polygon_centroids(
+        layer.get_geometry(as_geometry_objects=True))
+
+
+def assign_features_to_zones(layer, zone_layer):
+    """Find the zone of each feature of vector layer
+
+    Args:
+        * layer: Point or polygon vector layer
+        * zone_layer: Polygon vector layer of zones or None
+
+    Returns:
+        * Integer array with the index of the zone of each feature or -1
+          for features outside all zones. If zone_layer is None all
+          features are in zone 0.
+    """
+
+    if zone_layer is None:
+        return numpy.zeros(len(layer), dtype=int)
+
+    msg = ('Aggregation layer %s must be a polygon layer'
+           % zone_layer.get_name())
+    verify(zone_layer.is_polygon_data, msg)
+
+    zones = zone_layer.get_geometry(as_geometry_objects=True)
+    return assign_points_to_polygons(
+        get_feature_points(layer), zones,
+        bboxes=calculate_polygon_bounding_boxes(zones),
+        check_input=False)
+
+
+def aggregate_vector(layer, zone_layer, target_field,
+                     statistics_type='sum', statistics_classes=None):
+    """Aggregate attribute of vector impact layer by zones
+
+    Args:
+        * layer: Point or polygon impact layer
+        * zone_layer: Polygon vector layer of zones or None to aggregate
+              the whole layer into one zone
+        * target_field: Name of the attribute to aggregate
+        * statistics_type: 'sum' to add up the attribute or 'class_count'
+              to count features of each class in each zone
+        * statistics_classes: List of classes counted by 'class_count'
+
+    Returns:
+        * Dictionary with keys
+              zone_ids: Zone of each feature as from
+                  assign_features_to_zones
+              attributes: List with the attribute dictionaries of the
+                  features in each zone
+              sums: List with the sum of the attribute in each zone
+                  (statistics type 'sum' only). Values that are not
+                  numbers are ignored.
+              counts: List with an OrderedDict of counts by class for
+                  each zone (statistics type 'class_count' only)
+
+    Raises:
+        * KeyError with the offending value if a feature in a zone has a
+          class not in statistics_classes
+
+    Note:
+        Polygons which are summed by zones are split along the zones
+        with overlay_polygon_layers and the target field is apportioned
+        by area. Zone ids and attributes are then those of the parts,
+        which are grouped by their ZONE_ATTRIBUTE. Polygons counted by
+        class are assigned to the zone of their centroid.
+    """
+
+    msg = ('Statistics type must be one of %s. I got %s'
+           % (STATISTICS_TYPES, statistics_type))
+    verify(statistics_type in STATISTICS_TYPES, msg)
+
+    attributes = layer.get_data()
+    if len(attributes) > 0:
+        msg = ('Attribute %s was not found in impact layer %s'
+               % (target_field, layer.get_name()))
+        verify(target_field in attributes[0], msg)
+
+    if zone_layer is None:
+        number_of_zones = 1
+    else:
+        number_of_zones = len(zone_layer)
+
+    if (zone_layer is not None and layer.is_polygon_data and
+            statistics_type == 'sum'):
+        # Parts of polygons know their zone and carry their share of
+        # the target field
+        layer = overlay_polygon_layers(layer, zone_layer,
+                                       apportion=[target_field])
+        attributes = layer.get_data()
+        zone_ids = numpy.array([x[ZONE_ATTRIBUTE] for x in attributes],
+                               dtype=int)
+    else:
+        zone_ids = assign_features_to_zones(layer, zone_layer)
+    values = [x[target_field] for x in attributes]
+
+    result = {'zone_ids': zone_ids,
+              'attributes': [[attributes[i] for i in members]
+                             for members in zone_members(zone_ids,
+                                                         number_of_zones)]}
+
+    if statistics_type == 'sum':
+        result['sums'] = zone_sums(zone_ids, values,
+                                   number_of_zones).tolist()
+    else:
+        classes, counts = zone_class_counts(zone_ids, values,
+                                            number_of_zones,
+                                            classes=statistics_classes)
+        result['counts'] = [OrderedDict(zip(classes, x))
+                            for x in counts.tolist()]
+
+    return result
+
+
+def _get_cell_centres(geotransform, window):
+    """Coordinates of the centres of the cells in window of a grid
+
+    Returns:
+        * Array of x for each column and array of y for each row
+    """
+
+    row, column, rows, columns = window
+    x = (geotransform[0] +
+         (column + numpy.arange(columns) + 0.5) * geotransform[1])
+    y = (geotransform[3] +
+         (row + numpy.arange(rows) + 0.5) * geotransform[5])
+    return x, y
+
+
+def aggregate_raster(layer, zone_layer, block_rows=None):
+    """Count, sum and mean of raster impact layer in each zone
+
+    Args:
+        * layer: Raster impact layer
+        * zone_layer: Polygon vector layer of zones or None to aggregate
+              the whole raster into one zone
+        * block_rows: Number of rows read at a time. Default is
+              AGGREGATION_BLOCK_ROWS.
+
+    Returns:
+        * Dictionary with keys count, sum and mean holding lists with the
+          number of valid cells, their sum and their mean in each zone.
+          The mean is NaN in zones without valid cells. Key sums holds
+          the sums as well for use with get_postprocessor_params.
+
+    Note:
+        Cells belong to the first zone containing their centre as with
+        QgsZonalStatistics. Cells without data are ignored. The whole
+        raster is aggregated from its statistics (see
+        Raster.get_statistics) without reading the data again.
+    """
+
+    if block_rows is None:
+        block_rows = AGGREGATION_BLOCK_ROWS
+
+    if zone_layer is None:
+        statistics = layer.get_statistics()
+        counts = numpy.array([statistics['count']])
+        sums = numpy.array([statistics['sum'] * layer.get_scaling_factor()])
+        zones = []
+        number_of_zones = 1
+        windows = []
+    else:
+        msg = ('Aggregation layer %s must be a polygon layer'
+               % zone_layer.get_name())
+        verify(zone_layer.is_polygon_data, msg)
+        zones = zone_layer.get_geometry(as_geometry_objects=True)
+        number_of_zones = len(zones)
+        counts = numpy.zeros(number_of_zones, dtype=int)
+        sums = numpy.zeros(number_of_zones)
+        windows = layer.get_row_blocks(block_rows)
+    bboxes = calculate_polygon_bounding_boxes(zones)
+
+    geotransform = layer.get_geotransform()
+    for window in windows:
+        A = layer.get_data(nan=True, window=window)
+
+        x, y = _get_cell_centres(geotransform, window)
+        X, Y = numpy.meshgrid(x, y)
+        values = A.ravel()
+
+        # Only valid cells are assigned to zones
+        zone_ids = assign_points_to_polygons(
+            numpy.column_stack([X.ravel(), Y.ravel()]), zones,
+            bboxes=bboxes,
+            candidates=numpy.nonzero(~numpy.isnan(values))[0],
+            check_input=False)
+
+        mask = zone_ids >= 0
+        counts += numpy.bincount(zone_ids[mask],
+                                 minlength=number_of_zones)[:number_of_zones]
+        sums += zone_sums(zone_ids, values, number_of_zones)
+
+    means = numpy.empty(number_of_zones)
+    means.fill(numpy.nan)
+    valid = counts > 0
+    means[valid] = sums[valid] / counts[valid]
+
+    return {'count': counts.tolist(),
+            'sum': sums.tolist(),
+            'mean': means.tolist(),
+            'sums': sums.tolist()}
+
+
+def aggregate(layer, zone_layer, target_field=None, statistics_type='sum',
+              statistics_classes=None):
+    """Aggregate impact layer by zones
+
+    Args:
+        * layer: Raster or vector impact layer
+        * zone_layer: Polygon vector layer of zones or None to aggregate
+              the whole layer into one zone
+        * target_field, statistics_type, statistics_classes: See
+              aggregate_vector. They are ignored for raster layers which
+              are always summed.
+
+    Returns:
+        * Dictionary as returned by aggregate_vector or aggregate_raster
+    """
+
+    if layer.is_raster:
+        return aggregate_raster(layer, zone_layer)
+
+    return aggregate_vector(layer, zone_layer, target_field,
+                            statistics_type=statistics_type,
+                            statistics_classes=statistics_classes)
+
+
+def get_postprocessor_params(aggregation, target_field=None,
+                             statistics_type='sum', statistics_classes=None):
+    """General parameters passed to postprocessors for each zone
+
+    Args:
+        * aggregation: Dictionary as returned by aggregate
+        * target_field, statistics_type, statistics_classes: As used for
+              the aggregation
+
+    Returns:
+        * List with one dictionary of parameters for each zone with keys
+          target_field, impact_attrs (None for raster layers) and either
+          impact_total or impact_classes and impact_counts
+    """
+
+    if 'counts' in aggregation:
+        number_of_zones = len(aggregation['counts'])
+    else:
+        number_of_zones = len(aggregation['sums'])
+    attributes = aggregation.get('attributes')
+
+    zones_params = []
+    for i in range(number_of_zones):
+        params = {'target_field': target_field}
+        if statistics_type == 'class_count':
+            params['impact_classes'] = statistics_classes
+            if 'counts' in aggregation:
+                params['impact_counts'] = aggregation['counts'][i]
+        elif statistics_type == 'sum':
+            params['impact_total'] = aggregation['sums'][i]
+
+        if attributes is None:
+            params['impact_attrs'] = None
+        else:
+            params['impact_attrs'] = attributes[i]
+        zones_params.append(params)
+
+    return zones_params
+
+
+def run_postprocessors(postprocessors, zones_params, zone_names,
+                       extra_params=None, zones_extra_params=None):
+    """Run postprocessors on the table of zones
+
+    Args:
+        * postprocessors: Dictionary of postprocessor instances by name
+              as returned by get_postprocessors
+        * zones_params: List of parameters for each zone as returned by
+              get_postprocessor_params
+        * zone_names: List of names of the zones
+        * extra_params: Optional dictionary of parameters for all zones
+              by postprocessor name (e.g. from the impact function)
+        * zones_extra_params: Optional dictionary of lists of parameters
+              for each zone by postprocessor name (e.g. the female ratio
+              of each zone for the Gender postprocessor)
+
+    Returns:
+        * Dictionary by postprocessor name of lists of (zone name,
+          results) pairs
+    """
+
+    msg = ('There must be one zone name for each zone. I got %i names for '
+           '%i zones' % (len(zone_names), len(zones_params)))
+    verify(len(zone_names) == len(zones_params), msg)
+
+    if extra_params is None:
+        extra_params = {}
+    if zones_extra_params is None:
+        zones_extra_params = {}
+
+    output = {}
+    for name, postprocessor in postprocessors.iteritems():
+        table = []
+        for i, general_params in enumerate(zones_params):
+            params = dict(general_params)
+            params.update(extra_params.get(name, {}))
+            if name in zones_extra_params:
+                params.update(zones_extra_params[name][i])
+            table.append(params)
+
+        output[name] = zip(zone_names, postprocessor.process_zones(table))
+    return output
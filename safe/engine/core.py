@@ -1,18 +1,26 @@
 """Computational engine for InaSAFE core.
 
-Provides the function calculate_impact()
+Provides the function calculate_impact() and calculate_impacts() for
+batches of hazard scenarios
 """
 
+import os
+import csv
 import numpy
 
 from safe.storage.projection import Projection
 from safe.storage.projection import DEFAULT_PROJECTION
+from safe.storage.core import read_layer
 from safe.impact_functions.core import extract_layers
 from safe.common.utilities import unique_filename, verify
 from utilities import REQUIRED_KEYWORDS
+from memory import plan_layers, describe_plan
+from interpolation_cache import (interpolation_cache,
+                                 enable_interpolation_cache)
 from datetime import datetime
 from socket import gethostname
 from safe.common.utilities import ugettext as tr
+from third_party.odict import OrderedDict
 import getpass
 
 # The LOGGER is intialised in utilities.py by init
@@ -20,7 +28,7 @@ import logging
 LOGGER = logging.getLogger('InaSAFE')
 
 
-def calculate_impact(layers, impact_fcn):
+def calculate_impact(layers, impact_fcn, write_result=True):
     """Calculate impact levels as a function of list of input layers
 
     Input
@@ -28,9 +36,14 @@ def calculate_impact(layers, impact_fcn):
 
         impact_fcn: Function of the form f(layers)
 
+        write_result: If True (default) the impact layer is written to a
+                      temporary file. If False it is only kept in memory
+                      and can be written later with its write_to_file
+                      method.
+
     Output
-        filename of resulting impact layer (GML). Comment is embedded as
-        metadata. Filename is generated from input data and date.
+        Impact layer. Comment is embedded as metadata. If written, the
+        filename is generated from input data and date.
 
     Note
         The admissible file types are tif and asc/prj for raster and
@@ -50,6 +63,17 @@ def calculate_impact(layers, impact_fcn):
     # Get an instance of the passed impact_fcn
     impact_function = impact_fcn()
 
+    # Functions working blockwise process rasters in blocks of rows that
+    # fit in the available memory
+    plan = plan_layers(impact_function, layers)
+    if plan is not None:
+        LOGGER.debug('Memory plan: %s' % describe_plan(plan))
+        if not plan['feasible']:
+            LOGGER.warning('Analysis may not fit in memory: %s'
+                           % describe_plan(plan))
+        if plan['block_rows'] is not None:
+            impact_function.block_rows = plan['block_rows']
+
     # Start time
     start_time = datetime.now()
 
@@ -104,16 +128,17 @@ def calculate_impact(layers, impact_fcn):
     verify(F is not None, msg)
 
     # Write result and return filename
-    if F.is_raster:
-        extension = '.tif'
-        # use default style for raster
-    else:
-        extension = '.shp'
-        # use default style for vector
+    if write_result:
+        if F.is_raster:
+            extension = '.tif'
+            # use default style for raster
+        else:
+            extension = '.shp'
+            # use default style for vector
 
-    output_filename = unique_filename(suffix=extension)
-    F.filename = output_filename
-    F.write_to_file(output_filename)
+        output_filename = unique_filename(suffix=extension)
+        F.filename = output_filename
+        F.write_to_file(output_filename)
 
     # Establish default name (layer1 X layer1 x impact_function)
     if not F.get_name():
@@ -136,6 +161,175 @@ def calculate_impact(layers, impact_fcn):
     return F
 
 
+def iterate_impacts(hazard_layers, exposure_layer, impact_fcn,
+                    cache_interpolation=False):
+    """Calculate impacts of a sequence of hazard scenarios on one exposure
+
+    Input
+        hazard_layers: Sequence of hazard layers or file names of hazard
+                       layers. File names are read one at a time so only
+                       the current scenario is held in memory.
+
+        exposure_layer: Exposure layer or its file name. It is read once
+                        and shared by all scenarios.
+
+        impact_fcn: Function of the form f(layers)
+
+        cache_interpolation: If True, the interpolation cache is enabled
+                             while the scenarios are run (see
+                             enable_interpolation_cache) so that hazard
+                             layers interpolated before, e.g. when the
+                             same scenarios are run with other impact
+                             functions, are reused.
+
+    Output
+        Generator of impact layers kept in memory (see calculate_impact),
+        one for each hazard layer and in the same order.
+
+    Note
+        Interpolation weights of exposure points in hazard grids are
+        computed once for all scenarios on the same grid (see
+        get_sampling_weights in interpolation.py). Exposure attributes
+        are reset before each scenario as impact functions may add
+        attributes to them.
+    """
+
+    if isinstance(exposure_layer, basestring):
+        exposure_layer = read_layer(exposure_layer)
+
+    original_attributes = None
+    if exposure_layer.is_vector:
+        original_attributes = exposure_layer.get_data(copy=True)
+
+    previous = None
+    if cache_interpolation and interpolation_cache.max_entries == 0:
+        previous = enable_interpolation_cache(
+            cache_dir=interpolation_cache.cache_dir)
+
+    try:
+        for hazard_layer in hazard_layers:
+            if isinstance(hazard_layer, basestring):
+                hazard_layer = read_layer(hazard_layer)
+
+            if original_attributes is not None:
+                # Earlier impacts may share the old attribute dictionaries
+                # so replace rather than modify them
+                exposure_layer.data = [dict(x) for x in original_attributes]
+
+            yield calculate_impact(layers=[hazard_layer, exposure_layer],
+                                   impact_fcn=impact_fcn,
+                                   write_result=False)
+    finally:
+        if previous is not None:
+            enable_interpolation_cache(*previous)
+
+
+def calculate_impacts(hazard_layers, exposure_layer, impact_fcn,
+                      output_dir=None, summary_keywords=None,
+                      cache_interpolation=False):
+    """Calculate and summarise impacts of many hazard scenarios
+
+    Input
+        hazard_layers, exposure_layer, impact_fcn, cache_interpolation:
+            See iterate_impacts
+
+        output_dir: Optional directory. If given, the impact of scenario
+                    n is written there as impact_<n>.tif or impact_<n>.shp
+                    and the summary as summary.csv.
+
+        summary_keywords: Optional list of impact keywords to summarise.
+                          If None, all keywords with numeric values are
+                          included.
+
+    Output
+        Summary table as a list with one OrderedDict per scenario holding
+        the scenario number, hazard (file) name, impact file name (if
+        written) and the selected impact keywords.
+
+    Note
+        Impact layers are not kept in memory. Use iterate_impacts to
+        process them directly.
+    """
+
+    hazard_layers = list(hazard_layers)
+
+    if output_dir is not None and not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    summary = []
+    impacts = iterate_impacts(hazard_layers, exposure_layer, impact_fcn,
+                              cache_interpolation=cache_interpolation)
+    for i, impact in enumerate(impacts):
+        hazard_layer = hazard_layers[i]
+        row = OrderedDict()
+        row['scenario'] = i
+        if isinstance(hazard_layer, basestring):
+            row['hazard'] = hazard_layer
+        else:
+            row['hazard'] = hazard_layer.get_name()
+
+        if output_dir is not None:
+            if impact.is_raster:
+                extension = '.tif'
+            else:
+                extension = '.shp'
+            filename = os.path.join(output_dir,
+                                    'impact_%i%s' % (i, extension))
+            impact.write_to_file(filename)
+            row['impact'] = filename
+
+        keywords = impact.get_keywords()
+        if summary_keywords is None:
+            for key in sorted(keywords):
+                value = keywords[key]
+                if (isinstance(value, (int, long, float, numpy.number))
+                        and not isinstance(value, bool)):
+                    row[key] = value
+        else:
+            for key in summary_keywords:
+                row[key] = keywords.get(key)
+
+        summary.append(row)
+        LOGGER.debug('Scenario %i of %i done' % (i + 1, len(hazard_layers)))
+
+    if output_dir is not None:
+        write_summary_table(summary, os.path.join(output_dir,
+                                                  'summary.csv'))
+
+    return summary
+
+
+def write_summary_table(summary, filename):
+    """Write summary table from calculate_impacts as comma separated values
+
+    Input
+        summary: List of dictionaries, one per row
+        filename: Name of csv file
+
+    Output
+        None
+
+    Note
+        Columns are the union of the keys of all rows in order of first
+        appearance. Missing values are left empty.
+    """
+
+    columns = []
+    for row in summary:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+
+    fid = open(filename, 'wb')
+    try:
+        writer = csv.writer(fid)
+        writer.writerow(columns)
+        for row in summary:
+            writer.writerow([row.get(key, '') for key in columns])
+    finally:
+        fid.close()
+
+
 def check_data_integrity(layer_objects):
     """Check list of layer objects
 
@@ -1,9 +1,10 @@
 import sys
+import numpy
 
 from safe.impact_functions.core import FunctionProvider
 from safe.impact_functions.core import get_hazard_layer, get_exposure_layer
 
-from safe.impact_functions.utilities import Damage_curve
+from safe.impact_functions.utilities import Damage_curve, Damage_curves
 from safe.storage.vector import Vector
 from safe.engine.interpolation import assign_hazard_values_to_exposure_data
 
@@ -40,6 +41,10 @@ struct_damage_curve = {'Double brick': Damage_curve([[-MAXFLOAT, 0.0],
                                                [2.0, 0.955],
                                                [MAXFLOAT, 99.4]])}
 
+# Unknown wall types are taken to be brick veneer
+struct_damage_curves = Damage_curves(struct_damage_curve,
+                                     default='Brick veneer')
+
 contents_damage_curve = Damage_curve([[-MAXFLOAT, 0.0],
                                       [0.0, 0.013],
                                       [0.1, 0.102],
@@ -83,80 +88,61 @@ class TsunamiBuildingLossFunction(FunctionProvider):
 
         # Extract relevant numerical data
         coordinates = E.get_geometry()
-        inundation = H.get_data()
-
-        # Calculate
-        N = len(H)
+        depth = numpy.array(H.get_data('depth'), dtype='float64')
+
+        # FIXME: Get rid of the type casting when
+        #        issue #66 is done
+        number_of_people = numpy.array([int(x) for x in
+                                        E.get_data('NEXIS_PEOP')])
+        wall_types = E.get_data('WALL_TYPE')
+        contents_value = numpy.array(E.get_data('CONT_VALUE'),
+                                     dtype='float64')
+        structure_value = numpy.array(E.get_data('STR_VALUE'),
+                                      dtype='float64')
+
+        #------------------------
+        # Compute people affected
+        #------------------------
+        people_affected = numpy.where((depth > 0.01) & (depth < 1.0),
+                                      number_of_people, 0)
+        people_severely_affected = numpy.where(depth >= 1.0,
+                                               number_of_people, 0)
+
+        #----------------------------------------
+        # Compute impact on buldings and contents
+        #----------------------------------------
+        depth_floor = depth - 0.3  # Adjust for floor height
+        buildings_inundated = numpy.where(depth_floor >= 0.0, 1, 0)
+
+        # Water is deep enough to cause damage where depth_floor is not
+        # negative. NaN depths give NaN damage.
+        structural_damage = struct_damage_curves(depth_floor, wall_types)
+        contents_damage = contents_damage_curve(depth_floor)
+        dry = depth_floor < 0.0
+        structural_damage[dry] = 0.0
+        contents_damage[dry] = 0.0
+
+        #---------------
+        # Compute losses
+        #---------------
+        structural_loss = structural_damage * structure_value
+        contents_loss = contents_damage * contents_value
+
+        #-------
+        # Return
+        #-------
         impact = []
-        for i in range(N):
-
-            #-------------------
-            # Extract parameters
-            #-------------------
-            depth = float(inundation[i]['depth'])
-            #shore_distance = E.get_data('SHORE_DIST', i)
-
-            # FIXME: Get rid of the type casting when
-            #        issue #66 is done
-            number_of_people_in_building = int(E.get_data('NEXIS_PEOP', i))
-            wall_type = E.get_data('WALL_TYPE', i)
-            contents_value = E.get_data('CONT_VALUE', i)
-            structure_value = E.get_data('STR_VALUE', i)
-
-            #------------------------
-            # Compute people affected
-            #------------------------
-            if 0.01 < depth < 1.0:
-                people_affected = number_of_people_in_building
-            else:
-                people_affected = 0
-
-            if depth >= 1.0:
-                people_severely_affected = number_of_people_in_building
-            else:
-                people_severely_affected = 0
-
-            #----------------------------------------
-            # Compute impact on buldings and contents
-            #----------------------------------------
-            depth_floor = depth - 0.3  # Adjust for floor height
-
-            if depth_floor >= 0.0:
-                buildings_inundated = 1
-            else:
-                buildings_inundated = 0
-
-            if depth_floor < 0.0:
-                structural_damage = contents_damage = 0.0
-            else:
-                # Water is deep enough to cause damage
-                if wall_type in struct_damage_curve:
-                    curve = struct_damage_curve[wall_type]
-                else:
-                    # Establish default for unknown wall type
-                    curve = struct_damage_curve['Brick veneer']
-
-                structural_damage = curve(depth_floor)
-                contents_damage = contents_damage_curve(depth_floor)
-
-            #---------------
-            # Compute losses
-            #---------------
-            structural_loss = structural_damage * structure_value
-            contents_loss = contents_damage * contents_value
-
-            #-------
-            # Return
-            #-------
-            impact.append({'NEXIS_PEOP': number_of_people_in_building,
-                           'PEOPLE_AFFECTED': people_affected,
-                           'PEOPLE_SEV_AFFECTED': people_severely_affected,
-                           'STRUCT_INUNDATED': buildings_inundated,
-                           'STRUCT_DAMAGE_fraction': structural_damage,
-                           'CONTENTS_DAMAGE_fraction': contents_damage,
-                           'STRUCT_LOSS_AUD': structural_loss,
-                           'CONTENTS_LOSS_AUD': contents_loss,
-                           'DEPTH': depth})
+        for i in range(len(H)):
+            impact.append({'NEXIS_PEOP': int(number_of_people[i]),
+                           'PEOPLE_AFFECTED': int(people_affected[i]),
+                           'PEOPLE_SEV_AFFECTED':
+                               int(people_severely_affected[i]),
+                           'STRUCT_INUNDATED': int(buildings_inundated[i]),
+                           'STRUCT_DAMAGE_fraction': structural_damage[i],
+                           'CONTENTS_DAMAGE_fraction': contents_damage[i],
+                           'STRUCT_LOSS_AUD': structural_loss[i],
+                           'CONTENTS_LOSS_AUD': contents_loss[i],
+                           'DEPTH': float(depth[i])})
 
         # FIXME (Ole): Need helper to generate new layer using
         #              correct spatial reference
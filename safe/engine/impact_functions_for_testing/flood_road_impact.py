@@ -2,7 +2,7 @@ from safe.impact_functions.core import FunctionProvider
 from safe.impact_functions.core import get_hazard_layer, get_exposure_layer
 from safe.storage.vector import Vector
 from safe.storage.vector import convert_line_to_points
-from safe.engine.interpolation import assign_hazard_values_to_exposure_data
+from safe.common.interpolation2d import interpolate_raster
 
 
 class FloodRoadImpactFunction(FunctionProvider):
@@ -31,19 +31,16 @@ class FloodRoadImpactFunction(FunctionProvider):
         delta = abs(H.get_geotransform()[1]) * 10
         min_value, max_value = H.get_extrema()
 
-        E = convert_line_to_points(R, delta)
+        coordinates, line_ids = convert_line_to_points(R, delta)
 
-        # Interpolate hazard level to building locations
-        H = assign_hazard_values_to_exposure_data(H, E,
-                                             attribute_name='flood_lev')
-
-        # Extract relevant numerical data
-        coordinates = E.get_geometry()
-        depth = H.get_data()
+        # Interpolate hazard level to points along the roads
+        longitudes, latitudes = H.get_geometry()
+        depth = interpolate_raster(longitudes, latitudes,
+                                   H.get_data(nan=True), coordinates)
         N = len(depth)
 
-        # List attributes to carry forward to result layer
-        attributes = E.get_attribute_names()
+        # Attributes of the roads to carry forward to result layer
+        attributes = R.get_data()
 
         #print attributes
         #print 'Number of population points', N
@@ -55,7 +52,7 @@ class FloodRoadImpactFunction(FunctionProvider):
         difference = (max_value - min_value) / num_classes
 
         for i in range(N):
-            dep = float(depth[i]['flood_lev'])
+            dep = float(depth[i])
             affected = classes[0]
             for level in classes:
                 normalized_depth = dep - min_value
@@ -67,9 +64,8 @@ class FloodRoadImpactFunction(FunctionProvider):
             result_dict = {'AFFECTED': affected,
                            'DEPTH': dep}
 
-            # Carry all original attributes forward
-            for key in attributes:
-                result_dict[key] = E.get_data(key, i)
+            # Carry all attributes of the road forward
+            result_dict.update(attributes[line_ids[i]])
 
             # Record result for this feature
             road_impact.append(result_dict)
@@ -79,7 +75,7 @@ class FloodRoadImpactFunction(FunctionProvider):
 
         # Create vector layer and return
         V = Vector(data=road_impact,
-                   projection=E.get_projection(),
+                   projection=R.get_projection(),
                    geometry=coordinates,
                    name='Estimated roads affected',
                    keywords={'impact_summary': impact_summary})
@@ -4,9 +4,11 @@ Provides interpolation functionality to assign values from one layer instance
 to another irrespective of layer types.
 """
 
+import hashlib
 import numpy
 
-from safe.common.interpolation2d import interpolate_raster
+from safe.common.interpolation2d import (interpolate_raster,
+                                         get_interpolation_weights)
 from safe.common.utilities import verify
 from safe.common.utilities import ugettext as tr
 from safe.common.numerics import ensure_numeric
@@ -19,6 +21,15 @@ from safe.storage.vector import Vector, convert_polygons_to_centroids
 from safe.storage.utilities import geometrytype2string
 from safe.storage.utilities import DEFAULT_ATTRIBUTE
 from safe.storage.geometry import Polygon
+from safe.engine.interpolation_cache import (interpolation_cache,
+                                             get_interpolation_key)
+from third_party.odict import OrderedDict
+
+# Interpolation weights of recently used combinations of grid and points.
+# Running several hazard grids against the same exposure points (e.g. with
+# calculate_impacts) only locates the points in the grid once.
+sampling_weights = OrderedDict()
+MAX_SAMPLING_WEIGHTS = 4
 
 
 def assign_hazard_values_to_exposure_data(hazard, exposure,
@@ -100,6 +111,12 @@ def assign_hazard_values_to_exposure_data(hazard, exposure,
         Raster-Line:     N/A
         Raster-Polygon:  Polygon data
         Raster-Raster:   Raster data
+
+        If enabled (see enable_interpolation_cache), results are kept in
+        interpolation_cache so that repeated calls with the same layers
+        and arguments, e.g. while trying different impact function
+        parameters, only copy the earlier result. The returned layer is
+        always a new object.
     """
 
     # Make sure attribute name can be stored in a shapefile
@@ -114,30 +131,44 @@ def assign_hazard_values_to_exposure_data(hazard, exposure,
 
     layer_name, attribute_name = check_inputs(hazard, exposure,
                                               layer_name, attribute_name)
+
+    # Raster-Raster (nothing to interpolate)
+    if hazard.is_raster and exposure.is_raster:
+        return interpolate_raster_raster(hazard, exposure)
+
+    # Reuse earlier result if available
+    key = None
+    if interpolation_cache.max_entries > 0:
+        key = get_interpolation_key(hazard, exposure,
+                                    layer_name, attribute_name, mode)
+        result = interpolation_cache.get(key)
+        if result is not None:
+            return result
+
     # Raster-Vector
     if hazard.is_raster and exposure.is_vector:
-        return interpolate_raster_vector(hazard, exposure,
-                                         layer_name=layer_name,
-                                         attribute_name=attribute_name,
-                                         mode=mode)
-    # Raster-Raster
-    elif hazard.is_raster and exposure.is_raster:
-        return interpolate_raster_raster(hazard, exposure)
+        result = interpolate_raster_vector(hazard, exposure,
+                                           layer_name=layer_name,
+                                           attribute_name=attribute_name,
+                                           mode=mode)
     # Vector-Vector
     elif hazard.is_vector and exposure.is_vector:
-        return interpolate_polygon_vector(hazard, exposure,
-                                          layer_name=layer_name)
+        result = interpolate_polygon_vector(hazard, exposure,
+                                            layer_name=layer_name)
     # Vector-Raster
     elif hazard.is_vector and exposure.is_raster:
-        return interpolate_polygon_raster(hazard, exposure,
-                                          layer_name=layer_name,
-                                          attribute_name=attribute_name)
+        result = interpolate_polygon_raster(hazard, exposure,
+                                            layer_name=layer_name,
+                                            attribute_name=attribute_name)
     # Unknown
     else:
         msg = ('Unknown combination of types for hazard and exposure data. '
                'hazard: %s, exposure: %s' % (str(hazard), str(exposure)))
         raise InaSAFEError(msg)
 
+    interpolation_cache.put(key, result)
+    return result
+
 
 def check_inputs(hazard, exposure, layer_name, attribute_name):
     """Check inputs and establish default values
@@ -405,8 +436,9 @@ def interpolate_raster_vector_points(source, target,
 
     # Create new attribute and interpolate
     try:
+        weights = get_sampling_weights(longitudes, latitudes, coordinates)
         values = interpolate_raster(longitudes, latitudes, A,
-                                    coordinates, mode=mode)
+                                    coordinates, mode=mode, weights=weights)
     except (BoundsError, InaSAFEError), e:
         msg = (tr('Could not interpolate from raster layer %(raster)s to '
                  'vector layer %(vector)s. Error message: %(error)s')
@@ -426,6 +458,47 @@ def interpolate_raster_vector_points(source, target,
                   name=layer_name)
 
 
+def get_sampling_weights(longitudes, latitudes, coordinates):
+    """Get interpolation weights of points in grid reusing earlier ones
+
+    Args:
+        * longitudes, latitudes: Axes of grid as returned by
+              Raster.get_geometry
+        * coordinates: Nx2 array of point coordinates
+
+    Returns:
+        * Weights as returned by get_interpolation_weights or None if
+          the grid axes are not increasing. In that case interpolate_raster
+          will report the error.
+    """
+
+    longitudes = numpy.asarray(longitudes, dtype='d')
+    latitudes = numpy.asarray(latitudes, dtype='d')
+    if (len(longitudes) == 0 or len(latitudes) == 0 or
+            numpy.any(numpy.diff(longitudes) < 0) or
+            numpy.any(numpy.diff(latitudes) < 0)):
+        return None
+
+    digest = hashlib.md5()
+    for A in [longitudes, latitudes, coordinates]:
+        A = numpy.ascontiguousarray(A, dtype='d')
+        digest.update(str(A.shape))
+        digest.update(A.tostring())
+    key = digest.hexdigest()
+
+    if key in sampling_weights:
+        weights = sampling_weights.pop(key)
+    else:
+        weights = get_interpolation_weights(longitudes, latitudes,
+                                            coordinates[:, 0],
+                                            coordinates[:, 1])
+    sampling_weights[key] = weights  # Most recently used is last
+    while len(sampling_weights) > MAX_SAMPLING_WEIGHTS:
+        sampling_weights.pop(sampling_weights.keys()[0])
+
+    return weights
+
+
 def interpolate_polygon_points(source, target,
                                layer_name=None):
     """Interpolate from polygon vector layer to point vector data
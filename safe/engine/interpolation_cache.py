@@ -0,0 +1,349 @@
+"""**Cache of hazard to exposure interpolation results.**
+
+Running the same hazard and exposure layers through an impact function
+with different parameters repeats the interpolation of hazard values to
+the exposure data every time. The cache defined here lets
+assign_hazard_values_to_exposure_data reuse earlier results.
+
+Entries are keyed by a hash of the identity of the input layers (file
+name, modification time and size for layers read from file, content for
+layers held in memory), their georeferencing and keywords and the
+interpolation parameters. The most recently used results are kept in
+memory and, optionally, all results are also stored in a directory.
+
+The cache is disabled unless enabled with enable_interpolation_cache,
+as computing keys and copying results only pays off for callers which
+interpolate the same layers repeatedly.
+"""
+
+import os
+import hashlib
+import cPickle as pickle
+import logging
+
+import numpy
+
+from safe.common.utilities import verify
+from safe.storage.vector import Vector
+from third_party.odict import OrderedDict
+
+LOGGER = logging.getLogger('InaSAFE')
+
+# Change this when the interpolation results change so that entries
+# stored on disk by earlier versions are not used
+CACHE_VERSION = 1
+
+
+class InterpolationCache:
+    """Least recently used cache of interpolated exposure layers
+
+    Args:
+        * max_entries: Maximal number of results kept in memory.
+              Zero disables the cache.
+        * cache_dir: Optional directory where results are also stored.
+              Results found there are reused by later sessions.
+
+    Note:
+        Layers are copied when stored and when retrieved, so callers
+        are free to modify the layers they get.
+    """
+
+    def __init__(self, max_entries=4, cache_dir=None):
+        msg = ('Maximal number of entries must be a non negative integer. '
+               'I got %s' % str(max_entries))
+        verify(isinstance(max_entries, int) and max_entries >= 0, msg)
+
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries or self._disk_path(key) is not None
+
+    def get(self, key):
+        """Get copy of cached layer
+
+        Args:
+            * key: Key as returned by get_interpolation_key
+
+        Returns:
+            * Copy of the cached layer or None if key is not in the cache
+        """
+
+        if key is None or self.max_entries == 0:
+            return None
+
+        if key in self.entries:
+            layer = self.entries.pop(key)
+            self.entries[key] = layer  # Most recently used is last
+        else:
+            layer = self._read(key)
+            if layer is None:
+                self.misses += 1
+                return None
+            self._remember(key, layer)
+
+        self.hits += 1
+        return copy_vector(layer)
+
+    def put(self, key, layer):
+        """Store copy of layer in the cache
+
+        Args:
+            * key: Key as returned by get_interpolation_key
+            * layer: Interpolated vector layer
+
+        Returns:
+            * None
+        """
+
+        if key is None or self.max_entries == 0 or not layer.is_vector:
+            return
+
+        layer = copy_vector(layer)
+        self._remember(key, layer)
+        self._write(key, layer)
+
+    def clear(self):
+        """Remove all results held in memory
+
+        Results stored in cache_dir are not removed.
+        """
+
+        self.entries.clear()
+
+    def _remember(self, key, layer):
+        """Keep layer in memory evicting least recently used entries
+        """
+
+        self.entries.pop(key, None)
+        self.entries[key] = layer
+        while len(self.entries) > self.max_entries:
+            self.entries.pop(self.entries.keys()[0])
+
+    def _disk_path(self, key):
+        """Path of stored result for key or None if there is none
+        """
+
+        if self.cache_dir is None or key is None:
+            return None
+        path = os.path.join(self.cache_dir, '%s.pickle' % key)
+        if os.path.isfile(path):
+            return path
+        return None
+
+    def _read(self, key):
+        """Read stored result for key from cache_dir
+
+        Returns:
+            * Vector layer or None if there is no (readable) result
+        """
+
+        path = self._disk_path(key)
+        if path is None:
+            return None
+
+        try:
+            fid = open(path, 'rb')
+            try:
+                record = pickle.load(fid)
+            finally:
+                fid.close()
+            return Vector(data=record['data'],
+                          geometry=record['geometry'],
+                          geometry_type=record['geometry_type'],
+                          projection=record['projection'],
+                          name=record['name'],
+                          keywords=record['keywords'],
+                          style_info=record['style_info'])
+        except Exception, e:  # pylint: disable=W0703
+            LOGGER.debug('Could not read cached interpolation result %s: %s'
+                         % (path, str(e)))
+            return None
+
+    def _write(self, key, layer):
+        """Store result for key in cache_dir if set
+        """
+
+        if self.cache_dir is None:
+            return
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        record = {'data': layer.get_data(),
+                  'geometry': layer.get_geometry(
+                      as_geometry_objects=layer.is_polygon_data),
+                  'geometry_type': layer.get_geometry_type(),
+                  'projection': layer.get_projection(),
+                  'name': layer.get_name(),
+                  'keywords': layer.get_keywords(),
+                  'style_info': layer.get_style_info()}
+
+        # Write to a temporary file first so that readers never see a
+        # partially written result
+        path = os.path.join(self.cache_dir, '%s.pickle' % key)
+        tmp_path = '%s.%i.tmp' % (path, os.getpid())
+        fid = open(tmp_path, 'wb')
+        try:
+            pickle.dump(record, fid, pickle.HIGHEST_PROTOCOL)
+        finally:
+            fid.close()
+        if os.path.isfile(path):
+            # os.rename does not replace existing files on Windows
+            os.remove(path)
+        os.rename(tmp_path, path)
+
+
+# Number of results kept in memory when the cache is enabled
+DEFAULT_MAX_ENTRIES = 4
+
+# Cache used by assign_hazard_values_to_exposure_data. It is disabled
+# by default as results are only reused when the same layers, read from
+# the same files, are interpolated again. Callers doing that, e.g. the
+# analysis service, enable it with enable_interpolation_cache.
+interpolation_cache = InterpolationCache(max_entries=0)
+
+
+def enable_interpolation_cache(max_entries=DEFAULT_MAX_ENTRIES,
+                               cache_dir=None):
+    """Enable the interpolation cache used by the engine
+
+    Args:
+        * max_entries: Maximal number of results kept in memory. Zero
+              disables the cache again.
+        * cache_dir: Optional directory where results are also stored
+
+    Returns:
+        * Previous (max_entries, cache_dir) so that callers enabling the
+          cache temporarily can restore the settings
+
+    Note:
+        Keys identify layers read from file by file name, modification
+        time and size. Layers read from file must therefore not be
+        modified in memory while the cache is enabled.
+    """
+
+    msg = ('Maximal number of entries must be a non negative integer. '
+           'I got %s' % str(max_entries))
+    verify(isinstance(max_entries, int) and max_entries >= 0, msg)
+
+    previous = (interpolation_cache.max_entries, interpolation_cache.cache_dir)
+    interpolation_cache.max_entries = max_entries
+    interpolation_cache.cache_dir = cache_dir
+    while len(interpolation_cache.entries) > max_entries:
+        interpolation_cache.entries.popitem(0)
+    return previous
+
+
+def copy_vector(layer):
+    """Copy vector layer including name, geometry type and style
+
+    Args:
+        * layer: Vector layer
+
+    Returns:
+        * Deep copy of layer
+    """
+
+    geometry = layer.get_geometry(copy=True,
+                                  as_geometry_objects=layer.is_polygon_data)
+    return Vector(data=layer.get_data(copy=True),
+                  geometry=geometry,
+                  geometry_type=layer.get_geometry_type(),
+                  projection=layer.get_projection(),
+                  name=layer.get_name(),
+                  keywords=layer.get_keywords(),
+                  style_info=layer.get_style_info())
+
+
+def _update_with_array(digest, A):
+    """Add content of array to hash
+    """
+
+    A = numpy.ascontiguousarray(A)
+    digest.update(str(A.dtype))
+    digest.update(str(A.shape))
+    digest.update(A.tostring())
+
+
+def get_layer_identity(layer):
+    """String identifying the content of a layer
+
+    Args:
+        * layer: Raster or vector layer
+
+    Returns:
+        * String that changes whenever the content of layer changes
+
+    Note:
+        Layers read from file are identified by file name, modification
+        time and size as well as the bounding box and attribute names
+        vector layers were read with. Layers held in memory are
+        identified by a hash of their data. In both cases georeferencing
+        and keywords are included.
+    """
+
+    digest = hashlib.md5()
+    digest.update(layer.get_projection())
+    digest.update(repr(sorted(layer.get_keywords().items())))
+
+    if layer.is_raster:
+        digest.update(repr(layer.get_geotransform()))
+        digest.update(repr(getattr(layer, 'band_number', 1)))
+    else:
+        digest.update(repr(layer.get_bounding_box()))
+        digest.update(str(layer.get_geometry_type()))
+
+    filename = layer.get_filename()
+    if filename is not None and os.path.isfile(filename):
+        stat = os.stat(filename)
+        digest.update(repr((os.path.abspath(filename),
+                            layer.sublayer,
+                            getattr(layer, 'read_filter', None),
+                            stat.st_mtime,
+                            stat.st_size)))
+    elif layer.is_raster:
+        _update_with_array(digest, layer.get_data(nan=True, scaling=False))
+    else:
+        for geometry in layer.get_geometry(
+                as_geometry_objects=layer.is_polygon_data):
+            if layer.is_polygon_data:
+                _update_with_array(digest, geometry.outer_ring)
+                for ring in geometry.inner_rings:
+                    _update_with_array(digest, ring)
+            else:
+                _update_with_array(digest, geometry)
+        digest.update(repr(layer.get_data()))
+
+    return digest.hexdigest()
+
+
+def get_interpolation_key(hazard, exposure, layer_name, attribute_name,
+                          mode):
+    """Key of an interpolation result in the cache
+
+    Args:
+        * hazard, exposure, layer_name, attribute_name, mode: Arguments
+              of assign_hazard_values_to_exposure_data with defaults
+              resolved (see check_inputs)
+
+    Returns:
+        * Hexadecimal hash string
+    """
+
+    digest = hashlib.md5()
+    digest.update(repr((CACHE_VERSION,
+                        get_layer_identity(hazard),
+                        get_layer_identity(exposure),
+                        layer_name,
+                        attribute_name,
+                        mode)))
+    return digest.hexdigest()
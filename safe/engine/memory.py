@@ -0,0 +1,355 @@
+"""Memory planning for impact calculations
+
+Each impact function may declare how much memory it uses per raster cell
+as multiples of one double precision value (8 bytes):
+
+    memory_multiple: Peak memory per cell of the part of the grid being
+                     processed at a time
+    resident_multiple: Memory per cell of the whole grid which is kept
+                       while processing (e.g. the impact grid)
+
+Functions which do not declare memory_multiple can have it measured with
+measure_memory_multiple. Otherwise DEFAULT_MEMORY_MULTIPLE is assumed.
+
+Functions which process rasters blockwise declare the class attribute
+block_rows. For those, the planner picks the number of rows processed at
+a time so that the analysis fits in a fraction of the available memory
+and calculate_impact passes it on to the function. Other functions are
+run in one piece and the plan only reports whether they are likely to
+fit.
+"""
+
+import Queue
+import inspect
+import multiprocessing
+
+from safe.common.utilities import get_free_memory, verify
+
+# The LOGGER is intialised in utilities.py by init
+import logging
+LOGGER = logging.getLogger('InaSAFE')
+
+# Bytes per raster cell (numpy arrays are double precision)
+BYTES_PER_CELL = 8
+
+# Multiple assumed for functions which declare none and were not measured
+DEFAULT_MEMORY_MULTIPLE = 4
+
+# Fraction of the available memory an analysis may use
+MEMORY_FRACTION = 0.5
+
+# Multiples measured with measure_memory_multiple by function name
+MEASURED_MULTIPLES = {}
+
+
+def get_available_memory():
+    """Memory available to an analysis in MB
+
+    Output
+        Memory available for new allocations without swapping in MB or
+        None if it can not be determined.
+
+    Note
+        On Linux this reads /proc/meminfo (see get_free_memory_linux)
+        which is cheap enough to do on every call.
+    """
+
+    try:
+        return get_free_memory()
+    except Exception, e:  # pylint: disable=W0703
+        LOGGER.debug('Could not determine free memory: %s' % e)
+        return None
+
+
+def get_memory_multiple(impact_fcn):
+    """Memory multiples of impact function
+
+    Input
+        impact_fcn: Impact function class or instance
+
+    Output
+        memory_multiple, resident_multiple: See module docstring. The
+        declared multiples are used if there are any, otherwise a
+        measured multiple or DEFAULT_MEMORY_MULTIPLE for the whole
+        memory use.
+    """
+
+    multiple = getattr(impact_fcn, 'memory_multiple', None)
+    if multiple is None:
+        # Measured multiples include the resident grids
+        multiple = MEASURED_MULTIPLES.get(function_name(impact_fcn),
+                                          DEFAULT_MEMORY_MULTIPLE)
+        return multiple, 0
+
+    resident = getattr(impact_fcn, 'resident_multiple', None) or 0
+    return multiple, resident
+
+
+def function_name(impact_fcn):
+    """Name of impact function class or instance
+    """
+
+    if inspect.isclass(impact_fcn):
+        return impact_fcn.__name__
+    return impact_fcn.__class__.__name__
+
+
+def get_grid_size(layers):
+    """Dimensions of the largest raster among layers
+
+    Input
+        layers: List of Raster and Vector layers
+
+    Output
+        rows, columns of the raster with the most cells or None if there
+        are no raster layers
+    """
+
+    size = None
+    for layer in layers:
+        if not layer.is_raster:
+            continue
+        if size is None or layer.rows * layer.columns > size[0] * size[1]:
+            size = (layer.rows, layer.columns)
+
+    return size
+
+
+def to_megabytes(cells, multiple):
+    """Memory in MB of cells times multiple double values
+    """
+
+    return float(cells) * multiple * BYTES_PER_CELL / 1024 / 1024
+
+
+def plan_tiles(rows, columns, multiple=DEFAULT_MEMORY_MULTIPLE, resident=0,
+               available=None, max_rows=None, tiled=True,
+               fraction=MEMORY_FRACTION):
+    """Plan processing of grid in blocks of rows that fit in memory
+
+    Input
+        rows, columns: Dimensions of the grid
+        multiple: Peak memory per cell of the block being processed as
+                  multiple of 8 bytes
+        resident: Memory per cell of the whole grid kept while processing
+                  as multiple of 8 bytes
+        available: Available memory in MB. If None, it is read with
+                   get_available_memory.
+        max_rows: Largest number of rows per block. Default is all rows.
+        tiled: If False the grid is planned to be processed in one piece
+        fraction: Fraction of the available memory the analysis may use
+
+    Output
+        Dictionary with the plan:
+            rows, columns: Dimensions of the grid
+            required: Memory in MB needed to process the grid in one piece
+            available: Available memory in MB or None if unknown
+            budget: Memory in MB the analysis may use or None
+            block_rows: Number of rows per block. None if not tiled.
+            tiles: Number of blocks
+            peak: Estimated peak memory in MB with this plan
+            feasible: False if the plan is expected to exceed the budget
+    """
+
+    verify(rows > 0 and columns > 0,
+           'Grid must have rows and columns. Got %s x %s' % (rows, columns))
+    verify(multiple > 0,
+           'Memory multiple must be positive. Got %s' % str(multiple))
+
+    if available is None:
+        available = get_available_memory()
+
+    if max_rows is None:
+        max_rows = rows
+    max_rows = max(1, min(max_rows, rows))
+
+    budget = None
+    if available is not None:
+        budget = available * fraction
+
+    block_rows = None
+    if tiled:
+        block_rows = max_rows
+        if budget is not None:
+            # Rows of a block that fit next to the resident grids
+            spare = budget - to_megabytes(rows * columns, resident)
+            fitting = int(spare / to_megabytes(columns, multiple))
+            block_rows = max(1, min(fitting, max_rows))
+        tiles = (rows + block_rows - 1) // block_rows
+        block_cells = block_rows * columns
+    else:
+        tiles = 1
+        block_cells = rows * columns
+
+    peak = (to_megabytes(block_cells, multiple) +
+            to_megabytes(rows * columns, resident))
+    plan = {'rows': rows,
+            'columns': columns,
+            'required': to_megabytes(rows * columns, multiple + resident),
+            'available': available,
+            'budget': budget,
+            'block_rows': block_rows,
+            'tiles': tiles,
+            'peak': peak,
+            'feasible': budget is None or peak <= budget}
+
+    return plan
+
+
+def plan_memory(impact_fcn, rows, columns, available=None):
+    """Plan memory use of impact function for grid
+
+    Input
+        impact_fcn: Impact function class or instance
+        rows, columns: Dimensions of the largest raster grid
+        available: Available memory in MB. Default is read from system.
+
+    Output
+        Plan as returned by plan_tiles. Functions are tiled if they
+        declare block_rows, which is then the largest block considered.
+    """
+
+    multiple, resident = get_memory_multiple(impact_fcn)
+    max_rows = getattr(impact_fcn, 'block_rows', None)
+
+    return plan_tiles(rows, columns, multiple=multiple, resident=resident,
+                      available=available, max_rows=max_rows,
+                      tiled=max_rows is not None)
+
+
+def plan_layers(impact_fcn, layers, available=None):
+    """Plan memory use of impact function for input layers
+
+    Input
+        impact_fcn: Impact function class or instance
+        layers: List of Raster and Vector layers
+        available: Available memory in MB. Default is read from system.
+
+    Output
+        Plan as returned by plan_tiles or None if there are no rasters
+    """
+
+    size = get_grid_size(layers)
+    if size is None:
+        return None
+
+    return plan_memory(impact_fcn, size[0], size[1], available=available)
+
+
+def describe_plan(plan):
+    """One line description of plan for logs and messages
+    """
+
+    if plan['block_rows'] is None:
+        text = ('%i x %i cells in one piece: about %iMB'
+                % (plan['rows'], plan['columns'], plan['peak']))
+    else:
+        text = ('%i x %i cells in %i tiles of %i rows: about %iMB'
+                % (plan['rows'], plan['columns'], plan['tiles'],
+                   plan['block_rows'], plan['peak']))
+
+    if plan['available'] is None:
+        text += ' (available memory unknown)'
+    else:
+        text += ' of %iMB available' % plan['available']
+
+    return text
+
+
+def _peak_rss():
+    """Peak and current resident memory of this process in bytes
+
+    Output
+        (VmHWM, VmRSS) from /proc/self/status or None on other systems
+    """
+
+    values = {}
+    try:
+        fid = open('/proc/self/status')
+        try:
+            for line in fid:
+                fields = line.split()
+                if fields and fields[0] in ['VmHWM:', 'VmRSS:']:
+                    values[fields[0]] = int(fields[1]) * 1024
+        finally:
+            fid.close()
+    except IOError:
+        return None
+
+    if len(values) < 2:
+        return None
+    return values['VmHWM:'], values['VmRSS:']
+
+
+def _measure(impact_fcn, layers, queue):
+    """Run impact function and put memory it used in bytes on queue
+    """
+
+    try:
+        before = _peak_rss()
+        if before is None:
+            queue.put(None)
+            return
+
+        impact_function = impact_fcn()
+        if getattr(impact_function, 'block_rows', None) is not None:
+            # Measure the whole grid in one block
+            impact_function.block_rows = get_grid_size(layers)[0]
+        impact_function.run(layers)
+
+        after = _peak_rss()
+        queue.put(after[0] - before[1])
+    except Exception, e:  # pylint: disable=W0703
+        queue.put(e)
+
+
+def measure_memory_multiple(impact_fcn, layers):
+    """Measure memory used by impact function per raster cell
+
+    Input
+        impact_fcn: Impact function class
+        layers: List of Raster and Vector layers with at least one raster,
+                preferably small
+
+    Output
+        Peak memory used per cell of the largest raster as multiple of
+        8 bytes, or None if it can not be measured on this system. The
+        result is also kept in MEASURED_MULTIPLES for functions which do
+        not declare memory_multiple.
+
+    Note
+        The function is run in a child process so that the peak memory is
+        not hidden by memory this process used before. Layers should have
+        their data read (e.g. with get_data) before, otherwise reading is
+        counted as well. Functions with declared block_rows are measured
+        processing the whole grid in one block.
+    """
+
+    size = get_grid_size(layers)
+    verify(size is not None,
+           'Memory use can only be measured with raster layers')
+
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure,
+                                      args=(impact_fcn, layers, queue))
+    process.start()
+    used = None
+    while True:
+        try:
+            used = queue.get(timeout=1)
+            break
+        except Queue.Empty:
+            if not process.is_alive():
+                # Child died without answering
+                break
+    process.join()
+
+    if isinstance(used, Exception):
+        raise used
+    if used is None:
+        return None
+
+    multiple = float(used) / (size[0] * size[1] * BYTES_PER_CELL)
+    MEASURED_MULTIPLES[function_name(impact_fcn)] = multiple
+
+    return multiple
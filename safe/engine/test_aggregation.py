@@ -0,0 +1,225 @@
+import unittest
+import numpy
+
+from safe.storage.vector import Vector
+from safe.storage.raster import Raster
+from safe.storage.utilities import calculate_polygon_centroid
+from safe.common.polygon import clip_grid_by_polygons
+from safe.common.polygon import is_inside_polygon
+from safe.postprocessors import get_postprocessors
+from safe.postprocessors.abstract_postprocessor import AbstractPostprocessor
+from safe.engine.aggregation import (aggregate,
+                                     aggregate_vector,
+                                     aggregate_raster,
+                                     get_postprocessor_params,
+                                     run_postprocessors)
+
+
+def square(west, south, east, north):
+    """Closed ring of rectangle
+    """
+
+    return numpy.array([[west, south], [west, north], [east, north],
+                        [east, south], [west, south]], dtype='float64')
+
+
+class Test_Aggregation(unittest.TestCase):
+    """Tests for headless aggregation of impact layers
+    """
+
+    def setUp(self):
+        # Two districts side by side and one further north
+        self.zones = Vector(geometry=[square(0, 0, 1, 1),
+                                     square(1, 0, 2, 1),
+                                     square(0, 1, 2, 2)],
+                            data=[{'name': 'west'},
+                                  {'name': 'east'},
+                                  {'name': 'north'}])
+
+    def test_aggregate_points(self):
+        """Point attributes are summed and counted by zone
+        """
+
+        numpy.random.seed(17)
+        points = numpy.random.uniform(-0.5, 2.5, (200, 2))
+        classes = ['low', 'medium', 'high']
+        data = []
+        for i in range(len(points)):
+            data.append({'population': i,
+                         'category': classes[i % 3]})
+        data[0]['population'] = 'None'
+        layer = Vector(geometry=points, data=data)
+
+        result = aggregate_vector(layer, self.zones, 'population')
+        counts = aggregate_vector(layer, self.zones, 'category',
+                                  statistics_type='class_count',
+                                  statistics_classes=classes)
+
+        # Compare with feature by feature aggregation
+        zones = self.zones.get_geometry()
+        for i, zone in enumerate(zones):
+            total = 0
+            class_counts = dict((x, 0) for x in classes)
+            members = []
+            for j, point in enumerate(points):
+                owner = [k for k in range(i)
+                         if is_inside_polygon(point, zones[k])]
+                if owner or not is_inside_polygon(point, zone):
+                    continue
+                if j > 0:
+                    total += j
+                class_counts[data[j]['category']] += 1
+                members.append(data[j])
+
+            assert numpy.allclose(result['sums'][i], total)
+            assert counts['counts'][i].keys() == classes
+            assert dict(counts['counts'][i]) == class_counts
+            assert result['attributes'][i] == members
+
+        # Points outside all zones are left out
+        outside = numpy.sum(result['zone_ids'] == -1)
+        assert outside == len(points) - sum([len(x) for x in
+                                             result['attributes']])
+
+        # Whole layer as one zone
+        result = aggregate(layer, None, 'population')
+        assert numpy.allclose(result['sums'], [sum(range(1, len(points)))])
+        assert len(result['attributes'][0]) == len(points)
+
+        # Classes not declared are reported
+        try:
+            aggregate_vector(layer, self.zones, 'category',
+                             statistics_type='class_count',
+                             statistics_classes=['low', 'medium'])
+        except KeyError, e:
+            assert e.args[0] == 'high'
+        else:
+            msg = 'Undeclared class should have raised an exception'
+            raise Exception(msg)
+
+    def test_aggregate_polygons(self):
+        """Polygons are split by zones and their values apportioned
+        """
+
+        polygons = [square(0.1, 0.1, 0.3, 0.3),
+                    square(1.2, 0.2, 1.4, 0.9),
+                    square(0.5, 1.5, 1.9, 1.9),
+                    square(3, 3, 4, 4),
+                    square(0.8, 0.2, 1.6, 0.4)]
+        layer = Vector(geometry=polygons,
+                       data=[{'affected': 10, 'category': 'low'},
+                             {'affected': 20, 'category': 'low'},
+                             {'affected': 30, 'category': 'high'},
+                             {'affected': 40, 'category': 'high'},
+                             {'affected': 100, 'category': 'high'}])
+
+        # The last polygon has a quarter of its area in the west zone
+        result = aggregate(layer, self.zones, 'affected')
+        assert numpy.allclose(result['sums'], [35, 95, 30])
+        assert sorted(result['zone_ids'].tolist()) == [-1, 0, 0, 1, 1, 2]
+        parts = result['attributes'][0]
+        assert numpy.allclose([x['affected'] for x in parts], [10, 25])
+        assert numpy.allclose(parts[1]['area_frac'], 0.25)
+
+        # Polygons counted by class are assigned by their centroids
+        result = aggregate(layer, self.zones, 'category',
+                           statistics_type='class_count',
+                           statistics_classes=['low', 'high'])
+        assert result['zone_ids'].tolist() == [0, 1, 2, -1, 1]
+        assert [dict(x) for x in result['counts']] == [
+            {'low': 1, 'high': 0},
+            {'low': 1, 'high': 1},
+            {'low': 0, 'high': 1}]
+
+        for polygon, zone_id in zip(polygons, result['zone_ids']):
+            if zone_id >= 0:
+                zone = self.zones.get_geometry()[zone_id]
+                centroid = calculate_polygon_centroid(polygon)
+                assert is_inside_polygon(centroid, zone)
+
+    def test_aggregate_raster(self):
+        """Raster sums agree with clipping the grid by each zone
+        """
+
+        numpy.random.seed(17)
+        A = numpy.random.uniform(0, 10, (50, 60))
+        A[10:12, 5:50] = numpy.nan
+        geotransform = (-0.5, 0.05, 0, 2.3, 0, -0.05)
+        layer = Raster(A, projection=None, geotransform=geotransform)
+
+        for block_rows in [1, 7, 100]:
+            result = aggregate_raster(layer, self.zones,
+                                      block_rows=block_rows)
+
+            covered = clip_grid_by_polygons(A, geotransform,
+                                            self.zones.get_geometry())
+            for i, (_, values) in enumerate(covered):
+                values = values[~numpy.isnan(values)]
+                assert result['count'][i] == len(values)
+                assert numpy.allclose(result['sum'][i], numpy.sum(values))
+                assert numpy.allclose(result['mean'][i], numpy.mean(values))
+                assert result['sums'][i] == result['sum'][i]
+
+        # The whole raster is aggregated from its statistics
+        assert layer.get_statistics(compute=False) is None
+        result = aggregate(layer, None)
+        assert result['count'] == [numpy.sum(~numpy.isnan(A))]
+        assert numpy.allclose(result['sum'], numpy.nansum(A))
+        assert numpy.allclose(result['mean'], numpy.nanmean(A))
+        assert layer.get_statistics(compute=False) is not None
+
+    def test_postprocessor_params(self):
+        """Aggregation results are passed to postprocessors by zone
+        """
+
+        layer = Vector(geometry=[[0.5, 0.5], [1.5, 0.5], [1.6, 0.5]],
+                       data=[{'population': 100},
+                             {'population': 200},
+                             {'population': 300}])
+        result = aggregate(layer, self.zones, 'population')
+
+        params = get_postprocessor_params(result, target_field='population')
+        assert len(params) == 3
+        assert [x['impact_total'] for x in params] == [100, 500, 0]
+        assert params[1]['impact_attrs'] == layer.get_data()[1:]
+        assert params[0]['target_field'] == 'population'
+
+        postprocessors = get_postprocessors({'Gender': {'on': True}})
+        output = run_postprocessors(
+            postprocessors, params, ['west', 'east', 'north'],
+            zones_extra_params={'Gender': [{'female_ratio': 0.5},
+                                           {'female_ratio': 0.4},
+                                           {'female_ratio': 0.5}]})
+
+        assert [x[0] for x in output['Gender']] == ['west', 'east', 'north']
+        females = [x[1].values()[1]['value'] for x in output['Gender']]
+        assert [int(x) for x in females] == [50, 200, 0]
+
+    def test_postprocessors_by_columns(self):
+        """Postprocessors calculating columns match zone by zone results
+        """
+
+        table = [{'impact_total': 100, 'female_ratio': 0.5,
+                  'youth_ratio': 0.2, 'adult_ratio': 0.7,
+                  'elder_ratio': 0.1},
+                 {'impact_total': 12345.6, 'female_ratio': 0.51},
+                 {'impact_total': 1.0e10, 'female_ratio': 0.4},
+                 {'impact_total': numpy.nan, 'female_ratio': 0.4},
+                 {'impact_total': None, 'female_ratio': 0.4}]
+
+        postprocessors = get_postprocessors({'Gender': {'on': True},
+                                             'Age': {'on': True}})
+        assert len(postprocessors) == 2
+        for postprocessor in postprocessors.values():
+            results = postprocessor.process_zones(table)
+            reference = AbstractPostprocessor.process_zones(postprocessor,
+                                                            table)
+            assert results == reference
+            assert results[0]['Total']['value'] == '100'
+            assert len(results[-1]) == 0
+
+
+if __name__ == '__main__':
+    suite = unittest.makeSuite(Test_Aggregation, 'test')
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
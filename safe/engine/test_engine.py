@@ -3,20 +3,29 @@ import cPickle
 import numpy
 import sys
 import os
+import shutil
 from os.path import join
 
 # Import InaSAFE modules
-from safe.engine.core import calculate_impact
+from safe.engine.core import calculate_impact, calculate_impacts
+from safe.engine import memory
+from safe.engine.memory import plan_layers
 from safe.engine.interpolation import interpolate_polygon_raster
 from safe.engine.interpolation import interpolate_raster_vector_points
 from safe.engine.interpolation import assign_hazard_values_to_exposure_data
 from safe.engine.interpolation import tag_polygons_by_grid
+from safe.engine.interpolation_cache import (InterpolationCache,
+                                             get_interpolation_key,
+                                             interpolation_cache,
+                                             enable_interpolation_cache)
 
 
 from safe.storage.core import read_layer
 from safe.storage.core import write_vector_data
 from safe.storage.core import write_raster_data
 from safe.storage.vector import Vector
+from safe.storage.raster import Raster
+from safe.storage.projection import DEFAULT_PROJECTION
 from safe.storage.utilities import DEFAULT_ATTRIBUTE
 
 from safe.common.polygon import separate_points_by_polygon
@@ -26,8 +35,10 @@ from safe.common.polygon import line_dictionary_to_geometry
 from safe.common.interpolation2d import interpolate_raster
 from safe.common.numerics import normal_cdf, lognormal_cdf, erf, ensure_numeric
 from safe.common.numerics import nanallclose
+from safe.common.lines import line_lengths
 from safe.common.utilities import (VerificationError,
                                    unique_filename,
+                                   temp_dir,
                                    format_int)
 from safe.common.testing import TESTDATA, HAZDATA, EXPDATA
 from safe.common.exceptions import InaSAFEError
@@ -51,6 +62,10 @@ from impact_functions_for_testing import padang_building_impact_model
 from safe.impact_functions.earthquake.pager_earthquake_fatality_model import (
 PAGFatalityFunction)
 # pylint: enable=W0611
+from safe.impact_functions.inundation.flood_road_impact_experimental import (
+    is_flooded)
+from safe.impact_functions.inundation.flood_population_evacuation import (
+    FloodEvacuationFunction)
 
 
 def linear_function(x, y):
@@ -294,6 +309,51 @@ class Test_Engine(unittest.TestCase):
         assert numpy.allclose(fatalities, expected_fatalities,
                               rtol=1.0e-5), msg
 
+    def test_fatality_models_per_mmi_breakdown(self):
+        """Per MMI breakdown of ITB and Pager models match per level sums
+        """
+
+        hazard_filename = '%s/itb_test_mmi.asc' % TESTDATA
+        exposure_filename = '%s/itb_test_pop.asc' % TESTDATA
+        H = read_layer(hazard_filename)
+        E = read_layer(exposure_filename)
+        mmi = H.get_data()
+        population = E.get_data(scaling=True)
+
+        for plugin_name in ['I T B Fatality Function',
+                            'P A G Fatality Function']:
+            IF = get_plugin(plugin_name)
+            impact_layer = calculate_impact(layers=[H, E],
+                                            impact_fcn=IF)
+            keywords = impact_layer.get_keywords()
+
+            # Reference computed one MMI level at a time
+            step = IF.parameters['step']
+            displaced_map = numpy.zeros(mmi.shape)
+            for level in IF.parameters['mmi_range']:
+                I = numpy.where((mmi > level - step) * (mmi <= level + step),
+                                population, 0)
+                F = IF().fatality_rate(level) * I
+                D = IF.parameters['displacement_rate'][level] * I
+                D = numpy.where(D > F, D - F, 0)
+                displaced_map += D
+
+                for key, expected in [('exposed_per_mmi', I),
+                                      ('fatalites_per_mmi', F),
+                                      ('displaced_per_mmi', D)]:
+                    value = keywords[key][level]
+                    msg = ('%s: %s at MMI %s was %f, expected %f'
+                           % (plugin_name, key, level, value,
+                              numpy.nansum(expected.flat)))
+                    assert numpy.allclose(value, numpy.nansum(expected.flat),
+                                          rtol=1.0e-12), msg
+
+            tolerance = IF.parameters['tolerance']
+            displaced_map[displaced_map < tolerance] = numpy.nan
+            msg = 'Displaced population map differs from reference'
+            assert nanallclose(impact_layer.get_data(), displaced_map,
+                               rtol=1.0e-12), msg
+
     def test_ITB_earthquake_fatality_estimation_org(self):
         """Fatalities from ground shaking can be computed correctly
            using the ITB fatality model (Test data from Hadi Ghasemi).
@@ -1057,6 +1117,69 @@ class Test_Engine(unittest.TestCase):
 
     test_data_sources_are_carried_forward.slow = True
 
+    def test_batch_of_scenarios(self):
+        """Impacts of many hazard scenarios can be calculated in one batch
+        """
+
+        hazard_filename = '%s/itb_test_mmi.asc' % TESTDATA
+        exposure_filename = '%s/itb_test_pop.asc' % TESTDATA
+
+        plugin_name = 'I T B Fatality Function'
+        IF = get_plugins(plugin_name)[0][plugin_name]
+
+        # Reference result for one scenario
+        impact_layer = calculate_impact(layers=[read_layer(hazard_filename),
+                                                read_layer(exposure_filename)],
+                                        impact_fcn=IF)
+        fatalities = impact_layer.get_keywords()['total_fatalities']
+
+        # Scenarios given as file names and as layers
+        H = read_layer(hazard_filename)
+        output_dir = temp_dir('batch_test')
+        summary = calculate_impacts([hazard_filename, H],
+                                    exposure_filename, IF,
+                                    output_dir=output_dir,
+                                    summary_keywords=['total_fatalities'])
+
+        assert len(summary) == 2
+        assert summary[0]['hazard'] == hazard_filename
+        assert summary[1]['hazard'] == H.get_name()
+        for i, row in enumerate(summary):
+            assert row['scenario'] == i
+            msg = ('Expected %s fatalities in scenario %i, got %s'
+                   % (fatalities, i, row['total_fatalities']))
+            assert row['total_fatalities'] == fatalities, msg
+            I = read_layer(row['impact'])
+            assert numpy.allclose(float(I.get_keywords()['total_fatalities']),
+                                  fatalities)
+        assert os.path.isfile(os.path.join(output_dir, 'summary.csv'))
+
+        shutil.rmtree(output_dir)
+
+    def test_impact_kept_in_memory(self):
+        """Impact layer can be kept in memory and written later
+        """
+
+        H = read_layer('%s/itb_test_mmi.asc' % TESTDATA)
+        E = read_layer('%s/itb_test_pop.asc' % TESTDATA)
+
+        plugin_name = 'I T B Fatality Function'
+        IF = get_plugins(plugin_name)[0][plugin_name]
+
+        impact_layer = calculate_impact(layers=[H, E],
+                                        impact_fcn=IF,
+                                        write_result=False)
+        assert impact_layer.get_filename() is None
+        assert 'total_fatalities' in impact_layer.get_keywords()
+
+        # Writing it afterwards gives the same layer as the default
+        out_filename = unique_filename(suffix='.tif')
+        impact_layer.write_to_file(out_filename)
+        I = read_layer(out_filename)
+        assert I.get_keywords() == impact_layer.get_keywords()
+        assert numpy.allclose(I.get_data(nan=0.0),
+                              impact_layer.get_data(nan=0.0))
+
     def test_earthquake_damage_schools(self):
         """Lembang building damage from ground shaking works
 
@@ -1542,6 +1665,90 @@ class Test_Engine(unittest.TestCase):
 
     test_interpolation_wrapper.slow = True
 
+    def test_interpolation_cache(self):
+        """Interpolation results are reused for identical inputs
+        """
+
+        A = numpy.arange(20, dtype='float64').reshape((4, 5))
+        H = Raster(data=A, projection=DEFAULT_PROJECTION,
+                   geotransform=(100.0, 1.0, 0, 10.0, 0, -1.0),
+                   name='depth', keywords={'category': 'hazard'})
+        points = [[100.5, 9.5], [101.5, 8.5], [103.5, 6.5]]
+        E = Vector(data=[{'id': i} for i in range(len(points))],
+                   projection=DEFAULT_PROJECTION, geometry=points,
+                   name='points', keywords={'category': 'exposure'})
+
+        cache_dir = temp_dir('interpolation_cache_test')
+        cache = InterpolationCache(max_entries=2, cache_dir=cache_dir)
+        key = get_interpolation_key(H, E, 'points', 'depth', 'linear')
+        assert cache.get(key) is None
+
+        I = assign_hazard_values_to_exposure_data(H, E,
+                                                  attribute_name='depth')
+        cache.put(key, I)
+        assert key in cache
+
+        # Cached layers are copies
+        I.get_data()[0]['depth'] = -1
+        C = cache.get(key)
+        assert C is not I
+        assert C.get_name() == I.get_name()
+        assert numpy.allclose(C.get_data('depth'), [0, 6, 18])
+        assert numpy.allclose(C.get_geometry(), I.get_geometry())
+
+        # Different inputs or arguments give different keys
+        assert key != get_interpolation_key(H, E, 'points', 'depth',
+                                            'constant')
+        E.get_data()[0]['id'] = 10
+        assert key != get_interpolation_key(H, E, 'points', 'depth',
+                                            'linear')
+
+        # Vectors read from the same file with a bounding box or only
+        # some of their attributes give different keys
+        filename = join(TESTDATA, 'test_buildings.shp')
+        V = read_layer(filename)
+        west, south, east, north = V.get_bounding_box()
+        bbox = [west, south, (west + east) / 2, (south + north) / 2]
+        keys = [get_interpolation_key(H, read_layer(filename, **kwargs),
+                                      'points', 'depth', 'linear')
+                for kwargs in [{}, {'bbox': bbox},
+                               {'attribute_names': ['FLOOR_AREA']}]]
+        assert keys[0] == get_interpolation_key(H, V, 'points', 'depth',
+                                                'linear')
+        assert len(set(keys)) == 3
+
+        # Least recently used entries are evicted from memory
+        # but can still be read from cache_dir
+        cache.put('a', I)
+        cache.put('b', I)
+        assert len(cache) == 2
+        assert key not in cache.entries
+        C = InterpolationCache(cache_dir=cache_dir).get(key)
+        assert numpy.allclose(C.get_data('depth'), [0, 6, 18])
+        assert C.get_keywords() == I.get_keywords()
+
+        shutil.rmtree(cache_dir)
+
+        # The cache used by the engine is off unless enabled
+        assert interpolation_cache.max_entries == 0
+        previous = enable_interpolation_cache(max_entries=1)
+        try:
+            E = Vector(data=[{'id': i} for i in range(len(points))],
+                       projection=DEFAULT_PROJECTION, geometry=points,
+                       name='points', keywords={'category': 'exposure'})
+            I1 = assign_hazard_values_to_exposure_data(
+                H, E.copy(), attribute_name='depth')
+            hits = interpolation_cache.hits
+            I2 = assign_hazard_values_to_exposure_data(
+                H, E.copy(), attribute_name='depth')
+            assert interpolation_cache.hits == hits + 1
+            assert I2 is not I1
+            assert numpy.allclose(I2.get_data('depth'), [0, 6, 18])
+        finally:
+            enable_interpolation_cache(*previous)
+        assert interpolation_cache.max_entries == 0
+        assert len(interpolation_cache) == 0
+
     def test_interpolation_functions(self):
         """Interpolation using Raster and Vector objects
         """
@@ -2901,6 +3108,162 @@ class Test_Engine(unittest.TestCase):
 
     test_flood_on_roads.slow = True
 
+    def test_calculate_impact_tiled(self):
+        """Impact functions are run in the planned blocks
+        """
+
+        numpy.random.seed(13)
+        rows, columns = 120, 80
+        depth = numpy.random.uniform(0, 2, (rows, columns))
+        depth[:40] = 0.0
+        depth[50:60, 10:20] = numpy.nan
+        population = numpy.random.uniform(0, 100, (rows, columns))
+        geotransform = (106.7, 0.001, 0, -6.1, 0, -0.001)
+        H = Raster(depth, projection=DEFAULT_PROJECTION,
+                   geotransform=geotransform, name='depth',
+                   keywords={'category': 'hazard', 'subcategory': 'flood',
+                             'unit': 'm'})
+        E = Raster(population, projection=DEFAULT_PROJECTION,
+                   geotransform=geotransform, name='population',
+                   keywords={'category': 'exposure',
+                             'subcategory': 'population'})
+
+        # Untiled reference
+        impact_function = FloodEvacuationFunction()
+        impact_function.block_rows = None
+        reference = impact_function.run([H, E])
+
+        # Memory for blocks of a few rows next to the impact grid
+        plan = plan_layers(FloodEvacuationFunction, [H, E], available=0.4)
+        assert 1 < plan['block_rows'] < rows / 5
+
+        # Record the blocks the function is run with
+        used_block_rows = []
+
+        def tiled_evacuation_function():
+            impact_function = FloodEvacuationFunction()
+            run = impact_function.run
+
+            def recording_run(layers):
+                used_block_rows.append(impact_function.block_rows)
+                return run(layers)
+            impact_function.run = recording_run
+            return impact_function
+
+        get_available_memory = memory.get_available_memory
+        memory.get_available_memory = lambda: 0.4
+        try:
+            impact = calculate_impact([H, E], tiled_evacuation_function,
+                                      write_result=False)
+        finally:
+            memory.get_available_memory = get_available_memory
+
+        assert used_block_rows == [plan['block_rows']]
+        assert numpy.allclose(impact.get_data(), reference.get_data())
+        assert (impact.get_keywords()['impact_summary'] ==
+                reference.get_keywords()['impact_summary'])
+
+    def test_flood_raster_on_roads_experimental(self):
+        """Maumere tsunami depth (raster) impact on roads is correct
+        """
+
+        hazard_filename = join(HAZDATA,
+                               'maumere_aos_depth_20m_land_wgs84.asc')
+        exposure_filename = join(TESTDATA, 'roads_Maumere.shp')
+        plugin_name = 'Flood Road Impact Function Experimental'
+
+        H = read_layer(hazard_filename)
+        H = Raster(data=H.get_data(), projection=H.get_projection(),
+                   geotransform=H.get_geotransform(), name='depth',
+                   keywords={'category': 'hazard',
+                             'subcategory': 'tsunami'})
+        E = read_layer(exposure_filename)
+        E = Vector(data=E.get_data(), projection=E.get_projection(),
+                   geometry=E.get_geometry(),
+                   geometry_type=E.get_geometry_type(), name='roads',
+                   keywords={'category': 'exposure', 'subcategory': 'road'})
+        N = len(E)
+        total_lengths = line_lengths(E.get_geometry())
+
+        plugin_list = get_plugins(plugin_name)
+        assert plugin_list[0].keys()[0] == plugin_name
+        IF = plugin_list[0][plugin_name]
+
+        flooded_lengths = {}
+        for threshold in [0.0, 1.0, 100.0]:
+            impact_function = IF()
+            impact_function.parameters = {'threshold [m]': threshold}
+            I = impact_function.run([H, E])
+
+            msg = 'Expected %i roads, but got %i' % (N, len(I))
+            assert len(I) == N, msg
+            assert I.is_line_data
+            attributes = I.get_data()
+            lengths = numpy.array([x['FLOODED_M'] for x in attributes])
+            inundated = numpy.array([x['INUNDATED'] for x in attributes])
+            assert numpy.alltrue(inundated == (lengths > 0))
+            flooded_lengths[threshold] = lengths
+
+        # With no threshold all of every road is flooded, with a threshold
+        # above the deepest water none
+        assert numpy.allclose(flooded_lengths[0.0], total_lengths,
+                              rtol=1.0e-6)
+        assert numpy.alltrue(flooded_lengths[100.0] == 0)
+
+        lengths = flooded_lengths[1.0]
+        assert numpy.alltrue(lengths <= flooded_lengths[0.0] + 1.0e-6)
+        assert 0 < numpy.sum(lengths) < numpy.sum(total_lengths)
+
+    test_flood_raster_on_roads_experimental.slow = True
+
+    def test_flood_polygon_on_roads_experimental(self):
+        """Maumere tsunami polygon impact on roads is correct
+        """
+
+        hazard_filename = join(TESTDATA, 'tsunami_polygon_WGS84.shp')
+        exposure_filename = join(TESTDATA, 'roads_Maumere.shp')
+        plugin_name = 'Flood Road Impact Function Experimental'
+
+        # Cut down to polygon #799 to make test quick
+        H = read_layer(hazard_filename)
+        H = Vector(data=H.get_data()[799:800],
+                   geometry=H.get_geometry()[799:800],
+                   projection=H.get_projection(), name='tsunami',
+                   keywords={'category': 'hazard',
+                             'subcategory': 'tsunami'})
+        E = read_layer(exposure_filename)
+        E = Vector(data=E.get_data(), projection=E.get_projection(),
+                   geometry=E.get_geometry(),
+                   geometry_type=E.get_geometry_type(), name='roads',
+                   keywords={'category': 'exposure', 'subcategory': 'road'})
+        N = len(E)
+
+        IF = get_plugins(plugin_name)[0][plugin_name]
+        I = IF().run([H, E])
+        assert len(I) == N
+        assert I.is_line_data
+
+        # Expected flooded lengths from the parts of roads in the polygon
+        P = assign_hazard_values_to_exposure_data(H, E)
+        assert len(P) == 14
+        expected = numpy.zeros(N)
+        for attributes, part in zip(P.get_data(), P.get_geometry()):
+            if is_flooded(attributes):
+                i = attributes['parent_line_id']
+                expected[i] += numpy.sum(line_lengths([part]))
+
+        attributes = I.get_data()
+        lengths = numpy.array([x['FLOODED_M'] for x in attributes])
+        inundated = numpy.array([x['INUNDATED'] for x in attributes])
+        assert numpy.allclose(lengths, expected, rtol=1.0e-6)
+        assert numpy.alltrue(inundated == (expected > 0))
+
+        # Only roads running through the polygon can be flooded. Road 131
+        # is one of them (see test_line_interpolation_from_polygons_one_poly)
+        parents = set([x['parent_line_id'] for x in P.get_data()])
+        assert 131 in parents
+        assert numpy.sum(inundated) <= len(parents) < N
+
     def test_erf(self):
         """Test ERF approximation
 
@@ -0,0 +1,184 @@
+import os
+import numpy
+import unittest
+
+from safe.common.utilities import (VerificationError, unique_filename,
+                                   get_free_memory_linux)
+from safe.engine.memory import (plan_tiles, plan_memory, plan_layers,
+                                describe_plan, get_memory_multiple,
+                                measure_memory_multiple,
+                                MEASURED_MULTIPLES,
+                                DEFAULT_MEMORY_MULTIPLE)
+
+
+class Grid:
+    """Stand in for raster layers of given dimensions
+    """
+
+    is_raster = True
+
+    def __init__(self, rows, columns):
+        self.rows = rows
+        self.columns = columns
+
+
+class Points:
+    """Stand in for vector layers
+    """
+
+    is_raster = False
+
+
+class BlockwiseFunction:
+    """Function declaring its memory use and processing blockwise
+    """
+
+    block_rows = 256
+    memory_multiple = 6
+    resident_multiple = 2
+
+
+class AllocatingFunction:
+    """Function allocating 10 doubles per cell of its grid
+    """
+
+    def run(self, layers):
+        grid = layers[0]
+        A = numpy.ones((grid.rows, grid.columns, 10))
+        return A.sum()
+
+
+class Test_Memory(unittest.TestCase):
+    """Tests of memory planning
+    """
+
+    def test_free_memory_linux(self):
+        """Free memory is read from meminfo
+        """
+
+        filename = unique_filename(suffix='.txt')
+        fid = open(filename, 'w')
+        fid.write('MemTotal:        8000000 kB\n'
+                  'MemFree:          102400 kB\n'
+                  'MemAvailable:    2048000 kB\n'
+                  'Buffers:           10240 kB\n'
+                  'Cached:           204800 kB\n')
+        fid.close()
+        assert get_free_memory_linux(filename) == 2000
+
+        # Older kernels without MemAvailable
+        fid = open(filename, 'w')
+        fid.write('MemFree:          102400 kB\n'
+                  'Buffers:           10240 kB\n'
+                  'Cached:           204800 kB\n')
+        fid.close()
+        assert get_free_memory_linux(filename) == 310
+
+        fid = open(filename, 'w')
+        fid.write('MemTotal:        8000000 kB\n')
+        fid.close()
+        self.assertRaises(ValueError, get_free_memory_linux, filename)
+        os.remove(filename)
+
+    def test_plan_tiles(self):
+        """Blocks are sized to fit in the memory budget
+        """
+
+        # 1000 x 1000 cells at 4 doubles per cell is about 30.5MB
+        plan = plan_tiles(1000, 1000, multiple=4, available=1000)
+        assert plan['tiles'] == 1
+        assert plan['block_rows'] == 1000
+        assert plan['feasible']
+        assert numpy.allclose(plan['required'], 30.52, rtol=1.0e-3)
+        assert numpy.allclose(plan['budget'], 500)
+
+        # Only 10MB may be used. Each row takes 4 * 8000 bytes
+        plan = plan_tiles(1000, 1000, multiple=4, available=20)
+        assert plan['block_rows'] == 327
+        assert plan['tiles'] == 4
+        assert plan['peak'] <= plan['budget']
+        assert plan['feasible']
+
+        # Resident grids reduce the memory left for blocks
+        plan = plan_tiles(1000, 1000, multiple=4, resident=1,
+                          available=20)
+        assert plan['block_rows'] == 77
+        assert plan['tiles'] == 13
+        assert plan['feasible']
+
+        # Blocks are never larger than max_rows
+        plan = plan_tiles(1000, 1000, multiple=4, available=1000,
+                          max_rows=256)
+        assert plan['block_rows'] == 256
+        assert plan['tiles'] == 4
+
+        # Analyses that can not fit are still planned
+        plan = plan_tiles(1000, 1000, multiple=4, resident=2, available=20)
+        assert plan['block_rows'] == 1
+        assert not plan['feasible']
+
+        plan = plan_tiles(1000, 1000, multiple=4, available=20, tiled=False)
+        assert plan['block_rows'] is None
+        assert plan['tiles'] == 1
+        assert not plan['feasible']
+
+        # Available memory is read from the system by default
+        plan = plan_tiles(10, 10)
+        assert plan['tiles'] == 1
+        assert plan['feasible']
+
+        self.assertRaises(VerificationError, plan_tiles, 0, 10)
+        self.assertRaises(VerificationError, plan_tiles, 10, 10, 0)
+
+    def test_plan_memory(self):
+        """Impact functions are planned as they declare
+        """
+
+        assert get_memory_multiple(BlockwiseFunction) == (6, 2)
+        assert get_memory_multiple(AllocatingFunction) == (
+            DEFAULT_MEMORY_MULTIPLE, 0)
+
+        plan = plan_memory(BlockwiseFunction, 1000, 1000, available=40)
+        assert plan['block_rows'] == 103
+        assert plan['tiles'] == 10
+
+        plan = plan_memory(BlockwiseFunction(), 1000, 1000,
+                           available=1000)
+        assert plan['block_rows'] == 256
+        assert 'in 4 tiles of 256 rows' in describe_plan(plan)
+
+        plan = plan_memory(AllocatingFunction, 1000, 1000, available=20)
+        assert plan['block_rows'] is None
+        assert 'in one piece' in describe_plan(plan)
+
+        # Largest raster is planned for
+        layers = [Points(), Grid(10, 10), Grid(1000, 1000)]
+        plan = plan_layers(BlockwiseFunction, layers, available=40)
+        assert plan['rows'] == 1000
+        assert plan_layers(BlockwiseFunction, [Points()]) is None
+
+    def test_measure_memory_multiple(self):
+        """Memory use of functions can be measured
+        """
+
+        multiple = measure_memory_multiple(AllocatingFunction,
+                                           [Grid(1000, 1000)])
+        if multiple is None:
+            # Not measurable on this system
+            return
+
+        try:
+            # Allow for the interpreter itself
+            assert 9.5 < multiple < 12, 'Got multiple %f' % multiple
+            assert get_memory_multiple(AllocatingFunction) == (multiple, 0)
+        finally:
+            MEASURED_MULTIPLES.clear()
+
+        self.assertRaises(VerificationError, measure_memory_multiple,
+                          AllocatingFunction, [Points()])
+
+
+if __name__ == '__main__':
+    suite = unittest.makeSuite(Test_Memory, 'test')
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
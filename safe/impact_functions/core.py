@@ -3,20 +3,42 @@
 The design is based on http://effbot.org/zone/metaclass-plugins.htm
 
 To register the plugin, the module must be imported by the Python process
-using it.
+using it. Bundled impact functions are described by a manifest (see
+safe.impact_functions.manifest) so they are only imported when needed.
 """
 
-import numpy
 import logging
 import keyword as python_keywords
-from safe.common.polygon import inside_polygon
+from safe.common.polygon import assign_points_to_polygons
 from safe.common.utilities import ugettext as tr
 from safe.common.tables import Table, TableCell, TableRow
-from utilities import pretty_string, remove_double_spaces
+from utilities import (pretty_string, remove_double_spaces,
+                       zone_sums, zone_class_counts)
+from safe.impact_functions.manifest import (plugin_module_names,
+                                            make_manifest_entry,
+                                            read_manifest,
+                                            write_manifest)
 from third_party.odict import OrderedDict
 
 LOGGER = logging.getLogger('InaSAFE')
 
+# Caches used by the requirements machinery. Requirements are parsed from
+# the plugin doc strings once, compiled once and the outcome of checking
+# them against a given set of keywords is remembered.
+_requirements_cache = {}
+_compiled_requirements = {}
+_requirement_check_cache = {}
+MAX_REQUIREMENT_CHECK_CACHE = 10000
+
+# Some keyword should never go into the requirement check
+# FIXME (Ole): This is not the most robust way. If we get a
+# more general way of doing metadata we can treat impact_summary and
+# many other things separately. See issue #148
+EXCLUDED_KEYWORDS = ['impact_summary']
+
+# Manifest of bundled impact functions ({name: entry}), see get_manifest
+_manifest = None
+
 
 # Disable lots of pylint for this as it is using magic
 # for managing the plugin system devised by Ted Dunstone
@@ -34,6 +56,10 @@ class PluginMount(type):
             # Simply appending it to the list is all that's needed to keep
             # track of it later.
             cls.plugins.append(cls)
+
+            # Parse and compile the requirements once at registration time
+            for requirement in requirements_collect(cls):
+                compile_requirement(requirement)
 # pylint: enable=W0613,C0203
 
 
@@ -54,6 +80,13 @@ class FunctionProvider:
     target_field = 'DAMAGE'
     symbol_field = 'USE_MAJOR'
 
+    # Memory used per raster cell as multiples of 8 bytes and number of
+    # rows processed at a time by functions working blockwise. See
+    # safe.engine.memory
+    memory_multiple = None
+    resident_multiple = 0
+    block_rows = None
+
 
 def get_function_title(func):
     """Get title for impact function
@@ -75,27 +108,144 @@ def get_function_title(func):
     return tr(myTitle)
 
 
+def load_plugins():
+    """Import all bundled impact function modules
+
+    Modules that can not be imported are logged and skipped.
+
+    Output
+        True if all modules were imported, otherwise False
+    """
+
+    all_loaded = True
+    for module_name in plugin_module_names():
+        try:
+            __import__(module_name)
+        except ImportError, e:
+            # Ignore e.g. modules whose dependencies are missing
+            LOGGER.debug('Could not import impact functions from %s: %s'
+                         % (module_name, e))
+            all_loaded = False
+
+    return all_loaded
+
+
+def get_manifest():
+    """Get manifest of bundled impact functions
+
+    The manifest is read from disk if it is up to date. Otherwise all
+    bundled impact functions are imported and the manifest is regenerated.
+
+    Output
+        Dictionary of manifest entries keyed by plugin name
+    """
+
+    global _manifest  # pylint: disable=W0603
+    if _manifest is not None:
+        return _manifest
+
+    entries = read_manifest()
+    if entries is None:
+        all_loaded = load_plugins()
+        module_names = plugin_module_names()
+
+        entries = []
+        for func in FunctionProvider.plugins:
+            if func.__module__ not in module_names:
+                continue
+            entries.append(make_manifest_entry(
+                pretty_function_name(func),
+                func,
+                requirements_collect(func),
+                getattr(func, 'title', pretty_function_name(func))))
+
+        # Only cache complete manifests
+        if all_loaded:
+            write_manifest(entries)
+
+    _manifest = dict([(entry['name'], entry) for entry in entries])
+    return _manifest
+
+
+def _registered_plugins():
+    """Dictionary of impact functions already imported ({name: class})
+    """
+    return dict([(pretty_function_name(p), p)
+                 for p in FunctionProvider.plugins])
+
+
+def _load_plugin_module(name):
+    """Import the module defining the named impact function
+
+    Input
+        name: Plugin name or class name of impact function
+
+    Plugins not listed in the manifest are ignored.
+    """
+
+    for entry in get_manifest().values():
+        if name in [entry['name'], entry['class_name']]:
+            try:
+                __import__(entry['module'])
+            except ImportError, e:
+                LOGGER.debug('Could not import impact function %s from %s: '
+                             '%s' % (name, entry['module'], e))
+            return
+
+
+def get_plugins_metadata():
+    """Get titles and requirements of all impact functions
+
+    This is answered from the manifest and does not import impact
+    function modules that have not been imported already.
+
+    Output
+        Dictionary {name: {'title': title, 'requirements': [...]}}
+    """
+
+    metadata = {}
+    for name, entry in get_manifest().items():
+        metadata[name] = {'title': tr(entry['title']),
+                          'requirements': list(entry['requirements'])}
+
+    # Impact functions registered outside the manifest (e.g. in tests)
+    for name, func in _registered_plugins().items():
+        metadata[name] = {'title': get_function_title(func),
+                          'requirements': requirements_collect(func)}
+
+    return metadata
+
+
 def get_plugins(name=None):
     """Retrieve a list of plugins that match the name you pass
 
        Or all of them if no name is passed.
-    """
 
-    plugins_dict = dict([(pretty_function_name(p), p)
-                         for p in FunctionProvider.plugins])
+       Note that retrieving all plugins imports all impact function
+       modules. Only the relevant module is imported if a name is passed.
+    """
 
     if name is None:
-        return plugins_dict
+        load_plugins()
+        return _registered_plugins()
 
     if isinstance(name, basestring):
+        plugins_dict = _registered_plugins()
         # Add the names
         plugins_dict.update(dict([(p.__name__, p)
                                   for p in FunctionProvider.plugins]))
 
-        msg = ('No plugin named "%s" was found. '
-               'List of available plugins is: %s'
-               % (name, ', '.join(plugins_dict.keys())))
         if name not in plugins_dict:
+            _load_plugin_module(name)
+            plugins_dict = _registered_plugins()
+            plugins_dict.update(dict([(p.__name__, p)
+                                      for p in FunctionProvider.plugins]))
+
+        if name not in plugins_dict:
+            available = set(plugins_dict.keys()) | set(get_manifest().keys())
+            msg = ('No plugin named "%s" was found. '
+                   'List of available plugins is: %s'
+                   % (name, ', '.join(available)))
             raise RuntimeError(msg)
 
         return [{name: plugins_dict[name]}]
@@ -154,89 +304,165 @@ def requirements_collect(func):
                     subcategory in ['flood', 'tsunami'] and \
                     layertype=='raster' and \
                     unit=='m'
+
+    Note
+        The doc string is only parsed once. Subsequent calls for
+        the same doc string are served from a cache.
     """
 
+    if not hasattr(func, '__doc__') or not func.__doc__:
+        return []
+
+    docstr = func.__doc__
+    if docstr in _requirements_cache:
+        return list(_requirements_cache[docstr])
+
     requires_lines = []
-    if hasattr(func, '__doc__') and func.__doc__:
 
-        # Define tag that indentifies requirements expressions
-        require_cmd = ':param requires'
-        indent = len(require_cmd) + 1  # Index where expression starts
+    # Define tag that indentifies requirements expressions
+    require_cmd = ':param requires'
+    indent = len(require_cmd) + 1  # Index where expression starts
 
-        # Collect Python expressions from docstring
-        docstr = func.__doc__
-        for line in docstr.split('\n'):
-            doc_line = line.strip()
+    # Collect Python expressions from docstring
+    for line in docstr.split('\n'):
+        doc_line = line.strip()
 
-            if doc_line.startswith(require_cmd):
-                # Extract expression and remove excessive whitespace
-                expression = ' '.join(doc_line[indent:].split())
-                requires_lines.append(expression)
+        if doc_line.startswith(require_cmd):
+            # Extract expression and remove excessive whitespace
+            expression = ' '.join(doc_line[indent:].split())
+            requires_lines.append(expression)
+
+    _requirements_cache[docstr] = requires_lines
 
     # Return list with one item per requirement
-    return requires_lines
+    return list(requires_lines)
 
 
-def requirement_check(params, require_str, verbose=False):
-    """Checks a dictionary params against the requirements defined
-    in require_str. Require_str must be a valid python expression
-    and evaluate to True or False"""
+def compile_requirement(require_str):
+    """Compile requirement expression to a code object
+
+    Input
+        require_str: Python expression as collected by requirements_collect
+
+    Output
+        Code object that can be evaluated against a keyword namespace or
+        None if the expression is not valid Python.
+
+    Note
+        Compiled expressions are cached so each requirement string
+        is only compiled once.
+    """
+
+    if require_str in _compiled_requirements:
+        return _compiled_requirements[require_str]
+
+    try:
+        code = compile(require_str.strip(), '<requirement>', 'eval')
+    except SyntaxError, e:
+        LOGGER.debug('Requirement %s could not be compiled: %s'
+                     % (require_str, e))
+        code = None
+
+    _compiled_requirements[require_str] = code
+    return code
 
-    # Some keyword should never go into the requirement check
-    # FIXME (Ole): This is not the most robust way. If we get a
-    # more general way of doing metadata we can treat impact_summary and
-    # many other things separately. See issue #148
-    excluded_keywords = ['impact_summary']
 
-    execstr = 'def check():\n'
-    for key in params.keys():
+def requirement_namespace(params):
+    """Convert keyword dictionary to namespace for requirement evaluation
+
+    Input
+        params: Dictionary of layer keywords
+
+    Output
+        Dictionary suitable for evaluating requirements against or None
+        if the keywords can not be used (e.g. a Python keyword was used
+        as a key).
+    """
+
+    namespace = {}
+    for key, value in params.items():
         if key == '':
-            if params[''] != '':
+            if value != '':
                 # This should never happen
                 msg = ('Empty key found in requirements with '
-                       'non-empty value: %s' % params[''])
+                       'non-empty value: %s' % value)
                 raise Exception(msg)
             else:
                 continue
 
         # Check that symbol is not a Python keyword
         if key in python_keywords.kwlist:
-            msg = ('Error in plugin requirements'
-                   'Must not use Python keywords as params: %s' % key)
-            #print msg
-            #logger.error(msg)
-            return False
+            LOGGER.debug('Error in plugin requirements. '
+                         'Must not use Python keywords as params: %s' % key)
+            return None
 
-        if key in excluded_keywords:
+        if key in EXCLUDED_KEYWORDS:
             continue
 
-        if isinstance(params[key], basestring):
-            execstr += '  %s = "%s" \n' % (key.strip(), params[key])
-        else:
-            execstr += '  %s = %s \n' % (key.strip(), params[key])
+        namespace[key.strip()] = value
+
+    return namespace
+
+
+def _keywords_signature(params):
+    """Hashable signature of keyword dictionary used for memoisation
+    """
+
+    return tuple(sorted([(key, repr(value))
+                         for key, value in params.items()
+                         if key not in EXCLUDED_KEYWORDS]))
+
+
+def requirement_check(params, require_str, verbose=False):
+    """Checks a dictionary params against the requirements defined
+    in require_str. Require_str must be a valid python expression
+    and evaluate to True or False
+
+    The expression is compiled once and evaluated with the keywords as
+    namespace. Outcomes are memoised by expression and keywords.
+    """
+
+    signature = (require_str, _keywords_signature(params))
+    if signature in _requirement_check_cache and not verbose:
+        return _requirement_check_cache[signature]
+
+    result = _evaluate_requirement(params, require_str, verbose)
+
+    if len(_requirement_check_cache) > MAX_REQUIREMENT_CHECK_CACHE:
+        _requirement_check_cache.clear()
+    _requirement_check_cache[signature] = result
+
+    return result
+
+
+def _evaluate_requirement(params, require_str, verbose=False):
+    """Evaluate requirement against keywords without using the cache
+    """
 
-    execstr += '  return ' + require_str
+    namespace = requirement_namespace(params)
+    if namespace is None:
+        return False
 
     if verbose:
-        print execstr
+        print 'Requirement: %s' % require_str
+        print 'Keywords: %s' % namespace
+
+    code = compile_requirement(require_str)
+    if code is None:
+        return False
+
     try:
-        # pylint: disable=W0122
-        exec(compile(execstr, '<string>', 'exec'))
-        # pylint: enable=W0122
-
-        # pylint: disable=E0602
-        return check()
-        # pylint: enable=E0602
-    except NameError, e:
+        # pylint: disable=W0123
+        return bool(eval(code, namespace))
+        # pylint: enable=W0123
+    except NameError:
         # This condition will happen frequently since the function
         # is evaled against many params that are not relevant and
         # hence correctly return False
         pass
     except Exception, e:
-        msg = ('Requirements header could not compiled: %s. '
-               'Original message: %s' % (execstr, e))
-        #print msg
-        #logger.error(msg)
+        LOGGER.debug('Requirement %s could not be evaluated against %s. '
+                     'Original message: %s' % (require_str, namespace, e))
 
     return False
 
@@ -395,6 +621,8 @@ def aggregate_point_data(data=None, boundaries=None,
         'count': Dictionary with counts of occurences of each value
                  of attribute_name
 
+        Each point is assigned to at most one polygon (the first one
+        containing it) and all polygons are aggregated in one grouped pass.
     """
 
     msg = ('Input argument "data" must be point type. I got type: %s'
@@ -408,35 +636,27 @@ def aggregate_point_data(data=None, boundaries=None,
         raise Exception(msg)
 
     polygon_geoms = boundaries.get_geometry()
-    #polygon_attrs = boundaries.get_data()
+    number_of_polygons = len(polygon_geoms)
 
-    points = data.get_geometry()
-    attributes = data.get_data()
+    # One spatial join giving the polygon id of each point
+    polygon_ids = assign_points_to_polygons(data.get_geometry(),
+                                            polygon_geoms)
 
-    result = []
-    #for i, polygon in enumerate(polygon_geoms):
-    for polygon in polygon_geoms:
-        indices = inside_polygon(points, polygon)
+    # Extract the attribute column once
+    values = [att[attribute_name] for att in data.get_data()]
 
-        #print 'Found %i points in polygon %i' % (len(indices), i)
-
-        # Aggregate numbers
-        if aggregation_function == 'count':
+    result = []
+    if aggregation_function == 'count':
+        classes, counts = zone_class_counts(polygon_ids, values,
+                                            number_of_polygons)
+        for row in counts:
             bins = {}
-            for att in numpy.take(attributes, indices):
-                val = att[attribute_name]
-
-                # Count occurences of val
-                if val not in bins:
-                    bins[val] = 0
-                bins[val] += 1
+            for value, count in zip(classes, row):
+                if count > 0:
+                    bins[value] = int(count)
             result.append(bins)
-        elif aggregation_function == 'sum':
-            sum_ = 0
-            for att in numpy.take(attributes, indices):
-                val = att[attribute_name]
-                sum_ += val
-            result.append(sum_)
+    elif aggregation_function == 'sum':
+        result = zone_sums(polygon_ids, values, number_of_polygons).tolist()
 
     return result
 
@@ -503,15 +723,15 @@ def get_admissible_plugins(keywords=None):  # , name=None):
     if isinstance(keywords, dict):
         keywords = [keywords]
 
-    # Get all impact functions
-    plugin_dict = get_plugins()
+    # Get requirements of all impact functions without importing them
+    plugins_metadata = get_plugins_metadata()
 
     # Build dictionary of those that match given keywords
     admissible_plugins = {}
-    for f_name, func in plugin_dict.items():
+    for f_name, metadata in plugins_metadata.items():
 
         # Required keywords for func
-        requirelines = requirements_collect(func)
+        requirelines = metadata['requirements']
 
         # Keep impact function if requirements are met for all given keywords
         match = True
@@ -519,7 +739,12 @@ def get_admissible_plugins(keywords=None):  # , name=None):
             if not requirements_met(requirelines, kw_dict):
                 match = False
         if match:
-            admissible_plugins[f_name] = func
+            # Only import the impact functions that are admissible
+            try:
+                admissible_plugins[f_name] = get_plugin(f_name)
+            except RuntimeError, e:
+                LOGGER.debug('Admissible impact function %s could not be '
+                             'loaded: %s' % (f_name, e))
 
     # This is very verbose, but sometimes useful
     # LOGGER.debug(admissible_plugins_to_str(admissible_plugins))
@@ -595,12 +820,11 @@ def get_plugins_as_table(dict_filter=None):
                       header=True)
     table_body.append(header)
 
-    plugins_dict = dict([(pretty_function_name(p), p)
-                         for p in FunctionProvider.plugins])
+    plugins_metadata = get_plugins_metadata()
 
     not_found_value = 'N/A'
-    for key, func in plugins_dict.iteritems():
-        for requirement in requirements_collect(func):
+    for key, metadata in plugins_metadata.iteritems():
+        for requirement in metadata['requirements']:
             dict_found = {'title': False,
                           'id': False,
                           'category': False,
@@ -618,7 +842,7 @@ def get_plugins_as_table(dict_filter=None):
             for myKey in dict_found.iterkeys():
                 myFilter = dict_filter.get(myKey, [])
                 if myKey == 'title':
-                    myValue = str(get_function_title(func))
+                    myValue = str(metadata['title'])
                 elif myKey == 'id':
                     myValue = str(key)
                 else:
@@ -649,7 +873,7 @@ def get_plugins_as_table(dict_filter=None):
 
             if add_row:
                 row = []
-                row.append(TableCell(get_function_title(func), header=True))
+                row.append(TableCell(metadata['title'], header=True))
                 row.append(key)
                 for myKey in atts:
                     myValue = pretty_string(dict_req.get(myKey,
@@ -685,14 +909,13 @@ def get_unique_values():
                    'id': set(),
                    'title': set()}
 
-    plugins_dict = dict([(pretty_function_name(p), p)
-                         for p in FunctionProvider.plugins])
-    for key, func in plugins_dict.iteritems():
-        if not is_function_enabled(func):
+    plugins_metadata = get_plugins_metadata()
+    for key, metadata in plugins_metadata.iteritems():
+        if not requirements_enabled(metadata['requirements']):
             continue
-        dict_retval['title'].add(get_function_title(func))
+        dict_retval['title'].add(metadata['title'])
         dict_retval['id'].add(key)
-        for requirement in requirements_collect(func):
+        for requirement in metadata['requirements']:
             dict_req = parse_single_requirement(str(requirement))
             for key in dict_req.iterkeys():
                 if key not in atts:
@@ -726,12 +949,10 @@ def get_documentation(func):
     retval = OrderedDict()
     retval['unique_identifier'] = func
 
-    plugins_dict = dict([(pretty_function_name(p), p)
-                         for p in FunctionProvider.plugins])
-    if func not in plugins_dict.keys():
+    if func not in get_plugins_metadata():
         return None
     else:
-        func = plugins_dict[func]
+        func = get_plugin(func)
 
     author_tag = ':author'
     rating_tag = ':rating'
@@ -790,7 +1011,15 @@ def is_function_enabled(func):
     :param func:
     :return: False is disabled param is True
     """
-    for requirement in requirements_collect(func):
+    return requirements_enabled(requirements_collect(func))
+
+
+def requirements_enabled(requirements):
+    """Check whether a list of requirements leaves a function enabled
+    :param requirements: List of requirement expressions
+    :return: False if any requirement has disabled param True
+    """
+    for requirement in requirements:
         dict_req = parse_single_requirement(str(requirement))
 
         # If the impact function is disabled, do not show it
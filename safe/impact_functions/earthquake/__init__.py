@@ -1,9 +1,4 @@
-import os
+"""Impact functions in this package are imported on demand.
 
-dirname = os.path.dirname(__file__)
-
-# Import all the subdirectories
-for module in os.listdir(dirname):
-    if module == '__init__.py' or module[-3:] != '.py':
-        continue
-    __import__(module[:-3], locals(), globals())
+See safe.impact_functions.manifest.
+"""
@@ -20,6 +20,40 @@ from safe.common.exceptions import InaSAFEError
 LOGGER = logging.getLogger('InaSAFE')
 
 
+def mmi_bin_membership(mmi_range, step):
+    """Split MMI classes into non-overlapping bins
+
+    Input
+        mmi_range: List of MMI levels. Level mmi covers the interval
+                   (mmi - step, mmi + step]
+        step: Half width of each MMI class
+
+    Output
+        edges: Sorted array of all class boundaries
+        membership: Boolean array of shape (len(mmi_range), len(edges) + 1)
+                    where membership[k, j] is True if bin j, i.e. the
+                    interval (edges[j - 1], edges[j]], is part of level k.
+                    Bins 0 and len(edges) lie outside all levels.
+
+    Note
+        Bin indices for a grid are obtained with
+        numpy.digitize(grid, edges, right=True). Levels may overlap or
+        leave gaps between them.
+    """
+
+    levels = numpy.array(mmi_range, dtype='float64')
+    lower = levels - step
+    upper = levels + step
+    edges = numpy.unique(numpy.concatenate([lower, upper]))
+
+    bin_lower = numpy.concatenate([[-numpy.inf], edges])
+    bin_upper = numpy.concatenate([edges, [numpy.inf]])
+    membership = ((lower[:, numpy.newaxis] <= bin_lower[numpy.newaxis, :]) *
+                  (bin_upper[numpy.newaxis, :] <= upper[:, numpy.newaxis]))
+
+    return edges, membership
+
+
 class ITBFatalityFunction(FunctionProvider):
     """Indonesian Earthquake Fatality Model
 
@@ -165,12 +199,10 @@ class ITBFatalityFunction(FunctionProvider):
         """
         # As per email discussion with Ole, Trevor, Hadi, mmi < 4 will have
         # a fatality rate of 0 - Tim
-        if mmi < 4:
-            return 0
-
         x = self.parameters['x']
         y = self.parameters['y']
-        return numpy.power(10.0, x * mmi - y)
+        return numpy.where(numpy.asarray(mmi) < 4, 0.0,
+                           numpy.power(10.0, x * numpy.asarray(mmi) - y))
 
     def run(self, layers):
         """Indonesian Earthquake Fatality Model
@@ -207,41 +239,47 @@ class ITBFatalityFunction(FunctionProvider):
         number_of_displaced = {}
         number_of_fatalities = {}
 
-        # Calculate fatality rates for observed Intensity values (my_hazard
+        # Digitise MMI grid once into bins and sum up population per bin.
+        # Cells without population data (NaN) count as zero.
+        edges, membership = mmi_bin_membership(mmi_range,
+                                               self.parameters['step'])
+        bin_index = numpy.digitize(my_hazard.ravel(), edges, right=True)
+        population = numpy.where(numpy.isnan(my_exposure), 0, my_exposure)
+        population_per_bin = numpy.bincount(bin_index,
+                                            weights=population.ravel(),
+                                            minlength=membership.shape[1])
+
+        # Calculate fatality and displacement rates for each MMI level
         # based on ITB power model
-        R = numpy.zeros(my_hazard.shape)
-        for mmi in mmi_range:
-            # Identify cells where MMI is in class i and
-            # count population affected by this shake level
-            I = numpy.where(
-                (my_hazard > mmi - self.parameters['step']) * (
-                    my_hazard <= mmi + self.parameters['step']),
-                my_exposure, 0)
-
-            # Calculate expected number of fatalities per level
-            fatality_rate = self.fatality_rate(mmi)
-
-            F = fatality_rate * I
-
-            # Calculate expected number of displaced people per level
+        fatality_rates = self.fatality_rate(numpy.array(mmi_range,
+                                                        dtype='float64'))
+        displacement_rates = numpy.zeros(len(mmi_range))
+        for i, mmi in enumerate(mmi_range):
             try:
-                D = displacement_rate[mmi] * I
+                displacement_rates[i] = displacement_rate[mmi]
             except KeyError, e:
-                msg = 'mmi = %i, I = %s, Error msg: %s' % (mmi, str(I), str(e))
+                msg = ('mmi = %i, no displacement rate defined. '
+                       'Error msg: %s' % (mmi, str(e)))
                 raise InaSAFEError(msg)
 
-            # Adjust displaced people to disregard fatalities.
-            # Set to zero if there are more fatalities than displaced.
-            D = numpy.where(D > F, D - F, 0)
-
-            # Sum up numbers for map
-            R += D   # Displaced
+        # Displaced people disregard fatalities.
+        # Set to zero if there are more fatalities than displaced.
+        net_displacement_rates = numpy.maximum(displacement_rates -
+                                               fatality_rates, 0)
 
+        # Count population affected by each shake level
+        exposed = numpy.dot(membership, population_per_bin)
+        for i, mmi in enumerate(mmi_range):
             # Generate text with result for this study
             # This is what is used in the real time system exposure table
-            number_of_exposed[mmi] = numpy.nansum(I.flat)
-            number_of_displaced[mmi] = numpy.nansum(D.flat)
-            number_of_fatalities[mmi] = numpy.nansum(F.flat)
+            number_of_exposed[mmi] = exposed[i]
+            number_of_fatalities[mmi] = fatality_rates[i] * exposed[i]
+            number_of_displaced[mmi] = net_displacement_rates[i] * exposed[i]
+
+        # Map of displaced people using one lookup table gather
+        displacement_lookup = numpy.dot(net_displacement_rates, membership)
+        R = displacement_lookup[bin_index].reshape(my_hazard.shape)
+        R *= population
 
         # Set resulting layer to NaN when less than a threshold. This is to
         # achieve transparency (see issue #126).
@@ -351,34 +389,13 @@ class ITBFatalityFunction(FunctionProvider):
         impact_summary = Table(table_body).toNewlineFreeString()
         impact_table = impact_summary
 
-        # Create style
-        colours = ['#EEFFEE', '#FFFF7F', '#E15500', '#E4001B', '#730000']
-        classes = create_classes(R.flat[:], len(colours))
-        interval_classes = humanize_class(classes)
-        style_classes = []
-        for i in xrange(len(colours)):
-            style_class = dict()
-            style_class['label'] = create_label(interval_classes[i])
-            style_class['quantity'] = classes[i]
-            if i == 0:
-                transparency = 100
-            else:
-                transparency = 30
-            style_class['transparency'] = transparency
-            style_class['colour'] = colours[i]
-            style_classes.append(style_class)
-
-        style_info = dict(target_field=None,
-                          style_classes=style_classes,
-                          style_type='rasterStyle')
-
         # For printing map purpose
         map_title = tr('Earthquake impact to population')
         legend_notes = tr('Thousand separator is represented by \'.\'')
         legend_units = tr('(people per cell)')
         legend_title = tr('Population density')
 
-        # Create raster object and return
+        # Create raster object
         L = Raster(R,
                    projection=population.get_projection(),
                    geotransform=population.get_geotransform(),
@@ -393,7 +410,28 @@ class ITBFatalityFunction(FunctionProvider):
                              'legend_notes': legend_notes,
                              'legend_units': legend_units,
                              'legend_title': legend_title},
-                   name=tr('Estimated displaced population per cell'),
-                   style_info=style_info)
+                   name=tr('Estimated displaced population per cell'))
+
+        # Create style from the statistics of the impact layer
+        colours = ['#EEFFEE', '#FFFF7F', '#E15500', '#E4001B', '#730000']
+        classes = create_classes(L, len(colours))
+        interval_classes = humanize_class(classes)
+        style_classes = []
+        for i in xrange(len(colours)):
+            style_class = dict()
+            style_class['label'] = create_label(interval_classes[i])
+            style_class['quantity'] = classes[i]
+            if i == 0:
+                transparency = 100
+            else:
+                transparency = 30
+            style_class['transparency'] = transparency
+            style_class['colour'] = colours[i]
+            style_classes.append(style_class)
+
+        style_info = dict(target_field=None,
+                          style_classes=style_classes,
+                          style_type='rasterStyle')
+        L.style_info = style_info
 
         return L
@@ -1,4 +1,3 @@
-import math
 import numpy
 
 from safe.impact_functions.earthquake.itb_earthquake_fatality_model import (
@@ -63,11 +62,14 @@ class PAGFatalityFunction(ITBFatalityFunction):
                                               defaults['ELDER_RATIO']}}})
 
     def fatality_rate(self, mmi):
-        """Pager method to compute fatality rate"""
+        """Pager method to compute fatality rate
 
-        N = math.sqrt(2 * math.pi)
+        mmi can be a single value or an array of MMI levels
+        """
+
+        N = numpy.sqrt(2 * numpy.pi)
         THETA = self.parameters['Theta']
         BETA = self.parameters['Beta']
 
-        x = math.log(mmi / THETA) / BETA
-        return math.exp(-x * x / 2.0) / N
+        x = numpy.log(numpy.asarray(mmi) / THETA) / BETA
+        return numpy.exp(-x * x / 2.0) / N
@@ -11,6 +11,8 @@ from safe.common.utilities import (ugettext as tr,
                                    get_defaults,
                                    round_thousand)
 from safe.common.tables import Table, TableRow
+from safe.impact_functions.utilities import (raster_class_sums,
+                                             DEFAULT_BLOCK_ROWS)
 from third_party.odict import OrderedDict
 
 
@@ -60,6 +62,12 @@ class CategorisedHazardPopulationImpactFunction(FunctionProvider):
                     ('adult_ratio', defaults['ADULT_RATIO']),
                     ('elder_ratio', defaults['ELDER_RATIO'])])})]))])
 
+    # Grids are processed in blocks of rows keeping only the impact grid
+    # in full. calculate_impact sets block_rows to fit in memory
+    block_rows = DEFAULT_BLOCK_ROWS
+    memory_multiple = 6
+    resident_multiple = 2
+
     def run(self, layers):
         """Plugin for impact of population as derived by categorised hazard
 
@@ -88,20 +96,29 @@ class CategorisedHazardPopulationImpactFunction(FunctionProvider):
                                 my_exposure.get_name(),
                                 self)
 
-        # Extract data as numeric arrays
-        C = my_hazard.get_data(nan=0.0)  # Category
-
-        # Calculate impact as population exposed to each category
-        P = my_exposure.get_data(nan=0.0, scaling=True)
-        H = numpy.where(C == high_t, P, 0)
-        M = numpy.where(C > medium_t, P, 0)
-        L = numpy.where(C < low_t, P, 0)
+        # Calculate impact as population exposed to each category in one
+        # pass over the grids. Classes are
+        # 0: C < low_t
+        # 1: low_t <= C <= medium_t
+        # 2: medium_t < C < high_t
+        # 3: C == high_t
+        # 4: C > high_t
+        edges = [low_t,
+                 numpy.nextafter(medium_t, numpy.inf),
+                 high_t,
+                 numpy.nextafter(high_t, numpy.inf)]
+        class_totals, M = raster_class_sums(my_hazard, my_exposure, edges,
+                                            impact_classes=[2, 3, 4],
+                                            block_rows=self.block_rows)
+        sum_high = class_totals[3]
+        sum_medium = numpy.sum(class_totals[2:])
+        sum_low = class_totals[0]
 
         # Count totals
-        total = int(numpy.sum(P))
-        high = int(numpy.sum(H))
-        medium = int(numpy.sum(M)) - int(numpy.sum(H))
-        low = int(numpy.sum(L)) - int(numpy.sum(M))
+        total = int(numpy.sum(class_totals))
+        high = int(sum_high)
+        medium = int(sum_medium) - int(sum_high)
+        low = int(sum_low) - int(sum_medium)
         total_impact = high + medium + low
 
         # Don't show digits less than a 1000
@@ -136,11 +153,22 @@ class CategorisedHazardPopulationImpactFunction(FunctionProvider):
         impact_summary = Table(table_body).toNewlineFreeString()
         map_title = tr('People in high hazard areas')
 
+        # Create raster object
+        R = Raster(M,
+                   projection=my_hazard.get_projection(),
+                   geotransform=my_hazard.get_geotransform(),
+                   name=tr('Population which %s') % get_function_title(self),
+                   keywords={'impact_summary': impact_summary,
+                             'impact_table': impact_table,
+                             'map_title': map_title},
+                   style_info=style_info)
+
         # Generare 8 equidistant classes across the range of flooded population
         # 8 is the number of classes in the predefined flood population style
-        # as imported
-        classes = numpy.linspace(numpy.nanmin(M.flat[:]),
-                                 numpy.nanmax(M.flat[:]), 8)
+        # as imported. The range is taken from the statistics of the impact
+        # layer.
+        min_value, max_value = R.get_extrema()
+        classes = numpy.linspace(min_value, max_value, 8)
 
         # Modify labels in existing flood style to show quantities
         style_classes = style_info['style_classes']
@@ -151,13 +179,4 @@ class CategorisedHazardPopulationImpactFunction(FunctionProvider):
 
         style_info['legend_title'] = tr('Population Density')
 
-        # Create raster object and return
-        R = Raster(M,
-                   projection=my_hazard.get_projection(),
-                   geotransform=my_hazard.get_geotransform(),
-                   name=tr('Population which %s') % get_function_title(self),
-                   keywords={'impact_summary': impact_summary,
-                             'impact_table': impact_table,
-                             'map_title': map_title},
-                   style_info=style_info)
         return R
@@ -17,6 +17,8 @@ from safe.common.utilities import (
     create_classes,
     create_label)
 from safe.common.tables import Table, TableRow
+from safe.impact_functions.utilities import (raster_class_sums,
+                                             DEFAULT_BLOCK_ROWS)
 
 
 class FloodEvacuationFunction(FunctionProvider):
@@ -82,6 +84,12 @@ class FloodEvacuationFunction(FunctionProvider):
                     ('adult_ratio', defaults['ADULT_RATIO']),
                     ('elder_ratio', defaults['ELDER_RATIO'])])})]))])
 
+    # Grids are processed in blocks of rows keeping only the impact grid
+    # in full. calculate_impact sets block_rows to fit in memory
+    block_rows = DEFAULT_BLOCK_ROWS
+    memory_multiple = 6
+    resident_multiple = 2
+
     def run(self, layers):
         """Risk plugin for flood population evacuation
 
@@ -114,25 +122,24 @@ class FloodEvacuationFunction(FunctionProvider):
         verify(isinstance(thresholds, list),
                'Expected thresholds to be a list. Got %s' % str(thresholds))
 
-        # Extract data as numeric arrays
-        D = my_hazard.get_data(nan=0.0)  # Depth
+        verify(thresholds == sorted(thresholds),
+               'Expected thresholds to be increasing. Got %s'
+               % str(thresholds))
 
-        # Calculate impact as population exposed to depths > max threshold
-        P = my_exposure.get_data(nan=0.0, scaling=True)
+        # Calculate population exposed to each band of depths between
+        # thresholds and the impact as population exposed to depths
+        # exceeding the max threshold in one pass over the grids
+        # (class i is thresholds[i - 1] <= depth < thresholds[i])
+        class_totals, my_impact = raster_class_sums(
+            my_hazard, my_exposure, thresholds,
+            impact_classes=[len(thresholds)],
+            block_rows=self.block_rows)
 
         # Calculate impact to intermediate thresholds
         counts = []
-        for i, lo in enumerate(thresholds):
-            if i == len(thresholds) - 1:
-                # The last threshold
-                my_impact = M = numpy.where(D >= lo, P, 0)
-            else:
-                # Intermediate thresholds
-                hi = thresholds[i + 1]
-                M = numpy.where((D >= lo) * (D < hi), P, 0)
-
+        for val in class_totals[1:]:
             # Count
-            val = int(numpy.sum(M))
+            val = int(val)
 
             # Don't show digits less than a 1000
             val = round_thousand(val)
@@ -140,7 +147,7 @@ class FloodEvacuationFunction(FunctionProvider):
 
         # Count totals
         evacuated = counts[-1]
-        total = int(numpy.sum(P))
+        total = int(numpy.sum(class_totals))
         # Don't show digits less than a 1000
         total = round_thousand(total)
 
@@ -208,10 +215,28 @@ class FloodEvacuationFunction(FunctionProvider):
         impact_summary = Table(table_body).toNewlineFreeString()
         impact_table = impact_summary
 
-        # Create style
+        # For printing map purpose
+        map_title = tr('People in need of evacuation')
+        legend_notes = tr('Thousand separator is represented by \'.\'')
+        legend_units = tr('(people per cell)')
+        legend_title = tr('Population density')
+
+        # Create raster object
+        R = Raster(my_impact,
+                   projection=my_hazard.get_projection(),
+                   geotransform=my_hazard.get_geotransform(),
+                   name=tr('Population which %s') % get_function_title(self),
+                   keywords={'impact_summary': impact_summary,
+                             'impact_table': impact_table,
+                             'map_title': map_title,
+                             'legend_notes': legend_notes,
+                             'legend_units': legend_units,
+                             'legend_title': legend_title})
+
+        # Create style from the statistics of the impact layer
         colours = ['#FFFFFF', '#38A800', '#79C900', '#CEED00',
                    '#FFCC00', '#FF6600', '#FF0000', '#7A0000']
-        classes = create_classes(my_impact.flat[:], len(colours))
+        classes = create_classes(R, len(colours))
         interval_classes = humanize_class(classes)
         style_classes = []
         for i in xrange(len(colours)):
@@ -238,22 +263,5 @@ class FloodEvacuationFunction(FunctionProvider):
                           style_classes=style_classes,
                           style_type='rasterStyle')
 
-        # For printing map purpose
-        map_title = tr('People in need of evacuation')
-        legend_notes = tr('Thousand separator is represented by \'.\'')
-        legend_units = tr('(people per cell)')
-        legend_title = tr('Population density')
-
-        # Create raster object and return
-        R = Raster(my_impact,
-                   projection=my_hazard.get_projection(),
-                   geotransform=my_hazard.get_geotransform(),
-                   name=tr('Population which %s') % get_function_title(self),
-                   keywords={'impact_summary': impact_summary,
-                             'impact_table': impact_table,
-                             'map_title': map_title,
-                             'legend_notes': legend_notes,
-                             'legend_units': legend_units,
-                             'legend_title': legend_title},
-                   style_info=style_info)
+        R.style_info = style_info
         return R
@@ -1,8 +1,8 @@
-import numpy
 from third_party.odict import OrderedDict
 from safe.impact_functions.core import (
     FunctionProvider, get_hazard_layer, get_exposure_layer, get_question)
 from safe.storage.vector import Vector
+from safe.storage.raster_expression import lazy
 from safe.common.utilities import (
     ugettext as tr,
     format_int,
@@ -184,7 +184,7 @@ class FloodEvacuationFunctionVectorHazard(FunctionProvider):
                      self.parameters['evacuation_percentage']
                      / 100.0)
 
-        total = int(numpy.sum(my_exposure.get_data(nan=0, scaling=False)))
+        total = int(lazy(my_exposure, nan=0, scaling=False).sum())
 
         # Don't show digits less than a 1000
         total = round_thousand(total)
@@ -1,91 +1,151 @@
+import numpy
+from third_party.odict import OrderedDict
+
 from safe.impact_functions.core import FunctionProvider
 from safe.impact_functions.core import get_hazard_layer, get_exposure_layer
 from safe.impact_functions.core import get_question
 from safe.storage.vector import Vector
-from safe.common.utilities import ugettext as tr
+from safe.storage.utilities import DEFAULT_ATTRIBUTE
+from safe.common.utilities import ugettext as tr, format_int
 from safe.common.tables import Table, TableRow
+from safe.common.interpolation2d import interpolate_raster
+from safe.common.geodesy import great_circle_distances
+from safe.common.lines import (get_segments, split_lines,
+                               line_lengths, lengths_by_class)
 from safe.engine.interpolation import assign_hazard_values_to_exposure_data
 
+# Attributes naming the type of roads, tried in this order
+ROAD_TYPE_ATTRIBUTES = ['TYPE', 'type', 'highway']
+
+
+def is_flooded(attributes):
+    """Whether a road segment inside a flood polygon is flooded
+
+    Input
+        attributes: Attributes of the segment joined with those of the
+                    polygon it lies in
+
+    Output
+        True if attribute FLOODPRONE is 'yes' or else attribute affected
+        is true. If the polygon has neither attribute, all roads inside it
+        are flooded.
+    """
+
+    if 'FLOODPRONE' in attributes:
+        res = attributes['FLOODPRONE']
+        return res is not None and res.lower() == 'yes'
+
+    for key in ['Affected', 'affected']:
+        if key in attributes:
+            res = attributes[key]
+            return res is not None and bool(res)
+
+    return bool(attributes.get(DEFAULT_ATTRIBUTE, False))
+
 
 class FloodRoadImpactFunctionExperimental(FunctionProvider):
     """Inundation impact on road data (experimental)
 
     :param requires category=='hazard' and \
-                    subcategory in ['flood', 'tsunami'] and \
-                    layertype=='vector and \
-                    disabled=='True'
+                    subcategory in ['flood', 'tsunami']
 
     :param requires category=='exposure' and \
                     subcategory=='road' and \
-                    layertype=='vector and \
-                    disabled=='True'
+                    layertype=='vector'
     """
 
     target_field = 'INUNDATED'
-    title = tr('Be flooded')
+    length_field = 'FLOODED_M'
+    title = tr('Be inundated')
+
+    parameters = OrderedDict([('threshold [m]', 1.0)])
 
     def run(self, layers):
-        """Flood impact to buildings (e.g. from Open Street Map)
+        """Flooded length of roads
+
+        Roads are split into pieces. With a raster hazard each piece is no
+        longer than a grid cell and flooded if the depth at its middle
+        reaches the threshold. With a polygon hazard the pieces are the
+        parts of roads inside flood polygons. Lengths are measured along
+        the surface of the Earth and added up for each road and each type
+        of road.
         """
 
         # Extract data
         H = get_hazard_layer(layers)    # Depth
-        E = get_exposure_layer(layers)  # Building locations
+        E = get_exposure_layer(layers)  # Road lines
 
         question = get_question(H.get_name(),
                                 E.get_name(),
                                 self)
 
-        # Interpolate hazard level to building locations
-        I = assign_hazard_values_to_exposure_data(H, E)
-
-        # Extract relevant exposure data
-        #attribute_names = I.get_attribute_names()
-        attributes = I.get_data()
-        N = len(I)
-
-        # Calculate road impact
-        count = 0
-        #flooded_distance = 0
+        lines = E.get_geometry()
+        attributes = E.get_data()
+        N = len(E)
+
+        if H.is_raster:
+            threshold = self.parameters['threshold [m]']
+
+            # Sample depth at the middle of pieces no longer than a cell
+            delta = abs(H.get_geotransform()[1])
+            starts, ends, line_ids = split_lines(lines, delta)
+            longitudes, latitudes = H.get_geometry()
+            depth = interpolate_raster(longitudes, latitudes,
+                                       H.get_data(nan=True),
+                                       (starts + ends) / 2)
+            depth[numpy.isnan(depth)] = 0.0
+            flooded = depth >= threshold
+        else:
+            # Clip roads by flood polygons. Each part remembers its road.
+            I = assign_hazard_values_to_exposure_data(H, E)
+            parts = I.get_data()
+            starts, ends, part_ids = get_segments(I.get_geometry())
+            part_flooded = numpy.array([is_flooded(x) for x in parts],
+                                       dtype=bool)
+            part_lines = numpy.array([x['parent_line_id'] for x in parts],
+                                     dtype=int)
+            flooded = part_flooded[part_ids]
+            line_ids = part_lines[part_ids]
+
+        # Flooded length of each road in metres
+        lengths = great_circle_distances(starts, ends)
+        flooded_lengths = numpy.bincount(line_ids,
+                                         weights=lengths * flooded,
+                                         minlength=N)[:N]
+
+        # Add calculated impact to existing attributes
+        new_attributes = []
         for i in range(N):
-            # Use interpolated polygon attribute
-            atts = attributes[i]
-
-            if 'FLOODPRONE' in atts:
-                res = atts['FLOODPRONE']
-                if res is None:
-                    x = False
-                else:
-                    x = res.lower() == 'yes'
-            else:
-                # If there isn't a flood prone attribute,
-                # assume that building is wet if inside polygon
-                # as flag by generic attribute AFFECTED
-                res = atts['Affected']
-                if res is None:
-                    x = False
-                else:
-                    x = res
-
-            # Count all roads
-            if x is True:
-                # Count total affected roads
-                count += 1
-
-            # Add calculated impact to existing attributes
-            attributes[i][self.target_field] = x
-            if i == 0:
-                print attributes[0].keys()
+            values = attributes[i].copy()
+            values[self.target_field] = bool(flooded_lengths[i] > 0)
+            values[self.length_field] = float(flooded_lengths[i])
+            new_attributes.append(values)
+
+        # Flooded and total length by type of road
+        road_types = [tr('All')] * N
+        for key in ROAD_TYPE_ATTRIBUTES:
+            if N > 0 and key in attributes[0]:
+                road_types = [x[key] for x in attributes]
+                break
+        types, flooded_by_type = lengths_by_class(flooded_lengths,
+                                                  road_types)
+        _, total_by_type = lengths_by_class(line_lengths(lines), road_types)
 
         # Generate simple impact report
         table_body = [question,
-                      TableRow([tr('Building type'),
-                                tr('Temporarily closed'),
-                                tr('Total')],
-                               header=True),
-                      TableRow([tr('All'), count, N])]
+                      TableRow([tr('Road type'),
+                                tr('Flooded [m]'),
+                                tr('Total [m]')],
+                               header=True)]
+        for road_type, flooded_length, total_length in zip(
+                types, flooded_by_type, total_by_type):
+            table_body.append(TableRow([road_type,
+                                        format_int(int(flooded_length)),
+                                        format_int(int(total_length))]))
+        table_body.append(TableRow([tr('All'),
+                                    format_int(int(sum(flooded_by_type))),
+                                    format_int(int(sum(total_by_type)))]))
         impact_summary = Table(table_body).toNewlineFreeString()
-        #impact_table = impact_summary
         map_title = tr('Roads inundated')
 
         # Create style
@@ -97,10 +157,10 @@ class FloodRoadImpactFunctionExperimental(FunctionProvider):
                           style_classes=style_classes)
 
         # Create vector layer and return
-        V = Vector(data=attributes,
-                   projection=I.get_projection(),
-                   geometry=I.get_geometry(),
-                   geometry_type=I.get_geometry_type(),
+        V = Vector(data=new_attributes,
+                   projection=E.get_projection(),
+                   geometry=lines,
+                   geometry_type=E.get_geometry_type(),
                    name=tr('Estimated roads affected'),
                    keywords={'impact_summary': impact_summary,
                              'map_title': map_title,
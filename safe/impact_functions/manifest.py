@@ -0,0 +1,173 @@
+"""Manifest of the impact functions bundled with SAFE
+
+The manifest lists, for every bundled impact function, the module it lives
+in, its title and its requirements. It is generated once by importing all
+impact function modules and cached on disk so that later processes can
+discover and filter impact functions without importing them. Only the
+module of a selected impact function is imported when it is needed.
+
+The cached manifest is invalidated whenever any impact function source
+file changes or the language changes.
+"""
+
+import os
+import json
+import logging
+
+from safe.common.utilities import temp_dir
+
+LOGGER = logging.getLogger('InaSAFE')
+
+MANIFEST_VERSION = 1
+MANIFEST_FILENAME = 'impact_functions_manifest.json'
+
+
+def plugin_directory():
+    """Return directory containing the bundled impact function packages
+    """
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def plugin_module_files():
+    """List source files of all bundled impact function modules
+
+    Output
+        Sorted list of (module name, file path) tuples, e.g.
+        ('safe.impact_functions.earthquake.itb_earthquake_fatality_model',
+         '/.../earthquake/itb_earthquake_fatality_model.py')
+    """
+
+    dirname = plugin_directory()
+    modules = []
+    for package in sorted(os.listdir(dirname)):
+        package_dir = os.path.join(dirname, package)
+        if not os.path.isfile(os.path.join(package_dir, '__init__.py')):
+            # Ignore e.g. directories that are not Python modules
+            continue
+
+        for filename in sorted(os.listdir(package_dir)):
+            if (filename == '__init__.py' or filename[-3:] != '.py' or
+                    filename.startswith('.#')):
+                continue
+            module_name = 'safe.impact_functions.%s.%s' % (package,
+                                                           filename[:-3])
+            modules.append((module_name, os.path.join(package_dir, filename)))
+
+    return modules
+
+
+def plugin_module_names():
+    """List names of all bundled impact function modules
+    """
+    return [module_name for module_name, _ in plugin_module_files()]
+
+
+def source_signature():
+    """Signature identifying the current impact function sources
+
+    Output
+        List of [module name, modification time, size] plus the current
+        language. Any change in the sources gives a different signature.
+    """
+
+    signature = []
+    for module_name, filename in plugin_module_files():
+        stat = os.stat(filename)
+        signature.append([module_name, stat.st_mtime, stat.st_size])
+
+    return {'version': MANIFEST_VERSION,
+            'language': os.environ.get('LANG', ''),
+            'modules': signature}
+
+
+def default_manifest_path():
+    """Location of the cached manifest
+
+    The environment variable INASAFE_PLUGIN_MANIFEST can be used to
+    override the default location in the InaSAFE work directory.
+    """
+
+    if 'INASAFE_PLUGIN_MANIFEST' in os.environ:
+        return os.environ['INASAFE_PLUGIN_MANIFEST']
+    return os.path.join(temp_dir('plugins'), MANIFEST_FILENAME)
+
+
+def make_manifest_entry(name, func, requirements, title):
+    """Create manifest entry for one impact function
+
+    Input
+        name: Plugin name as used by get_plugins
+        func: Impact function class
+        requirements: List of requirement expressions
+        title: Title of impact function
+
+    Output
+        Dictionary describing the impact function
+    """
+
+    return {'name': name,
+            'class_name': func.__name__,
+            'module': func.__module__,
+            'title': title,
+            'requirements': requirements}
+
+
+def read_manifest(filename=None):
+    """Read cached manifest if it is up to date
+
+    Input
+        filename: Manifest file. Default is default_manifest_path()
+
+    Output
+        List of manifest entries or None if there is no valid manifest
+        for the current impact function sources.
+    """
+
+    if filename is None:
+        filename = default_manifest_path()
+
+    if not os.path.isfile(filename):
+        return None
+
+    try:
+        manifest_file = open(filename)
+        try:
+            manifest = json.load(manifest_file)
+        finally:
+            manifest_file.close()
+    except (IOError, ValueError), e:
+        LOGGER.debug('Could not read impact function manifest %s: %s'
+                     % (filename, e))
+        return None
+
+    if manifest.get('signature') != source_signature():
+        return None
+
+    return manifest['plugins']
+
+
+def write_manifest(entries, filename=None):
+    """Write manifest entries to disk
+
+    Input
+        entries: List of manifest entries (see make_manifest_entry)
+        filename: Manifest file. Default is default_manifest_path()
+
+    Failure to write the manifest is logged but otherwise ignored as
+    the manifest is only a cache.
+    """
+
+    if filename is None:
+        filename = default_manifest_path()
+
+    manifest = {'signature': source_signature(),
+                'plugins': entries}
+    try:
+        manifest_file = open(filename, 'w')
+        try:
+            json.dump(manifest, manifest_file, indent=1)
+        finally:
+            manifest_file.close()
+    except (IOError, OSError), e:
+        LOGGER.debug('Could not write impact function manifest %s: %s'
+                     % (filename, e))
@@ -6,12 +6,17 @@ from core import FunctionProvider
 from core import requirements_collect
 from core import requirement_check
 from core import requirements_met
+from core import compile_requirement
 from core import get_admissible_plugins
 from core import get_function_title
 from core import get_plugins_as_table
 from core import parse_single_requirement
+from core import get_plugins_metadata
 from core import get_documentation
 from utilities import pretty_string
+from manifest import (make_manifest_entry, read_manifest, write_manifest,
+                      plugin_module_names)
+from safe.common.utilities import unique_filename
 from safe.common.utilities import format_int
 # from safe.impact_functions.core import get_dict_doc_func
 
@@ -159,6 +164,45 @@ class Test_plugin_core(unittest.TestCase):
         msg = 'Reserved keyword in statement (logged)'
         assert not requirement_check(params, line), msg
 
+    def test_requirements_are_compiled_once(self):
+        """Requirement expressions are compiled once and reused
+        """
+        line = "category=='test_cat1' and subcategory.startswith('flood')"
+        code = compile_requirement(line)
+        assert code is not None
+        assert compile_requirement(line) is code
+
+        # Invalid expressions compile to None and never pass
+        assert compile_requirement("unit='MMI'") is None
+
+        # Requirements of registered plugins are collected from cache
+        requirelines = requirements_collect(F1)
+        assert requirelines == requirements_collect(F1)
+        requirelines.append('garbage')
+        assert 'garbage' not in requirements_collect(F1)
+
+    def test_requirement_check_is_memoised(self):
+        """Memoised requirement checks agree with uncached evaluation
+        """
+        line = "category=='test_cat1' and subcategory.startswith('flood')"
+        params = {'category': 'test_cat1', 'subcategory': 'flood'}
+
+        for _ in range(3):
+            assert requirement_check(params, line) is True
+            assert requirement_check(params, line, verbose=True) is True
+
+        # Changing keywords is reflected in the outcome
+        params['subcategory'] = 'tsunami'
+        assert requirement_check(params, line) is False
+
+        # Missing keywords evaluate to False
+        assert requirement_check({'category': 'test_cat1'}, line) is False
+
+        # Excluded keywords do not participate
+        params = {'category': 'test_cat1', 'subcategory': 'flood',
+                  'impact_summary': 'a "summary" with quotes'}
+        assert requirement_check(params, line) is True
+
     def test_filtering_of_impact_functions(self):
         """Impact functions are filtered correctly
         """
@@ -198,6 +242,40 @@ class Test_plugin_core(unittest.TestCase):
                % str(P.keys()))
         assert 'F1' in P and 'F2' in P and 'F3' in P, msg
 
+    def test_plugins_metadata(self):
+        """Plugin metadata includes plugins registered outside the manifest
+        """
+        metadata = get_plugins_metadata()
+        assert 'F1' in metadata
+        assert metadata['F1']['title'] == 'Title for F1'
+        assert metadata['F1']['requirements'] == requirements_collect(F1)
+        assert metadata['F3']['title'] == 'F3'
+
+    def test_manifest_round_trip(self):
+        """Impact function manifest can be written and read back
+        """
+        filename = unique_filename(suffix='.json')
+        entry = make_manifest_entry('F4', F4, requirements_collect(F4), 'F4')
+        write_manifest([entry], filename)
+
+        entries = read_manifest(filename)
+        assert len(entries) == 1
+        assert entries[0]['name'] == 'F4'
+        assert entries[0]['class_name'] == 'F4'
+        assert entries[0]['module'] == F4.__module__
+        assert entries[0]['requirements'] == requirements_collect(F4)
+
+        # Stale or missing manifests are ignored
+        assert read_manifest(filename + '.missing') is None
+        os.remove(filename)
+
+        # Bundled modules are discovered without importing them
+        module_names = plugin_module_names()
+        for name in module_names:
+            assert name.startswith('safe.impact_functions.')
+        assert ('safe.impact_functions.inundation.flood_population_evacuation'
+                in module_names)
+
     def test_parse_requirement(self):
         """Test parse requirements of a function to dictionary."""
         myRequirement = requirements_collect(F4)[0]
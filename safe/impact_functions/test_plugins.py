@@ -11,10 +11,18 @@ from safe.impact_functions.core import aggregate
 from safe.impact_functions.core import get_function_title
 
 from safe.impact_functions.utilities import Damage_curve
+from safe.impact_functions.utilities import Damage_curves
 from safe.impact_functions.utilities import admissible_plugins_to_str
 from safe.impact_functions.utilities import keywords_to_str
+from safe.impact_functions.utilities import class_sums
+from safe.impact_functions.utilities import raster_class_sums
+from safe.impact_functions.utilities import zone_sums
+from safe.impact_functions.utilities import zone_class_counts
+from safe.impact_functions.utilities import zone_members
 
 from safe.storage.core import read_layer
+from safe.storage.raster import Raster
+from safe.common.utilities import VerificationError
 from safe.common.testing import TESTDATA
 
 DEFAULT_PLUGINS = ('Earthquake Fatality Function',)
@@ -234,6 +242,246 @@ class Test_plugins(unittest.TestCase):
                    'more than two colums')
             raise Exception(msg)
 
+    def test_damage_curve_arrays(self):
+        """Damage curves evaluate arrays as interpolate1d does
+        """
+
+        D = Damage_curve([[0.0, 0.0], [0.5, 0.2], [1.0, 0.5],
+                          [1.0, 0.7], [3.0, 1.0]])
+        x = numpy.array([-1.0, 0.0, 0.25, 0.5, 0.75, 1.0, 2.0, 3.0, 4.0,
+                         numpy.nan])
+        y = D(x)
+        inside = numpy.array([0, 1, 1, 1, 1, 1, 1, 1, 0, 0], dtype=bool)
+        assert numpy.all(numpy.isnan(y) == ~inside)
+        assert numpy.allclose(y[inside], [0.0, 0.1, 0.2, 0.35, 0.5,
+                                          0.85, 1.0])
+
+        # Same as one value at a time
+        for i in range(len(x)):
+            if numpy.isnan(y[i]):
+                assert numpy.isnan(D(x[i]))
+            else:
+                assert D(x[i]) == y[i]
+        assert numpy.ndim(D(0.25)) == 0
+
+        # Result in given buffer with shape of input
+        out = numpy.zeros((2, 5))
+        result = D(x.reshape((2, 5)), out=out)
+        assert result is out
+        assert numpy.allclose(out.ravel()[inside], y[inside])
+
+        try:
+            D(x, out=numpy.zeros(3))
+        except VerificationError:
+            pass
+        else:
+            msg = 'Damage_curve should have raised exception for out'
+            raise Exception(msg)
+
+        try:
+            Damage_curve([[1, 2], [0, 3]])
+        except RuntimeError:
+            pass
+        else:
+            msg = ('Damage_curve should have raised exception for '
+                   'decreasing hazard values')
+            raise Exception(msg)
+
+    def test_damage_curves(self):
+        """Families of damage curves evaluate values by class
+        """
+
+        curves = {'Timber': [[0.0, 0.0], [1.0, 1.0]],
+                  'Brick': Damage_curve([[0.0, 0.0], [1.0, 0.5]])}
+        D = Damage_curves(curves, default='Brick')
+
+        depth = numpy.array([0.5, 0.5, 0.2, 2.0, 1.0])
+        classes = ['Timber', 'Brick', 'Unknown', 'Timber', 'Brick']
+        damage = D(depth, classes)
+        assert numpy.isnan(damage[3])
+        assert numpy.allclose(damage[[0, 1, 2, 4]], [0.5, 0.25, 0.1, 0.5])
+
+        # Same as one value at a time
+        for i in [0, 1, 2, 4]:
+            assert damage[i] == D.get_curve(classes[i])(depth[i])
+
+        out = numpy.zeros(len(depth))
+        assert D(depth, classes, out=out) is out
+        assert numpy.allclose(out[[0, 1, 2, 4]], damage[[0, 1, 2, 4]])
+
+        # Unknown classes without default
+        D = Damage_curves(curves)
+        try:
+            D(depth, classes)
+        except VerificationError:
+            pass
+        else:
+            msg = 'Damage_curves should have raised exception for Unknown'
+            raise Exception(msg)
+
+        try:
+            Damage_curves(curves, default='Steel')
+        except VerificationError:
+            pass
+        else:
+            msg = 'Damage_curves should have raised exception for default'
+            raise Exception(msg)
+
+    def test_class_sums(self):
+        """Exposure is summed correctly per hazard class in one pass
+        """
+
+        numpy.random.seed(17)
+        D = numpy.random.uniform(0, 5, (40, 30))
+        D[0, :] = numpy.nan
+        D[1, :4] = [0.5, 1.0, 2.0, 3.0]  # Values on class edges
+        P = numpy.random.uniform(0, 100, D.shape)
+        thresholds = [0.5, 1.0, 2.0, 3.0]
+
+        sums, impact = class_sums(D, P, thresholds,
+                                  impact_classes=[len(thresholds)])
+        assert len(sums) == len(thresholds) + 1
+
+        # Compare with one mask per class
+        expected = [numpy.sum(numpy.where(D < thresholds[0], P, 0))]
+        for i, lo in enumerate(thresholds[:-1]):
+            hi = thresholds[i + 1]
+            expected.append(numpy.sum(numpy.where((D >= lo) * (D < hi),
+                                                  P, 0)))
+        expected.append(numpy.sum(numpy.where(D >= thresholds[-1], P, 0)))
+        assert numpy.allclose(sums, expected, rtol=1.0e-12)
+
+        # NaN hazard is not counted in any class
+        assert numpy.allclose(numpy.sum(sums), numpy.sum(P[1:, :]))
+
+        # Impact is exposure where hazard is in the requested classes
+        assert numpy.allclose(impact,
+                              numpy.where(D >= thresholds[-1], P, 0))
+
+        # Closed on the right
+        sums, impact = class_sums(D, P, thresholds, right=True)
+        assert impact is None
+        assert numpy.allclose(sums[-1],
+                              numpy.sum(numpy.where(D > thresholds[-1], P, 0)))
+
+        # Edges must be increasing
+        try:
+            class_sums(D, P, [1.0, 0.5])
+        except VerificationError:
+            pass
+        else:
+            msg = 'class_sums should have failed for decreasing edges'
+            raise Exception(msg)
+
+        # Blockwise reduction over raster layers gives same result
+        H = Raster(numpy.where(numpy.isnan(D), 0, D), projection=None,
+                   geotransform=(100.0, 0.01, 0, 0.0, 0, -0.01))
+        E = Raster(P, projection=None,
+                   geotransform=(100.0, 0.01, 0, 0.0, 0, -0.01))
+        sums, impact = raster_class_sums(H, E, thresholds,
+                                         impact_classes=[len(thresholds)])
+        for block_rows in [1, 7, 40, 100]:
+            block_sums, block_impact = raster_class_sums(
+                H, E, thresholds, impact_classes=[len(thresholds)],
+                block_rows=block_rows)
+            assert numpy.allclose(block_sums, sums, rtol=1.0e-12)
+            assert numpy.allclose(block_impact, impact)
+
+        # Hazard confined to a small area. Second run uses the footprint
+        # recorded by the first and gives the same result.
+        D = numpy.zeros((40, 30))
+        D[10:14, 5:9] = [0.5, 1.0, 2.0, 3.5]
+        H = Raster(D, projection=None,
+                   geotransform=(100.0, 0.01, 0, 0.0, 0, -0.01))
+        for impact_classes in [[len(thresholds)], [0, 2]]:
+            sums, impact = raster_class_sums(H, E, thresholds,
+                                             impact_classes=impact_classes)
+            for block_rows in [1, 7, 40]:
+                for _ in range(2):
+                    block_sums, block_impact = raster_class_sums(
+                        H, E, thresholds, impact_classes=impact_classes,
+                        block_rows=block_rows)
+                    assert numpy.allclose(block_sums, sums, rtol=1.0e-12)
+                    assert numpy.allclose(block_impact, impact)
+
+        footprint = H.get_footprint(7, compute=False)
+        assert footprint == [None, (5, 9), None, None, None, None]
+
+        # With known exposure statistics only exposure inside the footprint
+        # is read, already on the first call with a hazard layer
+        E.get_statistics()
+        get_data = E.get_data
+        windows = []
+
+        def recording_get_data(*args, **kwargs):
+            windows.append(kwargs.get('window'))
+            return get_data(*args, **kwargs)
+
+        E.get_data = recording_get_data
+        for impact_classes in [[len(thresholds)], [2]]:
+            sums, impact = raster_class_sums(H, E, thresholds,
+                                             impact_classes=impact_classes)
+            H = Raster(D, projection=None,
+                       geotransform=(100.0, 0.01, 0, 0.0, 0, -0.01))
+            windows[:] = []
+            block_sums, block_impact = raster_class_sums(
+                H, E, thresholds, impact_classes=impact_classes,
+                block_rows=7)
+            assert numpy.allclose(block_sums, sums, rtol=1.0e-10)
+            assert numpy.allclose(block_impact, impact)
+            assert windows == [(7, 5, 7, 4)]
+
+    def test_zone_aggregation(self):
+        """Grouped sums and counts per zone match per zone loops
+        """
+
+        numpy.random.seed(17)
+        N = 1000
+        number_of_zones = 7
+        zone_ids = numpy.random.randint(-1, number_of_zones, N)
+        values = numpy.random.rand(N).tolist()
+        values[3] = None
+        values[5] = 'None'
+        categories = [['Low', 'Medium', 'High'][i]
+                      for i in numpy.random.randint(0, 3, N)]
+
+        sums = zone_sums(zone_ids, values, number_of_zones)
+        members = zone_members(zone_ids, number_of_zones)
+        classes, counts = zone_class_counts(zone_ids, categories,
+                                            number_of_zones,
+                                            classes=['Low', 'Medium',
+                                                     'High', 'Extreme'])
+        assert classes == ['Low', 'Medium', 'High', 'Extreme']
+        assert counts.shape == (number_of_zones, 4)
+
+        for zone in range(number_of_zones):
+            indices = [i for i in range(N) if zone_ids[i] == zone]
+            assert numpy.all(members[zone] == indices)
+
+            expected = sum([values[i] for i in indices
+                            if isinstance(values[i], float)])
+            assert numpy.allclose(sums[zone], expected, rtol=1.0e-12)
+
+            for j, category in enumerate(classes):
+                expected = len([i for i in indices
+                                if categories[i] == category])
+                assert counts[zone, j] == expected
+
+        # Classes are discovered in order of appearance when not given
+        classes, counts = zone_class_counts([0, 1, 1, -1], ['a', 'b', 'a',
+                                                            'c'], 3)
+        assert classes == ['a', 'b']
+        assert numpy.all(counts == [[1, 0], [1, 1], [0, 0]])
+
+        # Values outside expected classes are reported
+        try:
+            zone_class_counts([0, 0], ['a', 'x'], 1, classes=['a'])
+        except KeyError, e:
+            assert e.args[0] == 'x'
+        else:
+            msg = 'zone_class_counts should have failed for unknown class'
+            raise Exception(msg)
+
     def test_aggregate(self):
         """Aggregation by boundaries works
         """
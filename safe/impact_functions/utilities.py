@@ -1,13 +1,23 @@
-"""Module to create damage curves from point data and additional logging
-utils relevant to impact_functions.
+"""Module to create damage curves from point data, reductions of hazard
+and exposure grids and additional logging utils relevant to
+impact_functions.
 """
 
 import numpy
-from safe.common.interpolation1d import interpolate1d
+from safe.common.utilities import verify
+from safe.common.numerics import block_footprint
+
+# Number of raster rows processed at a time by blockwise reductions
+DEFAULT_BLOCK_ROWS = 256
 
 
 class Damage_curve:
     """Class for implementation of damage curves based on point data
+
+    Curves are evaluated by linear interpolation between the data points
+    with slopes precomputed once so that whole arrays of hazard values
+    are evaluated in one call. Values outside the curve, and NaN, give
+    NaN as with interpolate1d.
     """
 
     def __init__(self, data):
@@ -29,8 +39,453 @@ class Damage_curve:
         self.x = data[:, 0]
         self.y = data[:, 1]
 
-    def __call__(self, zeta):
-        return interpolate1d(self.x, self.y, [zeta], mode='linear')[0]
+        msg = 'Damage curve data must have at least two points'
+        if len(self.x) < 2:
+            raise RuntimeError(msg)
+
+        msg = 'Hazard values of damage curve must be increasing'
+        if numpy.any(numpy.diff(self.x) < 0):
+            raise RuntimeError(msg)
+
+        # Slope of each segment. Vertical steps never get used for
+        # interpolation as searchsorted picks the segment left of them.
+        self._x = numpy.array(self.x, dtype='float64')
+        self._y = numpy.array(self.y, dtype='float64')
+        dx = numpy.diff(self._x)
+        dy = numpy.diff(self._y)
+        self._slopes = numpy.zeros(len(dx))
+        step = dx > 0
+        self._slopes[step] = dy[step] / dx[step]
+
+    def __call__(self, zeta, out=None):
+        """Evaluate damage curve
+
+        Input
+            zeta: Hazard value or array of hazard values
+            out: Optional float array with the shape of zeta for the result
+
+        Output
+            Damage for each hazard value. A number if zeta is a number,
+            otherwise an array with the shape of zeta (out if given).
+        """
+
+        scalar = numpy.ndim(zeta) == 0
+        zeta = numpy.asarray(zeta, dtype='float64')
+
+        if out is None:
+            out = numpy.empty(zeta.shape)
+        else:
+            msg = ('Output array must have shape %s. I got %s'
+                   % (str(zeta.shape), str(out.shape)))
+            verify(out.shape == zeta.shape, msg)
+
+        # Index of segment for each value, valid ones are in [0, N - 2]
+        idx = numpy.searchsorted(self._x, zeta, side='left') - 1
+        idx = numpy.clip(idx, 0, len(self._slopes) - 1)
+
+        out[...] = self._y[idx] + self._slopes[idx] * (zeta - self._x[idx])
+
+        # Outside values and NaN give NaN (all comparisons false for NaN)
+        inside = (zeta >= self._x[0]) & (zeta <= self._x[-1])
+        out[~inside] = numpy.nan
+
+        if scalar:
+            return out[()]
+        return out
+
+
+class Damage_curves:
+    """Family of damage curves keyed by class, e.g. building type
+
+    All hazard values are evaluated in one call with each curve applied
+    to the group of values of its class.
+    """
+
+    def __init__(self, curves, default=None):
+        """Create family of curves
+
+        Input
+            curves: Dictionary of Damage_curve instances (or data accepted
+                    by Damage_curve) keyed by class
+            default: Optional class whose curve is used for classes
+                     without a curve of their own
+        """
+
+        self.curves = {}
+        for key, curve in curves.items():
+            if not isinstance(curve, Damage_curve):
+                curve = Damage_curve(curve)
+            self.curves[key] = curve
+
+        msg = ('Default class %s does not have a damage curve. Classes are '
+               '%s' % (default, self.curves.keys()))
+        verify(default is None or default in self.curves, msg)
+        self.default = default
+
+    def get_curve(self, key):
+        """Damage curve for class key, falling back to the default
+
+        Raises
+            VerificationError if key has no curve and there is no default
+        """
+
+        if key in self.curves:
+            return self.curves[key]
+
+        msg = ('No damage curve for class %s and no default. Classes are '
+               '%s' % (key, self.curves.keys()))
+        verify(self.default is not None, msg)
+        return self.curves[self.default]
+
+    def __call__(self, zeta, classes, out=None):
+        """Evaluate damage for hazard values of features in given classes
+
+        Input
+            zeta: Array of hazard values
+            classes: Sequence of classes with one entry per hazard value
+            out: Optional float array with the shape of zeta for the result
+
+        Output
+            Array with the damage for each hazard value (out if given)
+        """
+
+        zeta = numpy.asarray(zeta, dtype='float64')
+        classes = numpy.asarray(classes)
+
+        msg = ('Hazard values and classes must have the same shape. I got '
+               '%s and %s' % (str(zeta.shape), str(classes.shape)))
+        verify(zeta.shape == classes.shape, msg)
+
+        if out is None:
+            out = numpy.empty(zeta.shape)
+        else:
+            msg = ('Output array must have shape %s. I got %s'
+                   % (str(zeta.shape), str(out.shape)))
+            verify(out.shape == zeta.shape, msg)
+
+        # One evaluation per class present
+        keys, inverse = numpy.unique(classes.ravel(), return_inverse=True)
+        inverse = inverse.reshape(zeta.shape)
+        for i, key in enumerate(keys):
+            group = inverse == i
+            out[group] = self.get_curve(key)(zeta[group])
+
+        return out
+
+
+def class_sums(hazard, exposure, edges, right=False, impact_classes=None):
+    """Sum exposure values for each class of hazard values in one pass
+
+    Input
+        hazard: Array of hazard values
+        exposure: Array of exposure values (e.g. population counts) with
+                  the same shape as hazard. Must not contain NaN.
+        edges: Increasing sequence of class boundaries. Classes are
+               numbered as by numpy.digitize, i.e. with right=False class i
+               holds values with edges[i - 1] <= value < edges[i], class 0
+               holds values below edges[0] and class len(edges) values at
+               or above edges[-1]. With right=True the intervals are closed
+               on the right instead.
+        right: Flag indicating which side of the intervals is closed
+        impact_classes: Optional list of class numbers. If given, an impact
+                        array is returned which has the exposure values
+                        where hazard falls in one of these classes and zero
+                        elsewhere.
+
+    Output
+        sums: Array of length len(edges) + 1 with the sum of exposure
+              values in each class. Cells where hazard is NaN do not
+              contribute to any class.
+        impact: Impact array with the shape of hazard or None if
+                impact_classes was not given.
+
+    Note
+        Memory use is independent of the number of classes: the hazard is
+        digitised once and all sums obtained with one weighted bincount.
+    """
+
+    hazard = numpy.asarray(hazard)
+    exposure = numpy.asarray(exposure)
+
+    msg = ('Hazard and exposure arrays must have the same shape. '
+           'I got %s and %s' % (str(hazard.shape), str(exposure.shape)))
+    verify(hazard.shape == exposure.shape, msg)
+
+    edges = numpy.asarray(edges, dtype='float64')
+    msg = 'Class edges must be increasing. I got %s' % str(edges)
+    verify(numpy.all(edges[1:] > edges[:-1]), msg)
+
+    number_of_classes = len(edges) + 1
+
+    # Digitise once. NaN hazard goes into an extra class which is dropped.
+    indices = numpy.digitize(hazard.ravel(), edges, right=right)
+    indices[numpy.isnan(hazard.ravel())] = number_of_classes
+
+    sums = numpy.bincount(indices, weights=exposure.ravel(),
+                          minlength=number_of_classes + 1)
+
+    impact = None
+    if impact_classes is not None:
+        weights = numpy.zeros(number_of_classes + 1)
+        weights[list(impact_classes)] = 1
+        impact = weights[indices].reshape(hazard.shape)
+        impact *= exposure
+
+    return sums[:number_of_classes], impact
+
+
+def raster_class_sums(hazard, exposure, edges, right=False,
+                      impact_classes=None, block_rows=None):
+    """Sum exposure for each class of hazard for aligned raster layers
+
+    Input
+        hazard: Raster layer of hazard values. Missing values are
+                taken as 0.
+        exposure: Raster layer of exposure values (e.g. population counts)
+                  on the same grid. Missing values are taken as 0 and
+                  density data is scaled as in get_data(scaling=True).
+        edges, right, impact_classes: See class_sums
+        block_rows: Optional number of rows read and processed at a time.
+                    If None, the whole grid is processed at once.
+
+    Output
+        sums: Array of length len(edges) + 1 with the sum of exposure
+              in each class
+        impact: Impact grid or None as for class_sums
+
+    Note
+        When block_rows is given, hazard and exposure are read block by
+        block (windowed reads for file based rasters) so that only the
+        impact grid is held in memory in full.
+
+        Only the footprint of the hazard (the columns of each block with
+        non zero values, see Raster.get_footprint) is classified. It is
+        found from the hazard block itself and the exposure is read for
+        these columns only. The exposure elsewhere belongs to the class
+        of zero hazard. Its sum is taken from the statistics of the
+        exposure layer if they are known already (see
+        Raster.get_statistics) so that exposure outside the footprint is
+        not read at all. The footprint is kept with the hazard layer, so
+        later calls with the same hazard layer read it only inside the
+        footprint.
+    """
+
+    msg = ('Hazard and exposure rasters must have the same dimensions. '
+           'I got %i x %i and %i x %i' % (hazard.rows, hazard.columns,
+                                          exposure.rows, exposure.columns))
+    verify(hazard.rows == exposure.rows and
+           hazard.columns == exposure.columns, msg)
+
+    if block_rows is None:
+        windows = [(0, 0, hazard.rows, hazard.columns)]
+        footprint = None
+    else:
+        windows = hazard.get_row_blocks(block_rows)
+        footprint = hazard.get_footprint(block_rows, compute=False)
+
+    sums = numpy.zeros(len(edges) + 1)
+    impact = None
+    if impact_classes is not None:
+        impact = numpy.zeros((hazard.rows, hazard.columns))
+
+    # Class of cells outside the hazard footprint
+    background_class = numpy.digitize([0.0], numpy.asarray(edges),
+                                      right=right)[0]
+    background_impact = (impact_classes is not None and
+                         background_class in impact_classes)
+
+    # Total exposure if known without reading the exposure
+    total = None
+    if not background_impact:
+        statistics = exposure.get_statistics(compute=False)
+        if statistics is not None:
+            total = (statistics['sum'] *
+                     exposure.get_scaling_factor(scaling=True))
+    read_outside = total is None
+
+    new_footprint = []
+    inside_sum = 0.0
+    for i, window in enumerate(windows):
+        row, _, rows, columns = window
+        if footprint is None:
+            H = hazard.get_data(nan=0.0, window=window)
+            block_columns = block_footprint(H)
+            new_footprint.append(block_columns)
+        else:
+            block_columns = footprint[i]
+            H = None
+
+        if block_columns is None:
+            # Nothing but background in this block
+            if read_outside:
+                P = exposure.get_data(nan=0.0, scaling=True, window=window)
+                sums[background_class] += numpy.sum(P)
+                if background_impact:
+                    impact[row:row + rows, :] = P
+            continue
+
+        first, end = block_columns
+        if H is None:
+            H = hazard.get_data(nan=0.0,
+                                window=(row, first, rows, end - first))
+        else:
+            H = H[:, first:end]
+        P = exposure.get_data(nan=0.0, scaling=True,
+                              window=(row, first, rows, end - first))
+
+        if read_outside:
+            # Exposure of the columns on either side of the footprint
+            for start, stop in [(0, first), (end, columns)]:
+                if stop <= start:
+                    continue
+                Q = exposure.get_data(nan=0.0, scaling=True,
+                                      window=(row, start, rows,
+                                              stop - start))
+                sums[background_class] += numpy.sum(Q)
+                if background_impact:
+                    impact[row:row + rows, start:stop] = Q
+        else:
+            inside_sum += numpy.sum(P)
+
+        block_sums, block_impact = class_sums(H, P, edges, right=right,
+                                              impact_classes=impact_classes)
+        sums += block_sums
+
+        if impact_classes is not None:
+            impact[row:row + rows, first:end] = block_impact
+
+    if not read_outside:
+        sums[background_class] += total - inside_sum
+
+    if footprint is None and block_rows is not None:
+        hazard.set_footprint(block_rows, 0.0, new_footprint)
+
+    return sums, impact
+
+
+def numeric_column(values):
+    """Convert a column of attribute values to a float array
+
+    Input
+        values: Sequence of attribute values
+
+    Output
+        Float array. Values that are not numbers (e.g. None or 'None')
+        become NaN.
+    """
+
+    try:
+        return numpy.array(values, dtype='float64')
+    except (TypeError, ValueError):
+        column = numpy.empty(len(values))
+        for i, value in enumerate(values):
+            try:
+                column[i] = float(value)
+            except (TypeError, ValueError):
+                column[i] = numpy.nan
+        return column
+
+
+def zone_sums(zone_ids, values, number_of_zones):
+    """Sum values for each zone in one pass
+
+    Input
+        zone_ids: Integer array with the zone of each value. Values with
+                  negative zone id (e.g. -1 for points outside all zones)
+                  are ignored.
+        values: Sequence of numbers of the same length. Entries that are
+                not numbers are ignored.
+        number_of_zones: Number of zones
+
+    Output
+        Array of length number_of_zones with the sum of values in each zone
+    """
+
+    zone_ids = numpy.asarray(zone_ids, dtype='int')
+    values = numeric_column(values)
+
+    msg = ('Zone ids and values must have the same length. '
+           'I got %i and %i' % (len(zone_ids), len(values)))
+    verify(len(zone_ids) == len(values), msg)
+
+    mask = (zone_ids >= 0) & ~numpy.isnan(values)
+    return numpy.bincount(zone_ids[mask], weights=values[mask],
+                          minlength=number_of_zones)[:number_of_zones]
+
+
+def zone_class_counts(zone_ids, values, number_of_zones, classes=None):
+    """Count occurrences of each value for each zone in one pass
+
+    Input
+        zone_ids: Integer array with the zone of each value. Values with
+                  negative zone id are ignored.
+        values: Sequence of hashable values (e.g. impact categories)
+        number_of_zones: Number of zones
+        classes: Optional list of expected values. If None, all values
+                 occurring in zones are counted in order of appearance.
+
+    Output
+        classes: List of values counted
+        counts: Integer array of shape number_of_zones x len(classes)
+                with the number of occurrences of each class in each zone
+
+    Raises
+        KeyError with the offending value if classes is given and a
+        value in a zone is not one of them.
+    """
+
+    zone_ids = numpy.asarray(zone_ids, dtype='int')
+
+    msg = ('Zone ids and values must have the same length. '
+           'I got %i and %i' % (len(zone_ids), len(values)))
+    verify(len(zone_ids) == len(values), msg)
+
+    fixed_classes = classes is not None
+    if fixed_classes:
+        classes = list(classes)
+        lookup = dict((value, i) for i, value in enumerate(classes))
+    else:
+        classes = []
+        lookup = {}
+
+    # Encode values as class numbers. This is the only per value step.
+    selected = numpy.nonzero(zone_ids >= 0)[0]
+    codes = numpy.empty(len(selected), dtype='int')
+    for i, j in enumerate(selected):
+        value = values[j]
+        try:
+            codes[i] = lookup[value]
+        except KeyError:
+            if fixed_classes:
+                raise KeyError(value)
+            lookup[value] = codes[i] = len(classes)
+            classes.append(value)
+
+    number_of_classes = len(classes)
+    counts = numpy.bincount(zone_ids[selected] * number_of_classes + codes,
+                            minlength=number_of_zones * number_of_classes)
+    counts = counts[:number_of_zones * number_of_classes]
+    return classes, counts.reshape((number_of_zones, number_of_classes))
+
+
+def zone_members(zone_ids, number_of_zones):
+    """Group indices of features by zone
+
+    Input
+        zone_ids: Integer array with the zone of each feature. Features
+                  with negative zone id are left out.
+        number_of_zones: Number of zones
+
+    Output
+        List with one array of feature indices for each zone. Indices
+        keep their original order within a zone.
+    """
+
+    zone_ids = numpy.asarray(zone_ids, dtype='int')
+    order = numpy.argsort(zone_ids, kind='mergesort')
+    bounds = numpy.searchsorted(zone_ids[order],
+                                numpy.arange(number_of_zones + 1))
+    return [order[bounds[i]:bounds[i + 1]] for i in range(number_of_zones)]
 
 
 def admissible_plugins_to_str(plugin_list):
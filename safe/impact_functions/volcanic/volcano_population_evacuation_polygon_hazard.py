@@ -1,10 +1,10 @@
-import numpy
 from safe.impact_functions.core import (
     FunctionProvider,
     get_hazard_layer,
     get_exposure_layer,
     get_question)
 from safe.storage.vector import Vector
+from safe.storage.raster_expression import lazy
 from safe.common.utilities import (
     ugettext as tr,
     format_int,
@@ -165,7 +165,7 @@ class VolcanoPolygonHazardPopulation(FunctionProvider):
             categories[cat] += pop
 
         # Count totals
-        total = int(numpy.sum(E.get_data(nan=0)))
+        total = int(lazy(E, nan=0).sum())
 
         # Don't show digits less than a 1000
         total = round_thousand(total)
@@ -11,6 +11,7 @@ __copyright__ = 'Copyright 2012, Australia Indonesia Facility for '
 __copyright__ += 'Disaster Reduction'
 
 import logging
+import numpy
 
 from safe.common.exceptions import PostProcessorError
 from safe.common.utilities import (get_defaults,
@@ -36,6 +37,10 @@ class AbstractPostprocessor():
 
     for implementation examples see AgePostprocessor which uses mandatory and
     optional parameters
+
+    Postprocessors whose indicators are arithmetic on numeric parameters can
+    also overload process_zones to calculate them for a whole table of zones
+    at once, see GenderPostprocessor
     """
 
     NO_DATA_TEXT = get_defaults('NO_DATA')
@@ -48,6 +53,7 @@ class AbstractPostprocessor():
         AbstractPostprocessor.__init__(self)
         """
         self._results = None
+        self._zones_results = None
 
     def setup(self, params):
         """Abstract method to be called from the concrete implementation
@@ -62,10 +68,26 @@ class AbstractPostprocessor():
             None
         """
         del params
-        if self._results is not None:
+        if self._results is not None or self._zones_results is not None:
             self._raise_error('clear needs to be called before setup')
         self._results = OrderedDict()
 
+    def setup_zones(self, number_of_zones):
+        """Abstract method to be called from the concrete implementation of
+         process_zones with AbstractPostprocessor.setup_zones(self, n) it
+        takes care of the results of each zone being initialized
+
+        Args:
+            number_of_zones: number of zones in the table
+        Returns:
+            None
+        Raises:
+            None
+        """
+        if self._results is not None or self._zones_results is not None:
+            self._raise_error('clear needs to be called before setup')
+        self._zones_results = [OrderedDict() for _ in range(number_of_zones)]
+
     def process(self):
         """Abstract method to be called from the concrete implementation
          with AbstractPostprocessor.process(self) it takes care of results
@@ -94,6 +116,7 @@ class AbstractPostprocessor():
             None
         """
         self._results = None
+        self._zones_results = None
 
     def results(self):
         """Returns the postprocessors results
@@ -107,6 +130,47 @@ class AbstractPostprocessor():
         """
         return self._results
 
+    def process_zones(self, zones_params):
+        """Run the postprocessor for a whole table of zones
+
+        This runs setup, process and clear zone by zone. Postprocessors
+        whose indicators are arithmetic on numeric parameters overload it
+        to set their parameters as columns (numpy arrays) over the zones
+        and calculate each indicator once for all of them, see
+        GenderPostprocessor.
+
+        Args:
+            zones_params: list of parameter dicts, one per zone, as they
+                would be passed to setup
+        Returns:
+            list of results (Odict) in the same order as zones_params
+        Raises:
+            None
+        """
+        zones_results = []
+        for params in zones_params:
+            self.setup(params)
+            self.process()
+            zones_results.append(self.results())
+            self.clear()
+        return zones_results
+
+    def zones_results(self, skipped=None):
+        """Returns the postprocessors results for a table of zones
+
+        Args:
+            skipped: optional list of bool, True for zones whose parameters
+                are missing. These get empty results as process gives them.
+        Returns:
+            list of Odict of results, one for each zone
+        Raises:
+            None
+        """
+        if skipped is None:
+            return self._zones_results
+        return [OrderedDict() if x else results
+                for x, results in zip(skipped, self._zones_results)]
+
     def _raise_error(self, message=None):
         """internal method to be used by the postprocessors to raise an error
 
@@ -121,6 +185,21 @@ class AbstractPostprocessor():
             message = 'Postprocessor error'
         raise PostProcessorError(message)
 
+    def _get_column(self, zones_params, name):
+        """internal method to get a numeric parameter of all zones
+
+        Args:
+            * zones_params: list of parameter dicts, one per zone
+            * name: str the name of the parameter
+        Returns:
+            numpy array with the parameter of each zone and nan where it is
+            None
+        Raises:
+            KeyError if a zone lacks the parameter as setup would
+        """
+        return numpy.array([params[name] for params in zones_params],
+                           dtype='d')
+
     def _log_message(self, message):
         """internal method to be used by the postprocessors to log a message
 
@@ -159,3 +238,59 @@ class AbstractPostprocessor():
                 result = result
         self._results[name] = {'value': result,
                                'metadata': metadata}
+
+    def _append_indicator(self, name, result, metadata=None):
+        """add a population indicator to the postprocessors result.
+
+        internal method to be used by the postprocessors to add an indicator
+        calculated from self.impact_total. The result is rounded to int or
+        is NO_DATA_TEXT if the impact total is implausible or the result is
+        not a number.
+
+        If the postprocessor processes a table of zones, self.impact_total
+        and result are columns with one value for each zone and the
+        indicator is added to the results of each zone.
+
+        Args:
+            * name: str the name of the indicator
+            * result the value calculated by the indicator
+            * metadata Dict of metadata
+        Returns:
+            None
+        Raises:
+            None
+        """
+        if self._zones_results is None:
+            self._append_result(name,
+                                self._round_indicator(self.impact_total,
+                                                      result),
+                                metadata)
+            return
+
+        for i, results in enumerate(self._zones_results):
+            self._results = results
+            self._append_result(name,
+                                self._round_indicator(self.impact_total[i],
+                                                      result[i]),
+                                metadata)
+        self._results = None
+
+    def _round_indicator(self, impact_total, result):
+        """internal method to round the value of a population indicator
+
+        Args:
+            * impact_total: the impact total the indicator is calculated from
+            * result the value calculated by the indicator
+        Returns:
+            int or NO_DATA_TEXT
+        Raises:
+            None
+        """
+        #FIXME (MB) Shameless hack to deal with issue #368
+        if impact_total > 8000000000 or impact_total < 0:
+            return self.NO_DATA_TEXT
+
+        try:
+            return int(round(result))
+        except ValueError:
+            return self.NO_DATA_TEXT
@@ -10,6 +10,7 @@ __license__ = "GPL"
 __copyright__ = 'Copyright 2012, Australia Indonesia Facility for '
 __copyright__ += 'Disaster Reduction'
 
+import numpy
 
 from safe.postprocessors.abstract_postprocessor import (
     AbstractPostprocessor)
@@ -86,6 +87,53 @@ class AgePostprocessor(AbstractPostprocessor):
             self._calculate_adult()
             self._calculate_elder()
 
+    def process_zones(self, zones_params):
+        """concrete implementation it calculates the indicators for a whole
+        table of zones at once
+
+        impact_total and the age ratios are set as columns over the zones so
+        that each indicator is calculated for all zones in one go
+
+        Args:
+            zones_params: list of parameter dicts, one per zone, as they
+                would be passed to setup
+        Returns:
+            list of results (Odict) in the same order as zones_params
+        Raises:
+            None
+        """
+        AbstractPostprocessor.setup_zones(self, len(zones_params))
+        if self.impact_total is not None:
+            self._raise_error('clear needs to be called before setup')
+        self.impact_total = self._get_column(zones_params, 'impact_total')
+
+        #either all 3 ratio are custom set or we use defaults
+        defaults = get_defaults()
+        myRatios = []
+        for params in zones_params:
+            try:
+                myRatios.append([params['youth_ratio'],
+                                 params['adult_ratio'],
+                                 params['elder_ratio']])
+            except KeyError:
+                myRatios.append([defaults['YOUTH_RATIO'],
+                                 defaults['ADULT_RATIO'],
+                                 defaults['ELDER_RATIO']])
+        myRatios = numpy.array(myRatios, dtype='d').reshape((-1, 3))
+        self.youth_ratio = myRatios[:, 0]
+        self.adult_ratio = myRatios[:, 1]
+        self.elder_ratio = myRatios[:, 2]
+
+        self._calculate_total()
+        self._calculate_youth()
+        self._calculate_adult()
+        self._calculate_elder()
+
+        skipped = [x['impact_total'] is None for x in zones_params]
+        zones_results = self.zones_results(skipped)
+        self.clear()
+        return zones_results
+
     def clear(self):
         """concrete implementation it takes care of the needed parameters being
          properly cleared
@@ -114,17 +162,8 @@ class AgePostprocessor(AbstractPostprocessor):
         """
         myName = tr('Total')
 
-        #FIXME (MB) Shameless hack to deal with issue #368
-        if self.impact_total > 8000000000 or self.impact_total < 0:
-            self._append_result(myName, self.NO_DATA_TEXT)
-            return
-
         myResult = self.impact_total
-        try:
-            myResult = int(round(myResult))
-        except ValueError:
-            myResult = self.NO_DATA_TEXT
-        self._append_result(myName, myResult)
+        self._append_indicator(myName, myResult)
 
     def _calculate_youth(self):
         """Indicator that shows population below 15 years old.
@@ -141,17 +180,8 @@ class AgePostprocessor(AbstractPostprocessor):
         """
         myName = tr('Youth count')
 
-        #FIXME (MB) Shameless hack to deal with issue #368
-        if self.impact_total > 8000000000 or self.impact_total < 0:
-            self._append_result(myName, self.NO_DATA_TEXT)
-            return
-
         myResult = self.impact_total * self.youth_ratio
-        try:
-            myResult = int(round(myResult))
-        except ValueError:
-            myResult = self.NO_DATA_TEXT
-        self._append_result(myName, myResult)
+        self._append_indicator(myName, myResult)
 
     def _calculate_adult(self):
         """Indicator that shows population between 15 and 64 years old.
@@ -168,17 +198,8 @@ class AgePostprocessor(AbstractPostprocessor):
         """
         myName = tr('Adult count')
 
-        #FIXME (MB) Shameless hack to deal with issue #368
-        if self.impact_total > 8000000000 or self.impact_total < 0:
-            self._append_result(myName, self.NO_DATA_TEXT)
-            return
-
         myResult = self.impact_total * self.adult_ratio
-        try:
-            myResult = int(round(myResult))
-        except ValueError:
-            myResult = self.NO_DATA_TEXT
-        self._append_result(myName, myResult)
+        self._append_indicator(myName, myResult)
 
     def _calculate_elder(self):
         """Indicator that shows population above 64 years old.
@@ -195,14 +216,5 @@ class AgePostprocessor(AbstractPostprocessor):
         """
         myName = tr('Elderly count')
 
-        #FIXME (MB) Shameless hack to deal with issue #368
-        if self.impact_total > 8000000000 or self.impact_total < 0:
-            self._append_result(myName, self.NO_DATA_TEXT)
-            return
-
         myResult = self.impact_total * self.elder_ratio
-        try:
-            myResult = int(round(myResult))
-        except ValueError:
-            myResult = self.NO_DATA_TEXT
-        self._append_result(myName, myResult)
+        self._append_indicator(myName, myResult)
@@ -32,6 +32,7 @@ class AggregationCategoricalPostprocessor(AbstractPostprocessor):
         AbstractPostprocessor.__init__(self)
         self.impact_classes = None
         self.impact_attrs = None
+        self.impact_counts = None
         self.target_field = None
 
     def setup(self, params):
@@ -39,7 +40,10 @@ class AggregationCategoricalPostprocessor(AbstractPostprocessor):
          initialized
 
         Args:
-            params: dict of parameters to pass to the post processor
+            params: dict of parameters to pass to the post processor.
+                If it contains 'impact_counts', a dict of precomputed counts
+                per impact class, these are used instead of counting the
+                features in 'impact_attrs'.
         Returns:
             None
         Raises:
@@ -48,13 +52,14 @@ class AggregationCategoricalPostprocessor(AbstractPostprocessor):
         AbstractPostprocessor.setup(self, None)
         if (self.impact_classes is not None or
             self.impact_attrs is not None or
+            self.impact_counts is not None or
             self.target_field is not None):
             self._raise_error('clear needs to be called before setup')
 
         self.impact_classes = params['impact_classes']
         self.impact_attrs = params['impact_attrs']
+        self.impact_counts = params.get('impact_counts')
         self.target_field = params['target_field']
-        self._log_message(self.impact_attrs)
 
     def process(self):
         """concrete implementation it takes care of the needed parameters being
@@ -69,7 +74,7 @@ class AggregationCategoricalPostprocessor(AbstractPostprocessor):
         """
         AbstractPostprocessor.process(self)
         if (self.impact_classes is None or
-            self.impact_attrs is None or
+            (self.impact_attrs is None and self.impact_counts is None) or
             self.target_field is None):
             self._log_message('%s not all params have been correctly '
                               'initialized, setup needs to be called before '
@@ -92,6 +97,7 @@ class AggregationCategoricalPostprocessor(AbstractPostprocessor):
         AbstractPostprocessor.clear(self)
         self.impact_classes = None
         self.impact_attrs = None
+        self.impact_counts = None
         self.target_field = None
 
     def _calculate_categories(self):
@@ -109,14 +115,17 @@ class AggregationCategoricalPostprocessor(AbstractPostprocessor):
 
         impact_name = tr(self.target_field).lower()
 
-        results = {}
-        for impact_class in self.impact_classes:
-            results[impact_class] = 0
+        if self.impact_counts is not None:
+            results = self.impact_counts
+        else:
+            results = {}
+            for impact_class in self.impact_classes:
+                results[impact_class] = 0
 
-        for feature in self.impact_attrs:
-            myTarget = feature[self.target_field]
-            results[myTarget] += 1
+            for feature in self.impact_attrs:
+                myTarget = feature[self.target_field]
+                results[myTarget] += 1
 
         for impact_class in self.impact_classes:
-            result = results[impact_class]
+            result = results.get(impact_class, 0)
             self._append_result('%s %s' % (impact_name, impact_class), result)
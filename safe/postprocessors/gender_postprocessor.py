@@ -69,6 +69,38 @@ class GenderPostprocessor(AbstractPostprocessor):
             self._calculate_weekly_hygene_packs()
             self._calculate_weekly_increased_calories()
 
+    def process_zones(self, zones_params):
+        """concrete implementation it calculates the indicators for a whole
+        table of zones at once
+
+        impact_total and female_ratio are set as columns over the zones so
+        that each indicator is calculated for all zones in one go
+
+        Args:
+            zones_params: list of parameter dicts, one per zone, as they
+                would be passed to setup
+        Returns:
+            list of results (Odict) in the same order as zones_params
+        Raises:
+            None
+        """
+        AbstractPostprocessor.setup_zones(self, len(zones_params))
+        if self.impact_total is not None or self.female_ratio is not None:
+            self._raise_error('clear needs to be called before setup')
+        self.impact_total = self._get_column(zones_params, 'impact_total')
+        self.female_ratio = self._get_column(zones_params, 'female_ratio')
+
+        self._calculate_total()
+        self._calculate_females()
+        self._calculate_weekly_hygene_packs()
+        self._calculate_weekly_increased_calories()
+
+        skipped = [x['impact_total'] is None or x['female_ratio'] is None
+                   for x in zones_params]
+        zones_results = self.zones_results(skipped)
+        self.clear()
+        return zones_results
+
     def clear(self):
         """concrete implementation it takes care of the needed parameters being
          properly cleared
@@ -98,17 +130,8 @@ class GenderPostprocessor(AbstractPostprocessor):
         """
         myName = tr('Total')
 
-        #FIXME (MB) Shameless hack to deal with issue #368
-        if self.impact_total > 8000000000 or self.impact_total < 0:
-            self._append_result(myName, self.NO_DATA_TEXT)
-            return
-
-        try:
-            myResult = self.impact_total
-            myResult = int(round(myResult))
-        except ValueError:
-            myResult = self.NO_DATA_TEXT
-        self._append_result(myName, myResult)
+        myResult = self.impact_total
+        self._append_indicator(myName, myResult)
 
     def _calculate_females(self):
         """Female population count indicator.
@@ -125,17 +148,8 @@ class GenderPostprocessor(AbstractPostprocessor):
         """
         myName = tr('Female population')
 
-        #FIXME (MB) Shameless hack to deal with issue #368
-        if self.impact_total > 8000000000 or self.impact_total < 0:
-            self._append_result(myName, self.NO_DATA_TEXT)
-            return
-
         myResult = self.impact_total * self.female_ratio
-        try:
-            myResult = int(round(myResult))
-        except ValueError:
-            myResult = self.NO_DATA_TEXT
-        self._append_result(myName, myResult)
+        self._append_indicator(myName, myResult)
 
     def _calculate_weekly_hygene_packs(self):
         """Weekly requirements of female hygiene packs indicator.
@@ -154,19 +168,10 @@ class GenderPostprocessor(AbstractPostprocessor):
         myName = tr('Weekly hygiene packs')
         myMeta = {'description': 'Females hygiene packs for weekly use'}
 
-        #FIXME (MB) Shameless hack to deal with issue #368
-        if self.impact_total > 8000000000 or self.impact_total < 0:
-            self._append_result(myName, self.NO_DATA_TEXT, myMeta)
-            return
-
         #weekly hygene packs =
         # affected pop * fem_ratio * 0.7937 * week / intended day-of-use
         myResult = self.impact_total * self.female_ratio * 0.7937 * (7 / 7)
-        try:
-            myResult = int(round(myResult))
-        except ValueError:
-            myResult = self.NO_DATA_TEXT
-        self._append_result(myName, myResult, myMeta)
+        self._append_indicator(myName, myResult, myMeta)
 
     def _calculate_weekly_increased_calories(self):
         """Weekly additional kg of rice for pregnant and lactating women
@@ -189,18 +194,9 @@ class GenderPostprocessor(AbstractPostprocessor):
         myMeta = {'description': 'Additional rice kg per week for pregnant and'
                                  ' lactating women'}
 
-        #FIXME (MB) Shameless hack to deal with issue #368
-        if self.impact_total > 8000000000 or self.impact_total < 0:
-            self._append_result(myName, self.NO_DATA_TEXT, myMeta)
-            return
-
         #weekly Kg rice =
         # affected pop * fem_ratio * 0.7937 * week / intended day-of-use
         myLactKg = self.impact_total * self.female_ratio * 2 * 0.033782
         myPregKg = self.impact_total * self.female_ratio * 2 * 0.01281
         myResult = myLactKg + myPregKg
-        try:
-            myResult = int(round(myResult))
-        except ValueError:
-            myResult = self.NO_DATA_TEXT
-        self._append_result(myName, myResult, myMeta)
+        self._append_indicator(myName, myResult, myMeta)
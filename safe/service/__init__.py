@@ -0,0 +1,10 @@
+"""Local HTTP service running SAFE analyses in pre-warmed workers.
+
+Start it with::
+
+    python -m safe.service.server --workers 4 --preload exposure.shp
+
+or from Python with safe.service.server.start_service. Analyses are run
+by a pool of worker processes (see safe.service.pool) that keep the
+impact functions loaded and the layers they have read in memory.
+"""
@@ -0,0 +1,598 @@
+"""Pool of worker processes running SAFE analyses.
+
+Each worker imports SAFE and loads the impact functions once when it
+starts. It then keeps the layers it has read, and the interpolation
+results cached for them, in memory between jobs. Exposure layers used by
+most jobs can be read by all workers in advance by passing them as
+preload.
+
+Jobs are dictionaries of one of these types::
+
+    {'type': 'impact', 'hazard': path, 'exposure': path,
+     'function': name, 'output': path (optional)}
+
+    {'type': 'plugins', 'hazard': path, 'exposure': path}
+
+For batch analyses the hazard of an impact job can be a list of paths.
+The impact of each is then calculated with calculate_impacts and the
+summary table returned, with the impact layers written to the output
+directory if one is given.
+"""
+
+import os
+import atexit
+import time
+import json
+import Queue
+import logging
+import itertools
+import threading
+import multiprocessing
+
+from safe.api import (read_layer,
+                      get_plugins,
+                      get_admissible_plugins,
+                      calculate_impact,
+                      calculate_impacts,
+                      enable_interpolation_cache)
+from safe.common.utilities import verify
+from safe.common.exceptions import QueueFullError
+from third_party.odict import OrderedDict
+
+LOGGER = logging.getLogger('InaSAFE')
+
+# Number of worker processes, i.e. of jobs run at the same time
+DEFAULT_WORKERS = 2
+
+# Number of jobs that may wait for a worker before new ones are refused
+DEFAULT_MAX_QUEUED = 20
+
+# Number of layers each worker keeps in memory
+DEFAULT_MAX_LAYERS = 10
+
+# Seconds a job may wait for a worker before it fails
+DEFAULT_QUEUE_TIMEOUT = 3600
+
+# Number of finished jobs whose status is kept
+MAX_FINISHED_JOBS = 1000
+
+# Seconds between checks that workers are alive
+POLL_INTERVAL = 1.0
+
+JOB_TYPES = ['impact', 'plugins']
+
+
+class LayerCache:
+    """Layers read from file kept in memory by file name
+    """
+
+    def __init__(self, max_layers=DEFAULT_MAX_LAYERS):
+        """Create empty cache
+
+        Input
+            max_layers: Number of layers to keep. The least recently used
+                        one is dropped when more are read.
+        """
+
+        self.max_layers = max_layers
+        self.layers = OrderedDict()
+
+    def load(self, filename):
+        """Read layer unless it is in the cache already
+
+        Input
+            filename: Name of raster or vector file
+
+        Output
+            Cached layer
+
+        Note
+            A layer is read again if its file has changed since.
+        """
+
+        filename = os.path.abspath(filename)
+        mtime = os.path.getmtime(filename)
+
+        entry = self.layers.pop(filename, None)
+        if entry is None or entry[0] != mtime:
+            entry = (mtime, read_layer(filename))
+        self.layers[filename] = entry
+
+        while len(self.layers) > self.max_layers:
+            self.layers.popitem(0)
+        return entry[1]
+
+    def get(self, filename):
+        """Get layer read from file
+
+        Input
+            filename: Name of raster or vector file
+
+        Output
+            The layer itself if it is a raster read from file, as its data
+            is read anew on every call of get_data. Other layers hold their
+            data in memory and are handed out as copies since impact
+            functions may change the data of their input layers. Copies
+            keep the name and style of the layer as well as its file name
+            so that the interpolation cache recognises them without
+            hashing their data.
+        """
+
+        layer = self.load(filename)
+        if layer.is_raster and getattr(layer, 'data', None) is None:
+            return layer
+
+        copy = layer.copy()
+        copy.name = layer.name
+        copy.style_info = dict(layer.style_info)
+        copy.filename = layer.filename
+        copy.sublayer = layer.sublayer
+        return copy
+
+
+def check_job(job):
+    """Check that job is a valid request
+
+    Raises
+        VerificationError with a message for the client if it is not
+    """
+
+    verify(isinstance(job, dict), 'Job must be a JSON object')
+
+    msg = ('Job type must be one of %s. I got %s'
+           % (', '.join(JOB_TYPES), job.get('type')))
+    verify(job.get('type') in JOB_TYPES, msg)
+
+    if job['type'] == 'impact':
+        required = ['hazard', 'exposure', 'function']
+    else:
+        required = ['hazard', 'exposure']
+    for key in required:
+        msg = 'Job of type %s must have %s' % (job['type'], key)
+        verify(key in job, msg)
+
+
+def to_json(value):
+    """Value with what can not be stored as JSON replaced by strings
+    """
+
+    try:
+        json.dumps(value)
+    except (TypeError, ValueError):
+        if isinstance(value, dict):
+            return dict((str(k), to_json(v)) for k, v in value.items())
+        if isinstance(value, (list, tuple)):
+            return [to_json(v) for v in value]
+        return str(value)
+    return value
+
+
+def get_function(name):
+    """Impact function of given name
+    """
+
+    plugins = get_plugins(name)
+    msg = 'Impact function %s not found' % name
+    verify(len(plugins) == 1, msg)
+    return plugins[0][name]
+
+
+def run_job(job, layers):
+    """Run one job
+
+    Input
+        job: Job as described in module docstring
+        layers: LayerCache of the worker
+
+    Output
+        Dictionary with the result of the job:
+            plugins: 'functions', sorted names of admissible functions
+            impact: 'filename' and 'keywords' of the impact layer or, for
+                    a list of hazards, 'summary' as from calculate_impacts
+    """
+
+    hazard = job['hazard']
+    exposure = layers.get(job['exposure'])
+
+    if job['type'] == 'plugins':
+        keywords = [layers.get(hazard).get_keywords(),
+                    exposure.get_keywords()]
+        return {'functions': sorted(get_admissible_plugins(keywords).keys())}
+
+    function = get_function(job['function'])
+    output = job.get('output')
+
+    if isinstance(hazard, list):
+        summary = calculate_impacts(hazard, exposure, function,
+                                    output_dir=output)
+        return {'summary': to_json([dict(row) for row in summary])}
+
+    impact = calculate_impact([layers.get(hazard), exposure], function,
+                              write_result=output is None)
+    if output is not None:
+        impact.write_to_file(output)
+    return {'filename': impact.get_filename(),
+            'keywords': to_json(impact.get_keywords())}
+
+
+def worker(jobs, messages, current, preload, max_layers):
+    """Main function of worker processes
+
+    Input
+        jobs: Queue of (job id, job, deadline) tuples. Jobs taken after
+              their deadline, in seconds since the epoch, are skipped as
+              the pool fails them. None stops the worker.
+        messages: Queue of (job id, status, pid, result or error)
+                  tuples sent to the pool
+        current: Shared integer set to the id of the job being run, 0
+                 when idle. Unlike messages, which are sent by a
+                 background thread, it is set before the job starts so
+                 that the pool knows which job a crashed worker was
+                 running.
+        preload: List of files to read before taking jobs
+        max_layers: Number of layers to keep in memory
+    """
+
+    # Warm up: find all impact functions and read the common layers.
+    # Layers are read from file and kept, so interpolation results for
+    # them can be reused by later jobs.
+    get_plugins()
+    enable_interpolation_cache()
+    layers = LayerCache(max(max_layers, len(preload)))
+    for filename in preload:
+        try:
+            layers.load(filename)
+        except Exception, e:  # pylint: disable=W0703
+            LOGGER.error('Could not preload %s: %s' % (filename, e))
+
+    pid = os.getpid()
+    while True:
+        entry = jobs.get()
+        if entry is None:
+            return
+
+        job_id, job, deadline = entry
+        if time.time() > deadline:
+            continue
+
+        current.value = int(job_id)
+        messages.put((job_id, 'running', pid, None))
+        try:
+            result = run_job(job, layers)
+        except Exception, e:  # pylint: disable=W0703
+            LOGGER.exception('Job %s failed' % job_id)
+            messages.put((job_id, 'failed', pid,
+                          '%s: %s' % (e.__class__.__name__, e)))
+        else:
+            messages.put((job_id, 'done', pid, result))
+        current.value = 0
+
+
+def start_worker(jobs, messages, preload, max_layers):
+    """Start one worker process
+
+    Output
+        Tuple of the process and the shared id of its current job
+    """
+
+    current = multiprocessing.Value('i', 0)
+    process = multiprocessing.Process(target=worker,
+                                      args=(jobs, messages, current,
+                                            preload, max_layers))
+    process.daemon = True
+    process.start()
+    return process, current
+
+
+def spawner(jobs, messages, notices, closing, alive, workers, preload,
+            max_layers):
+    """Main function of the process starting the workers
+
+    The pool forks this process before it starts any thread, and it runs
+    no threads itself. Workers, also those replacing workers that died,
+    are therefore never forked from a process where another thread may
+    hold a lock of the logging module or of the queues. The workers are
+    daemonic, so they are stopped when the spawner returns, which it also
+    does when the pool process ended without closing the pool.
+
+    Input
+        jobs, messages, preload, max_layers: As for worker
+        notices: Connection to send (job id, error) tuples to the pool
+                 for jobs of workers that died
+        closing: Event set by the pool when the workers are to stop
+        alive: Shared integer set to the number of live workers
+        workers: Number of worker processes
+    """
+
+    parent = os.getppid()
+    processes = []
+    while True:
+        if os.getppid() != parent:
+            return
+
+        for process, current in list(processes):
+            if process.is_alive():
+                continue
+
+            processes.remove((process, current))
+            if process.exitcode != 0 or current.value:
+                LOGGER.error('Worker %i ended with exit code %s'
+                             % (process.pid, process.exitcode))
+            if current.value:
+                notices.send((str(current.value),
+                              'Worker ended with exit code %s'
+                              % process.exitcode))
+
+        if closing.is_set():
+            if not processes:
+                alive.value = 0
+                return
+        else:
+            while len(processes) < workers:
+                processes.append(start_worker(jobs, messages, preload,
+                                              max_layers))
+
+        alive.value = len(processes)
+        time.sleep(POLL_INTERVAL)
+
+
+class WorkerPool:
+    """Pre-warmed worker processes with a queue of jobs
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, preload=None,
+                 max_queued=DEFAULT_MAX_QUEUED,
+                 max_layers=DEFAULT_MAX_LAYERS,
+                 queue_timeout=DEFAULT_QUEUE_TIMEOUT):
+        """Start worker processes
+
+        The pool must be created before any other thread of the process
+        is started, as it forks the process starting the workers.
+
+        Input
+            workers: Number of worker processes. This is the number of
+                     jobs run at the same time.
+            preload: Optional list of layer files, e.g. exposure data,
+                     that every worker reads when it starts
+            max_queued: Number of jobs that may wait for a worker
+            max_layers: Number of layers each worker keeps in memory
+            queue_timeout: Seconds a job may wait for a worker. Jobs
+                           waiting longer fail. This also fails jobs
+                           lost by a worker that died before it could
+                           report them as running.
+        """
+
+        verify(workers > 0, 'Number of workers must be positive')
+
+        self.max_queued = max_queued
+        self.preload = list(preload or [])
+        self.max_layers = max_layers
+
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.counter = itertools.count(1)
+        self.job_queue = multiprocessing.Queue()
+        self.messages = multiprocessing.Queue()
+
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+
+        # Workers are started and replaced by a process of their own
+        self.notices, notices = multiprocessing.Pipe(duplex=False)
+        self.closing = multiprocessing.Event()
+        self.alive = multiprocessing.Value('i', 0)
+        self.spawner = multiprocessing.Process(target=spawner,
+                                               args=(self.job_queue,
+                                                     self.messages,
+                                                     notices,
+                                                     self.closing,
+                                                     self.alive,
+                                                     workers,
+                                                     self.preload,
+                                                     self.max_layers))
+        self.spawner.start()
+        atexit.register(self.close)
+
+        # Wait for the first workers so that status counts them
+        while self.alive.value < workers and self.spawner.is_alive():
+            time.sleep(0.01)
+
+        self.closed = False
+        self.stopped = False
+        self.collector = threading.Thread(target=self._collect,
+                                          name='collector')
+        self.collector.daemon = True
+        self.collector.start()
+
+    def submit(self, job):
+        """Queue job for the workers
+
+        Input
+            job: Job as described in the module docstring
+
+        Output
+            Id of job to get its status with
+
+        Raises
+            VerificationError if job is not valid
+            QueueFullError if max_queued jobs are waiting already
+        """
+
+        check_job(job)
+
+        self.lock.acquire()
+        try:
+            verify(not self.closed, 'Worker pool has been closed')
+            queued = len([x for x in self.jobs.values()
+                          if x['status'] == 'queued'])
+            if queued >= self.max_queued:
+                msg = ('%i jobs are waiting already. Try again later.'
+                       % queued)
+                raise QueueFullError(msg)
+
+            job_id = str(self.counter.next())
+            submitted = time.time()
+            self.jobs[job_id] = {'id': job_id,
+                                 'job': job,
+                                 'status': 'queued',
+                                 'submitted': submitted,
+                                 'started': None,
+                                 'finished': None,
+                                 'result': None,
+                                 'error': None}
+            self._forget_finished()
+        finally:
+            self.lock.release()
+
+        self.job_queue.put((job_id, job, submitted + self.queue_timeout))
+        return job_id
+
+    def _forget_finished(self):
+        """Drop oldest finished jobs beyond MAX_FINISHED_JOBS
+        """
+
+        finished = [job_id for job_id, status in self.jobs.items()
+                    if status['finished'] is not None]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        """Status of job as dictionary or None if the job is not known
+
+        The dictionary has the job, its status ('queued', 'running',
+        'done' or 'failed'), the times it was submitted, started and
+        finished and its result or error message.
+        """
+
+        self.lock.acquire()
+        try:
+            status = self.jobs.get(job_id)
+            if status is None:
+                return None
+            return dict(status)
+        finally:
+            self.lock.release()
+
+    def get_all(self):
+        """Status of all jobs known in order of submission
+        """
+
+        self.lock.acquire()
+        try:
+            return [dict(status) for status in self.jobs.values()]
+        finally:
+            self.lock.release()
+
+    def wait(self, job_id, timeout=None):
+        """Wait for job to finish
+
+        Output
+            Status of job as from get. Its status is still 'queued' or
+            'running' if it did not finish within timeout seconds.
+        """
+
+        start = time.time()
+        while True:
+            status = self.get(job_id)
+            if status is None or status['finished'] is not None:
+                return status
+            if timeout is not None and time.time() - start > timeout:
+                return status
+            time.sleep(0.05)
+
+    def status(self):
+        """Numbers of workers and of jobs by status
+        """
+
+        self.lock.acquire()
+        try:
+            counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+            for status in self.jobs.values():
+                counts[status['status']] += 1
+        finally:
+            self.lock.release()
+
+        return {'workers': self.alive.value,
+                'max_queued': self.max_queued,
+                'jobs': counts}
+
+    def _collect(self):
+        """Update jobs with messages from workers and the spawner
+        """
+
+        while not self.stopped:
+            try:
+                job_id, status, _, value = self.messages.get(
+                    timeout=POLL_INTERVAL)
+            except Queue.Empty:
+                pass
+            else:
+                self._update(job_id, status, value)
+
+            try:
+                while self.notices.poll():
+                    job_id, error = self.notices.recv()
+                    self._update(job_id, 'failed', error)
+            except EOFError:
+                # The spawner has ended as the pool is being closed
+                pass
+            self._expire_queued()
+
+    def _update(self, job_id, status, value):
+        """Set status of job with its result or error message
+        """
+
+        self.lock.acquire()
+        try:
+            entry = self.jobs.get(job_id)
+            # Jobs of crashed workers may have been failed already
+            if entry is not None and entry['finished'] is None:
+                entry['status'] = status
+                if status == 'running':
+                    entry['started'] = time.time()
+                else:
+                    entry['finished'] = time.time()
+                    if status == 'done':
+                        entry['result'] = value
+                    else:
+                        entry['error'] = value
+        finally:
+            self.lock.release()
+
+    def _expire_queued(self):
+        """Fail jobs that waited for a worker longer than queue_timeout
+        """
+
+        now = time.time()
+        self.lock.acquire()
+        try:
+            for entry in self.jobs.values():
+                if (entry['status'] == 'queued' and
+                        now - entry['submitted'] > self.queue_timeout):
+                    entry['status'] = 'failed'
+                    entry['finished'] = now
+                    entry['error'] = ('Job waited more than %i seconds '
+                                      'for a worker' % self.queue_timeout)
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """Stop workers after their current jobs
+        """
+
+        self.lock.acquire()
+        try:
+            if self.closed:
+                return
+            self.closed = True
+        finally:
+            self.lock.release()
+
+        # Workers are joined by the spawner while the collector still
+        # reads their messages as they can not end before these are sent.
+        self.closing.set()
+        for _ in range(self.workers):
+            self.job_queue.put(None)
+        self.spawner.join()
+        self.stopped = True
+        self.collector.join()
@@ -0,0 +1,236 @@
+"""HTTP server for SAFE analyses on the local machine.
+
+Usage::
+
+    python -m safe.service.server [--port N] [--workers N]
+                                  [--preload FILE ...]
+
+Requests and responses are JSON. The server listens on 127.0.0.1 only.
+
+    GET  /status
+        Numbers of workers and of jobs by status
+    GET  /plugins?hazard=FILE&exposure=FILE
+        Names of impact functions admissible for the two layers
+    POST /jobs
+        Queue a job (see safe.service.pool) and return its id. Responds
+        with 503 if too many jobs are waiting already.
+    GET  /jobs
+        Status of all jobs
+    GET  /jobs/ID
+        Status of one job with its result once it is done
+"""
+
+import sys
+import json
+import time
+import logging
+import urlparse
+import threading
+from optparse import OptionParser
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from safe.common.utilities import VerificationError
+from safe.common.exceptions import QueueFullError
+from safe.service.pool import (WorkerPool,
+                               DEFAULT_WORKERS,
+                               DEFAULT_MAX_QUEUED)
+
+LOGGER = logging.getLogger('InaSAFE')
+
+DEFAULT_PORT = 8765
+
+# Seconds the plugins request waits for its answer
+PLUGINS_TIMEOUT = 60
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Handle requests to the analysis service
+    """
+
+    def send_json(self, code, value):
+        """Send response with value as JSON
+        """
+
+        body = json.dumps(value)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, code, message):
+        """Send error response with message as JSON
+        """
+
+        self.send_json(code, {'error': message})
+
+    def do_GET(self):
+        """Status of service or jobs and admissible plugins
+        """
+
+        pool = self.server.pool
+        url = urlparse.urlparse(self.path)
+        parts = [x for x in url.path.split('/') if x]
+
+        if parts == ['status']:
+            self.send_json(200, pool.status())
+        elif parts == ['plugins']:
+            self.get_plugins(urlparse.parse_qs(url.query))
+        elif parts == ['jobs']:
+            self.send_json(200, pool.get_all())
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            status = pool.get(parts[1])
+            if status is None:
+                self.send_error_json(404, 'Job %s not found' % parts[1])
+            else:
+                self.send_json(200, status)
+        else:
+            self.send_error_json(404, 'Unknown path %s' % url.path)
+
+    def get_plugins(self, query):
+        """Run plugins job and send its result
+        """
+
+        job = {'type': 'plugins'}
+        for key in ['hazard', 'exposure']:
+            if key in query:
+                job[key] = query[key][0]
+
+        try:
+            job_id = self.server.pool.submit(job)
+        except VerificationError, e:
+            self.send_error_json(400, str(e))
+            return
+        except QueueFullError, e:
+            self.send_error_json(503, str(e))
+            return
+
+        status = self.server.pool.wait(job_id, timeout=PLUGINS_TIMEOUT)
+        if status['status'] == 'done':
+            self.send_json(200, status['result']['functions'])
+        elif status['status'] == 'failed':
+            self.send_error_json(500, status['error'])
+        else:
+            self.send_error_json(504, 'Job %s did not finish in time. Poll '
+                                      '/jobs/%s for its result'
+                                      % (job_id, job_id))
+
+    def do_POST(self):
+        """Queue job
+        """
+
+        if self.path.rstrip('/') != '/jobs':
+            self.send_error_json(404, 'Unknown path %s' % self.path)
+            return
+
+        try:
+            length = int(self.headers.getheader('Content-Length', 0))
+            job = json.loads(self.rfile.read(length))
+        except ValueError, e:
+            self.send_error_json(400, 'Invalid JSON: %s' % e)
+            return
+
+        try:
+            job_id = self.server.pool.submit(job)
+        except VerificationError, e:
+            self.send_error_json(400, str(e))
+            return
+        except QueueFullError, e:
+            self.send_error_json(503, str(e))
+            return
+
+        self.send_json(202, {'id': job_id, 'status': 'queued',
+                             'url': '/jobs/%s' % job_id})
+
+    def log_message(self, format, *args):
+        """Log requests with the SAFE logger rather than to stderr
+        """
+
+        LOGGER.debug('%s - %s' % (self.address_string(), format % args))
+
+
+class ServiceServer(ThreadingMixIn, HTTPServer):
+    """HTTP server handling each request in a thread of its own
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, pool):
+        """Create server
+
+        Input
+            address: (host, port) tuple. Port 0 picks a free port.
+            pool: WorkerPool running the jobs
+        """
+
+        HTTPServer.__init__(self, address, ServiceHandler)
+        self.pool = pool
+
+    def close(self):
+        """Stop serving and stop the workers
+        """
+
+        self.shutdown()
+        self.server_close()
+        self.pool.close()
+
+
+def start_service(port=DEFAULT_PORT, workers=DEFAULT_WORKERS,
+                  preload=None, max_queued=DEFAULT_MAX_QUEUED):
+    """Start workers and serve requests in a background thread
+
+    Input
+        port: Port on 127.0.0.1 to listen to. 0 picks a free port which
+              is then found as server.server_address[1].
+        workers: Number of worker processes
+        preload: Optional list of layer files every worker reads when it
+                 starts, e.g. exposure data used by most jobs
+        max_queued: Number of jobs that may wait for a worker
+
+    Output
+        ServiceServer. Call its close method to stop it.
+    """
+
+    # The pool forks the process starting its workers before any
+    # thread of the server is started
+    pool = WorkerPool(workers=workers, preload=preload,
+                      max_queued=max_queued)
+    server = ServiceServer(('127.0.0.1', port), pool)
+
+    thread = threading.Thread(target=server.serve_forever,
+                              name='service')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main(argv=None):
+    """Run service as given on the command line until interrupted
+    """
+
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--port', type='int', default=DEFAULT_PORT,
+                      help='Port on 127.0.0.1 to listen to')
+    parser.add_option('--workers', type='int', default=DEFAULT_WORKERS,
+                      help='Number of worker processes')
+    parser.add_option('--max-queued', type='int', default=DEFAULT_MAX_QUEUED,
+                      help='Number of jobs that may wait for a worker')
+    parser.add_option('--preload', action='append', default=[],
+                      help='Layer file read by all workers at start')
+    options, _ = parser.parse_args(argv)
+
+    server = start_service(port=options.port, workers=options.workers,
+                           preload=options.preload,
+                           max_queued=options.max_queued)
+    print 'Serving on http://%s:%i/' % server.server_address
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    server.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import urllib2
+import unittest
+import numpy
+
+from safe.common.testing import TESTDATA
+from safe.common.utilities import VerificationError
+from safe.common.exceptions import QueueFullError
+from safe.service.pool import LayerCache, WorkerPool, check_job
+from safe.service.server import start_service
+
+HAZARD = '%s/Earthquake_Ground_Shaking_clip.tif' % TESTDATA
+EXPOSURE = '%s/Population_2010_clip.tif' % TESTDATA
+VECTOR = '%s/test_buildings.shp' % TESTDATA
+FUNCTION = 'Earthquake Fatality Function'
+
+
+def request(server, path, job=None):
+    """Send request to service and return status code and decoded JSON
+    """
+
+    url = 'http://127.0.0.1:%i%s' % (server.server_address[1], path)
+    if job is None:
+        data = None
+    else:
+        data = json.dumps(job)
+
+    try:
+        response = urllib2.urlopen(url, data)
+    except urllib2.HTTPError, e:
+        return e.code, json.loads(e.read())
+    return response.getcode(), json.loads(response.read())
+
+
+class Test_Service(unittest.TestCase):
+    """Tests of the analysis service
+    """
+
+    def test_layer_cache(self):
+        """Layers are read once and vectors are handed out as copies
+        """
+
+        cache = LayerCache(max_layers=1)
+
+        # Rasters read from file are handed out as they are as their
+        # data is read from file anew
+        R1 = cache.get(EXPOSURE)
+        R2 = cache.get(EXPOSURE)
+        assert R1 is R2
+        assert R1.get_filename() == os.path.abspath(EXPOSURE)
+        A = R1.get_data()
+        A[:] = 0
+        assert not numpy.all(R2.get_data() == 0)
+
+        # Vectors are held in memory and handed out as copies
+        V1 = cache.get(VECTOR)
+        V2 = cache.get(VECTOR)
+        assert V1 is not V2
+        assert V1 == V2
+        assert V1.get_filename() == os.path.abspath(VECTOR)
+
+        # Copies keep the name of the layer used in impact questions
+        assert V1.get_name() is not None
+        assert V1.get_name() == cache.load(VECTOR).get_name()
+
+        # Changing a copy leaves the cached layer alone
+        V1.get_data()[0]['changed'] = True
+        assert 'changed' not in cache.get(VECTOR).get_data()[0]
+
+        # Least recently used layer is dropped
+        cache.get(HAZARD)
+        assert cache.layers.keys() == [os.path.abspath(HAZARD)]
+
+    def test_check_job(self):
+        """Invalid jobs are refused
+        """
+
+        check_job({'type': 'plugins', 'hazard': HAZARD,
+                   'exposure': EXPOSURE})
+        for job in [[], {'type': 'unknown'},
+                    {'type': 'impact', 'hazard': HAZARD,
+                     'exposure': EXPOSURE}]:
+            self.assertRaises(VerificationError, check_job, job)
+
+    def test_queue_limit(self):
+        """Jobs beyond the limit of waiting jobs are refused
+        """
+
+        pool = WorkerPool(workers=1, max_queued=0)
+        try:
+            self.assertRaises(QueueFullError, pool.submit,
+                              {'type': 'plugins', 'hazard': HAZARD,
+                               'exposure': EXPOSURE})
+        finally:
+            pool.close()
+
+    def test_queue_timeout(self):
+        """Jobs waiting for a worker longer than the timeout fail
+        """
+
+        pool = WorkerPool(workers=1, queue_timeout=0)
+        try:
+            job_id = pool.submit({'type': 'plugins', 'hazard': HAZARD,
+                                  'exposure': EXPOSURE})
+            status = pool.wait(job_id, timeout=10)
+            assert status['status'] == 'failed'
+            assert 'waited' in status['error']
+            assert pool.status()['workers'] == 1
+        finally:
+            pool.close()
+
+    def test_service(self):
+        """Analyses are run through the service on localhost
+        """
+
+        server = start_service(port=0, workers=2, preload=[EXPOSURE])
+        try:
+            code, status = request(server, '/status')
+            assert code == 200
+            assert status['workers'] == 2
+
+            code, functions = request(server,
+                                      '/plugins?hazard=%s&exposure=%s'
+                                      % (HAZARD, EXPOSURE))
+            assert code == 200
+            assert FUNCTION in functions
+
+            code, answer = request(server, '/jobs',
+                                   {'type': 'impact', 'hazard': HAZARD,
+                                    'exposure': EXPOSURE,
+                                    'function': FUNCTION})
+            assert code == 202
+            job_id = answer['id']
+
+            # Unknown functions fail in the worker
+            code, answer = request(server, '/jobs',
+                                   {'type': 'impact', 'hazard': HAZARD,
+                                    'exposure': EXPOSURE,
+                                    'function': 'No such function'})
+            assert code == 202
+            failed_id = answer['id']
+
+            # Poll for the result
+            for _ in range(600):
+                code, status = request(server, '/jobs/%s' % job_id)
+                assert code == 200
+                if status['finished'] is not None:
+                    break
+                time.sleep(0.1)
+            msg = 'Job failed: %s' % status['error']
+            assert status['status'] == 'done', msg
+            assert os.path.isfile(status['result']['filename'])
+            assert 'impact_summary' in status['result']['keywords']
+
+            code, status = request(server, '/jobs/%s' % failed_id)
+            assert status['status'] in ['queued', 'running', 'failed']
+
+            code, jobs = request(server, '/jobs')
+            assert [x['id'] for x in jobs] == [job_id, failed_id]
+
+            # Errors
+            code, answer = request(server, '/jobs/unknown')
+            assert code == 404
+            code, answer = request(server, '/jobs', {'type': 'impact'})
+            assert code == 400
+            assert 'must have' in answer['error']
+        finally:
+            server.close()
+
+
+if __name__ == '__main__':
+    suite = unittest.makeSuite(Test_Service, 'test')
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -1,9 +1,14 @@
-"""Raster clipping by polygons
+"""Raster clipping by polygons and bounding boxes
 """
 
+import numpy
+
+from safe.common.utilities import verify
 from safe.common.polygon import clip_grid_by_polygons
 #from safe.common.polygon import clip_lines_by_polygon
 
+from raster import Raster
+
 
 # FIXME (Ole): Order should be reversed and this should move into
 # interpolation module.
@@ -27,3 +32,269 @@ def clip_raster_by_polygons(R, P):
 
     # Return
     return res
+
+
+# Admissible values of the method argument of clip_raster
+#   nearest: Value of the source cell containing the target cell centre
+#   bilinear: Bilinear interpolation between source cell centres
+#   mean: Area weighted average of the source cells covered
+#   sum: Area weighted sum of the source cells covered (preserves totals)
+RESAMPLING_METHODS = ['nearest', 'bilinear', 'mean', 'sum']
+
+
+def get_resampling_method(keywords):
+    """Choose resampling method appropriate for a layer
+
+    Args:
+        * keywords: Layer keywords
+
+    Returns:
+        * 'mean' for population data and 'nearest' otherwise.
+
+    Note:
+        Population grids are averaged rather than summed as their values
+        are rescaled by get_data according to the ratio between the actual
+        and the native resolution (see keyword 'resolution'). Averaging
+        followed by this scaling preserves the total population.
+    """
+
+    if keywords.get('datatype', '').lower() == 'density':
+        return 'mean'
+    if (keywords.get('category') == 'exposure' and
+            keywords.get('subcategory') == 'population'):
+        return 'mean'
+    return 'nearest'
+
+
+def clip_raster(layer, bbox, cell_size=None, method='nearest',
+                keywords=None, name=None):
+    """Clip raster layer to bounding box and resample if needed
+
+    Args:
+        * layer: Raster layer
+        * bbox: Bounding box [west, south, east, north] in the coordinates
+            of layer
+        * cell_size: Optional cell size of the result. If None, the cell
+            size of layer is kept and the result is aligned with its grid.
+        * method: Resampling method. One of RESAMPLING_METHODS.
+        * keywords: Optional keywords added to those of layer for the result
+        * name: Optional name of the result. Default is that of layer.
+
+    Returns:
+        * Raster layer covering bbox. Cells outside layer are NaN.
+
+    Note:
+        With cell_size None and method 'nearest' the result is an exact
+        copy of the grid cells of layer intersecting bbox.
+    """
+
+    msg = ('Resampling method must be one of %s. I got %s'
+           % (RESAMPLING_METHODS, method))
+    verify(method in RESAMPLING_METHODS, msg)
+
+    msg = ('Bounding box must be [west, south, east, north]. I got %s'
+           % str(bbox))
+    verify(len(bbox) == 4 and bbox[0] < bbox[2] and bbox[1] < bbox[3], msg)
+
+    x_origin, dx, x_rotation, y_origin, y_rotation, dy = \
+        layer.get_geotransform()
+    dy = -dy  # Positive row height
+    msg = ('Rotated rasters can not be clipped. Layer %s has geotransform %s'
+           % (layer.get_name(), str(layer.get_geotransform())))
+    verify(x_rotation == 0 and y_rotation == 0 and dx > 0 and dy > 0, msg)
+
+    west, south, east, north = [float(x) for x in bbox]
+
+    # Target grid
+    if cell_size is None:
+        # Align with source grid
+        first_column = int(numpy.floor((west - x_origin) / dx))
+        last_column = int(numpy.ceil((east - x_origin) / dx))
+        first_row = int(numpy.floor((y_origin - north) / dy))
+        last_row = int(numpy.ceil((y_origin - south) / dy))
+
+        target_dx, target_dy = dx, dy
+        target_x = x_origin + first_column * dx
+        target_y = y_origin - first_row * dy
+        columns = max(last_column - first_column, 1)
+        rows = max(last_row - first_row, 1)
+    else:
+        target_dx = target_dy = float(cell_size)
+        target_x = west
+        target_y = north
+        columns = max(int(numpy.ceil((east - west) / target_dx - 1.0e-9)), 1)
+        rows = max(int(numpy.ceil((north - south) / target_dy - 1.0e-9)), 1)
+
+    # Edges of target cells in fractional source cell indices
+    column_edges = (target_x + numpy.arange(columns + 1) * target_dx -
+                    x_origin) / dx
+    row_edges = (y_origin - target_y +
+                 numpy.arange(rows + 1) * target_dy) / dy
+
+    # Window of source grid needed (including a margin for bilinear)
+    margin = 1 if method == 'bilinear' else 0
+    column = max(int(numpy.floor(column_edges[0])) - margin, 0)
+    end_column = min(int(numpy.ceil(column_edges[-1])) + margin,
+                     layer.columns)
+    row = max(int(numpy.floor(row_edges[0])) - margin, 0)
+    end_row = min(int(numpy.ceil(row_edges[-1])) + margin, layer.rows)
+
+    A = numpy.nan * numpy.ones((rows, columns))
+    if end_column > column and end_row > row:
+        S = layer.get_data(nan=True, scaling=False,
+                           window=(row, column, end_row - row,
+                                   end_column - column))
+        column_edges -= column
+        row_edges -= row
+
+        if method == 'nearest':
+            A = _nearest(S, row_edges, column_edges)
+        elif method == 'bilinear':
+            A = _bilinear(S, row_edges, column_edges)
+        else:
+            A = _aggregate(S, row_edges, column_edges, method)
+
+    result_keywords = layer.get_keywords()
+    if keywords is not None:
+        result_keywords.update(keywords)
+
+    if name is None:
+        name = layer.get_name()
+
+    return Raster(data=A,
+                  projection=layer.get_projection(),
+                  geotransform=(target_x, target_dx, 0,
+                                target_y, 0, -target_dy),
+                  name=name,
+                  keywords=result_keywords,
+                  style_info=layer.get_style_info())
+
+
+def _cell_centres(edges):
+    """Centres of cells given their edges
+    """
+    return (edges[:-1] + edges[1:]) / 2
+
+
+def _nearest(S, row_edges, column_edges):
+    """Nearest neighbour resampling of source grid S
+
+    Edges are given in fractional indices of S. Target cells whose
+    centre falls outside S are NaN.
+    """
+
+    rows = numpy.floor(_cell_centres(row_edges)).astype(int)
+    columns = numpy.floor(_cell_centres(column_edges)).astype(int)
+
+    valid_rows = (rows >= 0) & (rows < S.shape[0])
+    valid_columns = (columns >= 0) & (columns < S.shape[1])
+
+    A = S[numpy.clip(rows, 0, S.shape[0] - 1)][
+        :, numpy.clip(columns, 0, S.shape[1] - 1)]
+    A[~valid_rows, :] = numpy.nan
+    A[:, ~valid_columns] = numpy.nan
+    return A
+
+
+def _interpolation_weights(centres, n):
+    """Indices and weights for linear interpolation along one axis
+
+    Args:
+        * centres: Target cell centres in fractional source indices
+        * n: Number of source cells
+
+    Returns:
+        * lower: Index of the source cell below each centre
+        * weight: Weight of the source cell above
+        * valid: Flag for centres inside the source grid
+    """
+
+    valid = (centres >= 0) & (centres <= n)
+
+    # Source cell centres are at index + 0.5
+    x = numpy.clip(centres - 0.5, 0, max(n - 1, 0))
+    lower = numpy.minimum(numpy.floor(x).astype(int), max(n - 2, 0))
+    weight = x - lower
+    if n == 1:
+        weight[:] = 0
+    return lower, weight, valid
+
+
+def _bilinear(S, row_edges, column_edges):
+    """Bilinear resampling of source grid S
+
+    Edges are given in fractional indices of S. Target cells whose
+    centre falls outside S are NaN. Near the edges of S values are
+    extrapolated as constants.
+    """
+
+    rows, row_weight, valid_rows = _interpolation_weights(
+        _cell_centres(row_edges), S.shape[0])
+    columns, column_weight, valid_columns = _interpolation_weights(
+        _cell_centres(column_edges), S.shape[1])
+
+    next_rows = numpy.minimum(rows + 1, S.shape[0] - 1)
+    next_columns = numpy.minimum(columns + 1, S.shape[1] - 1)
+
+    # Interpolate along rows then along columns
+    top = S[rows, :]
+    bottom = S[next_rows, :]
+    T = top + row_weight[:, numpy.newaxis] * (bottom - top)
+
+    left = T[:, columns]
+    right = T[:, next_columns]
+    A = left + column_weight[numpy.newaxis, :] * (right - left)
+
+    A[~valid_rows, :] = numpy.nan
+    A[:, ~valid_columns] = numpy.nan
+    return A
+
+
+def _integrate(S, edges, axis):
+    """Integrate grid over intervals of fractional indices along one axis
+
+    Values are taken as constant over each cell, so the integral over
+    [edges[k], edges[k + 1]] weighs each cell by the fraction covered.
+    Parts of intervals outside the grid contribute nothing.
+    """
+
+    n = S.shape[axis]
+    S = numpy.rollaxis(S, axis)
+
+    # Cumulative sum with a leading zero so that C[i] is the sum of the
+    # first i cells
+    C = numpy.zeros((n + 1,) + S.shape[1:])
+    numpy.cumsum(S, axis=0, out=C[1:])
+
+    x = numpy.clip(edges, 0, n)
+    lower = numpy.minimum(numpy.floor(x).astype(int), n - 1)
+    fraction = x - lower
+    fraction = fraction.reshape((-1,) + (1,) * (S.ndim - 1))
+    integral = C[lower] + fraction * (C[lower + 1] - C[lower])
+
+    return numpy.rollaxis(numpy.diff(integral, axis=0), 0, axis + 1)
+
+
+def _aggregate(S, row_edges, column_edges, method):
+    """Area weighted aggregation of source grid S
+
+    Missing values (NaN) are ignored. Target cells not covering any
+    valid source cell are NaN.
+    """
+
+    valid = ~numpy.isnan(S)
+    S = numpy.where(valid, S, 0)
+
+    total = _integrate(_integrate(S, row_edges, 0), column_edges, 1)
+    coverage = _integrate(_integrate(valid.astype(float), row_edges, 0),
+                          column_edges, 1)
+
+    # Allow for rounding in the cumulative sums
+    empty = coverage < 1.0e-9
+    if method == 'mean':
+        coverage[empty] = 1
+        A = total / coverage
+    else:
+        A = total
+    A[empty] = numpy.nan
+    return A
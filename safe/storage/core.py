@@ -16,16 +16,23 @@ import logging
 logger = logging.getLogger('inasafe')
 
 
-def read_layer(filename):
+def read_layer(filename, bbox=None, attribute_names=None):
     """Read spatial layer from file.
     This can be either raster or vector data.
+
+    Args:
+        * filename: Name of raster or vector file
+        * bbox: Optional bounding box [west, south, east, north].
+            Vector data only: features outside it are not read.
+        * attribute_names: Optional list of attributes to read.
+            Vector data only: other fields are not read.
     """
 
     _, ext = os.path.splitext(filename)
     if ext in ['.asc', '.tif', '.nc']:
         return Raster(filename)
     elif ext in ['.shp', '.sqlite']:
-        return Vector(filename)
+        return Vector(filename, bbox=bbox, attribute_names=attribute_names)
     else:
         msg = ('Could not read %s. '
                'Extension "%s" has not been implemented' % (filename, ext))
@@ -0,0 +1,292 @@
+"""Overlay of polygon layers
+
+Polygons (e.g. impact polygons or building footprints) are split along
+the boundaries of zone polygons (e.g. aggregation areas). Candidate pairs
+are found with a grid index of bounding boxes so that each polygon is
+only intersected with the few zones near it. Intersections are computed
+with OGR.
+
+Each part keeps the index of the polygon it was cut from, the index of
+the zone it lies in and the fraction of the area of the polygon it
+covers, so attributes can be apportioned by area.
+"""
+
+import numpy
+from osgeo import ogr
+
+from safe.common.utilities import verify
+
+from geometry import Polygon
+from vector import Vector
+from utilities import (array2line, get_polygondata,
+                       calculate_polygon_bounding_boxes)
+
+# Attribute names added by overlay_polygon_layers
+ZONE_ATTRIBUTE = 'zone_id'
+FRACTION_ATTRIBUTE = 'area_frac'
+
+# Relative area below which leftovers of polygons are ignored
+AREA_TOLERANCE = 1.0e-9
+
+
+class BoundingBoxIndex:
+    """Grid index for finding bounding boxes that overlap a given one
+
+    Args:
+        * bboxes: Array of bounding boxes [west, south, east, north]
+        * cell_size: Optional size of the grid cells. Default is the
+              average width and height of the boxes so that each box
+              is registered in a few cells only.
+    """
+
+    def __init__(self, bboxes, cell_size=None):
+        self.bboxes = numpy.asarray(bboxes, dtype='float64').reshape((-1, 4))
+
+        if len(self.bboxes) == 0:
+            self.origin = numpy.zeros(2)
+            self.cell_size = 1.0
+            self.cells = {}
+            return
+
+        if cell_size is None:
+            extent = self.bboxes[:, 2:] - self.bboxes[:, :2]
+            cell_size = numpy.mean(extent)
+            if cell_size <= 0:
+                cell_size = 1.0
+        self.cell_size = float(cell_size)
+        self.origin = numpy.min(self.bboxes[:, :2], axis=0)
+
+        # Register each box in the cells it covers
+        lower, upper = self._get_cell_ranges(self.bboxes)
+        self.cells = {}
+        for i in range(len(self.bboxes)):
+            for ix in range(lower[i, 0], upper[i, 0] + 1):
+                for iy in range(lower[i, 1], upper[i, 1] + 1):
+                    self.cells.setdefault((ix, iy), []).append(i)
+
+    def _get_cell_ranges(self, bboxes):
+        """First and last cell covered by each box along each axis
+        """
+
+        lower = numpy.floor((bboxes[:, :2] - self.origin) / self.cell_size)
+        upper = numpy.floor((bboxes[:, 2:] - self.origin) / self.cell_size)
+        return lower.astype(int), upper.astype(int)
+
+    def query(self, bbox):
+        """Find boxes overlapping bbox
+
+        Args:
+            * bbox: Bounding box [west, south, east, north]
+
+        Returns:
+            * Sorted array of indices of boxes overlapping bbox
+              (touching counts as overlapping)
+        """
+
+        bbox = numpy.asarray(bbox, dtype='float64').reshape((1, 4))
+        lower, upper = self._get_cell_ranges(bbox)
+
+        candidates = set()
+        for ix in range(lower[0, 0], upper[0, 0] + 1):
+            for iy in range(lower[0, 1], upper[0, 1] + 1):
+                candidates.update(self.cells.get((ix, iy), []))
+        candidates = numpy.array(sorted(candidates), dtype=int)
+
+        if len(candidates) > 0:
+            B = self.bboxes[candidates]
+            west, south, east, north = bbox[0]
+            overlap = ((B[:, 0] <= east) & (B[:, 2] >= west) &
+                       (B[:, 1] <= north) & (B[:, 3] >= south))
+            candidates = candidates[overlap]
+        return candidates
+
+
+def polygon_to_ogr(polygon):
+    """Convert polygon to OGR geometry
+
+    Args:
+        * polygon: Polygon instance or Nx2 array of vertices
+
+    Returns:
+        * OGR polygon geometry
+    """
+
+    if not isinstance(polygon, Polygon):
+        polygon = Polygon(outer_ring=polygon)
+
+    geometry = ogr.Geometry(ogr.wkbPolygon)
+    geometry.AddGeometry(array2line(polygon.outer_ring,
+                                    geometry_type=ogr.wkbLinearRing))
+    for ring in polygon.inner_rings:
+        geometry.AddGeometry(array2line(ring,
+                                        geometry_type=ogr.wkbLinearRing))
+    return geometry
+
+
+def _get_polygon_parts(geometry):
+    """Polygons with positive area making up an OGR geometry
+
+    Intersections may be polygons, multipolygons or collections also
+    holding lines or points where boundaries touch.
+    """
+
+    if geometry is None or geometry.IsEmpty():
+        return []
+
+    name = geometry.GetGeometryName()
+    if name == 'POLYGON':
+        if geometry.GetArea() > 0:
+            return [geometry]
+        return []
+
+    parts = []
+    if name in ['MULTIPOLYGON', 'GEOMETRYCOLLECTION']:
+        for i in range(geometry.GetGeometryCount()):
+            parts.extend(_get_polygon_parts(geometry.GetGeometryRef(i)))
+    return parts
+
+
+def overlay_polygons(polygons, zones):
+    """Split polygons along the boundaries of zones
+
+    Args:
+        * polygons: List of Polygon instances or Nx2 arrays of vertices
+        * zones: List of zone polygons in the same format
+
+    Returns:
+        * parts: List of Polygon instances. Each part of a polygon lies
+              inside one zone or outside all zones.
+        * parent_ids: Array with the index of the polygon of each part
+        * zone_ids: Array with the index of the zone of each part. Parts
+              outside all zones have zone id -1.
+        * fractions: Array with the area of each part divided by that of
+              its polygon
+
+    Note:
+        Zones are assumed not to overlap. Polygons lying inside a zone
+        are passed through without being intersected.
+    """
+
+    index = BoundingBoxIndex(calculate_polygon_bounding_boxes(zones))
+    bboxes = calculate_polygon_bounding_boxes(polygons)
+
+    # Zones are converted to OGR when first needed
+    zone_geometries = {}
+
+    parts = []
+    parent_ids = []
+    zone_ids = []
+    fractions = []
+
+    def add_part(part, parent_id, zone_id, fraction):
+        parts.append(part)
+        parent_ids.append(parent_id)
+        zone_ids.append(zone_id)
+        fractions.append(fraction)
+
+    for i, polygon in enumerate(polygons):
+        if not isinstance(polygon, Polygon):
+            polygon = Polygon(outer_ring=numpy.asarray(polygon))
+
+        candidates = index.query(bboxes[i])
+        if len(candidates) == 0:
+            add_part(polygon, i, -1, 1.0)
+            continue
+
+        geometry = polygon_to_ogr(polygon)
+        area = geometry.GetArea()
+
+        remainder = geometry
+        covered = 0.0
+        for zone_id in candidates:
+            if zone_id not in zone_geometries:
+                zone_geometries[zone_id] = polygon_to_ogr(zones[zone_id])
+            zone = zone_geometries[zone_id]
+
+            if zone.Contains(geometry):
+                # Fast path for polygons well inside a zone
+                add_part(polygon, i, zone_id, 1.0)
+                covered = area
+                remainder = None
+                break
+
+            if not zone.Intersects(geometry):
+                continue
+
+            # Keep the intersection referenced while its parts are used
+            intersection = geometry.Intersection(zone)
+            for part in _get_polygon_parts(intersection):
+                part_area = part.GetArea()
+                add_part(get_polygondata(part), i, zone_id,
+                         part_area / area if area > 0 else 1.0)
+                covered += part_area
+            if remainder is not None:
+                remainder = remainder.Difference(zone)
+
+        # Part outside all zones
+        if remainder is not None and covered < area * (1 - AREA_TOLERANCE):
+            for part in _get_polygon_parts(remainder):
+                part_area = part.GetArea()
+                if part_area > area * AREA_TOLERANCE:
+                    add_part(get_polygondata(part), i, -1,
+                             part_area / area)
+
+    return (parts,
+            numpy.array(parent_ids, dtype=int),
+            numpy.array(zone_ids, dtype=int),
+            numpy.array(fractions, dtype='float64'))
+
+
+def overlay_polygon_layers(layer, zone_layer, apportion=None):
+    """Split polygon layer along the polygons of a zone layer
+
+    Args:
+        * layer: Polygon vector layer
+        * zone_layer: Polygon vector layer of zones (e.g. aggregation
+              areas)
+        * apportion: Optional list of names of numeric attributes (e.g.
+              population counts) that are split among the parts of a
+              polygon in proportion to their area. Other attributes are
+              copied to all parts.
+
+    Returns:
+        * Polygon vector layer with one feature for each part as
+          returned by overlay_polygons. Features have the attributes of
+          the polygon they were cut from plus the index of their zone
+          (ZONE_ATTRIBUTE, -1 outside all zones) and their share of the
+          area of that polygon (FRACTION_ATTRIBUTE).
+    """
+
+    msg = ('Layers to be overlaid must be polygon layers. I got %s and %s'
+           % (layer.get_name(), zone_layer.get_name()))
+    verify(layer.is_polygon_data and zone_layer.is_polygon_data, msg)
+
+    if apportion is None:
+        apportion = []
+
+    parts, parent_ids, zone_ids, fractions = overlay_polygons(
+        layer.get_geometry(as_geometry_objects=True),
+        zone_layer.get_geometry(as_geometry_objects=True))
+
+    attributes = layer.get_data()
+    data = []
+    for parent_id, zone_id, fraction in zip(parent_ids, zone_ids,
+                                            fractions):
+        values = attributes[parent_id].copy()
+        for name in apportion:
+            try:
+                values[name] = float(values[name]) * fraction
+            except (TypeError, ValueError):
+                # Leave values that are not numbers as they are
+                pass
+        values[ZONE_ATTRIBUTE] = int(zone_id)
+        values[FRACTION_ATTRIBUTE] = float(fraction)
+        data.append(values)
+
+    return Vector(data=data,
+                  geometry=parts,
+                  geometry_type=layer.get_geometry_type(),
+                  projection=layer.get_projection(),
+                  name=layer.get_name(),
+                  keywords=layer.get_keywords(),
+                  style_info=layer.get_style_info())
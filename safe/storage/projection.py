@@ -6,6 +6,26 @@ from osgeo import osr
 # The projection string depends on the gdal version
 DEFAULT_PROJECTION = '+proj=longlat +datum=WGS84 +no_defs'
 
+# Parsed projections by input string and by WKT, and results of
+# comparisons by pairs of WKT. Layers with the same spatial reference
+# share one Projection instance so that neither making layers nor
+# comparing their projections goes through OSR more than once.
+_projections = {}
+_projections_by_wkt = {}
+_projection_comparisons = {}
+
+# Caches are emptied when they reach this size
+MAX_CACHED_PROJECTIONS = 1000
+
+
+def clear_projection_cache():
+    """Forget all parsed projections and comparisons between them
+    """
+
+    _projections.clear()
+    _projections_by_wkt.clear()
+    _projection_comparisons.clear()
+
 
 def proj4_to_dict(P):
     """Helper to turn a proj4 string into a dictionary for ease of comparison
@@ -31,27 +51,63 @@ def proj4_to_dict(P):
     return D
 
 
-class Projection:
+class Projection(object):
     """Represents projections associated with layers
+
+    Projections are immutable and interned: Projection(p) returns the
+    same instance for the same input and for inputs that give the same
+    WKT.
     """
 
-    def __init__(self, p):
+    def __new__(cls, p=None):
+        """Return the projection for p, parsing it only the first time
+        """
+
+        if isinstance(p, Projection):
+            return p
+
+        if p is None:
+            #msg = 'Requested projection is None'
+            #raise TypeError(msg)
+            p = DEFAULT_PROJECTION
+
+        # Clean input string
+        p = str(p).strip()
+        try:
+            return _projections[p]
+        except KeyError:
+            pass
+
+        if len(_projections) >= MAX_CACHED_PROJECTIONS:
+            clear_projection_cache()
+
+        projection = object.__new__(cls)
+        projection._parse(p)  # pylint: disable=W0212
+
+        # Equivalent inputs share the instance made first
+        projection = _projections_by_wkt.setdefault(projection.wkt,
+                                                    projection)
+        _projections[p] = projection
+        return projection
+
+    def __init__(self, p=None):
         """Constructor for Projection.
 
         Args:
             * p: Projection information.
                  Any of the GDAL formats are OK including WKT, proj4, ESRI, XML
                  It can also be an instance of Projection.
+
+        Note:
+            Projection information is parsed by __new__ the first time it
+            is seen. There is nothing left to do here.
         """
 
-        if p is None:
-            #msg = 'Requested projection is None'
-            #raise TypeError(msg)
-            p = DEFAULT_PROJECTION
+        pass
 
-        # Clean input string. This will also work when p is of class
-        # Projection by virtue of its __repr__()
-        p = str(p).strip()
+    def _parse(self, p):
+        """Create spatial reference from cleaned projection string p
+        """
 
         # Create OSR spatial reference object
         srs = self.spatial_reference = osr.SpatialReference()
@@ -99,6 +155,15 @@ class Projection:
     def __repr__(self):
         return self.wkt
 
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (Projection, (self.wkt,))
+
     def get_projection(self, proj4=False):
         """Return projection
 
@@ -132,6 +197,25 @@ class Projection:
                    'message: %s' % (str(other), e))
             raise TypeError(msg)
 
+        if self is other:
+            return True
+
+        key = (self.wkt, other.wkt)
+        try:
+            return _projection_comparisons[key]
+        except KeyError:
+            pass
+
+        if len(_projection_comparisons) >= MAX_CACHED_PROJECTIONS:
+            _projection_comparisons.clear()
+
+        result = _projection_comparisons[key] = self._is_same(other)
+        return result
+
+    def _is_same(self, other):
+        """Compare spatial references of this and another projection
+        """
+
         if self.spatial_reference.IsSame(other.spatial_reference):
             # OSR comparison checks out
             return True
@@ -10,6 +10,7 @@ from osgeo import gdal
 from safe.common.utilities import (verify,
                                    ugettext as safe_tr)
 from safe.common.numerics import nanallclose, geotransform2axes, grid2points
+from safe.common.numerics import block_footprint
 from safe.common.exceptions import ReadLayerError, WriteLayerError
 from safe.common.exceptions import GetDataError, InaSAFEError
 
@@ -20,6 +21,9 @@ from projection import Projection
 from utilities import DRIVER_MAP
 from utilities import read_keywords
 from utilities import write_keywords
+from raster_statistics import (read_statistics, write_statistics,
+                               compute_statistics, compute_histogram,
+                               compute_order_statistics, HISTOGRAM_BINS)
 from utilities import (geotransform2bbox, geotransform2resolution,
                        check_geotransform)
 
@@ -63,6 +67,10 @@ class Raster(Layer):
         If data is a filename, all other arguments are ignored
         as they will be inferred from the file.
 
+        Files may have several bands (e.g. time steps of a forecast or
+        a stack of scenarios). Band 1 is used by default. Other bands are
+        read on demand with get_data(band=...) or get_band_layer.
+
     """
 
     def __init__(self, data=None, projection=None, geotransform=None,
@@ -81,6 +89,13 @@ class Raster(Layer):
                        keywords=keywords,
                        style_info=style_info)
 
+        # Footprints computed by get_footprint keyed by block size and
+        # background value
+        self.footprints = {}
+
+        # Statistics computed by get_statistics
+        self.statistics = None
+
         # Input checks
         if data is None:
             # Instantiate empty object
@@ -108,6 +123,7 @@ class Raster(Layer):
             self.columns = data.shape[1]
 
             self.number_of_bands = 1
+            self.band_number = 1
 
             # We assume internal numpy layers are using nan correctly
             # FIXME (Ole): If read from file is refactored to load the data
@@ -218,20 +234,14 @@ class Raster(Layer):
         self.rows = fid.RasterYSize
         self.number_of_bands = fid.RasterCount
 
-        # Assume that file contains all data in one band
-        msg = 'Only one raster band currently allowed'
-        if self.number_of_bands > 1:
-            msg = ('WARNING: Number of bands in %s are %i. '
-                   'Only the first band will currently be '
-                   'used.' % (filename, self.number_of_bands))
-            # FIXME(Ole): Let us use python warnings here
-            raise ReadLayerError(msg)
+        # Bands and their nodata values are looked up when first needed
+        # and kept for later calls
+        self.bands = {}
+        self.nodata_values = {}
 
-        # Get first band.
-        band = self.band = fid.GetRasterBand(1)
-        if band is None:
-            msg = 'Could not read raster band from %s' % filename
-            raise ReadLayerError(msg)
+        # Get first band. This is the default band of the layer.
+        self.band_number = 1
+        self.band = self.get_band(1)
 
         # FIXME (Ole): I think internal data array should be populated at
         #              this point - then refactor get_data()
@@ -284,7 +294,90 @@ class Raster(Layer):
         # Write keywords if any
         write_keywords(self.keywords, basename + '.keywords')
 
-    def get_data(self, nan=True, scaling=None, copy=False):
+    def get_band(self, band=None):
+        """Get GDAL band of raster read from file
+
+        Args:
+            * band: Band number counting from 1. If None, the default band
+                    of this layer is returned.
+
+        Returns:
+            * GDAL raster band
+
+        Raises:
+            * ReadLayerError if band does not exist
+        """
+
+        if band is None:
+            band = self.band_number
+
+        if band not in self.bands:
+            msg = ('Band %s does not exist in raster %s which has %i bands'
+                   % (band, self.filename, self.number_of_bands))
+            if not (isinstance(band, (int, long)) and
+                    1 <= band <= self.number_of_bands):
+                raise ReadLayerError(msg)
+
+            gdal_band = self.fid.GetRasterBand(band)
+            if gdal_band is None:
+                msg = ('Could not read raster band %i from %s'
+                       % (band, self.filename))
+                raise ReadLayerError(msg)
+            self.bands[band] = gdal_band
+
+        return self.bands[band]
+
+    def get_band_layer(self, band):
+        """Get one band of a raster file as a raster layer
+
+        Args:
+            * band: Band number counting from 1
+
+        Returns:
+            * Raster layer sharing the open file with this one. Its data
+              is only read when requested, so layers for many bands can
+              be created without duplicating files or data.
+        """
+
+        msg = ('Bands can only be extracted from rasters read from file. '
+               'Raster %s is held in memory' % self.get_name())
+        verify(hasattr(self, 'fid'), msg)
+
+        gdal_band = self.get_band(band)
+
+        name = self.get_name()
+        if self.number_of_bands > 1:
+            name = '%s (band %i)' % (name, band)
+
+        R = Raster(name=name,
+                   projection=self.get_projection(),
+                   keywords=self.get_keywords(),
+                   style_info=self.get_style_info())
+        R.filename = self.filename
+        R.fid = self.fid
+        R.geotransform = self.geotransform
+        R.rows = self.rows
+        R.columns = self.columns
+        R.number_of_bands = self.number_of_bands
+        R.bands = self.bands
+        R.nodata_values = self.nodata_values
+        R.band_number = band
+        R.band = gdal_band
+        return R
+
+    def get_band_layers(self):
+        """Get all bands of a raster file as raster layers
+
+        Returns:
+            * List of layers as returned by get_band_layer for bands
+              1 to number_of_bands
+        """
+
+        return [self.get_band_layer(band)
+                for band in range(1, self.number_of_bands + 1)]
+
+    def get_data(self, nan=True, scaling=None, copy=False, window=None,
+                 band=None):
         """Get raster data as numeric array
 
         Args:
@@ -308,20 +401,44 @@ class Raster(Layer):
                        scalar value: If scaling takes a numerical scalar value,
                                      that will be use to scale the data
         * copy (optional): If present and True return copy
+        * window (optional): Tuple (row, column, rows, columns) specifying
+                             a rectangular block of the grid to return.
+                             If the raster is stored in a file, only that
+                             block is read. If None, the whole grid is
+                             returned.
+        * band (optional): Number of band to read (counting from 1) for
+                           rasters read from file. If None, the default
+                           band of the layer is read.
 
         Note:
             Scaling does not currently work with projected layers.
             See issue #123
         """
 
+        if window is None:
+            row, column, rows, columns = 0, 0, self.rows, self.columns
+        else:
+            row, column, rows, columns = window
+            msg = ('Window %s is outside raster %s with dimensions %i x %i'
+                   % (str(window), self.get_name(), self.rows, self.columns))
+            verify(row >= 0 and column >= 0 and rows >= 0 and columns >= 0,
+                   msg)
+            verify(row + rows <= self.rows and
+                   column + columns <= self.columns, msg)
+
         if hasattr(self, 'data') and self.data is not None:
             # Return internal data grid
-            if copy:
+            msg = ('Raster %s is held in memory and has only one band. '
+                   'I got band=%s' % (self.get_name(), band))
+            verify(band is None or band == 1, msg)
+            verify(self.data.shape[0] == self.rows and
+                   self.data.shape[1] == self.columns)
+            A = self.data
+            if window is not None:
+                A = A[row:row + rows, column:column + columns]
 
-                A = copy_module.deepcopy(self.data)
-            else:
-                A = self.data
-            verify(A.shape[0] == self.rows and A.shape[1] == self.columns)
+            if copy:
+                A = copy_module.deepcopy(A)
 
         else:
             # Force garbage collection to free up any memory we can (TS)
@@ -329,7 +446,11 @@ class Raster(Layer):
 
             # Read from raster file
             # FIXME: This can be slow so should be moved to read_from_file
-            A = self.band.ReadAsArray()
+            gdal_band = self.get_band(band)
+            if window is None:
+                A = gdal_band.ReadAsArray()
+            else:
+                A = gdal_band.ReadAsArray(column, row, columns, rows)
 
             # Convert to double precision (issue #75)
             A = numpy.array(A, dtype=numpy.float64)
@@ -338,13 +459,13 @@ class Raster(Layer):
             M, N = A.shape
             msg = ('Dimensions of raster array do not match those of '
                    'raster file %s' % self.filename)
-            verify(M == self.rows, msg)
-            verify(N == self.columns, msg)
+            verify(M == rows, msg)
+            verify(N == columns, msg)
 
         # Handle no data value
         # FIXME (Ole): This only pertains to data read from file
         # and should be moved to read_from_file.
-        nodata = self.get_nodata_value()
+        nodata = self.get_nodata_value(band=band)
 
         # Must explicit comparison to False and True as nan can be a number
         # so 0 would evaluate to False and e.g. 1 to True.
@@ -370,6 +491,21 @@ class Raster(Layer):
             A = numpy.where(A == nodata, NaN, A)
 
         # Take care of possible scaling
+        sigma = self.get_scaling_factor(scaling)
+
+        # Return possibly scaled data
+        return sigma * A
+
+    def get_scaling_factor(self, scaling=None):
+        """Get factor applied to data by get_data
+
+        Args:
+            * scaling: As for get_data
+
+        Returns:
+            * Factor by which get_data multiplies values read
+        """
+
         if scaling is None:
             # Redefine scaling from density keyword if possible
             kw = self.get_keywords()
@@ -401,8 +537,82 @@ class Raster(Layer):
                        'number: %s' % (scaling, str(e)))
                 raise GetDataError(msg)
 
-        # Return possibly scaled data
-        return sigma * A
+        return sigma
+
+    def get_row_blocks(self, block_rows):
+        """Get windows covering the raster in strips of whole rows
+
+        Args:
+            * block_rows: Maximal number of rows in each strip
+
+        Returns:
+            * List of windows (row, column, rows, columns) suitable for the
+              window argument of get_data.
+        """
+
+        msg = ('Number of rows in blocks must be positive. I got %s'
+               % block_rows)
+        verify(block_rows > 0, msg)
+
+        windows = []
+        for row in range(0, self.rows, block_rows):
+            windows.append((row, 0, min(block_rows, self.rows - row),
+                            self.columns))
+        return windows
+
+    def get_footprint(self, block_rows, background=0.0, compute=True):
+        """Get the part of each row block holding other than background
+
+        Args:
+            * block_rows: Number of rows in blocks as for get_row_blocks
+            * background: Value regarded as empty. Missing values are
+                          taken to be background too.
+            * compute: If False, only a footprint computed earlier is
+                       returned.
+
+        Returns:
+            * List with one item for each window of get_row_blocks: None
+              if the block is all background, otherwise the range
+              (first_column, end_column) of columns holding other values.
+              None is returned instead of the list if compute is False
+              and the footprint has not been computed yet.
+
+        Note:
+            The footprint is computed once and kept with the layer, so
+            hazard layers used repeatedly are scanned only once. It is
+            assumed that the data of the layer does not change.
+        """
+
+        key = (block_rows, background)
+        if key not in self.footprints:
+            if not compute:
+                return None
+
+            footprint = []
+            for window in self.get_row_blocks(block_rows):
+                A = self.get_data(nan=background, window=window)
+                footprint.append(block_footprint(A, background=background))
+            self.footprints[key] = footprint
+
+        return self.footprints[key]
+
+    def set_footprint(self, block_rows, background, footprint):
+        """Keep footprint computed elsewhere for later calls
+
+        Args:
+            * block_rows, background: As for get_footprint
+            * footprint: List as returned by get_footprint
+
+        Returns:
+            * None
+        """
+
+        msg = ('Footprint must have one entry for each of the %i row '
+               'blocks. I got %i' % (len(self.get_row_blocks(block_rows)),
+                                     len(footprint)))
+        verify(len(footprint) == len(self.get_row_blocks(block_rows)), msg)
+
+        self.footprints[(block_rows, background)] = footprint
 
     def get_geotransform(self, copy=False):
         """Return geotransform for this raster layer
@@ -465,34 +675,108 @@ class Raster(Layer):
     def __add__(self, other):
         return self.get_data() + other.get_data()
 
+    def get_statistics(self, histogram=False, compute=True):
+        """Get statistics of raster data computed in one streaming pass
+
+        Args:
+            * histogram: If True, a histogram is included
+            * compute: If False, only statistics known already (kept with
+                       the layer or stored in its sidecar file) are
+                       returned and None otherwise
+
+        Returns:
+            * Dictionary with keys
+                  minimum, maximum: Extrema (NaN if there is no data)
+                  count: Number of cells holding data
+                  sum: Sum of data
+                  histogram: Counts in equal width bins from minimum to
+                             maximum (only if requested)
+              All values refer to unscaled data (see get_scaling_factor)
+              with nodata values omitted.
+
+        Note:
+            Statistics are computed block by block, kept with the layer
+            and, for rasters read from file, stored in a sidecar file
+            (see raster_statistics) so that they are reused until the
+            file changes. Data held in memory must not be modified in
+            place after statistics have been computed.
+        """
+
+        if self.statistics is None and self.filename is not None:
+            self.statistics = read_statistics(self.filename,
+                                              self.band_number)
+
+        modified = False
+        if self.statistics is None:
+            if not compute:
+                return None
+            self.statistics = compute_statistics(self)
+            modified = True
+
+        statistics = self.statistics
+        if histogram and compute and 'histogram' not in statistics:
+            if statistics['count'] > 0:
+                statistics['histogram'] = compute_histogram(
+                    self, statistics['minimum'], statistics['maximum'])
+            else:
+                statistics['histogram'] = [0] * HISTOGRAM_BINS
+            modified = True
+
+        if modified:
+            self._store_statistics()
+
+        return dict(statistics)
+
+    def _store_statistics(self):
+        """Write statistics to the sidecar of the raster file if any
+        """
+
+        if self.filename is not None and os.path.isfile(self.filename):
+            write_statistics(self.filename, self.band_number,
+                             self.statistics)
+
     def get_extrema(self):
         """Get min and max from raster
         Note:
             If raster has a nominated no_data value, this is ignored.
 
+            Extrema are taken from get_statistics so repeated calls do
+            not scan the data again.
+
         Returns:
             min, max
         """
 
-        A = self.get_data(nan=True)
-        Amin = numpy.nanmin(A.flat[:])
-        Amax = numpy.nanmax(A.flat[:])
+        statistics = self.get_statistics()
+        sigma = self.get_scaling_factor()
+        Amin = sigma * statistics['minimum']
+        Amax = sigma * statistics['maximum']
 
         return Amin, Amax
 
-    def get_nodata_value(self):
+    def get_nodata_value(self, band=None):
         """Get the internal representation of NODATA
 
+        Args:
+            * band: Optional band number for rasters read from file.
+                    If None, the default band of the layer is used.
+
         Note:
             If the internal value is None, the standard -9999 is assumed
         """
 
         if hasattr(self, 'band'):
-            nodata = self.band.GetNoDataValue()
+            if band is None:
+                band = self.band_number
 
-            # FIXME (Ole): Too hacky, but probably the reality
-            if nodata is None:
-                nodata = -9999
+            if band not in self.nodata_values:
+                nodata = self.get_band(band).GetNoDataValue()
+
+                # FIXME (Ole): Too hacky, but probably the reality
+                if nodata is None:
+                    nodata = -9999
+                self.nodata_values[band] = nodata
+            nodata = self.nodata_values[band]
         else:
             nodata = self.nodata_value
 
@@ -505,6 +789,10 @@ class Raster(Layer):
         the last is max. Intermediate values depend on the keyword quantiles:
         If quantiles is True, they represent boundaries between quantiles.
         If quantiles is False, they represent equidistant interval boundaries.
+
+        Quantiles are found from the histogram of get_statistics and
+        kept with the statistics, so the data is neither sorted nor
+        held in memory in full.
         """
 
         rmin, rmax = self.get_extrema()
@@ -520,24 +808,31 @@ class Raster(Layer):
             # Quantiles
             # FIXME (Ole): Not 100% sure about this algorithm,
             # but it is close enough
-
-            A = self.get_data(nan=True).flat[:]
-
-            mask = numpy.logical_not(numpy.isnan(A))  # Omit NaN's
-            A = A.compress(mask)
-
-            A.sort()
-
-            verify(len(A) == A.shape[0])
-
-            d = float(len(A) + 0.5) / N
-            for i in range(N):
-                levels.append(A[int(i * d)])
+            levels = self._get_quantiles(N)
 
         levels.append(rmax)
 
         return levels
 
+    def _get_quantiles(self, N):
+        """Lower boundaries of N quantiles as used by get_bins
+        """
+
+        statistics = self.get_statistics(histogram=True)
+        quantiles = statistics.get('quantiles', {})
+        if str(N) not in quantiles:
+            count = statistics['count']
+            d = float(count + 0.5) / N
+            ranks = [min(int(i * d), count - 1) for i in range(N)]
+            quantiles[str(N)] = compute_order_statistics(
+                self, statistics['minimum'], statistics['maximum'],
+                statistics['histogram'], ranks)
+            self.statistics['quantiles'] = quantiles
+            self._store_statistics()
+
+        sigma = self.get_scaling_factor()
+        return [sigma * x for x in quantiles[str(N)]]
+
     def get_bounding_box(self):
         """Get bounding box coordinates for raster layer
 
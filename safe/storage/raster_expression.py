@@ -0,0 +1,371 @@
+"""Lazy arithmetic on aligned raster layers
+
+Expressions built from raster layers with lazy, arithmetic and comparison
+operators and where are not evaluated when they are written. Instead
+they are evaluated a block of rows at a time when the result or a
+reduction of it is requested, so no full size temporary grids are
+allocated and file based rasters are never read in full. For example
+
+    D = lazy(hazard, nan=0.0)
+    P = lazy(exposure, nan=0.0, scaling=True)
+    affected = where((D >= 0.5) & (D < 1.0), P, 0).sum()
+
+Blocks can be evaluated by several threads as numpy releases the global
+interpreter lock in most array operations. Reading from raster files is
+serialised as GDAL datasets must not be used by several threads at once.
+"""
+
+import threading
+from multiprocessing.pool import ThreadPool
+
+import numpy
+
+from safe.common.utilities import verify
+
+from raster import Raster
+
+# Number of raster rows evaluated at a time
+EXPRESSION_BLOCK_ROWS = 256
+
+# Lock serialising reads from raster layers
+_read_lock = threading.Lock()
+
+
+class RasterExpression(object):
+    """Lazily evaluated function of aligned raster layers
+
+    Args:
+        * function: Function applied elementwise to the evaluated operands
+        * operands: List of expressions or numbers
+
+    Note:
+        Expressions are normally created with lazy, where and the
+        arithmetic and comparison operators rather than directly.
+        Use & | ~ for logical operations. == and != are not overloaded.
+    """
+
+    # Make numpy defer to the reflected operators of expressions
+    __array_priority__ = 100
+
+    def __init__(self, function, operands):
+        self.function = function
+        self.operands = operands
+
+    # Arithmetic
+    def __add__(self, other):
+        return RasterExpression(numpy.add, [self, other])
+
+    def __radd__(self, other):
+        return RasterExpression(numpy.add, [other, self])
+
+    def __sub__(self, other):
+        return RasterExpression(numpy.subtract, [self, other])
+
+    def __rsub__(self, other):
+        return RasterExpression(numpy.subtract, [other, self])
+
+    def __mul__(self, other):
+        return RasterExpression(numpy.multiply, [self, other])
+
+    def __rmul__(self, other):
+        return RasterExpression(numpy.multiply, [other, self])
+
+    def __div__(self, other):
+        return RasterExpression(numpy.true_divide, [self, other])
+
+    def __rdiv__(self, other):
+        return RasterExpression(numpy.true_divide, [other, self])
+
+    __truediv__ = __div__
+    __rtruediv__ = __rdiv__
+
+    def __pow__(self, other):
+        return RasterExpression(numpy.power, [self, other])
+
+    def __neg__(self):
+        return RasterExpression(numpy.negative, [self])
+
+    # Comparisons
+    def __lt__(self, other):
+        return RasterExpression(numpy.less, [self, other])
+
+    def __le__(self, other):
+        return RasterExpression(numpy.less_equal, [self, other])
+
+    def __gt__(self, other):
+        return RasterExpression(numpy.greater, [self, other])
+
+    def __ge__(self, other):
+        return RasterExpression(numpy.greater_equal, [self, other])
+
+    # Logical operations
+    def __and__(self, other):
+        return RasterExpression(numpy.logical_and, [self, other])
+
+    def __or__(self, other):
+        return RasterExpression(numpy.logical_or, [self, other])
+
+    def __invert__(self):
+        return RasterExpression(numpy.logical_not, [self])
+
+    def get_layers(self):
+        """Get raster layers the expression depends on
+
+        Returns:
+            * List of raster layers without duplicates
+        """
+
+        layers = []
+        for operand in self.operands:
+            if isinstance(operand, RasterExpression):
+                for layer in operand.get_layers():
+                    if not [x for x in layers if x is layer]:
+                        layers.append(layer)
+        return layers
+
+    def get_reference_layer(self):
+        """Get the layer defining the grid of the expression
+
+        Returns:
+            * First raster layer of the expression
+
+        Raises:
+            * VerificationError if there is no layer or the layers are
+              not aligned
+        """
+
+        layers = self.get_layers()
+        msg = 'Raster expression must involve at least one raster layer'
+        verify(len(layers) > 0, msg)
+
+        reference = layers[0]
+        for layer in layers[1:]:
+            msg = ('Raster layers %s and %s in expression are not aligned. '
+                   'They have dimensions %i x %i and %i x %i and '
+                   'geotransforms %s and %s'
+                   % (reference.get_name(), layer.get_name(),
+                      reference.rows, reference.columns,
+                      layer.rows, layer.columns,
+                      str(reference.get_geotransform()),
+                      str(layer.get_geotransform())))
+            verify(layer.rows == reference.rows and
+                   layer.columns == reference.columns, msg)
+            verify(numpy.allclose(layer.get_geotransform(),
+                                  reference.get_geotransform(),
+                                  rtol=1.0e-12, atol=1.0e-12), msg)
+        return reference
+
+    def evaluate_block(self, window, values=None):
+        """Evaluate expression for one block
+
+        Args:
+            * window: Window (row, column, rows, columns) as for get_data
+            * values: Optional dictionary of values already evaluated for
+                      this block keyed by id of subexpression. Layers and
+                      subexpressions occurring several times in the
+                      expression are evaluated once.
+
+        Returns:
+            * Array of values in window
+        """
+
+        if values is None:
+            values = {}
+
+        key = id(self)
+        if key not in values:
+            arguments = []
+            for operand in self.operands:
+                if isinstance(operand, RasterExpression):
+                    arguments.append(operand.evaluate_block(window, values))
+                else:
+                    arguments.append(operand)
+            values[key] = self.function(*arguments)
+        return values[key]
+
+    def map_blocks(self, function=None, block_rows=None, threads=None):
+        """Evaluate expression block by block
+
+        Args:
+            * function: Optional function applied to the values of each
+                        block. Only its results are kept, so reductions
+                        need memory for one block per thread only.
+            * block_rows: Number of rows in each block. Default is
+                          EXPRESSION_BLOCK_ROWS.
+            * threads: Optional number of threads evaluating blocks
+
+        Returns:
+            * List of (window, result) pairs in row order
+        """
+
+        if block_rows is None:
+            block_rows = EXPRESSION_BLOCK_ROWS
+        windows = self.get_reference_layer().get_row_blocks(block_rows)
+
+        def evaluate(window):
+            A = numpy.asarray(self.evaluate_block(window))
+            if function is not None:
+                A = function(A)
+            return window, A
+
+        if threads is None or threads <= 1 or len(windows) <= 1:
+            return [evaluate(window) for window in windows]
+
+        pool = ThreadPool(min(threads, len(windows)))
+        try:
+            return pool.map(evaluate, windows)
+        finally:
+            pool.close()
+            pool.join()
+
+    def evaluate(self, block_rows=None, threads=None):
+        """Evaluate expression for the whole grid
+
+        Args:
+            * block_rows, threads: See map_blocks
+
+        Returns:
+            * Array with the dimensions of the raster layers
+        """
+
+        reference = self.get_reference_layer()
+        A = None
+        for window, B in self.map_blocks(block_rows=block_rows,
+                                         threads=threads):
+            if A is None:
+                A = numpy.empty((reference.rows, reference.columns),
+                                dtype=B.dtype)
+            row, _, rows, _ = window
+            A[row:row + rows, :] = B
+
+        if A is None:
+            A = numpy.empty((reference.rows, reference.columns))
+        return A
+
+    def to_raster(self, name=None, keywords=None, style_info=None,
+                  block_rows=None, threads=None):
+        """Evaluate expression into a raster layer
+
+        Args:
+            * name, keywords, style_info: As for Raster
+            * block_rows, threads: See map_blocks
+
+        Returns:
+            * Raster layer on the grid of the layers of the expression
+        """
+
+        reference = self.get_reference_layer()
+        return Raster(self.evaluate(block_rows=block_rows, threads=threads),
+                      projection=reference.get_projection(),
+                      geotransform=reference.get_geotransform(),
+                      name=name,
+                      keywords=keywords,
+                      style_info=style_info)
+
+    def sum(self, block_rows=None, threads=None):
+        """Sum of expression over the grid ignoring NaN
+
+        Args:
+            * block_rows, threads: See map_blocks
+        """
+
+        results = self.map_blocks(numpy.nansum, block_rows=block_rows,
+                                  threads=threads)
+        return float(sum([x for _, x in results]))
+
+    def count(self, block_rows=None, threads=None):
+        """Number of cells where expression is true (non zero)
+
+        Args:
+            * block_rows, threads: See map_blocks
+        """
+
+        results = self.map_blocks(numpy.count_nonzero, block_rows=block_rows,
+                                  threads=threads)
+        return int(sum([x for _, x in results]))
+
+    def get_extrema(self, block_rows=None, threads=None):
+        """Minimum and maximum of expression over the grid ignoring NaN
+
+        Args:
+            * block_rows, threads: See map_blocks
+
+        Returns:
+            * min, max. Both are NaN if there are no values.
+        """
+
+        def extrema(A):
+            A = A[~numpy.isnan(A)]
+            if len(A) == 0:
+                return None
+            return numpy.min(A), numpy.max(A)
+
+        results = [x for _, x in self.map_blocks(extrema,
+                                                  block_rows=block_rows,
+                                                  threads=threads)
+                   if x is not None]
+        if len(results) == 0:
+            return numpy.nan, numpy.nan
+        return (min([x[0] for x in results]),
+                max([x[1] for x in results]))
+
+
+class LayerTerm(RasterExpression):
+    """Values of a raster layer in an expression (see lazy)
+    """
+
+    def __init__(self, layer, nan=True, scaling=None):
+        msg = 'Only raster layers can be used in raster expressions'
+        verify(getattr(layer, 'is_raster', False), msg)
+
+        RasterExpression.__init__(self, None, [])
+        self.layer = layer
+        self.nan = nan
+        self.scaling = scaling
+
+    def get_layers(self):
+        return [self.layer]
+
+    def evaluate_block(self, window, values=None):
+        if values is None:
+            values = {}
+
+        key = id(self)
+        if key not in values:
+            _read_lock.acquire()
+            try:
+                values[key] = self.layer.get_data(nan=self.nan,
+                                                  scaling=self.scaling,
+                                                  window=window)
+            finally:
+                _read_lock.release()
+        return values[key]
+
+
+def lazy(layer, nan=True, scaling=None):
+    """Use raster layer in a lazily evaluated expression
+
+    Args:
+        * layer: Raster layer
+        * nan, scaling: Arguments of get_data used when reading the layer
+
+    Returns:
+        * RasterExpression
+    """
+
+    return LayerTerm(layer, nan=nan, scaling=scaling)
+
+
+def where(condition, x, y):
+    """Lazy counterpart of numpy.where
+
+    Args:
+        * condition: Expression
+        * x, y: Expressions or numbers
+
+    Returns:
+        * RasterExpression with the values of x where condition is true
+          and those of y elsewhere
+    """
+
+    return RasterExpression(numpy.where, [condition, x, y])
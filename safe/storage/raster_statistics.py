@@ -0,0 +1,259 @@
+"""Streaming statistics of raster layers and their sidecar files
+
+Statistics (extrema, count, sum, histogram and quantiles) are computed
+block by block so that a raster never has to be held in memory in full.
+For rasters read from file they are stored in a sidecar file next to the
+raster (extension .stats) together with the modification time and size
+of the raster file, so later sessions can reuse them as long as the
+file is unchanged.
+
+All statistics refer to unscaled data with nodata values omitted.
+"""
+
+import os
+import json
+import logging
+
+import numpy
+
+from safe.common.utilities import verify
+
+LOGGER = logging.getLogger('InaSAFE')
+
+# Change this when the statistics change so that sidecar files written
+# by earlier versions are not used
+STATISTICS_VERSION = 1
+
+# Number of rows read at a time
+STATISTICS_BLOCK_ROWS = 256
+
+# Number of equal width bins in histograms
+HISTOGRAM_BINS = 1024
+
+
+def get_statistics_filename(filename):
+    """Name of sidecar file holding statistics of raster file
+    """
+
+    basename, _ = os.path.splitext(filename)
+    return basename + '.stats'
+
+
+def _get_file_stamp(filename):
+    """Modification time and size identifying the content of a file
+    """
+
+    stat = os.stat(filename)
+    return [stat.st_mtime, stat.st_size]
+
+
+def _read_sidecar(filename):
+    """Read sidecar of raster file
+
+    Returns:
+        * Dictionary of statistics by band number (as string). It is empty
+          if there is no sidecar or it is unreadable or out of date.
+    """
+
+    path = get_statistics_filename(filename)
+    if not os.path.isfile(path):
+        return {}
+
+    try:
+        fid = open(path)
+        try:
+            record = json.load(fid)
+        finally:
+            fid.close()
+    except (IOError, ValueError), e:
+        LOGGER.debug('Could not read raster statistics %s: %s'
+                     % (path, str(e)))
+        return {}
+
+    if (record.get('version') != STATISTICS_VERSION or
+            record.get('stamp') != _get_file_stamp(filename)):
+        return {}
+    return record.get('bands', {})
+
+
+def read_statistics(filename, band):
+    """Read statistics of one band of a raster file from its sidecar
+
+    Args:
+        * filename: Name of raster file
+        * band: Band number
+
+    Returns:
+        * Dictionary of statistics or None if none are stored for the
+          current content of the file
+    """
+
+    return _read_sidecar(filename).get(str(band))
+
+
+def write_statistics(filename, band, statistics):
+    """Store statistics of one band of a raster file in its sidecar
+
+    Args:
+        * filename: Name of raster file
+        * band: Band number
+        * statistics: Dictionary as returned by Raster.get_statistics
+
+    Returns:
+        * None
+
+    Note:
+        Failure to write the sidecar (e.g. in a read only directory) is
+        logged and otherwise ignored.
+    """
+
+    path = get_statistics_filename(filename)
+    bands = _read_sidecar(filename)
+    bands[str(band)] = statistics
+    record = {'version': STATISTICS_VERSION,
+              'stamp': _get_file_stamp(filename),
+              'bands': bands}
+
+    # Write to a temporary file first so that readers never see a
+    # partially written sidecar
+    tmp_path = '%s.%i.tmp' % (path, os.getpid())
+    try:
+        fid = open(tmp_path, 'w')
+        try:
+            json.dump(record, fid)
+        finally:
+            fid.close()
+        if os.path.isfile(path):
+            # os.rename does not replace existing files on Windows
+            os.remove(path)
+        os.rename(tmp_path, path)
+    except (IOError, OSError), e:
+        LOGGER.debug('Could not write raster statistics %s: %s'
+                     % (path, str(e)))
+
+
+def _get_blocks(layer):
+    """Generate valid values of raster layer block by block
+    """
+
+    for window in layer.get_row_blocks(STATISTICS_BLOCK_ROWS):
+        A = layer.get_data(nan=True, scaling=False, window=window)
+        A = A[~numpy.isnan(A)]
+        if len(A) > 0:
+            yield A
+
+
+def compute_statistics(layer):
+    """Compute extrema, count and sum of raster layer in one pass
+
+    Args:
+        * layer: Raster layer
+
+    Returns:
+        * Dictionary with keys minimum, maximum, count and sum. Minimum
+          and maximum are NaN if the layer holds no valid values.
+    """
+
+    minimum = numpy.inf
+    maximum = -numpy.inf
+    count = 0
+    total = 0.0
+    for A in _get_blocks(layer):
+        minimum = min(minimum, float(numpy.min(A)))
+        maximum = max(maximum, float(numpy.max(A)))
+        count += len(A)
+        total += float(numpy.sum(A))
+
+    if count == 0:
+        minimum = maximum = numpy.nan
+
+    return {'minimum': minimum,
+            'maximum': maximum,
+            'count': count,
+            'sum': total}
+
+
+def _get_bin_indices(A, minimum, maximum, bins):
+    """Bin of each value for equal width bins from minimum to maximum
+
+    The mapping is monotonic so bins preserve the order of values.
+    """
+
+    if maximum > minimum:
+        indices = ((A - minimum) * (bins / (maximum - minimum))).astype(int)
+        return numpy.clip(indices, 0, bins - 1)
+    return numpy.zeros(A.shape, dtype=int)
+
+
+def compute_histogram(layer, minimum, maximum, bins=HISTOGRAM_BINS):
+    """Count values of raster layer in equal width bins
+
+    Args:
+        * layer: Raster layer
+        * minimum, maximum: Extrema of layer as from compute_statistics
+        * bins: Number of bins
+
+    Returns:
+        * List of counts. The maximum is counted in the last bin.
+    """
+
+    counts = numpy.zeros(bins, dtype=int)
+    for A in _get_blocks(layer):
+        counts += numpy.bincount(_get_bin_indices(A, minimum, maximum, bins),
+                                 minlength=bins)
+    return counts.tolist()
+
+
+def compute_order_statistics(layer, minimum, maximum, histogram, ranks):
+    """Values of given ranks among the sorted values of raster layer
+
+    Args:
+        * layer: Raster layer
+        * minimum, maximum, histogram: As from compute_statistics and
+              compute_histogram
+        * ranks: Sequence of ranks counting from 0
+
+    Returns:
+        * List of values, one for each rank
+
+    Note:
+        The histogram locates the bin holding each rank. Only values
+        falling into these bins are collected and sorted, so the result
+        is exact while memory use is bounded by the size of these bins.
+    """
+
+    bins = len(histogram)
+    offsets = numpy.concatenate([[0], numpy.cumsum(histogram)])
+    msg = ('Ranks must be between 0 and %i. I got %s'
+           % (offsets[-1] - 1, str(ranks)))
+    verify(len(ranks) == 0 or
+           (min(ranks) >= 0 and max(ranks) < offsets[-1]), msg)
+
+    rank_bins = numpy.searchsorted(offsets, ranks, side='right') - 1
+
+    wanted = numpy.zeros(bins, dtype=bool)
+    wanted[rank_bins] = True
+
+    values = []
+    indices = []
+    for A in _get_blocks(layer):
+        I = _get_bin_indices(A, minimum, maximum, bins)
+        mask = wanted[I]
+        values.append(A[mask])
+        indices.append(I[mask])
+
+    if len(values) == 0:
+        return []
+    values = numpy.concatenate(values)
+    indices = numpy.concatenate(indices)
+
+    # Sort by bin and then by value
+    order = numpy.lexsort((values, indices))
+    values = values[order]
+    indices = indices[order]
+
+    result = []
+    for rank, rank_bin in zip(ranks, rank_bins):
+        start = numpy.searchsorted(indices, rank_bin)
+        result.append(float(values[start + rank - offsets[rank_bin]]))
+    return result
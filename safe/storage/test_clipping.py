@@ -10,6 +10,8 @@ from safe.common.polygon import (is_inside_polygon, inside_polygon,
 from safe.storage.vector import Vector
 from safe.storage.core import read_layer
 from safe.storage.clipping import clip_raster_by_polygons
+from safe.storage.clipping import clip_raster
+from safe.storage.raster import Raster
 from safe.storage.geometry import Polygon
 from safe.common.utilities import unique_filename
 
@@ -186,6 +188,57 @@ class Test_Clipping(unittest.TestCase):
 
     test_clip_raster_by_polygons.slow = True
 
+    def test_clip_raster_by_bbox(self):
+        """Rasters can be clipped to a bounding box and resampled
+        """
+
+        numpy.random.seed(1)
+        A = numpy.random.rand(40, 60)
+        R = Raster(A, geotransform=(100.0, 0.1, 0, 10.0, 0, -0.1))
+
+        # Native cell size gives exact copy of the cells covered
+        C = clip_raster(R, [101.05, 7.05, 103.0, 9.0])
+        assert numpy.allclose(C.get_geotransform(),
+                              (101.0, 0.1, 0, 9.0, 0, -0.1))
+        assert numpy.allclose(C.get_data(), A[10:30, 10:30])
+
+        # Areas outside the raster are padded with NaN
+        C = clip_raster(R, [99.0, 9.0, 100.5, 11.0])
+        B = C.get_data()
+        assert B.shape == (20, 15)
+        assert numpy.all(numpy.isnan(B[:10, :]))
+        assert numpy.all(numpy.isnan(B[:, :10]))
+        assert numpy.allclose(B[10:, 10:], A[:10, :5])
+
+        # Sum preserving aggregation
+        bbox = [100.0, 6.0, 106.0, 10.0]
+        C = clip_raster(R, bbox, cell_size=0.2, method='sum')
+        blocks = A.reshape((20, 2, 30, 2))
+        assert numpy.allclose(C.get_data(), blocks.sum(axis=3).sum(axis=1))
+        for cell_size in [0.05, 0.15, 0.3]:
+            C = clip_raster(R, bbox, cell_size=cell_size, method='sum')
+            assert numpy.allclose(numpy.nansum(C.get_data()), numpy.sum(A))
+
+        # Averaging ignores missing values
+        A[:2, :2] = numpy.nan
+        R = Raster(A, geotransform=(100.0, 0.1, 0, 10.0, 0, -0.1))
+        C = clip_raster(R, bbox, cell_size=0.2, method='mean')
+        B = C.get_data()
+        assert numpy.isnan(B[0, 0])
+        assert numpy.allclose(B[1:, 1:],
+                              blocks.mean(axis=3).mean(axis=1)[1:, 1:])
+
+        # Bilinear resampling reproduces linear functions
+        x, y = numpy.meshgrid(numpy.arange(60) + 0.5,
+                              numpy.arange(40) + 0.5)
+        R = Raster(2 * x + 3 * y, geotransform=(0.0, 1.0, 0, 40.0, 0, -1.0))
+        C = clip_raster(R, [10, 10, 30, 30], cell_size=0.7,
+                        method='bilinear')
+        x = 10 + (numpy.arange(C.columns) + 0.5) * 0.7
+        y = 10 + (numpy.arange(C.rows) + 0.5) * 0.7
+        x, y = numpy.meshgrid(x, y)
+        assert numpy.allclose(C.get_data(), 2 * x + 3 * y)
+
     def test_clip_points_by_polygons_with_holes0(self):
         """Points can be clipped by polygons with holes
         """
@@ -2,6 +2,8 @@ import unittest
 import numpy
 import sys
 import os
+import copy
+import cPickle as pickle
 
 from osgeo import gdal
 
@@ -10,9 +12,11 @@ from vector import Vector
 from vector import convert_polygons_to_centroids
 from projection import Projection
 from projection import DEFAULT_PROJECTION
+from projection import clear_projection_cache
 from core import read_layer
 from core import write_raster_data
 from utilities import write_keywords
+from raster_statistics import get_statistics_filename, read_statistics
 from utilities import read_keywords
 from utilities import bbox_intersection
 from utilities import minimal_bounding_box
@@ -20,6 +24,9 @@ from utilities import buffered_bounding_box
 from utilities import array2wkt
 from utilities import calculate_polygon_area
 from utilities import calculate_polygon_centroid
+from utilities import calculate_polygon_centroids
+from utilities import calculate_polygon_areas
+from utilities import calculate_polygon_bounding_boxes
 from utilities import points_along_line
 from utilities import geotransform2bbox
 from utilities import geotransform2resolution
@@ -328,6 +335,68 @@ class Test_IO(unittest.TestCase):
                 else:
                     raise Exception
 
+    def test_vector_filtered_read(self):
+        """Vector data can be read restricted to a bbox and attributes
+        """
+
+        filename = '%s/%s' % (TESTDATA, 'test_buildings.shp')
+        layer = read_layer(filename)
+        geometry = layer.get_geometry()
+        attributes = layer.get_data()
+
+        # Use the south west quarter of the data
+        west, south, east, north = layer.get_bounding_box()
+        bbox = [west, south, (west + east) / 2, (south + north) / 2]
+
+        L = read_layer(filename, bbox=bbox,
+                       attribute_names=['FLOOR_AREA'])
+
+        # Reference by filtering all features
+        ref = [i for i, (x, y) in enumerate(geometry)
+               if bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3]]
+        assert 0 < len(L) < len(layer)
+        assert len(L) == len(ref)
+        assert numpy.allclose(L.get_geometry(),
+                              [geometry[i] for i in ref])
+
+        assert L.get_attribute_names() == ['FLOOR_AREA']
+        assert [a['FLOOR_AREA'] for a in L.get_data()] == [
+            attributes[i]['FLOOR_AREA'] for i in ref]
+
+        # Extent is that of the features read
+        x = [geometry[i][0] for i in ref]
+        y = [geometry[i][1] for i in ref]
+        assert numpy.allclose(L.get_bounding_box(),
+                              [min(x), min(y), max(x), max(y)])
+
+        # Polygons extend beyond a small bounding box inside them
+        filename = '%s/%s' % (TESTDATA, 'test_polygon.shp')
+        polygon = read_layer(filename).get_geometry()[0]
+        west, south = numpy.amin(polygon, axis=0)
+        east, north = numpy.amax(polygon, axis=0)
+        x, y = (west + east) / 2, (south + north) / 2
+        bbox = [x - 1.0e-6, y - 1.0e-6, x + 1.0e-6, y + 1.0e-6]
+        L = read_layer(filename, bbox=bbox)
+        assert len(L) > 0
+        e = L.get_bounding_box()
+        assert e[0] <= west and e[1] <= south
+        assert e[2] >= east and e[3] >= north
+
+        # Nothing is read outside the data
+        bbox = [e[2] + 1, e[3] + 1, e[2] + 2, e[3] + 2]
+        L = read_layer(filename, bbox=bbox)
+        assert len(L) == 0
+        assert L.get_bounding_box() == [0, 0, 0, 0]
+
+        # Missing attributes are reported
+        try:
+            read_layer(filename, attribute_names=['NOT_THERE'])
+        except ReadLayerError:
+            pass
+        else:
+            msg = 'Reading non existing attribute should have failed'
+            raise Exception(msg)
+
     def test_vector_class(self):
         """Consistency of vector class for point data
         """
@@ -1437,6 +1506,45 @@ class Test_IO(unittest.TestCase):
 
     test_raster_extrema.slow = True
 
+    def test_raster_windows(self):
+        """Blocks of raster data can be read through windows
+        """
+
+        for rastername in ['Population_2010_clip.tif',
+                           'population_padang_1.asc']:
+
+            filename = '%s/%s' % (TESTDATA, rastername)
+            R = read_layer(filename)
+            A = R.get_data(nan=0.0, scaling=True)
+
+            # Windowed reads from file and from memory agree with full grid
+            window = (3, 5, R.rows // 2, R.columns // 3)
+            row, column, rows, columns = window
+            B = R.get_data(nan=0.0, scaling=True, window=window)
+            assert B.shape == (rows, columns)
+            assert numpy.allclose(B, A[row:row + rows,
+                                       column:column + columns])
+
+            M = Raster(A, projection=R.get_projection(),
+                       geotransform=R.get_geotransform())
+            assert numpy.allclose(M.get_data(window=window), B)
+
+            # Strips of rows cover the raster exactly once
+            blocks = R.get_row_blocks(7)
+            assert sum([w[2] for w in blocks]) == R.rows
+            C = numpy.concatenate([R.get_data(nan=0.0, scaling=True,
+                                              window=w) for w in blocks])
+            assert numpy.allclose(C, A)
+
+            # Windows outside the grid are rejected
+            try:
+                R.get_data(window=(0, 0, R.rows + 1, R.columns))
+            except VerificationError:
+                pass
+            else:
+                msg = 'Window outside raster should have raised an exception'
+                raise Exception(msg)
+
     def test_bins(self):
         """Linear and quantile bins are correct
         """
@@ -1496,6 +1604,52 @@ class Test_IO(unittest.TestCase):
 
     test_bins.slow = True
 
+    def test_raster_statistics_are_kept_in_sidecar(self):
+        """Raster statistics are computed once and kept in a sidecar file
+        """
+
+        filename = unique_filename(suffix='.tif')
+        A = numpy.arange(600, dtype='float64').reshape((20, 30)) % 37
+        A[3, :] = numpy.nan
+        R = Raster(A, projection=DEFAULT_PROJECTION,
+                   geotransform=(100.0, 0.5, 0, 10.0, 0, -0.5))
+        R.write_to_file(filename)
+
+        R = read_layer(filename)
+        statistics = R.get_statistics(histogram=True)
+        B = R.get_data(nan=True)
+        B = B[~numpy.isnan(B)]
+        assert statistics['count'] == len(B)
+        assert numpy.allclose(statistics['sum'], numpy.sum(B))
+        assert sum(statistics['histogram']) == len(B)
+        assert R.get_extrema() == (numpy.min(B), numpy.max(B))
+
+        # Quantiles are the same as those found by sorting the data
+        B.sort()
+        for N in [2, 3, 7, 10]:
+            d = float(len(B) + 0.5) / N
+            expected = [B[int(i * d)] for i in range(N)] + [B[-1]]
+            assert R.get_bins(N=N, quantiles=True) == expected
+
+        # Statistics are read from the sidecar by new layers
+        sidecar = get_statistics_filename(filename)
+        assert os.path.isfile(sidecar)
+        R = read_layer(filename)
+        cached = R.get_statistics()
+        assert 'quantiles' in cached
+        for key in statistics:
+            assert cached[key] == statistics[key]
+        assert R.get_bins(N=10, quantiles=True) == expected
+
+        # and are discarded once the raster changes
+        R = Raster(A + 1, projection=DEFAULT_PROJECTION,
+                   geotransform=(100.0, 0.5, 0, 10.0, 0, -0.5))
+        R.write_to_file(filename)
+        os.utime(filename, (0, 0))
+        assert read_statistics(filename, 1) is None
+        R = read_layer(filename)
+        assert R.get_extrema() == (numpy.nanmin(A) + 1, numpy.nanmax(A) + 1)
+
     def test_raster_to_vector_points(self):
         """Raster layers can be converted to vector point layers
         """
@@ -1723,6 +1877,14 @@ class Test_IO(unittest.TestCase):
         exclude = ['get_topN', 'get_bins',
                    'get_geotransform',
                    'get_nodata_value',
+                   'get_scaling_factor',
+                   'get_statistics',
+                   'get_row_blocks',
+                   'get_footprint',
+                   'set_footprint',
+                   'get_band',
+                   'get_band_layer',
+                   'get_band_layers',
                    'get_attribute_names',
                    'get_resolution',
                    'get_geometry_type',
@@ -2267,6 +2429,56 @@ class Test_IO(unittest.TestCase):
                    name='Test centroid')
         V.write_to_file(out_filename)
 
+    def test_polygon_centroids_batch(self):
+        """Centroids, areas and bounding boxes of many polygons agree
+        """
+
+        # Realistic polygons of both orientations
+        filename = '%s/%s' % (TESTDATA, 'test_polygon.shp')
+        layer = read_layer(filename)
+        geometry = layer.get_geometry()
+        polygons = geometry + [P[::-1] for P in geometry]
+
+        C = calculate_polygon_centroids(polygons)
+        A = calculate_polygon_areas(polygons)
+        S = calculate_polygon_areas(polygons, signed=True)
+        B = calculate_polygon_bounding_boxes(polygons)
+        for i, P in enumerate(polygons):
+            c = calculate_polygon_centroid(P)
+            msg = 'Got %s but expected %s' % (str(C[i]), str(c))
+            assert numpy.allclose(C[i], c, rtol=1.0e-12), msg
+            assert numpy.allclose(A[i], calculate_polygon_area(P))
+            assert numpy.allclose(S[i], calculate_polygon_area(P,
+                                                               signed=True))
+            assert numpy.allclose(B[i], [min(P[:, 0]), min(P[:, 1]),
+                                         max(P[:, 0]), max(P[:, 1])])
+
+        # Square with a hole in the eastern half
+        outer_ring = numpy.array([[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]])
+        hole = numpy.array([[2, 1], [2, 3], [3, 3], [3, 1], [2, 1]])
+        polygons = [Polygon(outer_ring, inner_rings=[hole]),
+                    Polygon(outer_ring, inner_rings=[hole[::-1]]),
+                    outer_ring + 10]
+
+        C = calculate_polygon_centroids(polygons)
+        A = calculate_polygon_areas(polygons)
+        B = calculate_polygon_bounding_boxes(polygons)
+        expected = (16 * 2 - 2 * 2.5) / 14.
+        assert numpy.allclose(C, [[expected, 2], [expected, 2], [12, 12]])
+        assert numpy.allclose(A, [14, 14, 16])
+        assert numpy.allclose(B, [[0, 0, 4, 4], [0, 0, 4, 4],
+                                  [10, 10, 14, 14]])
+
+        # Layer centroids use the holes
+        V = Vector(geometry=polygons[:2], data=[{'id': 0}, {'id': 1}])
+        P = convert_polygons_to_centroids(V)
+        assert numpy.allclose(P.get_geometry(), C[:2])
+        assert V.get_bounding_box() == [0, 0, 4, 4]
+
+        # Degenerate input
+        assert calculate_polygon_centroids([]).shape == (0, 2)
+        assert len(calculate_polygon_areas([])) == 0
+
     def test_line_to_points(self):
         """Points along line are computed correctly
         """
@@ -2555,6 +2767,59 @@ class Test_IO(unittest.TestCase):
 
     test_projection_comparisons.slow = True
 
+    def test_multiband_raster_bands_are_read_lazily(self):
+        """Bands of multiband rasters can be read one at a time
+        """
+
+        # Create a three band raster with a different nodata value
+        # in each band
+        rows, columns, bands = 4, 5, 3
+        geotransform = (100.0, 0.5, 0, 10.0, 0, -0.5)
+        filename = unique_filename(suffix='.tif')
+        driver = gdal.GetDriverByName('GTiff')
+        fid = driver.Create(filename, columns, rows, bands,
+                            gdal.GDT_Float64)
+        fid.SetProjection(Projection(DEFAULT_PROJECTION).wkt)
+        fid.SetGeoTransform(geotransform)
+        for band in range(1, bands + 1):
+            A = band * numpy.ones((rows, columns))
+            A[0, 0] = -band
+            fid.GetRasterBand(band).WriteArray(A)
+            fid.GetRasterBand(band).SetNoDataValue(-band)
+        fid = None  # Close
+
+        R = read_layer(filename)
+        assert R.number_of_bands == bands
+        assert R.get_data().shape == (rows, columns)
+
+        for band in range(1, bands + 1):
+            assert R.get_nodata_value(band=band) == -band
+            A = R.get_data(band=band)
+            assert numpy.isnan(A[0, 0])
+            assert numpy.allclose(A[1:, 1:], band)
+            A = R.get_data(band=band, nan=False, window=(0, 0, 2, 2))
+            assert numpy.allclose(A, [[-band, band], [band, band]])
+
+        # Default band is the first
+        assert nanallclose(R.get_data(), R.get_data(band=1))
+
+        # Bands as layers of their own
+        layers = R.get_band_layers()
+        assert len(layers) == bands
+        for band, L in enumerate(layers):
+            assert L.get_geotransform() == geotransform
+            assert L.get_nodata_value() == -(band + 1)
+            assert nanallclose(L.get_data(), R.get_data(band=band + 1))
+
+        # Nonexisting bands are reported
+        try:
+            R.get_data(band=bands + 1)
+        except ReadLayerError:
+            pass
+        else:
+            msg = 'Reading a nonexisting band should have raised an error'
+            raise Exception(msg)
+
     def Xtest_reading_and_writing_of_multiband_rasters(self):
         """Multiband rasters can be read and written correctly
         """
@@ -2595,6 +2860,51 @@ class Test_IO(unittest.TestCase):
         # But the InaSAFE comparison does pass
         assert H.projection == E.projection
 
+    def test_projection_cache(self):
+        """Projections are parsed once and shared between layers
+        """
+
+        P = Projection(DEFAULT_PROJECTION)
+        assert Projection(DEFAULT_PROJECTION) is P
+        assert Projection(' %s ' % DEFAULT_PROJECTION) is P
+        assert Projection(None) is P
+        assert Projection(P) is P
+
+        # Inputs giving the same spatial reference share the instance
+        assert Projection(P.wkt) is P
+
+        # Projections are immutable so copies are the same object
+        assert copy.deepcopy(P) is P
+        assert pickle.loads(pickle.dumps(P, pickle.HIGHEST_PROTOCOL)) is P
+
+        # Layers share projections
+        V1 = Vector(geometry=[[106.8, -6.2]], projection=DEFAULT_PROJECTION)
+        V2 = Vector(geometry=[[106.9, -6.3]])
+        assert V1.projection is V2.projection
+
+        # Comparisons give the same result when repeated or after the
+        # cache has been cleared
+        U = Projection('+proj=utm +zone=48 +south +datum=WGS84 '
+                       '+units=m +no_defs')
+        for _ in range(2):
+            assert U == U
+            assert not U == P
+            assert U != P
+            assert P != U
+        clear_projection_cache()
+        assert not U == P
+        assert Projection(DEFAULT_PROJECTION) == P
+        assert Projection(DEFAULT_PROJECTION) is not P
+
+        # Unknown projections are still reported
+        try:
+            Projection('Not a projection')
+        except TypeError:
+            pass
+        else:
+            msg = 'Unknown projection should have raised TypeError'
+            raise Exception(msg)
+
 
 if __name__ == '__main__':
     suite = unittest.makeSuite(Test_IO, 'test')
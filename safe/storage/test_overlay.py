@@ -0,0 +1,138 @@
+import unittest
+import numpy
+
+from safe.storage.vector import Vector
+from safe.storage.geometry import Polygon
+from safe.storage.utilities import (calculate_polygon_area,
+                                    calculate_polygon_bounding_boxes)
+from safe.storage.overlay import (BoundingBoxIndex,
+                                  overlay_polygons,
+                                  overlay_polygon_layers,
+                                  ZONE_ATTRIBUTE,
+                                  FRACTION_ATTRIBUTE)
+
+
+def square(west, south, east, north):
+    """Closed ring of rectangle
+    """
+
+    return numpy.array([[west, south], [west, north], [east, north],
+                        [east, south], [west, south]], dtype='float64')
+
+
+class Test_Overlay(unittest.TestCase):
+    """Tests for polygon overlay
+    """
+
+    def test_bounding_box_index(self):
+        """Bounding box index finds the same boxes as a brute force search
+        """
+
+        numpy.random.seed(17)
+        corners = numpy.random.uniform(0, 10, (500, 2))
+        sizes = numpy.random.uniform(0, 1, (500, 2))
+        bboxes = numpy.hstack([corners, corners + sizes])
+        index = BoundingBoxIndex(bboxes)
+
+        for _ in range(50):
+            west, south = numpy.random.uniform(-1, 10, 2)
+            east, north = numpy.array([west, south]) + \
+                numpy.random.uniform(0, 3, 2)
+            expected = numpy.nonzero((bboxes[:, 0] <= east) &
+                                     (bboxes[:, 2] >= west) &
+                                     (bboxes[:, 1] <= north) &
+                                     (bboxes[:, 3] >= south))[0]
+            found = index.query([west, south, east, north])
+            assert numpy.all(found == expected)
+
+        assert len(BoundingBoxIndex([]).query([0, 0, 1, 1])) == 0
+
+        # Zones and polygons may be arrays or Polygon instances
+        B = calculate_polygon_bounding_boxes(
+            [square(0, 1, 2, 3), Polygon(outer_ring=square(-1, 0, 1, 4))])
+        assert numpy.allclose(B, [[0, 1, 2, 3], [-1, 0, 1, 4]])
+
+    def test_overlay_polygons(self):
+        """Polygons are split along zone boundaries
+        """
+
+        zones = [square(0, 0, 1, 1), square(1, 0, 2, 1)]
+        polygons = [square(0.2, 0.2, 0.4, 0.4),  # Inside zone 0
+                    square(0.5, 0.5, 1.5, 0.9),  # Across both zones
+                    square(1.5, 0.5, 2.5, 0.7),  # Partly outside
+                    square(3, 3, 4, 4),  # Outside all zones
+                    Polygon(outer_ring=square(0.1, 0.1, 1.9, 0.9),
+                            inner_rings=[square(0.8, 0.2, 1.6, 0.8)])]
+
+        parts, parent_ids, zone_ids, fractions = overlay_polygons(polygons,
+                                                                  zones)
+        assert len(parts) == len(parent_ids) == len(zone_ids)
+        assert len(parts) == len(fractions)
+
+        # Areas of the parts of the polygon with a hole in each zone
+        west = 0.9 * 0.8 - 0.2 * 0.6
+        east = 0.9 * 0.8 - 0.6 * 0.6
+        expected = {0: {0: 1.0},
+                    1: {0: 0.5, 1: 0.5},
+                    2: {1: 0.5, -1: 0.5},
+                    3: {-1: 1.0},
+                    4: {0: west / (west + east), 1: east / (west + east)}}
+
+        for i in range(len(polygons)):
+            found = {}
+            for zone_id, fraction in zip(zone_ids[parent_ids == i],
+                                         fractions[parent_ids == i]):
+                found[zone_id] = found.get(zone_id, 0) + fraction
+            assert sorted(found.keys()) == sorted(expected[i].keys())
+            for zone_id in found:
+                assert numpy.allclose(found[zone_id], expected[i][zone_id])
+
+        # Parts have the areas given by their fractions
+        for part, parent_id, fraction in zip(parts, parent_ids, fractions):
+            area = calculate_polygon_area(part.outer_ring)
+            area -= sum([calculate_polygon_area(ring)
+                         for ring in part.inner_rings])
+            parent = polygons[parent_id]
+            parent_area = calculate_polygon_area(getattr(parent,
+                                                         'outer_ring',
+                                                         parent))
+            parent_area -= sum([calculate_polygon_area(ring)
+                                for ring in getattr(parent,
+                                                    'inner_rings', [])])
+            assert numpy.allclose(area, fraction * parent_area)
+
+    def test_overlay_polygon_layers(self):
+        """Attributes are copied or apportioned by area to the parts
+        """
+
+        zones = Vector(geometry=[square(0, 0, 1, 1), square(1, 0, 2, 1)],
+                       data=[{'name': 'west'}, {'name': 'east'}])
+        layer = Vector(geometry=[square(0.5, 0.5, 1.5, 0.9),
+                                 square(0.1, 0.1, 0.2, 0.2)],
+                       data=[{'population': 100, 'name': 'across'},
+                             {'population': 'None', 'name': 'inside'}])
+
+        result = overlay_polygon_layers(layer, zones,
+                                        apportion=['population'])
+        assert result.is_polygon_data
+        assert len(result) == 3
+
+        for attributes in result.get_data():
+            if attributes['name'] == 'across':
+                assert numpy.allclose(attributes['population'], 50)
+                assert numpy.allclose(attributes[FRACTION_ATTRIBUTE], 0.5)
+                assert attributes[ZONE_ATTRIBUTE] in [0, 1]
+            else:
+                assert attributes['population'] == 'None'
+                assert attributes[ZONE_ATTRIBUTE] == 0
+                assert attributes[FRACTION_ATTRIBUTE] == 1.0
+
+        # Input is not modified
+        assert layer.get_data()[0]['population'] == 100
+        assert ZONE_ATTRIBUTE not in layer.get_data()[0]
+
+
+if __name__ == '__main__':
+    suite = unittest.makeSuite(Test_Overlay, 'test')
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,84 @@
+import unittest
+import numpy
+
+from safe.storage.raster import Raster
+from safe.storage.raster_expression import lazy, where
+from safe.common.numerics import nanallclose
+from safe.common.utilities import VerificationError
+
+
+class Test_Raster_Expression(unittest.TestCase):
+    """Tests for lazy raster expressions
+    """
+
+    def setUp(self):
+        numpy.random.seed(17)
+        geotransform = (100.0, 0.01, 0, 0.0, 0, -0.01)
+
+        D = numpy.random.uniform(0, 3, (40, 30))
+        D[0, :3] = numpy.nan
+        P = numpy.random.uniform(0, 100, D.shape)
+
+        self.D = D
+        self.P = P
+        self.hazard = Raster(D, projection=None, geotransform=geotransform,
+                             name='depth')
+        self.exposure = Raster(P, projection=None,
+                               geotransform=geotransform,
+                               name='population')
+
+    def test_expressions_match_numpy(self):
+        """Lazy expressions give the same values as numpy expressions
+        """
+
+        D, P = self.D, self.P
+        H = lazy(self.hazard)
+        E = lazy(self.exposure)
+
+        # Same layers used several times
+        expression = where((H >= 0.5) & (H < 1.0), E, 0) + 2 * H - H / E
+        expected = (numpy.where((D >= 0.5) * (D < 1.0), P, 0) +
+                    2 * D - D / P)
+
+        for block_rows in [1, 7, 40, 100]:
+            for threads in [None, 3]:
+                A = expression.evaluate(block_rows=block_rows,
+                                        threads=threads)
+                assert nanallclose(A, expected)
+
+        # Reductions
+        assert numpy.allclose(expression.sum(block_rows=7),
+                              numpy.nansum(expected))
+        assert (H > 1).count(block_rows=7) == numpy.sum(D > 1)
+        assert numpy.allclose((-H).get_extrema(block_rows=7, threads=2),
+                              (-numpy.nanmax(D), -numpy.nanmin(D)))
+
+        # Missing values can be replaced when reading
+        H0 = lazy(self.hazard, nan=0.0)
+        assert numpy.allclose((~(H0 > 0)).count(), 3)
+
+        # Results as raster layers
+        R = (E * 0.5).to_raster(name='half')
+        assert R.get_name() == 'half'
+        assert R.get_geotransform() == self.exposure.get_geotransform()
+        assert numpy.allclose(R.get_data(), P * 0.5)
+
+    def test_misaligned_layers_are_refused(self):
+        """Raster expressions refuse layers on different grids
+        """
+
+        other = Raster(self.P[:20, :], projection=None,
+                       geotransform=(100.0, 0.01, 0, 0.0, 0, -0.01))
+        try:
+            (lazy(self.hazard) + lazy(other)).evaluate()
+        except VerificationError:
+            pass
+        else:
+            msg = 'Misaligned rasters should have raised an exception'
+            raise Exception(msg)
+
+
+if __name__ == '__main__':
+    suite = unittest.makeSuite(Test_Raster_Expression, 'test')
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
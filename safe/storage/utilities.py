@@ -12,6 +12,7 @@ from osgeo import ogr
 from geometry import Polygon
 
 from safe.common.numerics import ensure_numeric
+from safe.common.lines import densify_lines
 from safe.common.utilities import verify
 from safe.common.exceptions import BoundingBoxError, InaSAFEError
 
@@ -949,9 +950,10 @@ def calculate_polygon_centroid(polygon):
     P_origin = numpy.amin(P, axis=0)
     P = P - P_origin
 
-    # Get area. This calculation could be incorporated to save time
-    # if necessary as the two formulas are very similar.
-    A = calculate_polygon_area(polygon, signed=True)
+    # Get area of the normalised polygon too. Cancellation in the
+    # products of absolute coordinates would otherwise dominate the
+    # error of small polygons.
+    A = calculate_polygon_area(P, signed=True)
 
     x = P[:, 0]
     y = P[:, 1]
@@ -973,6 +975,190 @@ def calculate_polygon_centroid(polygon):
     return C
 
 
+def pack_polygons(polygons):
+    """Concatenate all rings of polygons into one array of vertices
+
+    Args:
+        * polygons: List of Polygon objects or of arrays with the outer
+                    ring of each polygon. Rings are assumed to be closed.
+
+    Returns:
+        * vertices: Mx2 array of the vertices of all rings
+        * offsets: Array with the index in vertices of the first vertex
+                   of each ring
+        * polygon_ids: Array with the index of the polygon of each ring
+        * holes: Boolean array, True for inner rings
+
+    Note:
+        The outer ring of each polygon comes before its inner rings.
+    """
+
+    rings = []
+    polygon_ids = []
+    holes = []
+    for i, polygon in enumerate(polygons):
+        if isinstance(polygon, Polygon):
+            polygon_rings = [polygon.outer_ring] + list(polygon.inner_rings)
+        else:
+            polygon_rings = [polygon]
+        for j, ring in enumerate(polygon_rings):
+            rings.append(numpy.asarray(ring, dtype='float64'))
+            polygon_ids.append(i)
+            holes.append(j > 0)
+
+    sizes = numpy.array([len(ring) for ring in rings], dtype=int)
+    msg = 'Polygon rings must have at least one vertex'
+    verify(numpy.all(sizes > 0), msg)
+
+    if len(rings) == 0:
+        vertices = numpy.zeros((0, 2))
+    else:
+        vertices = numpy.concatenate(rings)
+
+    msg = ('Polygon is assumed to consist of coordinate pairs. '
+           'I got second dimension %i instead of 2' % vertices.shape[1])
+    verify(vertices.shape[1] == 2, msg)
+
+    offsets = numpy.cumsum(sizes) - sizes
+    return (vertices, offsets,
+            numpy.array(polygon_ids, dtype=int),
+            numpy.array(holes, dtype=bool))
+
+
+def _calculate_ring_moments(vertices, offsets, origins):
+    """Signed area and first moments of each packed ring
+
+    Args:
+        * vertices, offsets: Packed rings as returned by pack_polygons
+        * origins: Point of each ring subtracted from its vertices for
+                   numerical accuracy
+
+    Returns:
+        * areas: Signed area of each ring
+        * moments: Rx2 array with the centroid of each ring multiplied by
+                   its signed area, relative to its origin
+    """
+
+    ring_ids = numpy.repeat(numpy.arange(len(offsets)),
+                            numpy.diff(numpy.append(offsets, len(vertices))))
+    P = vertices - origins[ring_ids]
+    x = P[:, 0]
+    y = P[:, 1]
+
+    # Terms x_i y_{i+1} - x_{i+1} y_i for edges within the same ring. The
+    # last vertex of a ring would pair with the first of the next ring.
+    cross = numpy.zeros(len(P))
+    cross[:-1] = x[:-1] * y[1:] - x[1:] * y[:-1]
+    cross[offsets[1:] - 1] = 0
+    cross[-1] = 0
+
+    cx = numpy.zeros(len(P))
+    cy = numpy.zeros(len(P))
+    cx[:-1] = (x[:-1] + x[1:]) * cross[:-1]
+    cy[:-1] = (y[:-1] + y[1:]) * cross[:-1]
+
+    areas = numpy.add.reduceat(cross, offsets) / 2.
+    moments = numpy.zeros((len(offsets), 2))
+    moments[:, 0] = numpy.add.reduceat(cx, offsets) / 6.
+    moments[:, 1] = numpy.add.reduceat(cy, offsets) / 6.
+    return areas, moments
+
+
+def calculate_polygon_areas(polygons, signed=False):
+    """Calculate the areas of many non-self-intersecting polygons at once
+
+    Args:
+        * polygons: List of Polygon objects or of arrays with the outer
+                    ring of each polygon (see calculate_polygon_area)
+        * signed: Optional flag deciding whether returned areas retain the
+                  sign of the orientation of the outer rings. Default is
+                  False which means that areas are always positive.
+
+    Returns:
+        * Array with the area of each polygon less the area of its holes
+    """
+
+    if len(polygons) == 0:
+        return numpy.zeros(0)
+
+    vertices, offsets, polygon_ids, holes = pack_polygons(polygons)
+    origins = numpy.zeros((len(offsets), 2))
+    areas, _ = _calculate_ring_moments(vertices, offsets, origins)
+
+    # Holes are taken out whatever their orientation
+    sizes = numpy.where(holes, -1, 1) * numpy.abs(areas)
+    net = numpy.bincount(polygon_ids, weights=sizes,
+                         minlength=len(polygons))
+    if signed:
+        net *= numpy.sign(areas[~holes])
+    return net
+
+
+def calculate_polygon_centroids(polygons):
+    """Calculate the centroids of many non-self-intersecting polygons at once
+
+    Args:
+        * polygons: List of Polygon objects or of arrays with the outer
+                    ring of each polygon (see calculate_polygon_centroid)
+
+    Returns:
+        * Nx2 array with the centroid of each polygon
+
+    Note:
+        Inner rings are taken out of the polygons, so the centroid is the
+        centre of mass of the area between the outer ring and the holes.
+        Rings are normalised to the lower left corner of the outer ring of
+        their polygon for numerical accuracy as in
+        calculate_polygon_centroid.
+    """
+
+    if len(polygons) == 0:
+        return numpy.zeros((0, 2))
+
+    vertices, offsets, polygon_ids, holes = pack_polygons(polygons)
+    origins = numpy.zeros((len(polygons), 2))
+    origins[:, 0] = numpy.minimum.reduceat(vertices[:, 0],
+                                           offsets)[~holes]
+    origins[:, 1] = numpy.minimum.reduceat(vertices[:, 1],
+                                           offsets)[~holes]
+    areas, moments = _calculate_ring_moments(vertices, offsets,
+                                             origins[polygon_ids])
+
+    # Holes subtract their moments whatever their orientation
+    signs = numpy.sign(areas) * numpy.where(holes, -1, 1)
+    A = numpy.bincount(polygon_ids, weights=signs * areas,
+                       minlength=len(polygons))
+    C = numpy.zeros((len(polygons), 2))
+    for k in range(2):
+        C[:, k] = numpy.bincount(polygon_ids, weights=signs * moments[:, k],
+                                 minlength=len(polygons))
+
+    # Translate back to real location
+    return C / A[:, numpy.newaxis] + origins
+
+
+def calculate_polygon_bounding_boxes(polygons):
+    """Bounding boxes of the outer rings of many polygons at once
+
+    Args:
+        * polygons: List of Polygon objects or of arrays with the outer
+                    ring of each polygon
+
+    Returns:
+        * Nx4 array with [West, South, East, North] of each polygon
+    """
+
+    outer_rings = [getattr(x, 'outer_ring', x) for x in polygons]
+    if len(outer_rings) == 0:
+        return numpy.zeros((0, 4))
+
+    vertices, offsets, _, _ = pack_polygons(outer_rings)
+    bboxes = numpy.zeros((len(outer_rings), 4))
+    bboxes[:, :2] = numpy.minimum.reduceat(vertices, offsets)
+    bboxes[:, 2:] = numpy.maximum.reduceat(vertices, offsets)
+    return bboxes
+
+
 def points_between_points(point1, point2, delta):
     """Creates an array of points between two points given a delta
 
@@ -988,12 +1174,14 @@ def points_between_points(point1, point2, delta):
     x1, y1 = point2
     L = math.sqrt(math.pow((x1 - x0), 2) + math.pow((y1 - y0), 2))
     pieces = int(L / delta)
+    if pieces == 0:
+        return numpy.array([point1], dtype='float64')
+
     uu = numpy.array([x1 - x0, y1 - y0]) / L
-    points = [point1]
-    for nn in range(pieces):
-        point = point1 + uu * (nn + 1) * delta
-        points.append(point)
-    return numpy.array(points)
+    steps = numpy.arange(pieces + 1)[:, numpy.newaxis] * delta
+    points = numpy.array(point1, dtype='float64') + uu * steps
+    points[0] = point1
+    return points
 
 
 def points_along_line(line, delta):
@@ -1007,24 +1195,11 @@ def points_along_line(line, delta):
         * V: Numeric array of points (longitude, latitude).
 
     Note:
-        Sources
-            http://paulbourke.net/geometry/polyarea/
-            http://en.wikipedia.org/wiki/Centroid
+        See densify_lines which does this for many lines at once
     """
 
-    # Make sure it is numeric
-    P = numpy.array(line)
-    points = []
-    for i in range(len(P) - 1):
-        pts = points_between_points(P[i], P[i + 1], delta)
-        # If the first point of this list is the same
-        # as the last one recorded, do not use it
-        if len(points) > 0:
-            if numpy.allclose(points[-1], pts[0]):
-                pts = pts[1:]
-        points.extend(pts)
-    C = numpy.array(points)
-    return C
+    points, _ = densify_lines([line], delta)
+    return points
 
 
 def combine_polygon_and_point_layers(layers):
@@ -28,6 +28,7 @@ from safe.common.utilities import (verify,
                                    ugettext as safe_tr)
 from safe.common.exceptions import ReadLayerError, WriteLayerError
 from safe.common.exceptions import GetDataError, InaSAFEError
+from safe.common.lines import densify_lines
 
 from layer import Layer
 from projection import Projection
@@ -38,8 +39,8 @@ from utilities import write_keywords
 from utilities import get_geometry_type
 from utilities import is_sequence
 from utilities import array2line
-from utilities import calculate_polygon_centroid
-from utilities import points_along_line
+from utilities import calculate_polygon_centroids
+from utilities import calculate_polygon_bounding_boxes
 from utilities import geometrytype2string
 from utilities import get_ringdata, get_polygondata
 from utilities import rings_equal
@@ -82,6 +83,14 @@ class Vector(Layer):
                   table name in case of sqlite etc.) to load. Only applicable
                   to those dataformats supporting more than one layer in the
                   data file.
+            * bbox: Optional bounding box [west, south, east, north] in the
+                  coordinates of the file. Only used if data is a filename.
+                  Only features intersecting the box are read. The filter is
+                  applied by OGR inside the driver, making use of any
+                  spatial index in the file.
+            * attribute_names: Optional list of attribute names to read.
+                  Only used if data is a filename. Other fields are ignored
+                  by the driver. If None all attributes are read.
 
         Returns:
             * InaSAFE vector layer instance
@@ -115,7 +124,8 @@ class Vector(Layer):
 
     def __init__(self, data=None, projection=None, geometry=None,
                  geometry_type=None, name=None, keywords=None,
-                 style_info=None, sublayer=None):
+                 style_info=None, sublayer=None, bbox=None,
+                 attribute_names=None):
         """Initialise object with either geometry or filename
 
         NOTE: Doc strings in constructor are not harvested and exposed in
@@ -131,6 +141,10 @@ class Vector(Layer):
                        style_info=style_info,
                        sublayer=sublayer)
 
+        # Bounding box and attribute names restricting what was read
+        # from file or None if all of it was read
+        self.read_filter = None
+
         # Input checks
         if data is None and geometry is None:
             # Instantiate empty object
@@ -139,7 +153,8 @@ class Vector(Layer):
             return
 
         if isinstance(data, basestring):
-            self.read_from_file(data)
+            self.read_from_file(data, bbox=bbox,
+                                attribute_names=attribute_names)
         else:
             # Assume that data is provided as sequences provided as
             # arguments to the Vector constructor
@@ -185,37 +200,36 @@ class Vector(Layer):
                 verify(len(geometry) == len(data), msg)
 
             # Establish extent
-            if len(geometry) == 0:
-                # Degenerate layer
-                self.extent = [0, 0, 0, 0]
-                return
-
-            # Compute bounding box for each geometry type
-            minx = miny = sys.maxint
-            maxx = maxy = -minx
-            if self.is_point_data:
-                A = numpy.array(self.get_geometry())
-                minx = min(A[:, 0])
-                maxx = max(A[:, 0])
-                miny = min(A[:, 1])
-                maxy = max(A[:, 1])
-            elif self.is_line_data:
-                for g in self.get_geometry():
-                    A = numpy.array(g)
-                    minx = min(minx, min(A[:, 0]))
-                    maxx = max(maxx, max(A[:, 0]))
-                    miny = min(miny, min(A[:, 1]))
-                    maxy = max(maxy, max(A[:, 1]))
-            elif self.is_polygon_data:
-                # Do outer ring only
-                for g in self.get_geometry(as_geometry_objects=False):
-                    A = numpy.array(g)
-                    minx = min(minx, min(A[:, 0]))
-                    maxx = max(maxx, max(A[:, 0]))
-                    miny = min(miny, min(A[:, 1]))
-                    maxy = max(maxy, max(A[:, 1]))
+            self.extent = self.calculate_extent()
 
-            self.extent = [minx, maxx, miny, maxy]
+    def calculate_extent(self):
+        """Compute bounding box of the features of this layer
+
+        Returns:
+            * List [minx, maxx, miny, maxy]. Degenerate layers without
+              features get [0, 0, 0, 0].
+        """
+
+        if len(self.geometry) == 0:
+            return [0, 0, 0, 0]
+
+        # Compute bounding box for each geometry type
+        minx = miny = sys.maxint
+        maxx = maxy = -minx
+        if self.is_point_data:
+            A = numpy.array(self.get_geometry())
+            minx = min(A[:, 0])
+            maxx = max(A[:, 0])
+            miny = min(A[:, 1])
+            maxy = max(A[:, 1])
+        elif self.is_line_data or self.is_polygon_data:
+            # Do outer ring only for polygons
+            bboxes = calculate_polygon_bounding_boxes(
+                self.get_geometry(as_geometry_objects=False))
+            minx, miny = numpy.amin(bboxes[:, :2], axis=0)
+            maxx, maxy = numpy.amax(bboxes[:, 2:], axis=0)
+
+        return [minx, maxx, miny, maxy]
 
     def __str__(self):
         """Render as name, number of features, geometry type
@@ -361,13 +375,18 @@ class Vector(Layer):
         # Vector layers are identical up to the specified tolerance
         return True
 
-    def read_from_file(self, filename):
+    def read_from_file(self, filename, bbox=None, attribute_names=None):
         """Read and unpack vector data.
 
         It is assumed that the file contains only one layer with the
         pertinent features. Further it is assumed for the moment that
         all geometries are points.
 
+        Optional bbox [west, south, east, north] and list of
+        attribute_names restrict the features and fields read. Both are
+        passed on to OGR (spatial filter and ignored fields) so that
+        features and fields not needed are skipped by the driver.
+
         * A feature is a geometry and a set of attributes.
         * A geometry refers to location and can be point, line, polygon or
           combinations thereof.
@@ -441,6 +460,38 @@ class Vector(Layer):
         p = layer.GetSpatialRef()
         self.projection = Projection(p)
 
+        # Let OGR skip features outside the bounding box
+        if bbox is not None:
+            msg = ('Bounding box must be [west, south, east, north]. '
+                   'I got %s' % str(bbox))
+            verify(len(bbox) == 4 and bbox[0] <= bbox[2] and
+                   bbox[1] <= bbox[3], msg)
+            layer.SetSpatialFilterRect(bbox[0], bbox[1], bbox[2], bbox[3])
+
+        # Field indices and names to read
+        layer_def = layer.GetLayerDefn()
+        all_names = [layer_def.GetFieldDefn(j).GetName()
+                     for j in range(layer_def.GetFieldCount())]
+        if attribute_names is None:
+            field_indices = range(len(all_names))
+        else:
+            missing = [name for name in attribute_names
+                       if name not in all_names]
+            if missing:
+                msg = ('Attributes %s were not found in %s. Available '
+                       'attributes are %s' % (missing, filename, all_names))
+                raise ReadLayerError(msg)
+
+            field_indices = [j for j, name in enumerate(all_names)
+                             if name in attribute_names]
+
+            # Let OGR skip the other fields (available since GDAL 1.8)
+            ignored = [name for name in all_names
+                       if name not in attribute_names]
+            if ignored and hasattr(layer, 'SetIgnoredFields'):
+                layer.SetIgnoredFields(ignored)
+        field_names = [all_names[j] for j in field_indices]
+
         layer.ResetReading()
 
         # Extract coordinates and attributes for all features
@@ -490,11 +541,8 @@ class Vector(Layer):
                     raise ReadLayerError(msg)
 
             # Record attributes by name
-            number_of_fields = feature.GetFieldCount()
             fields = {}
-            for j in range(number_of_fields):
-                name = feature.GetFieldDefnRef(j).GetName()
-
+            for j, name in zip(field_indices, field_names):
                 # FIXME (Ole): Ascertain the type of each field?
                 #              We need to cast each appropriately?
                 #              This is issue #66
@@ -518,6 +566,14 @@ class Vector(Layer):
         self.geometry = geometry
         self.data = data
 
+        # Extent of the features read which may extend beyond the bounding
+        # box or cover only part of it
+        if bbox is not None:
+            self.extent = self.calculate_extent()
+
+        if bbox is not None or attribute_names is not None:
+            self.read_filter = (bbox, attribute_names)
+
     def write_to_file(self, filename, sublayer=None):
         """Save vector data to file
 
@@ -924,41 +980,23 @@ class Vector(Layer):
 # Helper functions for class Vector
 #----------------------------------
 def convert_line_to_points(V, delta):
-    """Convert line vector data to point vector data
+    """Convert line vector data to points along the lines
 
     Args:
         * V: Vector layer with line data
         * delta: Incremental step to find the points
     Returns:
-        * Vector layer with point data and the same attributes as V
+        * points: Kx2 array of points along the lines
+        * line_ids: Array of K indices in V of the line of each point.
+          Attributes of a point are those of its line and are looked up
+          in V when needed rather than copied for each point.
     """
 
     msg = 'Input data %s must be line vector data' % V
     verify(V.is_line_data, msg)
 
-    geometry = V.get_geometry()
-    data = V.get_data()
-    N = len(V)
-
-    # Calculate centroids for each polygon
-    points = []
-    new_data = []
-    for i in range(N):
-        c = points_along_line(geometry[i], delta)
-        # We need to create a data entry for each point.
-        # FIXME (Ole): What on earth is this?
-        # pylint: disable=W0621
-        new_data.extend([data[i] for _ in c])
-        # pylint: enable=W0621
-        points.extend(c)
-
-    # Create new point vector layer with same attributes and return
-    V = Vector(data=new_data,
-               projection=V.get_projection(),
-               geometry=points,
-               name='%s_point_data' % V.get_name(),
-               keywords=V.get_keywords())
-    return V
+    # Densify all lines at once
+    return densify_lines(V.get_geometry(), delta)
 
 
 def convert_polygons_to_centroids(V):
@@ -974,14 +1012,9 @@ def convert_polygons_to_centroids(V):
     msg = 'Input data %s must be polygon vector data' % V
     verify(V.is_polygon_data, msg)
 
-    geometry = V.get_geometry()
-    N = len(V)
-
-    # Calculate points for each polygon
-    centroids = []
-    for i in range(N):
-        c = calculate_polygon_centroid(geometry[i])
-        centroids.append(c)
+    # Calculate points for all polygons at once
+    geometry = V.get_geometry(as_geometry_objects=True)
+    centroids = calculate_polygon_centroids(geometry)
 
     # Create new point vector layer with same attributes and return
     V = Vector(data=V.get_data(),
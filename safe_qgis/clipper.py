@@ -19,8 +19,9 @@ __copyright__ += 'Disaster Reduction'
 import os
 import tempfile
 import logging
+import numpy
 
-from PyQt4.QtCore import QCoreApplication, QProcess
+from PyQt4.QtCore import QCoreApplication, QProcess, QVariant
 from qgis.core import (QGis,
                        QgsCoordinateTransform,
                        QgsCoordinateReferenceSystem,
@@ -32,7 +33,12 @@ from qgis.core import (QGis,
 
 from safe_qgis.safe_interface import (verify,
                                       readKeywordsFromFile,
-                                      temp_dir)
+                                      temp_dir,
+                                      safe_read_layer,
+                                      clip_raster,
+                                      get_resampling_method,
+                                      Vector,
+                                      Polygon)
 
 from safe_qgis.keyword_io import KeywordIO
 from safe_qgis.exceptions import (
@@ -69,7 +75,8 @@ def clipLayer(theLayer,
               theCellSize=None,
               theExtraKeywords=None,
               theExplodeFlag=True,
-              theHardClipFlag=False):
+              theHardClipFlag=False,
+              theInMemoryFlag=False):
     """Clip a Hazard or Exposure layer to the extents provided.
 
     .. note:: Will delegate to clipVectorLayer or clipRasterLayer as needed.
@@ -96,9 +103,16 @@ def clipLayer(theLayer,
             are reduced in size to the part of the geometry that intersects
             the extent only. Default is False. **This parameter is ignored
             for raster layer clipping.**
+        * theInMemoryFlag - a bool specifying whether the clipped layer
+            may be returned as an in memory SAFE layer instead of a file.
+            This is done for vector layers that are exploded into single
+            parts and raster layers that can be clipped in process.
+            Default is False.
 
     Returns:
-        Path to the output clipped layer (placed in the system temp dir).
+        Path to the output clipped layer (placed in the system temp dir)
+        or, if theInMemoryFlag is True and no file was needed, a SAFE
+        layer with the clipped data and keywords.
         The output layer will be reprojected to EPSG:4326 if needed.
 
     Raises:
@@ -110,12 +124,14 @@ def clipLayer(theLayer,
                                 theExtent,
                                 theExtraKeywords=theExtraKeywords,
                                 theExplodeFlag=theExplodeFlag,
-                                theHardClipFlag=theHardClipFlag)
+                                theHardClipFlag=theHardClipFlag,
+                                theInMemoryFlag=theInMemoryFlag)
     else:
         try:
             return _clipRasterLayer(
                 theLayer, theExtent, theCellSize,
-                theExtraKeywords=theExtraKeywords)
+                theExtraKeywords=theExtraKeywords,
+                theInMemoryFlag=theInMemoryFlag)
         except CallGDALError, e:
             raise e
         except IOError, e:
@@ -126,7 +142,8 @@ def _clipVectorLayer(theLayer,
                      theExtent,
                      theExtraKeywords=None,
                      theExplodeFlag=True,
-                     theHardClipFlag=False):
+                     theHardClipFlag=False,
+                     theInMemoryFlag=False):
     """Clip a Hazard or Exposure layer to the
     extents of the current view frame. The layer must be a
     vector layer or an exception will be thrown.
@@ -150,9 +167,14 @@ def _clipVectorLayer(theLayer,
             that extend beyond the extents should be clipped such that they
             are reduced in size to the part of the geometry that intersects
             the extent only. Default is False.
+        * theInMemoryFlag - a bool specifying whether a SAFE vector layer
+            should be returned instead of a file. SAFE layers only hold
+            single part features so this is ignored unless theExplodeFlag
+            is True. Default is False.
 
     Returns:
-        Path to the output clipped layer (placed in the system temp dir).
+        Path to the output clipped layer (placed in the system temp dir)
+        or a SAFE vector layer (see theInMemoryFlag).
 
     Raises:
        None
@@ -167,19 +189,6 @@ def _clipVectorLayer(theLayer,
                        str(theLayer.type()))
         raise InvalidParameterError(myMessage)
 
-    #myHandle, myFilename = tempfile.mkstemp('.sqlite', 'clip_',
-    #    temp_dir())
-    myHandle, myFilename = tempfile.mkstemp('.shp', 'clip_',
-                                            temp_dir())
-
-    # Ensure the file is deleted before we try to write to it
-    # fixes windows specific issue where you get a message like this
-    # ERROR 1: c:\temp\inasafe\clip_jpxjnt.shp is not a directory.
-    # This is because mkstemp creates the file handle and leaves
-    # the file open.
-    os.close(myHandle)
-    os.remove(myFilename)
-
     # Get the clip extents in the layer's native CRS
     myGeoCrs = QgsCoordinateReferenceSystem()
     myGeoCrs.createFromId(4326, QgsCoordinateReferenceSystem.EpsgCrsId)
@@ -225,19 +234,39 @@ def _clipVectorLayer(theLayer,
 
     myFieldList = myProvider.fields()
 
-    myWriter = QgsVectorFileWriter(
-        myFilename,
-        'UTF-8',
-        myFieldList,
-        theLayer.wkbType(),
-        myGeoCrs,
-        #'SQLite')  # FIXME (Ole): This works but is far too slow
-        'ESRI Shapefile')
-    if myWriter.hasError() != QgsVectorFileWriter.NoError:
-        myMessage = tr('Error when creating shapefile: <br>Filename:'
-                       '%s<br>Error: %s' %
-                       (myFilename, myWriter.hasError()))
-        raise Exception(myMessage)
+    myInMemoryFlag = theInMemoryFlag and theExplodeFlag
+    if myInMemoryFlag:
+        # Features are collected for a SAFE layer instead of being
+        # written to disk
+        myGeometries = []
+        myData = []
+    else:
+        #myHandle, myFilename = tempfile.mkstemp('.sqlite', 'clip_',
+        #    temp_dir())
+        myHandle, myFilename = tempfile.mkstemp('.shp', 'clip_',
+                                                temp_dir())
+
+        # Ensure the file is deleted before we try to write to it
+        # fixes windows specific issue where you get a message like this
+        # ERROR 1: c:\temp\inasafe\clip_jpxjnt.shp is not a directory.
+        # This is because mkstemp creates the file handle and leaves
+        # the file open.
+        os.close(myHandle)
+        os.remove(myFilename)
+
+        myWriter = QgsVectorFileWriter(
+            myFilename,
+            'UTF-8',
+            myFieldList,
+            theLayer.wkbType(),
+            myGeoCrs,
+            #'SQLite')  # FIXME (Ole): This works but is far too slow
+            'ESRI Shapefile')
+        if myWriter.hasError() != QgsVectorFileWriter.NoError:
+            myMessage = tr('Error when creating shapefile: <br>Filename:'
+                           '%s<br>Error: %s' %
+                           (myFilename, myWriter.hasError()))
+            raise Exception(myMessage)
 
     # Reverse the coordinate xform now so that we can convert
     # geometries from layer crs to geocrs.
@@ -262,10 +291,20 @@ def _clipVectorLayer(theLayer,
                 myPart = clipGeometry(myClipPolygon, myPart)
             if myPart is None:
                 continue
-            myFeature.setGeometry(myPart)
-            myWriter.addFeature(myFeature)
+            if myInMemoryFlag:
+                # Hard clipping may split a part again
+                for mySinglePart in explodeMultiPartGeometry(myPart):
+                    mySafeGeometry = _safeGeometry(mySinglePart)
+                    if mySafeGeometry is None:
+                        continue
+                    myGeometries.append(mySafeGeometry)
+                    myData.append(_safeAttributes(myFeature, myFieldList))
+            else:
+                myFeature.setGeometry(myPart)
+                myWriter.addFeature(myFeature)
         myCount += 1
-    del myWriter  # Flush to disk
+    if not myInMemoryFlag:
+        del myWriter  # Flush to disk
 
     if myCount < 1:
         myMessage = tr('No features fall within the clip extents. '
@@ -281,12 +320,87 @@ def _clipVectorLayer(theLayer,
         raise NoFeaturesInExtentError(myMessage)
 
     myKeywordIO = KeywordIO()
+    if myInMemoryFlag:
+        # Copy so that the keywords cached for theLayer are left alone
+        myKeywords = dict(myKeywordIO.readKeywords(theLayer))
+        if theExtraKeywords is not None:
+            myKeywords.update(theExtraKeywords)
+        myGeometryType = {QGis.Point: 'point',
+                          QGis.Line: 'line',
+                          QGis.Polygon: 'polygon'}[theLayer.geometryType()]
+        return Vector(data=myData,
+                      geometry=myGeometries,
+                      geometry_type=myGeometryType,
+                      name=str(theLayer.name()),
+                      keywords=myKeywords)
+
     myKeywordIO.copyKeywords(
         theLayer, myFilename, theExtraKeywords=theExtraKeywords)
 
     return myFilename  # Filename of created file
 
 
+def _safeGeometry(theGeometry):
+    """Convert a single part QGIS geometry to SAFE vector geometry.
+
+    Args:
+        theGeometry - a single part QgsGeometry in EPSG:4326.
+
+    Returns:
+        [lon, lat] for points, an Nx2 list of coordinates for lines or a
+        SAFE Polygon with its inner rings for polygons. None if the
+        geometry is empty.
+
+    Raises:
+        None
+    """
+    myType = theGeometry.type()
+    if myType == QGis.Point:
+        myPoint = theGeometry.asPoint()
+        return [myPoint.x(), myPoint.y()]
+    elif myType == QGis.Line:
+        return [[myPoint.x(), myPoint.y()]
+                for myPoint in theGeometry.asPolyline()]
+    else:
+        myRings = [[[myPoint.x(), myPoint.y()] for myPoint in myRing]
+                   for myRing in theGeometry.asPolygon()]
+        if not myRings:
+            return None
+        return Polygon(outer_ring=numpy.array(myRings[0]),
+                       inner_rings=[numpy.array(myRing)
+                                    for myRing in myRings[1:]])
+
+
+def _safeAttributes(theFeature, theFields):
+    """Convert the attributes of a QGIS feature to a SAFE attribute dict.
+
+    Args:
+        * theFeature - a QgsFeature fetched with all attributes.
+        * theFields - the field map of its data provider.
+
+    Returns:
+        dict of field name to int, float or unicode value, None for null
+        values.
+
+    Raises:
+        None
+    """
+    myAttributes = {}
+    myAttributeMap = theFeature.attributeMap()
+    for myIndex in theFields:
+        myName = str(theFields[myIndex].name())
+        myValue = myAttributeMap[myIndex]
+        if myValue.isNull():
+            myAttributes[myName] = None
+        elif myValue.type() in [QVariant.Int, QVariant.LongLong]:
+            myAttributes[myName] = myValue.toLongLong()[0]
+        elif myValue.type() == QVariant.Double:
+            myAttributes[myName] = myValue.toDouble()[0]
+        else:
+            myAttributes[myName] = unicode(myValue.toString())
+    return myAttributes
+
+
 def clipGeometry(theClipPolygon, theGeometry):
     """Clip a geometry (linestring or polygon) using a clip polygon.
 
@@ -370,7 +484,7 @@ def explodeMultiPartGeometry(theGeom):
 
 
 def _clipRasterLayer(theLayer, theExtent, theCellSize=None,
-                     theExtraKeywords=None):
+                     theExtraKeywords=None, theInMemoryFlag=False):
     """Clip a Hazard or Exposure raster layer to the extents provided. The
     layer must be a raster layer or an exception will be thrown.
 
@@ -390,10 +504,15 @@ def _clipRasterLayer(theLayer, theExtent, theCellSize=None,
         * theCellSize - cell size (in GeoCRS) which the layer should
             be resampled to. If not provided for a raster layer (i.e.
             theCellSize=None), the native raster cell size will be used.
+        * theExtraKeywords - Optional keywords dictionary to be added to
+            output layer.
+        * theInMemoryFlag - a bool specifying whether a SAFE raster layer
+            should be returned instead of a file when the layer can be
+            clipped in process.
 
     Returns:
         Path to the output clipped layer (placed in the
-        system temp dir).
+        system temp dir) or a SAFE raster layer (see theInMemoryFlag).
 
     Raises:
        Exception if input layer is a density layer in projected coordinates -
@@ -437,16 +556,61 @@ def _clipRasterLayer(theLayer, theExtent, theCellSize=None,
                          % (myWorkingLayer, theLayer.crs().toProj4()))
             raise InvalidProjectionError(myMessage)
 
-    # We need to provide gdalwarp with a dataset for the clip
-    # because unline gdal_translate, it does not take projwin.
-    myClipKml = extentToKml(theExtent)
-
     # Create a filename for the clipped, resampled and reprojected layer
     myHandle, myFilename = tempfile.mkstemp('.tif', 'clip_',
                                             temp_dir())
     os.close(myHandle)
     os.remove(myFilename)
 
+    if (str(theLayer.crs().authid()) == 'EPSG:4326' and
+            isinstance(theExtent, (list, tuple))):
+        # No reprojection needed so clip and resample in process. Only
+        # the window of the raster covering the extent is read.
+        myMethod = get_resampling_method(myKeywords)
+        LOGGER.debug('Clipping %s in process using %s resampling'
+                     % (myWorkingLayer, myMethod))
+        myClippedLayer = clip_raster(safe_read_layer(myWorkingLayer),
+                                     theExtent,
+                                     cell_size=theCellSize,
+                                     method=myMethod,
+                                     keywords=theExtraKeywords)
+        if theInMemoryFlag:
+            # Hand the layer over without a round trip through disk
+            return myClippedLayer
+        myClippedLayer.write_to_file(myFilename)
+    else:
+        _warpRasterLayer(myWorkingLayer, myFilename, theExtent,
+                         theCellSize)
+
+    myKeywordIO = KeywordIO()
+    myKeywordIO.copyKeywords(theLayer, myFilename,
+                             theExtraKeywords=theExtraKeywords)
+    return myFilename  # Filename of created file
+
+
+def _warpRasterLayer(theInputPath, theOutputPath, theExtent,
+                     theCellSize=None):
+    """Clip, resample and reproject a raster to EPSG:4326 using gdalwarp.
+
+    Args:
+
+        * theInputPath - path of the raster to be clipped
+        * theOutputPath - path of the GeoTIFF to be created
+        * theExtent - extents in the form [xmin, ymin, xmax, ymax] in
+            EPSG:4326
+        * theCellSize - cell size (in GeoCRS) which the layer should
+            be resampled to. If None the native cell size will be used.
+
+    Returns:
+        None
+
+    Raises:
+        CallGDALError if gdalwarp can not be run
+    """
+    # We need to provide gdalwarp with a dataset for the clip
+    # because unline gdal_translate, it does not take projwin.
+    myClipKml = extentToKml(theExtent)
+
     # If no cell size is specified, we need to run gdalwarp without
     # specifying the output pixel size to ensure the raster dims
     # remain consistent.
@@ -462,8 +626,8 @@ def _clipRasterLayer(theLayer, theExtent, theCellSize=None,
                      '-cutline %s -crop_to_cutline -of GTiff '
                      '"%s" "%s"' % (myBinary,
                                     myClipKml,
-                                    myWorkingLayer,
-                                    myFilename))
+                                    theInputPath,
+                                    theOutputPath))
     else:
         myCommand = ('%s -q -t_srs EPSG:4326 -r near -tr %f %f '
                      '-cutline %s -crop_to_cutline -of GTiff '
@@ -471,8 +635,8 @@ def _clipRasterLayer(theLayer, theExtent, theCellSize=None,
                                     theCellSize,
                                     theCellSize,
                                     myClipKml,
-                                    myWorkingLayer,
-                                    myFilename))
+                                    theInputPath,
+                                    theOutputPath))
 
     LOGGER.debug(myCommand)
     myResult = QProcess().execute(myCommand)
@@ -492,12 +656,7 @@ def _clipRasterLayer(theLayer, theExtent, theCellSize=None,
                        '</p><pre>%s</pre><p>Error message: %s'
                        % (myCommand, myMessageDetail))
         raise CallGDALError(myMessage)
-
     # .. todo:: Check the result of the shell call is ok
-    myKeywordIO = KeywordIO()
-    myKeywordIO.copyKeywords(theLayer, myFilename,
-                             theExtraKeywords=theExtraKeywords)
-    return myFilename  # Filename of created file
 
 
 def extentToKml(theExtent):
@@ -20,7 +20,6 @@ __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
 
 import os
 import numpy
-import sys
 import logging
 import uuid
 
@@ -33,6 +32,7 @@ from qgis.core import (
     QgsMapLayer,
     QgsVectorLayer,
     QgsRasterLayer,
+    QgsContrastEnhancement,
     QgsGeometry,
     QgsMapLayerRegistry,
     QgsCoordinateReferenceSystem,
@@ -41,11 +41,9 @@ from qgis.core import (
     QgsRectangle,
     QgsPoint,
     QgsField,
-    QgsVectorFileWriter,
     QGis,
     QgsSingleSymbolRendererV2,
     QgsFillSymbolV2)
-from qgis.analysis import QgsZonalStatistics
 
 from safe_qgis.dock_base import Ui_DockBase
 from safe_qgis.help import Help
@@ -61,9 +59,10 @@ from safe_qgis.utilities import (
     qgisVersion,
     getDefaults,
     impactLayerAttribution,
-    copyInMemory,
     addComboItemInOrder,
-    setVectorCategorizedStyle)
+    setVectorCategorizedStyle,
+    safeLayerInMemory,
+    deleteLayerInMemory)
 
 from safe_qgis.impact_calculator import ImpactCalculator
 from safe_qgis.safe_interface import (
@@ -76,13 +75,18 @@ from safe_qgis.safe_interface import (
     get_version,
     temp_dir,
     safe_read_layer,
-    get_free_memory,
+    plan_memory,
+    describe_plan,
     ReadLayerError,
-    points_in_and_outside_polygon,
-    calculate_polygon_centroid,
+    overlay_polygon_layers,
+    aggregate_vector,
+    aggregate_raster,
+    get_postprocessor_params,
+    run_postprocessors,
     unique_filename,
     get_postprocessors,
-    get_postprocessor_human_name)
+    get_postprocessor_human_name,
+    isSafeLayer)
 from safe_qgis.keyword_io import KeywordIO
 from safe_qgis.clipper import clipLayer
 from safe_qgis.exceptions import (
@@ -101,8 +105,6 @@ from safe_qgis.html_renderer import HtmlRenderer
 from safe_qgis.function_options_dialog import FunctionOptionsDialog
 from safe_qgis.keywords_dialog import KeywordsDialog
 
-from third_party.odict import OrderedDict
-
 
 # Don't remove this even if it is flagged as unused by your ide
 # it is needed for qrc:/ url resolution. See Qt Resources docs.
@@ -157,6 +159,12 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
         self.calculator = ImpactCalculator()
         self.keywordIO = KeywordIO()
         self.runner = None
+        # Impact layer of the last run as SAFE and QGIS layer
+        self.safeImpactLayer = None
+        self.qgisImpactLayer = None
+        # Sources of in memory impact layers of earlier runs still on the
+        # map by layer id. See releaseImpactLayer.
+        self.mappedMemoryLayers = {}
         self.helpDialog = None
         self.state = None
         self.lastUsedFunction = ''
@@ -726,11 +734,12 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
 
         # MapLayers returns a QMap<QString id, QgsMapLayer layer>
         myLayers = myRegistry.mapLayers().values()
-        for myLayer in myLayers:
-            if (self.showOnlyVisibleLayersFlag and
-                    (myLayer not in myCanvasLayers)):
-                continue
-
+        if self.showOnlyVisibleLayersFlag:
+            myLayers = [myLayer for myLayer in myLayers
+                        if myLayer in myCanvasLayers]
+        # Read the keywords of all layers in one go
+        myKeywordsList = self.keywordIO.readKeywordsForLayers(myLayers)
+        for myLayer, myKeywords in zip(myLayers, myKeywordsList):
             # .. todo:: check raster is single band
             #    store uuid in user property of list widget for layers
 
@@ -738,15 +747,11 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
             mySource = str(myLayer.id())
             # See if there is a title for this layer, if not,
             # fallback to the layer's filename
-
-            # noinspection PyBroadException
-            try:
-                myTitle = self.keywordIO.readKeywords(myLayer, 'title')
-            except:  # pylint: disable=W0702
+            if myKeywords is None or 'title' not in myKeywords:
                 myTitle = myName
             else:
                 # Lookup internationalised title if available
-                myTitle = safeTr(myTitle)
+                myTitle = safeTr(myKeywords['title'])
             # Register title with layer
             if myTitle and self.setLayerNameFromTitleFlag:
                 myLayer.setLayerName(myTitle)
@@ -762,11 +767,10 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
             # Find out if the layer is a hazard or an exposure
             # layer by querying its keywords. If the query fails,
             # the layer will be ignored.
-            try:
-                myCategory = self.keywordIO.readKeywords(myLayer, 'category')
-            except:  # pylint: disable=W0702
+            if myKeywords is None or 'category' not in myKeywords:
                 # continue ignoring this layer
                 continue
+            myCategory = myKeywords['category']
 
             if myCategory == 'hazard':
                 addComboItemInOrder(self.cboHazard, myTitle, mySource)
@@ -859,6 +863,10 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
     def readImpactLayer(self, myEngineImpactLayer):
         """Helper function to read and validate layer.
 
+        Impact layers that were not written to disk are shown from memory
+        (see :func:`safeLayerInMemory`) until they are saved with
+        :func:`saveImpactLayer`.
+
         Args
             myEngineImpactLayer: Layer object as provided by InaSAFE engine.
 
@@ -876,25 +884,141 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
         if not myEngineImpactLayer.is_inasafe_spatial_object:
             raise Exception(myMessage)
 
+        # The layer is read for aggregation and again when it is loaded
+        if myEngineImpactLayer is self.safeImpactLayer:
+            return self.qgisImpactLayer
+
         # Get associated filename and symbolic name
         myFilename = myEngineImpactLayer.get_filename()
         myName = myEngineImpactLayer.get_name()
 
+        # The new layer replaces the one of the previous run
+        self.releaseImpactLayer()
+
         myQGISLayer = None
         # Read layer
-        if myEngineImpactLayer.is_vector:
+        if myFilename is None:
+            myQGISLayer = safeLayerInMemory(myEngineImpactLayer)
+            self.keywordIO.writeKeywords(
+                myQGISLayer, myEngineImpactLayer.get_keywords())
+            myFilename = myQGISLayer.source()
+        elif myEngineImpactLayer.is_vector:
             myQGISLayer = QgsVectorLayer(myFilename, myName, 'ogr')
         elif myEngineImpactLayer.is_raster:
             myQGISLayer = QgsRasterLayer(myFilename, myName)
 
         # Verify that new qgis layer is valid
         if myQGISLayer.isValid():
+            self.safeImpactLayer = myEngineImpactLayer
+            self.qgisImpactLayer = myQGISLayer
             return myQGISLayer
         else:
             myMessage = self.tr('Loaded impact layer "%1" is not'
                                 ' valid').arg(myFilename)
             raise Exception(myMessage)
 
+    def releaseImpactLayer(self):
+        """Release the impact layer of the previous run.
+
+        In memory impact layers are deleted together with their keywords
+        (see :func:`deleteLayerInMemory`). Layers which are still on the
+        map are deleted once they have been removed from it.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        myLayer = self.qgisImpactLayer
+        self.safeImpactLayer = None
+        self.qgisImpactLayer = None
+        if myLayer is not None and self.keywordIO.areKeywordsInMemory(myLayer):
+            self.mappedMemoryLayers[str(myLayer.id())] = str(myLayer.source())
+
+        myRegistry = QgsMapLayerRegistry.instance()
+        for myLayerId, mySource in self.mappedMemoryLayers.items():
+            if myRegistry.mapLayer(myLayerId) is not None:
+                continue
+            deleteLayerInMemory(mySource)
+            self.keywordIO.deleteKeywordsInMemory(mySource)
+            del self.mappedMemoryLayers[myLayerId]
+
+    def saveImpactLayer(self, theFilename):
+        """Write the impact layer of the last analysis to disk.
+
+        Impact layers are kept in memory after the analysis so this is
+        the only time they are written.
+
+        Args:
+            theFilename - str path with extension .tif for raster or .shp
+                for vector impact layers.
+
+        Returns:
+            str - theFilename.
+
+        Raises:
+            ReadLayerError if no analysis has been run. Any exceptions
+            raised by the InaSAFE library will be propagated.
+        """
+        if self.safeImpactLayer is None:
+            myMessage = self.tr('There is no impact layer to save.')
+            raise ReadLayerError(myMessage)
+        # Keywords such as the postprocessing report were added in QGIS
+        self.safeImpactLayer.keywords = dict(self.keywordIO.readKeywords(
+            self.qgisImpactLayer))
+        self.safeImpactLayer.write_to_file(str(theFilename))
+        return theFilename
+
+    def saveImpactLayerAs(self):
+        """Slot to save the impact layer of the last analysis to a file.
+
+        The user is asked for the file to write.
+
+        Args:
+            None
+        Returns:
+            str - the file written or None if nothing was saved.
+        Raises:
+            None
+        """
+        if self.safeImpactLayer is None:
+            QtGui.QMessageBox.warning(
+                self,
+                self.tr('InaSAFE'),
+                self.tr('Please run an analysis before trying to save '
+                        'its impact layer.'))
+            return None
+
+        if self.safeImpactLayer.is_raster:
+            myExtension = '.tif'
+            myFilter = self.tr('GeoTIFF File (*.tif)')
+        else:
+            myExtension = '.shp'
+            myFilter = self.tr('Shape File (*.shp)')
+        myDefaultFileName = self.safeImpactLayer.get_name() + myExtension
+        myDefaultFileName = myDefaultFileName.replace(' ', '_')
+        myFilename = QtGui.QFileDialog.getSaveFileName(
+            self, self.tr('Save impact layer'),
+            os.path.join(temp_dir(), myDefaultFileName), myFilter)
+        myFilename = str(myFilename)
+        if myFilename == '':
+            return None
+        if os.path.splitext(myFilename)[1].lower() != myExtension:
+            myFilename += myExtension
+
+        try:
+            self.saveImpactLayer(myFilename)
+        except Exception, e:  # pylint: disable=W0703
+            myReport = getExceptionWithStacktrace(e, theHtml=True)
+            if myReport is not None:
+                self.displayHtml(myReport)
+            return None
+        return myFilename
+
     def getHazardLayer(self):
         """Get the QgsMapLayer currently selected in the hazard combo.
 
@@ -1314,279 +1438,51 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
         """ A helper function to align the polygons to the postprocLayer
         polygons. If one input polygon is in two or more postprocLayer polygons
         then it is divided so that each part is within only one of the
-        postprocLayer polygons. this allows to aggregate in postrocessing using
-        centroid in polygon.
+        postprocLayer polygons.
+
+        The splitting is done by overlay_polygon_layers which uses a
+        spatial index to find the postprocLayer polygons near each input
+        polygon. Parts get the attributes zone_id and area_frac recording
+        the postprocLayer polygon they are in and their share of the area
+        of the input polygon. Attributes are copied to all parts. The
+        target field of the impact is apportioned by area when aggregating,
+        see :func:`_aggregateResultsVector`.
 
         The function assumes EPSG:4326 but no checks are enforced
 
         Args:
-            theLayerFilename str of the file to be processed
+            * theLayerFilename - str of the file to be processed or a SAFE
+              vector layer in memory as returned by :func:`clipLayer`.
+            * theQgisLayer - the QGIS layer that was clipped.
         Returns:
-            str of the processed file
+            SAFE vector layer with the split polygons and the keywords of
+            the input. It is only written to disk if the post processing
+            layers are shown.
 
         Raises:
             Any exceptions raised by the InaSAFE library will be propagated.
         """
-#        import time
-#        startTime = time.clock()
-        myPostprocPolygons = self.mySafePostprocLayer.get_geometry()
-        myPolygonsLayer = safe_read_layer(theLayerFilename)
-        myRemainingPolygons = numpy.array(myPolygonsLayer.get_geometry())
-#        myRemainingAttributes = numpy.array(myPolygonsLayer.get_data())
-        myRemainingIndexes = numpy.array(range(len(myRemainingPolygons)))
+        if isSafeLayer(theLayerFilename):
+            myPolygonsLayer = theLayerFilename
+        else:
+            myPolygonsLayer = safe_read_layer(theLayerFilename)
+        mySplitLayer = overlay_polygon_layers(myPolygonsLayer,
+                                              self.mySafePostprocLayer)
 
         #used for unit tests only
-        self.preprocessedFeatureCount = 0
-
-        # FIXME (MB) the intersecting array is used only for debugging and
-        # could be safely removed
-        myIntersectingPolygons = []
-        myInsidePolygons = []
-
-        # FIXME (MB) maybe do raw geos without qgis
-        #select all postproc polygons with no attributes
-        postprocProvider = self.postProcessingLayer.dataProvider()
-        postprocProvider.select([])
-
-        # copy polygons to a memory layer
-        myQgisMemoryLayer = copyInMemory(theQgisLayer)
-
-        polygonsProvider = myQgisMemoryLayer.dataProvider()
-        allPolygonAttrs = polygonsProvider.attributeIndexes()
-        polygonsProvider.select(allPolygonAttrs)
-        myQgisPostprocPoly = QgsFeature()
-        myQgisFeat = QgsFeature()
-        myInsideFeat = QgsFeature()
-        fields = polygonsProvider.fields()
-        myTempdir = temp_dir(sub_dir='preprocess')
-        myOutFilename = unique_filename(suffix='.shp',
-                                        dir=myTempdir)
-
-        self.keywordIO.copyKeywords(theQgisLayer, myOutFilename)
-        mySHPWriter = QgsVectorFileWriter(myOutFilename,
-                                          'UTF-8',
-                                          fields,
-                                          polygonsProvider.geometryType(),
-                                          polygonsProvider.crs())
-        if mySHPWriter.hasError():
-            raise InvalidParameterError(mySHPWriter.errorMessage())
-        # end FIXME
-
-        for (myPostprocPolygonIndex,
-             myPostprocPolygon) in enumerate(myPostprocPolygons):
-            LOGGER.debug('PostprocPolygon %s' % myPostprocPolygonIndex)
-            myPolygonsCount = len(myRemainingPolygons)
-            postprocProvider.featureAtId(myPostprocPolygonIndex,
-                                         myQgisPostprocPoly, True, [])
-            myQgisPostprocGeom = QgsGeometry(myQgisPostprocPoly.geometry())
-
-            # myPostprocPolygon bounding box values
-            A = numpy.array(myPostprocPolygon)
-            minx = miny = sys.maxint
-            maxx = maxy = -minx
-            myPostprocPolygonMinx = min(minx, min(A[:, 0]))
-            myPostprocPolygonMaxx = max(maxx, max(A[:, 0]))
-            myPostprocPolygonMiny = min(miny, min(A[:, 1]))
-            myPostprocPolygonMaxy = max(maxy, max(A[:, 1]))
-
-            # create an array full of False to store if a BB vertex is inside
-            # or outside the myPostprocPolygon
-            myAreVerticesInside = numpy.zeros(myPolygonsCount * 4,
-                                              dtype=numpy.bool)
-
-            # Create Nx2 vector of vertices of bounding boxes
-            myBBVertices = []
-            # Compute bounding box for each geometry type
-            for myPoly in myRemainingPolygons:
-                minx = miny = sys.maxint
-                maxx = maxy = -minx
-                # Do outer ring only as the BB is outside anyway
-                A = numpy.array(myPoly)
-                minx = min(minx, numpy.min(A[:, 0]))
-                maxx = max(maxx, numpy.max(A[:, 0]))
-                miny = min(miny, numpy.min(A[:, 1]))
-                maxy = max(maxy, numpy.max(A[:, 1]))
-                myBBVertices.extend([(minx, miny),
-                                    (minx, maxy),
-                                    (maxx, maxy),
-                                    (maxx, miny)])
-
-            # see if BB vertices are in myPostprocPolygon
-            myBBVertices = numpy.array(myBBVertices)
-            inside, _ = points_in_and_outside_polygon(myBBVertices,
-                                                      myPostprocPolygon)
-            # make True if the vertice was in myPostprocPolygon
-            myAreVerticesInside[inside] = True
-
-            # myNextIterPolygons has the 0:count indexes
-            # myOutsidePolygons has the mapped to original indexes
-            # and is overwritten at every iteration because we care only of
-            # the outside polygons remaining after the last iteration
-            myNextIterPolygons = []
-            myOutsidePolygons = []
-
-            for i in range(myPolygonsCount):
-                k = i * 4
-                myMappedIndex = myRemainingIndexes[i]
-                # memory layers counting starts at 1 instead of 0 as in our
-                # indexes
-                myFeatId = myMappedIndex + 1
-                doIntersection = False
-                # summ the isInside bool for each of the boundingbox vertices
-                # of each poygon. for example True + True + False + True is 3
-                myPolygonLocation = numpy.sum(myAreVerticesInside[k:k + 4])
-
-                if myPolygonLocation == 4:
-                    # all vertices are inside -> polygon is inside
-                    #ignore this polygon from further analysis
-                    myInsidePolygons.append(myMappedIndex)
-                    polygonsProvider.featureAtId(myFeatId,
-                                                 myQgisFeat,
-                                                 True,
-                                                 allPolygonAttrs)
-                    mySHPWriter.addFeature(myQgisFeat)
-                    self.preprocessedFeatureCount += 1
-#                    LOGGER.debug('Polygon %s is fully inside' %myMappedIndex)
-#                    tmpWriter.addFeature(myQgisFeat)
-
-                elif myPolygonLocation == 0:
-                    # all vertices are outside
-                    # check if the polygon BB is completely outside of the
-                    # myPostprocPolygon BB.
-                    myPolyMinx = numpy.min(myBBVertices[k:k + 4, 0])
-                    myPolyMaxx = numpy.max(myBBVertices[k:k + 4, 0])
-                    myPolyMiny = numpy.min(myBBVertices[k:k + 4, 1])
-                    myPolyMaxy = numpy.max(myBBVertices[k:k + 4, 1])
-
-                    # check if myPoly is all E,W,N,S of myPostprocPolygon
-                    if ((myPolyMinx > myPostprocPolygonMaxx) or
-                            (myPolyMaxx < myPostprocPolygonMinx) or
-                            (myPolyMiny > myPostprocPolygonMaxy) or
-                            (myPolyMaxy < myPostprocPolygonMiny)):
-                        #polygon is surely outside
-                        myOutsidePolygons.append(myMappedIndex)
-                        # we need this polygon in the next iteration
-                        myNextIterPolygons.append(i)
-                    else:
-                        # polygon might be outside or intersecting. consider
-                        # it intersecting so it goes into further analysis
-                        doIntersection = True
-                else:
-                    # some vertices are outside some inside -> polygon is
-                    # intersecting
-                    doIntersection = True
-
-                #intersect using qgis
-                if doIntersection:
-#                    LOGGER.debug('Intersecting polygon %s' % myMappedIndex)
-                    myIntersectingPolygons.append(myMappedIndex)
-
-                    ok = polygonsProvider.featureAtId(myFeatId,
-                                                      myQgisFeat,
-                                                      True,
-                                                      allPolygonAttrs)
-                    if not ok:
-                        LOGGER.debug('Couldn\'t fetch feature: %s' % myFeatId)
-                        LOGGER.debug([str(error) for error in
-                                      polygonsProvider.errors()])
-
-                    myQgisPolyGeom = QgsGeometry(myQgisFeat.geometry())
-                    myAtMap = myQgisFeat.attributeMap()
-#                    for (k, attr) in myAtMap.iteritems():
-#                        LOGGER.debug( "%d: %s" % (k, attr.toString()))
-
-                    # make intersection of the myQgisFeat and the postprocPoly
-                    # write the inside part to a shp file and the outside part
-                    # back to the original QGIS layer
-                    try:
-                        myIntersec = myQgisPostprocGeom.intersection(
-                            myQgisPolyGeom)
-#                        if myIntersec is not None:
-                        myIntersecGeom = QgsGeometry(myIntersec)
-
-                        #from ftools
-                        myUnknownGeomType = 0
-                        if myIntersecGeom.wkbType() == myUnknownGeomType:
-                            int_com = myQgisPostprocGeom.combine(
-                                myQgisPolyGeom)
-                            int_sym = myQgisPostprocGeom.symDifference(
-                                myQgisPolyGeom)
-                            myIntersecGeom = QgsGeometry(
-                                int_com.difference(int_sym))
-#                        LOGGER.debug('wkbType type of intersection: %s' %
-# myIntersecGeom.wkbType())
-                        polygonTypesList = [QGis.WKBPolygon,
-                                            QGis.WKBMultiPolygon]
-                        if myIntersecGeom.wkbType() in polygonTypesList:
-                            myInsideFeat.setGeometry(myIntersecGeom)
-                            myInsideFeat.setAttributeMap(myAtMap)
-                            mySHPWriter.addFeature(myInsideFeat)
-                            self.preprocessedFeatureCount += 1
-                        else:
-                            pass
-#                            LOGGER.debug('Intersection not a polygon so '
-#                                         'the two polygons either touch '
-#                                         'only or do not intersect. Not '
-#                                         'adding this to the inside list')
-                        #Part of the polygon that is outside the postprocpoly
-                        myOutside = myQgisPolyGeom.difference(myIntersecGeom)
-#                        if myOutside is not None:
-                        myOutsideGeom = QgsGeometry(myOutside)
-
-                        if myOutsideGeom.wkbType() in polygonTypesList:
-                            # modifiy the original geometry to the part
-                            # outside of the postproc polygon
-                            polygonsProvider.changeGeometryValues(
-                                {myFeatId: myOutsideGeom})
-                            # we need this polygon in the next iteration
-                            myOutsidePolygons.append(myMappedIndex)
-                            myNextIterPolygons.append(i)
-
-                    except TypeError:
-                        LOGGER.debug('ERROR with FID %s', myMappedIndex)
-
-#            LOGGER.debug('Inside %s' % myInsidePolygons)
-#            LOGGER.debug('Outside %s' % myOutsidePolygons)
-#            LOGGER.debug('Intersec %s' % myIntersectingPolygons)
-            if len(myNextIterPolygons) > 0:
-                #some polygons are still completely outside of the postprocPoly
-                #so go on and reiterate using only these
-                nextIterPolygonsIndex = numpy.array(myNextIterPolygons)
-
-                myRemainingPolygons = myRemainingPolygons[
-                    nextIterPolygonsIndex]
-#                myRemainingAttributes = myRemainingAttributes[
-#                                        nextIterPolygonsIndex]
-                myRemainingIndexes = myRemainingIndexes[nextIterPolygonsIndex]
-                LOGGER.debug('Remaining: %s' % len(myRemainingPolygons))
-            else:
-                print 'no more polygons to be checked'
-                break
-#            del tmpWriter
-
-        # here the full polygon set is represented by:
-        # myInsidePolygons + myIntersectingPolygons + myNextIterPolygons
-        # the a polygon intersecting multiple postproc polygons appears
-        # multiple times in the array
-        LOGGER.debug('Results:\nInside: %s\nIntersect: %s\nOutside: %s' % (
-            myInsidePolygons, myIntersectingPolygons, myOutsidePolygons))
-
-        #add in- and outside polygons
-
-        for i in myOutsidePolygons:
-            myFeatId = i + 1
-            polygonsProvider.featureAtId(myFeatId, myQgisFeat, True,
-                                         allPolygonAttrs)
-            mySHPWriter.addFeature(myQgisFeat)
-            self.preprocessedFeatureCount += 1
-
-        del mySHPWriter
-#        LOGGER.debug('Created: %s' % self.preprocessedFeatureCount)
+        self.preprocessedFeatureCount = len(mySplitLayer)
+
+        LOGGER.debug('Split %s polygons into %s parts' % (
+            len(myPolygonsLayer), self.preprocessedFeatureCount))
         if self.showPostProcLayers:
+            myTempdir = temp_dir(sub_dir='preprocess')
+            myOutFilename = unique_filename(suffix='.shp',
+                                            dir=myTempdir)
+            mySplitLayer.write_to_file(myOutFilename)
             self.iface.addVectorLayer(myOutFilename,
                                       theQgisLayer.title(),
                                       'ogr')
-        return myOutFilename
+        return mySplitLayer
 
     def postProcess(self):
         """Run all post processing steps.
@@ -1647,6 +1543,8 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
         self.aggregationErrorSkipPostprocessing = None
         self.targetField = None
         self.impactLayerAttributes = []
+        self.impactLayerCounts = []
+        self.aggregationResult = None
         try:
             if ((self.postProcessingLayer is not None) and
                     (self.lastUsedFunction != self.getFunctionID())):
@@ -1841,6 +1739,7 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
         except KeywordNotFoundError:
             #default to summing
             self.statisticsType = 'sum'
+            self.statisticsClasses = None
 
         #call the correct aggregator
         if myQGISImpactLayer.type() == QgsMapLayer.VectorLayer:
@@ -1912,9 +1811,6 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
         #TODO implement polygon to polygon aggregation (dissolve,
         # line in polygon, point in polygon)
 
-        # Note: The next line raises a pylint error but I am not disabling the
-        # pylint warning because I think we need some redesign here. TS
-        global myAttrs
         try:
             self.targetField = self.keywordIO.readKeywords(myQGISImpactLayer,
                                                            'target_field')
@@ -1926,7 +1822,6 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
             LOGGER.debug('Skipping postprocessing due to: %s' % myMessage)
             self.aggregationErrorSkipPostprocessing = myMessage
             return
-        myImpactProvider = myQGISImpactLayer.dataProvider()
         myTargetFieldIndex = myQGISImpactLayer.fieldNameIndex(self.targetField)
         #if a feature has no field called
         if myTargetFieldIndex == -1:
@@ -1939,11 +1834,6 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
             self.aggregationErrorSkipPostprocessing = myMessage
             return
 
-        # start data retreival: fetch no geometry and
-        # 1 attr for each feature
-        myImpactProvider.select([myTargetFieldIndex], QgsRectangle(), False)
-        myTotal = 0
-
         myPostprocessorProvider = self.postProcessingLayer.dataProvider()
         self.postProcessingLayer.startEditing()
 
@@ -1972,138 +1862,15 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
         self.postProcessingLayer.startEditing()
 
         mySafeImpactLayer = self.runner.impactLayer()
-        myImpactGeoms = mySafeImpactLayer.get_geometry()
-        myImpactValues = mySafeImpactLayer.get_data()
-
         if self.doZonalAggregation:
-            myPostprocPolygons = self.mySafePostprocLayer.get_geometry()
-
-            if ((mySafeImpactLayer.is_point_data) or
-                    (mySafeImpactLayer.is_polygon_data)):
-                LOGGER.debug('Doing point in polygon aggregation')
-
-                myRemainingValues = myImpactValues
-
-                if mySafeImpactLayer.is_polygon_data:
-                    # Using centroids to do polygon in polygon aggregation
-                    # this is always ok because
-                    # prepareInputLayerForAggregation() took care of splitting
-                    # polygons that spawn across multiple postprocessing
-                    # polygons. After prepareInputLayerForAggregation()
-                    # each impact polygon will never be contained by more than
-                    # one aggregation polygon
-
-                    # Calculate points for each polygon
-                    myCentroids = []
-                    for myPolygon in myImpactGeoms:
-                        if hasattr(myPolygon, 'outer_ring'):
-                            outer_ring = myPolygon.outer_ring
-                        else:
-                            # Assume it is an array
-                            outer_ring = myPolygon
-                        c = calculate_polygon_centroid(outer_ring)
-                        myCentroids.append(c)
-                    myRemainingPoints = myCentroids
-
-                else:
-                    myRemainingPoints = myImpactGeoms
-
-                for myPolygonIndex, myPolygon in enumerate(myPostprocPolygons):
-                    if hasattr(myPolygon, 'outer_ring'):
-                        outer_ring = myPolygon.outer_ring
-                        inner_rings = myPolygon.inner_rings
-                    else:
-                        # Assume it is an array
-                        outer_ring = myPolygon
-                        inner_rings = None
-
-                    inside, outside = points_in_and_outside_polygon(
-                        myRemainingPoints,
-                        outer_ring,
-                        holes=inner_rings,
-                        closed=True,
-                        check_input=True)
-
-                    #self.impactLayerAttributes is a list of list of dict
-                    #[
-                    #   [{...},{...},{...}],
-                    #   [{...},{...},{...}]
-                    #]
-                    self.impactLayerAttributes.append([])
-                    if self.statisticsType == 'class_count':
-                        myResults = OrderedDict()
-                        for myClass in self.statisticsClasses:
-                            myResults[myClass] = 0
-
-                        for i in inside:
-                            myKey = myRemainingValues[i][self.targetField]
-                            try:
-                                myResults[myKey] += 1
-                            except KeyError:
-                                myError = ('StatisticsClasses %s does not '
-                                           'include the %s class which was '
-                                           'found in the data. This is a '
-                                           'problem in the %s '
-                                           'statistics_classes definition' %
-                                           (self.statisticsClasses,
-                                            myKey,
-                                            self.getFunctionID()))
-                                raise KeyError(myError)
-
-                            self.impactLayerAttributes[myPolygonIndex].append(
-                                myRemainingValues[i])
-                        myAttrs = {}
-                        for k, v in myResults.iteritems():
-                            myKey = '%s_%s' % (k, self.targetField)
-                            #FIXME (MB) remove next line when we get rid of
-                            #shape files as internal format
-                            myKey = myKey[:10]
-                            myAggrFieldIndex = myAggrFieldMap[myKey]
-                            myAttrs[myAggrFieldIndex] = QtCore.QVariant(v)
-
-                    elif self.statisticsType == 'sum':
-                        #by default summ attributes
-                        myTotal = 0
-                        for i in inside:
-                            try:
-                                myTotal += myRemainingValues[i][
-                                    self.targetField]
-                            except TypeError:
-                                pass
-
-                            #add all attributes to the impactLayerAttributes
-                            self.impactLayerAttributes[myPolygonIndex].append(
-                                myRemainingValues[i])
-                        myAttrs = {myAggrFieldIndex: QtCore.QVariant(myTotal)}
-
-                    # Add features inside this polygon
-                    myFID = myPolygonIndex
-                    myPostprocessorProvider.changeAttributeValues(
-                        {myFID: myAttrs})
-
-                    # make outside points the input to the next iteration
-                    # this could maybe be done quicklier using directly numpy
-                    # arrays like this:
-                    # myRemainingPoints = myRemainingPoints[outside]
-                    # myRemainingValues =
-                    # [myRemainingValues[i] for i in outside]
-                    myTmpPoints = []
-                    myTmpValues = []
-                    for i in outside:
-                        myTmpPoints.append(myRemainingPoints[i])
-                        myTmpValues.append(myRemainingValues[i])
-                    myRemainingPoints = myTmpPoints
-                    myRemainingValues = myTmpValues
-
-#                    LOGGER.debug('Before: ' + str(len(myRemainingValues)))
-#                    LOGGER.debug('After: ' + str(len(myRemainingValues)))
-#                    LOGGER.debug('Inside: ' + str(len(inside)))
-#                    LOGGER.debug('Outside: ' + str(len(outside)))
-
-            elif mySafeImpactLayer.is_line_data:
-                LOGGER.debug('Doing line in polygon aggregation')
-
-            else:
+            myZoneLayer = self.mySafePostprocLayer
+            if mySafeImpactLayer.is_line_data:
+                LOGGER.debug('Line in polygon aggregation is not '
+                             'implemented yet')
+                self.postProcessingLayer.commitChanges()
+                return
+            if not (mySafeImpactLayer.is_point_data or
+                    mySafeImpactLayer.is_polygon_data):
                 myMessage = self.tr('Aggregation on vector impact layers other'
                                     'than points or polygons not implemented '
                                     'yet not implemented yet. '
@@ -2113,31 +1880,45 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
                 self.aggregationErrorSkipPostprocessing = myMessage
                 self.postProcessingLayer.commitChanges()
                 return
+            # Summed polygons are split along the postprocessing polygons
+            # by aggregate_vector which apportions the target field by area
+            # and aggregates the parts on their zone_id. Points and counted
+            # polygons are aggregated by point (centroid) in polygon.
+            LOGGER.debug('Doing point or polygon in polygon aggregation')
         else:
-            if self.statisticsType == 'class_count':
-                #loop over all features in impact layer
-                myResults = OrderedDict()
-                for myClass in self.statisticsClasses:
-                    myResults[myClass] = 0
-
-                self.impactLayerAttributes.append([])
-                for myImpactValueList in myImpactValues:
-                    myKey = myImpactValueList[self.targetField]
-                    try:
-                        myResults[myKey] += 1
-                    except KeyError:
-                        myError = ('StatisticsClasses %s does not '
-                                   'include the %s class which was '
-                                   'found in the data. This is a '
-                                   'problem in the %s '
-                                   'statistics_classes definition' %
-                                   (self.statisticsClasses,
-                                    myKey,
-                                    self.getFunctionID()))
-                        raise KeyError(myError)
-
-                    self.impactLayerAttributes[0].append(myImpactValueList)
+            # The whole impact layer is aggregated into the single feature
+            # of the entire area layer
+            myZoneLayer = None
 
+        try:
+            myAggregation = aggregate_vector(
+                mySafeImpactLayer, myZoneLayer, self.targetField,
+                statistics_type=self.statisticsType,
+                statistics_classes=self.statisticsClasses)
+        except KeyError, e:
+            myError = ('StatisticsClasses %s does not '
+                       'include the %s class which was '
+                       'found in the data. This is a '
+                       'problem in the %s '
+                       'statistics_classes definition' %
+                       (self.statisticsClasses,
+                        e.args[0],
+                        self.getFunctionID()))
+            raise KeyError(myError)
+        self.aggregationResult = myAggregation
+
+        #self.impactLayerAttributes is a list of list of dict
+        #[
+        #   [{...},{...},{...}],
+        #   [{...},{...},{...}]
+        #]
+        self.impactLayerAttributes = myAggregation['attributes']
+
+        myChangedAttributes = {}
+        if self.statisticsType == 'class_count':
+            self.impactLayerCounts = myAggregation['counts']
+            for myPolygonIndex, myResults in enumerate(
+                    myAggregation['counts']):
                 myAttrs = {}
                 for k, v in myResults.iteritems():
                     myKey = '%s_%s' % (k, self.targetField)
@@ -2146,51 +1927,64 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
                     myKey = myKey[:10]
                     myAggrFieldIndex = myAggrFieldMap[myKey]
                     myAttrs[myAggrFieldIndex] = QtCore.QVariant(v)
+                myChangedAttributes[myPolygonIndex] = myAttrs
 
-            elif self.statisticsType == 'sum':
-                #loop over all features in impact layer
-                self.impactLayerAttributes.append([])
-                for myImpactValueList in myImpactValues:
-                    if myImpactValueList[self.targetField] == 'None':
-                        myImpactValueList[self.targetField] = None
-                    try:
-                        myTotal += myImpactValueList[self.targetField]
-                    except TypeError:
-                        pass
-                    self.impactLayerAttributes[0].append(myImpactValueList)
-                myAttrs = {myAggrFieldIndex: QtCore.QVariant(myTotal)}
-
-            #apply to all area feature
-            myFID = 0
-            myPostprocessorProvider.changeAttributeValues({myFID: myAttrs})
+        elif self.statisticsType == 'sum':
+            for myPolygonIndex, myTotal in enumerate(myAggregation['sums']):
+                myChangedAttributes[myPolygonIndex] = {
+                    myAggrFieldIndex: QtCore.QVariant(myTotal)}
+
+        # Feature ids of the postprocessing layer are the polygon indices
+        myPostprocessorProvider.changeAttributeValues(myChangedAttributes)
 
         self.postProcessingLayer.commitChanges()
         return
 
     def _aggregateResultsRaster(self, theQGISImpactLayer):
-        """
-        Performs Aggregation postprocessing step on raster impact layers by
-        calling QgsZonalStatistics
+        """Performs Aggregation postprocessing step on raster impact layers.
+
+        Count, sum and mean of the impact layer in each postprocessing
+        polygon are computed by aggregate_raster and written to the fields
+        QgsZonalStatistics used to create.
+
         Args:
-            QgsMapLayer: theQGISImpactLayer a valid QgsVectorLayer
+            QgsMapLayer: theQGISImpactLayer a valid QgsRasterLayer
 
         Returns: None
         """
-        myZonalStatistics = QgsZonalStatistics(
-            self.postProcessingLayer,
-            theQGISImpactLayer.dataProvider().dataSourceUri(),
-            self.aggregationPrefix)
-        myProgressDialog = QtGui.QProgressDialog(
-            self.tr('Calculating zonal statistics'),
-            self.tr('Abort...'),
-            0,
-            0)
-        myZonalStatistics.calculateStatistics(myProgressDialog)
-        if myProgressDialog.wasCanceled():
-            QtGui.QMessageBox.error(
-                self, self.tr('ZonalStats: Error'),
-                self.tr('You aborted aggregation, '
-                        'so there are no data for analysis. Exiting...'))
+        mySafeImpactLayer = self.runner.impactLayer()
+        if self.doZonalAggregation:
+            myZoneLayer = self.mySafePostprocLayer
+        else:
+            # The whole impact layer is aggregated into the single feature
+            # of the entire area layer
+            myZoneLayer = None
+
+        LOGGER.debug('Calculating zonal statistics of %s' %
+                     theQGISImpactLayer.name())
+        myAggregation = aggregate_raster(mySafeImpactLayer, myZoneLayer)
+        self.aggregationResult = myAggregation
+
+        myProvider = self.postProcessingLayer.dataProvider()
+        self.postProcessingLayer.startEditing()
+        myFields = [(self.getAggregationFieldNameCount(), 'count'),
+                    (self.getAggregationFieldNameSum(), 'sum'),
+                    (self.getAggregationFieldNameMean(), 'mean')]
+        myProvider.addAttributes([QgsField(myField, QtCore.QVariant.Double)
+                                  for myField, _ in myFields])
+        self.postProcessingLayer.commitChanges()
+
+        self.postProcessingLayer.startEditing()
+        myChangedAttributes = {}
+        for myField, myKey in myFields:
+            myFieldIndex = self.postProcessingLayer.fieldNameIndex(myField)
+            for myPolygonIndex, myValue in enumerate(myAggregation[myKey]):
+                myAttrs = myChangedAttributes.setdefault(myPolygonIndex, {})
+                myAttrs[myFieldIndex] = QtCore.QVariant(myValue)
+
+        # Feature ids of the postprocessing layer are the polygon indices
+        myProvider.changeAttributeValues(myChangedAttributes)
+        self.postProcessingLayer.commitChanges()
 
         return
 
@@ -2224,8 +2018,6 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
 
         myNameFieldIndex = self.postProcessingLayer.fieldNameIndex(
             myFeatureNameAttribute)
-        mySumFieldIndex = self.postProcessingLayer.fieldNameIndex(
-            self.getAggregationFieldNameSum())
 
         if 'Gender' in myPostProcessors:
             #look if we need to look for a variable female ratio in a layer
@@ -2242,14 +2034,15 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
                     self.postProcessingLayer,
                     self.defaults['FEM_RATIO_KEY'])
 
-        #iterate zone features
+        #iterate zone features once to build the table of zones
         myProvider = self.postProcessingLayer.dataProvider()
         myAttributes = myProvider.attributeIndexes()
         # start data retreival: fetch no geometry and all attributes for each
         # feature
         myProvider.select(myAttributes, QgsRectangle(), False)
         myFeature = QgsFeature()
-        myPolygonIndex = 0
+        myZoneNames = []
+        myFemaleRatios = []
         while myProvider.nextFeature(myFeature):
             #get all attributes of a feature
             myAttributeMap = myFeature.attributeMap()
@@ -2259,55 +2052,48 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
                 myZoneName = str(myFeature.id())
             else:
                 myZoneName = myAttributeMap[myNameFieldIndex].toString()
+            myZoneNames.append(myZoneName)
+
+            if 'Gender' in myPostProcessors and myFemaleRatioIsVariable:
+                myFemaleRatio, mySuccessFlag = myAttributeMap[
+                    myFemRatioFieldIndex].toDouble()
+                if not mySuccessFlag:
+                    myFemaleRatio = self.defaults['FEM_RATIO']
+                LOGGER.debug(mySuccessFlag)
+            if 'Gender' in myPostProcessors:
+                myFemaleRatios.append(myFemaleRatio)
+
+        #create dictionaries of attributes to pass to postprocessors
+        if self.aggregationResult is None:
+            # Nothing was aggregated (e.g. lines in polygons)
+            myZonesParams = [{'target_field': self.targetField,
+                              'impact_attrs': None} for _ in myZoneNames]
+        else:
+            myZonesParams = get_postprocessor_params(
+                self.aggregationResult,
+                target_field=self.targetField,
+                statistics_type=self.statisticsType,
+                statistics_classes=self.statisticsClasses)
+
+        myExtraParams = {}
+        for myKey in myPostProcessors:
+            try:
+                #look if params are available for this postprocessor
+                myExtraParams[myKey] = (
+                    self.functionParams['postprocessors'][myKey]['params'])
+            except KeyError:
+                pass
 
-            #create dictionary of attributes to pass to postprocessor
-            myGeneralParams = {'target_field': self.targetField}
-
-            if self.statisticsType == 'class_count':
-                myGeneralParams['impact_classes'] = self.statisticsClasses
-            elif self.statisticsType == 'sum':
-                myImpactTotal, _ = myAttributeMap[mySumFieldIndex].toDouble()
-                myGeneralParams['impact_total'] = myImpactTotal
+        myZonesExtraParams = {}
+        if 'Gender' in myPostProcessors:
+            myZonesExtraParams['Gender'] = [{'female_ratio': r}
+                                            for r in myFemaleRatios]
 
-            try:
-                myGeneralParams['impact_attrs'] = (
-                    self.impactLayerAttributes[myPolygonIndex])
-            except IndexError:
-                #rasters and attributeless vectors have no attributes
-                myGeneralParams['impact_attrs'] = None
-
-            for myKey, myValue in myPostProcessors.iteritems():
-                myParameters = myGeneralParams
-                try:
-                    #look if params are available for this postprocessor
-                    myParameters.update(
-                        self.functionParams['postprocessors'][myKey]['params'])
-                except KeyError:
-                    pass
-
-                if myKey == 'Gender':
-                    if myFemaleRatioIsVariable:
-                        myFemaleRatio, mySuccessFlag = myAttributeMap[
-                            myFemRatioFieldIndex].toDouble()
-                        if not mySuccessFlag:
-                            myFemaleRatio = self.defaults['FEM_RATIO']
-                        LOGGER.debug(mySuccessFlag)
-                    myParameters['female_ratio'] = myFemaleRatio
-
-                myValue.setup(myParameters)
-                myValue.process()
-                myResults = myValue.results()
-                myValue.clear()
-#                LOGGER.debug(myResults)
-                try:
-                    self.postProcessingOutput[myKey].append(
-                        (myZoneName, myResults))
-                except KeyError:
-                    self.postProcessingOutput[myKey] = []
-                    self.postProcessingOutput[myKey].append(
-                        (myZoneName, myResults))
-            #increment the index
-            myPolygonIndex += 1
+        #run each postprocessor on the whole table of zones
+        self.postProcessingOutput.update(run_postprocessors(
+            myPostProcessors, myZonesParams, myZoneNames,
+            extra_params=myExtraParams,
+            zones_extra_params=myZonesExtraParams))
 
     def _checkPostProcessingAttributes(self):
         """Checks if the postprocessing layer has all attribute keyword.
@@ -2469,6 +2255,13 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
                     QgsRasterLayer.SingleBandPseudoColor)
                 myQGISImpactLayer.setColorShadingAlgorithm(
                     QgsRasterLayer.PseudoColorShader)
+                # Shade the range known from the statistics of the impact
+                # layer rather than have QGIS scan the raster for it
+                myMinimum, myMaximum = myEngineImpactLayer.get_extrema()
+                myQGISImpactLayer.setContrastEnhancementAlgorithm(
+                    QgsContrastEnhancement.UserDefinedEnhancement)
+                myQGISImpactLayer.setMinimumValue(1, myMinimum)
+                myQGISImpactLayer.setMaximumValue(1, myMaximum)
             else:
                 setRasterStyle(myQGISImpactLayer, myStyle)
 
@@ -2717,8 +2510,10 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
         Args:
             None
         Returns:
-            A two-tuple containing the paths to the clipped hazard and
-            exposure layers.
+            A three-tuple containing the clipped hazard and exposure layers
+            and the path to the clipped aggregation layer. Hazard and
+            exposure layers are returned as in memory SAFE layers where
+            they could be clipped in process, otherwise as paths.
 
         Raises:
             Any exceptions raised by the InaSAFE library will be propagated.
@@ -2745,7 +2540,8 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
             myClippedHazardPath = clipLayer(theLayer=myHazardLayer,
                                             theExtent=myBufferedGeoExtent,
                                             theCellSize=myCellSize,
-                                            theHardClipFlag=self.clipHard)
+                                            theHardClipFlag=self.clipHard,
+                                            theInMemoryFlag=True)
         except CallGDALError, e:
             raise e
         except IOError, e:
@@ -2762,7 +2558,8 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
             theExtent=myGeoExtent,
             theCellSize=myCellSize,
             theExtraKeywords=myExtraExposureKeywords,
-            theHardClipFlag=self.clipHard)
+            theHardClipFlag=self.clipHard,
+            theInMemoryFlag=True)
 
         myTitle = self.tr('Preparing aggregation layer...')
         myMessage = self.tr('We are clipping the aggregation'
@@ -3162,7 +2959,7 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
 
     @pyqtSlot()
     def checkMemoryUsage(self):
-        """Slot to check if analysis is feasible when extents change.
+        """Slot to plan memory use of the analysis when extents change.
 
         For simplicity, we will do all our calcs in geocrs.
 
@@ -3170,12 +2967,14 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
             None
 
         Returns:
-            str: A string containing notes about how much memory is needed
-                for a single raster and if this is likely to result in an
-                error.
+            str: None if the analysis is planned to fit in the available
+                memory, otherwise a string noting that it may not.
 
-        .. note:: The dock is also updated with a message indicating if the
-            memory usage is likely to be too much for the current system.
+        .. note:: The memory plan, i.e. in how many tiles the impact
+            function will process the rasters and how much of the
+            available memory this needs, is shown as tooltip of the run
+            button. The dock is only updated with a message if the
+            analysis may not fit in memory.
 
         """
         LOGGER.info('Extents changed!')
@@ -3206,33 +3005,56 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
         LOGGER.info('Height: %s' % myHeight)
         LOGGER.info('Pixel Size: %s' % myCellSize)
 
-        # Compute mem requirement in MB (assuming numpy uses 8bytes by per
-        # cell) see this link:
-        # http://stackoverflow.com/questions/11784329/
-        #      python-memory-usage-of-numpy-arrays
-        # Also note that the on-disk requirement of the clipped tifs is about
-        # half this since the tifs as in single precision,
-        # whereas numpy arrays are in double precision.
-        myRequirement = ((myWidth * myHeight * 8) / 1024 / 1024)
-        try:
-            myFreeMemory = get_free_memory()
-        except ValueError:
-            myMessage = 'Could not determine free memory'
-            LOGGER.exception(myMessage)
-            return None
+        # The planner sizes the tiles from the memory the selected impact
+        # function declares per cell and the memory available now
+        myFunction = None
+        myFunctionID = self.getFunctionID()
+        if myFunctionID:
+            try:
+                myFunction = getSafeImpactFunctions(
+                    myFunctionID)[0][myFunctionID]
+            except (RuntimeError, KeyError, IndexError):
+                LOGGER.exception('Impact function %s not found' %
+                                 myFunctionID)
+        myPlan = plan_memory(myFunction,
+                             max(1, int(round(myHeight))),
+                             max(1, int(round(myWidth))))
+        LOGGER.info('Memory plan: %s' % describe_plan(myPlan))
+
+        if myPlan['block_rows'] is None:
+            myPlanMessage = self.tr(
+                'The analysis of %1 x %2 cells will be run in one piece '
+                'using about %3mb of memory.').arg(
+                    myPlan['columns']).arg(myPlan['rows']).arg(
+                    int(myPlan['peak']))
+            if myFunction is not None:
+                myPlanMessage += ' ' + self.tr(
+                    'The impact function can not process the rasters in '
+                    'tiles.')
+        else:
+            myPlanMessage = self.tr(
+                'The analysis of %1 x %2 cells will be run in %3 tiles of '
+                '%4 rows using about %5mb of memory.').arg(
+                    myPlan['columns']).arg(myPlan['rows']).arg(
+                    myPlan['tiles']).arg(myPlan['block_rows']).arg(
+                    int(myPlan['peak']))
+        if getattr(myFunction, 'memory_multiple', None) is None:
+            myPlanMessage += ' ' + self.tr(
+                'The memory use is a rough estimate as the impact function '
+                'does not declare it.')
+        if myPlan['available'] is None:
+            myPlanMessage += ' ' + self.tr(
+                'Could not determine free memory.')
+        else:
+            myPlanMessage += ' ' + self.tr(
+                '%1mb of memory is available.').arg(myPlan['available'])
+
+        # Panning and zooming must not replace the report of an analysis
+        # so the plan is kept out of the results view
+        self.pbnRunStop.setToolTip(myPlanMessage)
 
-        # We work on the assumption that if more than 10% of the available
-        # memory is occupied by a single layer we could run out of memory
-        # (depending on the impact function). This is because multiple
-        # in memory copies of the layer are often made during processing.
-        myWarningLimit = 10
-        myUsageIndicator = (float(myRequirement) / float(myFreeMemory)) * 100
-        myCountsMessage = ('Memory requirement: about %imb per raster layer ('
-                           '%imb available). %.2f / %s' %
-                           (myRequirement, myFreeMemory, myUsageIndicator,
-                            myWarningLimit))
         myMessage = None
-        if myWarningLimit <= myUsageIndicator:
+        if not myPlan['feasible']:
             myMessage = self.tr(
                 'There may not be enough free memory to '
                 'run this analysis. You can attempt to run the '
@@ -3247,6 +3069,8 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
                 'requirements. You could also try adding '
                 'more RAM to your computer.')
             myHtmlMessage = ('<table class="condensed">'
+                             '<tr><th class="info button-cell">%s</th></tr>\n'
+                             '<tr><td>%s</td></tr>\n'
                              '<tr><th class="warning '
                              'button-cell">%s</th></tr>\n'
                              '<tr><td>%s</td></tr>\n'
@@ -3254,6 +3078,8 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
                              'button-cell">%s</th></tr>\n'
                              '<tr><td>%s</td></tr>\n</table>' %
                              (
+                                 self.tr('Memory plan:'),
+                                 myPlanMessage,
                                  self.tr('Memory usage:'),
                                  myMessage,
                                  self.tr('Suggestion'),
@@ -3262,6 +3088,5 @@ class Dock(QtGui.QDockWidget, Ui_DockBase):
             myReadyMessage += myHtmlMessage
             self.displayHtml(myReadyMessage)
 
-        LOGGER.info(myCountsMessage)
         # Caller will assume enough memory if myMessage is None
         return myMessage
@@ -25,7 +25,7 @@ from PyQt4.QtCore import QObject
 from safe_qgis.impact_calculator_thread import ImpactCalculatorThread
 from safe_qgis.exceptions import InsufficientParametersError
 from safe_qgis.safe_interface import (
-    readSafeLayer, getSafeImpactFunctions)
+    readSafeLayer, isSafeLayer, getSafeImpactFunctions)
 
 
 class ImpactCalculator(QObject):
@@ -59,14 +59,15 @@ class ImpactCalculator(QObject):
 
         Args:
             theLayerPath - This should be a string representing a
-            path to a file which can be loaded as a SAFE readlayer instance.
+            path to a file which can be loaded as a SAFE readlayer instance
+            or a SAFE layer instance already in memory.
         Returns:
             None
         Raises:
             None
         """
-        if theLayerPath is None:
-            self._exposureLayer = None
+        if theLayerPath is None or isSafeLayer(theLayerPath):
+            self._exposureLayer = theLayerPath
         else:
             self._exposureLayer = str(theLayerPath)
 
@@ -88,14 +89,15 @@ class ImpactCalculator(QObject):
 
         Args:
             theLayerPath - This should be a string representing a
-            path to a file which can be loaded as a SAFE readlayer instance.
+            path to a file which can be loaded as a SAFE readlayer instance
+            or a SAFE layer instance already in memory.
         Returns:
             None
         Raises:
             None
         """
-        if theLayerPath is None:
-            self._hazardLayer = None
+        if theLayerPath is None or isSafeLayer(theLayerPath):
+            self._hazardLayer = theLayerPath
         else:
             self._hazardLayer = str(theLayerPath)
 
@@ -131,8 +133,9 @@ class ImpactCalculator(QObject):
         Requires three parameters to be set before execution
         can take place:
 
-        * Hazard layer - a path to a raster (string)
-        * Exposure layer - a path to a vector hazard layer (string).
+        * Hazard layer - a path to a raster (string) or a SAFE layer
+        * Exposure layer - a path to a vector hazard layer (string) or a
+          SAFE layer.
         * Function - a function name that defines how the Hazard assessment
           will be computed (string).
 
@@ -146,11 +149,15 @@ class ImpactCalculator(QObject):
         """
         self._filename = None
         self._result = None
-        if self._hazardLayer is None or self._hazardLayer == '':
+        if self._hazardLayer is None or (
+                not isSafeLayer(self._hazardLayer) and
+                self._hazardLayer == ''):
             myMessage = self.tr('Error: Hazard layer not set.')
             raise InsufficientParametersError(myMessage)
 
-        if self._exposureLayer is None or self._exposureLayer == '':
+        if self._exposureLayer is None or (
+                not isSafeLayer(self._exposureLayer) and
+                self._exposureLayer == ''):
             myMessage = self.tr('Error: Exposure layer not set.')
             raise InsufficientParametersError(myMessage)
 
@@ -158,10 +165,15 @@ class ImpactCalculator(QObject):
             myMessage = self.tr('Error: Function not set.')
             raise InsufficientParametersError(myMessage)
 
-        # Call impact calculation engine
+        # Call impact calculation engine. Layers handed over in memory
+        # are used as they are.
         try:
-            myHazardLayer = readSafeLayer(self._hazardLayer)
-            myExposureLayer = readSafeLayer(self._exposureLayer)
+            myHazardLayer = self._hazardLayer
+            if not isSafeLayer(myHazardLayer):
+                myHazardLayer = readSafeLayer(myHazardLayer)
+            myExposureLayer = self._exposureLayer
+            if not isSafeLayer(myExposureLayer):
+                myExposureLayer = readSafeLayer(myExposureLayer)
         except:
             raise
 
@@ -39,7 +39,19 @@ class KeywordIO(QObject):
 
     It abstracts away differences between using SAFE to get keywords from a
     .keywords file and this plugins implemenation of keyword caching in a local
-    sqlite db used for supporting keywords for remote datasources."""
+    sqlite db used for supporting keywords for remote datasources.
+
+    Keywords read are kept in a cache shared by all instances. Entries are
+    keyed by the keywords file (or database and uri hash) and stamped with
+    the modification time and size of that file, so they are refreshed as
+    soon as the keywords are changed, whether through this class or not."""
+
+    # Map of cache key to (stamp, keywords dict). See _cacheKey.
+    keywordCache = {}
+
+    # Map of datasource to keywords dict of layers held in memory. See
+    # areKeywordsInMemory.
+    memoryKeywords = {}
 
     def __init__(self):
         """Constructor for the KeywordIO object.
@@ -54,8 +66,11 @@ class KeywordIO(QObject):
         QObject.__init__(self)
         # path to sqlite db path
         self.keywordDbPath = None
-        self.setupKeywordDbPath()
         self.connection = None
+        # Flag indicating that the schema of the open connection is known
+        # to contain the keyword table
+        self.schemaCheckedFlag = False
+        self.setupKeywordDbPath()
 
     def setKeywordDbPath(self, thePath):
         """Set the path for the keyword database (sqlite).
@@ -71,6 +86,10 @@ class KeywordIO(QObject):
         Raises:
             None
         """
+        # Connection is kept open between queries so close it if the
+        # database changes
+        if self.connection is not None and self.keywordDbPath != str(thePath):
+            self.closeConnection()
         self.keywordDbPath = str(thePath)
 
     def readKeywords(self, theLayer, theKeyword=None):
@@ -92,16 +111,93 @@ class KeywordIO(QObject):
         """
         mySource = str(theLayer.source())
         myFlag = self.areKeywordsFileBased(theLayer)
-        myKeywords = None
+        myKey = self._cacheKey(mySource, myFlag)
+        if self.areKeywordsInMemory(theLayer):
+            if mySource not in self.memoryKeywords:
+                raise HashNotFoundError('No keywords found for %s' %
+                                        mySource)
+            myKeywords = dict(self.memoryKeywords[mySource])
+        else:
+            myKeywords = self._cachedKeywords(myKey)
+        if myKeywords is None:
+            myStamp = self._cacheStamp(myKey)
+            try:
+                if myFlag:
+                    myKeywords = readKeywordsFromFile(mySource)
+                else:
+                    myKeywords = self.readKeywordFromUri(mySource)
+            except (HashNotFoundError, Exception, OperationalError):
+                raise
+            self._cacheKeywords(myKey, myStamp, myKeywords)
 
-        try:
-            if myFlag:
-                myKeywords = readKeywordsFromFile(mySource, theKeyword)
-            else:
-                myKeywords = self.readKeywordFromUri(mySource, theKeyword)
+        if theKeyword is None or myKeywords is None:
             return myKeywords
-        except (HashNotFoundError, Exception, OperationalError):
-            raise
+        if theKeyword not in myKeywords:
+            myMessage = self.tr('No value was found for keyword %s in %s' %
+                                (theKeyword, mySource))
+            raise KeywordNotFoundError(myMessage)
+        return myKeywords[theKeyword]
+
+    def readKeywordsForLayers(self, theLayers):
+        """Read keywords for many datasources at once.
+
+        Keywords not in the cache are read from their files, and those for
+        non local datasources with a single query to the keywords database.
+
+        Args:
+            * theLayers - A list of QGIS QgsMapLayer instances.
+        Returns:
+            A list with the keywords dict of each layer, or None for
+            layers whose keywords could not be read.
+        Raises:
+            None
+        """
+        myKeywordsList = [None] * len(theLayers)
+        # Non local datasources not in the cache: index, key, hash, stamp
+        myUriLayers = []
+        for myIndex, myLayer in enumerate(theLayers):
+            mySource = str(myLayer.source())
+            if self.areKeywordsInMemory(myLayer):
+                if mySource in self.memoryKeywords:
+                    myKeywordsList[myIndex] = dict(
+                        self.memoryKeywords[mySource])
+                continue
+            myFlag = self.areKeywordsFileBased(myLayer)
+            myKey = self._cacheKey(mySource, myFlag)
+            myKeywords = self._cachedKeywords(myKey)
+            if myKeywords is not None:
+                myKeywordsList[myIndex] = myKeywords
+            elif myFlag:
+                # pylint: disable=W0702
+                # noinspection PyBroadException
+                try:
+                    myKeywordsList[myIndex] = self.readKeywords(myLayer)
+                except:
+                    LOGGER.debug('No keywords found for %s' % mySource)
+                # pylint: enable=W0702
+            else:
+                myUriLayers.append((myIndex, myKey,
+                                    self.getHashForDatasource(mySource),
+                                    self._cacheStamp(myKey)))
+        if not myUriLayers:
+            return myKeywordsList
+
+        try:
+            myCursor = self.getCursor()
+            mySQL = ('select hash, dict from keyword where hash in (%s);' %
+                     ', '.join(['?'] * len(myUriLayers)))
+            myCursor.execute(mySQL, [myItem[2] for myItem in myUriLayers])
+            myRecords = dict(myCursor.fetchall())
+        except sqlite.Error, e:
+            LOGGER.debug("Error %s:" % e.args[0])
+            return myKeywordsList
+
+        for myIndex, myKey, myHash, myStamp in myUriLayers:
+            if myHash in myRecords:
+                myKeywords = pickle.loads(str(myRecords[myHash]))
+                self._cacheKeywords(myKey, myStamp, myKeywords)
+                myKeywordsList[myIndex] = myKeywords
+        return myKeywordsList
 
     def writeKeywords(self, theLayer, theKeywords):
         """Write keywords for a datasource.
@@ -120,7 +216,11 @@ class KeywordIO(QObject):
             None
         """
         mySource = str(theLayer.source())
+        if self.areKeywordsInMemory(theLayer):
+            self.memoryKeywords[mySource] = dict(theKeywords)
+            return
         myFlag = self.areKeywordsFileBased(theLayer)
+        self.keywordCache.pop(self._cacheKey(mySource, myFlag), None)
         try:
             if myFlag:
                 writeKeywordsToFile(mySource, theKeywords)
@@ -193,6 +293,7 @@ class KeywordIO(QObject):
         # compute the output keywords file name
         myDestinationBase = os.path.splitext(theDestinationFile)[0]
         myNewDestination = myDestinationBase + '.keywords'
+        self.keywordCache.pop(self._cacheKey(theDestinationFile, True), None)
         # write the extra keywords into the source dict
         try:
             for key in theExtraKeywords:
@@ -295,6 +396,7 @@ class KeywordIO(QObject):
             An sqlite.Error is raised if anything goes wrong
         """
         self.connection = None
+        self.schemaCheckedFlag = False
         try:
             self.connection = sqlite.connect(self.keywordDbPath)
         except (OperationalError, sqlite.Error):
@@ -314,12 +416,14 @@ class KeywordIO(QObject):
         if self.connection is not None:
             self.connection.close()
             self.connection = None
+        self.schemaCheckedFlag = False
 
     def getCursor(self):
         """Get a cursor for the active connection. The cursor can be used to
         execute arbitrary queries against the database. This method also checks
         that the keywords table exists in the schema, and if not, it creates
-        it.
+        it. The connection is opened on first use and then kept open, so the
+        schema is only checked once per connection.
 
         Args:
             theConnection - a valid, open sqlite3 database connection.
@@ -335,6 +439,8 @@ class KeywordIO(QObject):
                 raise
         try:
             myCursor = self.connection.cursor()
+            if self.schemaCheckedFlag:
+                return myCursor
             myCursor.execute('SELECT SQLITE_VERSION()')
             myData = myCursor.fetchone()
             LOGGER.debug("SQLite version: %s" % myData)
@@ -353,6 +459,7 @@ class KeywordIO(QObject):
                 myCursor.fetchone()
             else:
                 LOGGER.debug('Keywords table already exists')
+            self.schemaCheckedFlag = True
 
             return myCursor
         except sqlite.Error, e:
@@ -396,8 +503,44 @@ class KeywordIO(QObject):
         myFileBasedKeywords = False
         if myProviderType in myProviderDict:
             myFileBasedKeywords = myProviderDict[myProviderType]
+        # Files in the gdal in-memory file system have no keywords file
+        if str(theLayer.source()).startswith('/vsimem/'):
+            myFileBasedKeywords = False
         return myFileBasedKeywords
 
+    def areKeywordsInMemory(self, theLayer):
+        """Find out if keywords of a layer are kept in memory only.
+
+        Layers held in memory (memory provider layers and files in the gdal
+        in-memory file system, see :func:`safeLayerInMemory`) do not outlive
+        the session, so their keywords are not stored in the keywords db.
+
+        Args:
+            * theLayer - A QGIS QgsMapLayer instance.
+
+        Returns:
+            True if the keywords of the layer are kept in memory.
+        Raises:
+            None
+        """
+        if str(theLayer.source()).startswith('/vsimem/'):
+            return True
+        return (theLayer.type() == QgsMapLayer.VectorLayer and
+                str(theLayer.providerType()) == 'memory')
+
+    def deleteKeywordsInMemory(self, theSource):
+        """Forget the keywords of a layer held in memory.
+
+        Args:
+            * theSource - the datasource of the layer.
+
+        Returns:
+            None
+        Raises:
+            None
+        """
+        self.memoryKeywords.pop(str(theSource), None)
+
     def getHashForDatasource(self, theDataSource):
         """Given a datasource, return its hash.
 
@@ -435,6 +578,7 @@ class KeywordIO(QObject):
            None
         """
         myHash = self.getHashForDatasource(theUri)
+        self.keywordCache.pop(self._cacheKey(theUri, False), None)
         try:
             myCursor = self.getCursor()
             #now see if we have any data for our hash
@@ -448,8 +592,6 @@ class KeywordIO(QObject):
             LOGGER.debug("Error %s:" % e.args[0])
             self.connection.rollback()
             raise
-        finally:
-            self.closeConnection()
 
     def writeKeywordsForUri(self, theUri, theKeywords):
         """Write keywords for a URI into the keywords database. All the
@@ -477,6 +619,7 @@ class KeywordIO(QObject):
            KeywordNotFoundError if the keyword is not recognised.
         """
         myHash = self.getHashForDatasource(theUri)
+        self.keywordCache.pop(self._cacheKey(theUri, False), None)
         try:
             myCursor = self.getCursor()
             #now see if we have any data for our hash
@@ -504,8 +647,6 @@ class KeywordIO(QObject):
             if self.connection is not None:
                 self.connection.rollback()
             raise
-        finally:
-            self.closeConnection()
 
     def readKeywordFromUri(self, theUri, theKeyword=None):
         """Get metadata from the keywords file associated with a
@@ -533,10 +674,6 @@ class KeywordIO(QObject):
            KeywordNotFoundError if the keyword is not found.
         """
         myHash = self.getHashForDatasource(theUri)
-        try:
-            self.openConnection()
-        except OperationalError:
-            raise
         try:
             myCursor = self.getCursor()
             #now see if we have any data for our hash
@@ -560,5 +697,77 @@ class KeywordIO(QObject):
         except Exception, e:
             LOGGER.debug("Error %s:" % e.args[0])
             raise
-        finally:
-            self.closeConnection()
+
+    def _cacheKey(self, theSource, theFileBasedFlag):
+        """Key of the keywords of a datasource in the keyword cache.
+
+        Args:
+            * theSource - the datasource (file path or uri) of a layer.
+            * theFileBasedFlag - True if keywords are stored in a file next
+              to the datasource (see areKeywordsFileBased).
+        Returns:
+            The path of the keywords file for file based keywords, otherwise
+            a tuple of the keywords database path and the uri hash.
+        Raises:
+            None
+        """
+        if theFileBasedFlag:
+            return os.path.splitext(theSource)[0] + '.keywords'
+        return self.keywordDbPath, self.getHashForDatasource(theSource)
+
+    def _cacheStamp(self, theKey):
+        """Stamp identifying the current version of the keywords of a key.
+
+        Args:
+            * theKey - a key as returned by _cacheKey.
+        Returns:
+            A tuple of the modification time and size of the file holding
+            the keywords, or None if it does not exist.
+        Raises:
+            None
+        """
+        if isinstance(theKey, tuple):
+            myPath = theKey[0]
+        else:
+            myPath = theKey
+        try:
+            myStat = os.stat(myPath)
+        except OSError:
+            return None
+        return myStat.st_mtime, myStat.st_size
+
+    def _cachedKeywords(self, theKey):
+        """Get keywords from the cache if they are still current.
+
+        Args:
+            * theKey - a key as returned by _cacheKey.
+        Returns:
+            A copy of the cached keywords dict or None if there is no
+            current entry for theKey.
+        Raises:
+            None
+        """
+        if theKey not in self.keywordCache:
+            return None
+        myStamp, myKeywords = self.keywordCache[theKey]
+        if myStamp is None or myStamp != self._cacheStamp(theKey):
+            del self.keywordCache[theKey]
+            return None
+        return dict(myKeywords)
+
+    def _cacheKeywords(self, theKey, theStamp, theKeywords):
+        """Store keywords in the cache.
+
+        Args:
+            * theKey - a key as returned by _cacheKey.
+            * theStamp - stamp of the keywords file taken before they were
+              read (see _cacheStamp).
+            * theKeywords - the keywords dict read.
+        Returns:
+            None
+        Raises:
+            None
+        """
+        if theStamp is None or not isinstance(theKeywords, dict):
+            return
+        self.keywordCache[theKey] = (theStamp, dict(theKeywords))
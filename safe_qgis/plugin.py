@@ -231,6 +231,24 @@ class Plugin:
             self.tr('InaSAFE'),
             self.actionResetDock)
 
+        #--------------------------------------
+        # Create action for saving the impact layer
+        #--------------------------------------
+        self.actionSaveImpactLayer = QAction(
+            QIcon(':/plugins/inasafe/icon.svg'),
+            self.tr('Save InaSAFE Impact Layer'), self.iface.mainWindow())
+        self.actionSaveImpactLayer.setStatusTip(self.tr(
+            'Save the impact layer of the last analysis'))
+        self.actionSaveImpactLayer.setWhatsThis(self.tr(
+            'Save the impact layer of the last analysis'))
+        QObject.connect(
+            self.actionSaveImpactLayer, SIGNAL('triggered()'),
+            self.saveImpactLayer)
+
+        self.iface.addPluginToMenu(
+            self.tr('InaSAFE'),
+            self.actionSaveImpactLayer)
+
         #--------------------------------------
         # Create action for options dialog
         #--------------------------------------
@@ -382,6 +400,8 @@ class Plugin:
         self.iface.removePluginMenu(self.tr('InaSAFE'),
                                     self.actionResetDock)
         self.iface.removeToolBarIcon(self.actionResetDock)
+        self.iface.removePluginMenu(self.tr('InaSAFE'),
+                                    self.actionSaveImpactLayer)
         self.iface.removePluginMenu(self.tr('InaSAFE'),
                                     self.actionOptions)
         self.iface.removeToolBarIcon(self.actionOptions)
@@ -580,6 +600,24 @@ class Plugin:
         """
         self.dockWidget.getLayers()
 
+    def saveImpactLayer(self):
+        """Save the impact layer of the last analysis of the dock.
+
+        This slot is called when the user clicks the save impact layer menu
+        item associated with this plugin. Impact layers are kept in memory
+        so this is how they are written to disk.
+
+        .. see also:: :func:`Plugin.initGui`.
+
+        Args:
+           None.
+        Returns:
+           None.
+        Raises:
+           no exceptions explicitly raised.
+        """
+        self.dockWidget.saveImpactLayerAs()
+
     def layerChanged(self, theLayer):
         """Enable or disable the keywords editor icon.
 
@@ -34,6 +34,8 @@ from safe.api import (get_admissible_plugins,
                       read_keywords, bbox_intersection,
                       write_keywords as safe_write_keywords,
                       read_layer as safe_read_layer,
+                      clip_raster,
+                      get_resampling_method,
                       buffered_bounding_box,
                       verify as verify_util,
                       VerificationError,
@@ -42,13 +44,24 @@ from safe.api import (get_admissible_plugins,
                       unique_filename,
                       safe_tr as safeTr,
                       get_free_memory,
+                      plan_memory,
+                      describe_plan,
                       calculate_impact as safe_calculate_impact,
                       BoundingBoxError,
                       GetDataError,
                       ReadLayerError,
                       get_plugins, get_version,
                       in_and_outside_polygon as points_in_and_outside_polygon,
+                      assign_points_to_polygons,
+                      overlay_polygon_layers,
+                      zone_sums,
+                      zone_class_counts,
+                      zone_members,
                       calculate_polygon_centroid,
+                      aggregate_vector,
+                      aggregate_raster,
+                      get_postprocessor_params,
+                      run_postprocessors,
                       get_postprocessors,
                       get_postprocessor_human_name,
                       convert_mmi_data,
@@ -56,6 +69,7 @@ from safe.api import (get_admissible_plugins,
                       get_unique_values,
                       get_plugins_as_table,
                       Vector,
+                      Polygon,
                       nanallclose,
                       DEFAULTS)
 # hack for excluding test-related import in builded package
@@ -424,6 +438,19 @@ def readSafeLayer(thePath):
         raise
 
 
+def isSafeLayer(theLayer):
+    """Check whether an object is a SAFE layer rather than e.g. a path.
+
+    Args:
+        theLayer - object to be checked.
+    Returns:
+        True if theLayer is a SAFE Raster or Vector instance.
+    Raises:
+        None
+    """
+    return getattr(theLayer, 'is_inasafe_spatial_object', False) is True
+
+
 def getSafeImpactFunctions(theFunction=None):
     """Thin wrapper around the safe impact_functions function.
 
@@ -449,11 +476,13 @@ def calculateSafeImpact(theLayers, theFunction):
           with hazard layer first and exposure layer second.
         * theFunction - SAFE impact function instance to be used
     Returns:
-        A safe impact function is returned
+        The SAFE impact layer. It is only kept in memory and can be
+        written with its write_to_file method if it needs to be saved.
     Raises:
         Any exceptions are propogated
     """
     try:
-        return safe_calculate_impact(theLayers, theFunction)
+        return safe_calculate_impact(theLayers, theFunction,
+                                     write_result=False)
     except:
         raise
@@ -94,6 +94,20 @@ class ClipperTest(unittest.TestCase):
         # Check the output is valid
         assert(os.path.exists(myResult))
 
+        # Clipped features can be kept in memory
+        myMemoryLayer = clipLayer(myVectorLayer, myRect,
+                                  theExtraKeywords={'title': 'Clipped'},
+                                  theInMemoryFlag=True)
+        myFileLayer = readSafeLayer(myResult)
+        assert myMemoryLayer.is_vector
+        assert myMemoryLayer.get_filename() is None
+        self.assertEqual(len(myMemoryLayer), len(myFileLayer))
+        self.assertEqual(myMemoryLayer.get_keywords('title'), 'Clipped')
+        self.assertEqual(myMemoryLayer.get_keywords('category'),
+                         myFileLayer.get_keywords('category'))
+        assert numpy.allclose(myMemoryLayer.get_geometry(),
+                              myFileLayer.get_geometry())
+
     def test_clipRaster(self):
         """Raster layers can be clipped
         """
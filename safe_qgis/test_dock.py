@@ -37,6 +37,7 @@ from qgis.core import (QgsRasterLayer,
                        QgsMapLayerRegistry,
                        QgsRectangle)
 from safe_interface import (format_int,
+                            unique_filename,
                             HAZDATA, EXPDATA, TESTDATA, UNITDATA, BOUNDDATA)
 
 from safe_qgis.utilities_test import (getQgisTestApp,
@@ -1234,7 +1235,10 @@ class DockTest(unittest.TestCase):
         myRunner = DOCK.calculator.getRunner()
         myRunner.run()  # Run in same thread
         myEngineImpactLayer = myRunner.impactLayer()
+        # The impact is shown from memory
+        assert myEngineImpactLayer.get_filename() is None
         myQgisImpactLayer = DOCK.readImpactLayer(myEngineImpactLayer)
+        assert myQgisImpactLayer is DOCK.readImpactLayer(myEngineImpactLayer)
         myStyle = myEngineImpactLayer.get_style_info()
         #print myStyle
         setRasterStyle(myQgisImpactLayer, myStyle)
@@ -1245,6 +1249,11 @@ class DockTest(unittest.TestCase):
         assert myQgisImpactLayer.colorShadingAlgorithm() == QgsRasterLayer.\
             ColorRampShader, myMessage
 
+        # and is only written when it is saved
+        myFilename = unique_filename(suffix='.tif')
+        DOCK.saveImpactLayer(myFilename)
+        assert os.path.exists(myFilename)
+
         # Commenting out because we changed impact function to use floating
         # point quantities. Revisit in QGIS 2.0 where range based transparency
         # will have been implemented
@@ -1768,10 +1777,8 @@ Click for Diagnostic Information:
         assert myFlag, ('Expected configuration options '
                         'button to be enabled')
 
-    # I disabled the test for now as checkMemory now returns None unless
-    # there is a problem. TS
-    def Xtest_extentsChanged(self):
-        """Memory requirements are calculated correctly when extents change.
+    def test_extentsChanged(self):
+        """Memory plan is updated without replacing the results view.
         """
         setCanvasCrs(GEOCRS, True)
         setJakartaGeoExtent()
@@ -1780,10 +1787,15 @@ Click for Diagnostic Information:
             theExposure='Penduduk Jakarta',
             theFunction='Need evacuation',
             theFunctionId='Flood Evacuation Function')
+        DOCK.displayHtml('<p>Impact report</p>')
         myResult = DOCK.checkMemoryUsage()
-        myMessage = 'Expected "3mb" to apear in : %s' % myResult
-        assert myResult is not None, 'Check memory reported None'
-        assert '3mb' in myResult, myMessage
+        assert myResult is None, 'Check memory reported %s' % myResult
+
+        myToolTip = str(DOCK.pbnRunStop.toolTip())
+        myMessage = 'Expected tiles to be planned in: %s' % myToolTip
+        assert 'tiles of' in myToolTip, myMessage
+        myHtml = str(DOCK.wvResults.page().currentFrame().toHtml())
+        assert 'Impact report' in myHtml, myHtml
 
 if __name__ == '__main__':
     suite = unittest.makeSuite(DockTest, 'test')
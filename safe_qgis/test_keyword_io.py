@@ -16,7 +16,10 @@ from safe_qgis.utilities_test import (getQgisTestApp, loadLayer)
 from safe_qgis.keyword_io import KeywordIO
 from safe_qgis.exceptions import HashNotFoundError
 from safe_qgis.test_keywords_dialog import makePadangLayerClone
-from safe_interface import temp_dir, HAZDATA, TESTDATA
+from safe_interface import (temp_dir,
+                            writeKeywordsToFile,
+                            HAZDATA,
+                            TESTDATA)
 
 QGISAPP, CANVAS, IFACE, PARENT = getQgisTestApp()
 
@@ -120,6 +123,26 @@ class KeywordIOTest(unittest.TestCase):
         assert self.keywordIO.areKeywordsFileBased(self.fileRasterLayer)
         assert self.keywordIO.areKeywordsFileBased(self.fileVectorLayer)
 
+    def test_memoryLayerKeywords(self):
+        """Keywords of layers in memory are not stored in the keywords db
+        """
+        myLayer = QgsVectorLayer('Point?crs=epsg:4326', 'points', 'memory')
+        assert self.keywordIO.areKeywordsInMemory(myLayer)
+        assert not self.keywordIO.areKeywordsInMemory(self.fileVectorLayer)
+
+        myKeywords = {'category': 'impact', 'title': 'Points'}
+        self.keywordIO.writeKeywords(myLayer, myKeywords)
+        assert self.keywordIO.readKeywords(myLayer) == myKeywords
+        assert self.keywordIO.readKeywordsForLayers([myLayer]) == [
+            myKeywords]
+        self.assertRaises(HashNotFoundError,
+                          self.keywordIO.readKeywordFromUri,
+                          str(myLayer.source()))
+
+        self.keywordIO.deleteKeywordsInMemory(myLayer.source())
+        self.assertRaises(HashNotFoundError,
+                          self.keywordIO.readKeywords, myLayer)
+
     def test_readRasterFileKeywords(self):
         """Can we read raster file keywords using generic readKeywords method
         """
@@ -163,6 +186,36 @@ class KeywordIOTest(unittest.TestCase):
                           myNewKeywords))
             assert myKeywords[myKey] == myValue, myMessage
 
+    def test_keywordCacheIsRefreshed(self):
+        """Cached keywords are refreshed when the keywords file changes"""
+        myLayer, _ = makePadangLayerClone()
+        myKeywords = self.keywordIO.readKeywords(myLayer)
+        assert myKeywords == self.expectedRasterKeywords, myKeywords
+        # Changing the returned dict must not change the cache
+        myKeywords.pop('title')
+        myKeywords = self.keywordIO.readKeywords(myLayer)
+        assert 'title' in myKeywords, myKeywords
+
+        # Keywords written without KeywordIO are picked up too
+        myNewKeywords = {'category': 'hazard',
+                         'subcategory': 'earthquake',
+                         'unit': 'MMI'}
+        writeKeywordsToFile(str(myLayer.source()), myNewKeywords)
+        myKeywords = self.keywordIO.readKeywords(myLayer)
+        myMessage = 'Got: %s\n\nExpected %s' % (myKeywords, myNewKeywords)
+        assert myKeywords == myNewKeywords, myMessage
+        assert self.keywordIO.readKeywords(myLayer, 'unit') == 'MMI'
+
+    def test_readKeywordsForLayers(self):
+        """Can we read keywords for several layers at once"""
+        myKeywordsList = self.keywordIO.readKeywordsForLayers(
+            [self.fileRasterLayer, self.fileVectorLayer])
+        myExpectedList = [self.expectedRasterKeywords,
+                          self.expectedVectorKeywords]
+        myMessage = 'Got: %s\n\nExpected %s' % (myKeywordsList,
+                                                 myExpectedList)
+        assert myKeywordsList == myExpectedList, myMessage
+
     def test_readDBKeywords(self):
         """Can we read sqlite keywords with the generic readKeywords method
         """
@@ -25,6 +25,7 @@ import math
 import numpy
 import uuid
 
+from osgeo import gdal
 from PyQt4 import QtCore, QtGui
 from PyQt4.QtCore import QCoreApplication
 
@@ -43,6 +44,9 @@ from qgis.core import (
     QgsRasterTransparency,
     QgsVectorLayer,
     QgsFeature,
+    QgsField,
+    QgsGeometry,
+    QgsPoint,
     QgsCategorizedSymbolRendererV2)
 
 from safe_interface import temp_dir
@@ -1048,6 +1052,140 @@ def copyInMemory(vLayer, copyName=''):
     return memLayer
 
 
+def _qgsPoints(theCoordinates):
+    """Convert an Nx2 array of lon, lat coordinates to a list of QgsPoint"""
+    return [QgsPoint(float(x), float(y)) for x, y in theCoordinates]
+
+
+def safeLayerInMemory(theSafeLayer):
+    """Create a QGIS layer backed by memory from a SAFE layer.
+
+    This lets results of the InaSAFE library be shown without writing them
+    to disk first. Vector layers use the QGIS memory provider. Raster
+    layers are copied to a GeoTIFF in the GDAL in-memory file system as
+    QGIS has no memory provider for rasters. In both cases the keywords of
+    the layer are kept in memory (see :func:`KeywordIO.areKeywordsInMemory`)
+    and the layer should be released with :func:`deleteLayerInMemory` when
+    it is no longer used.
+
+    Args:
+        theSafeLayer - a SAFE Raster or Vector instance in EPSG:4326.
+
+    Returns:
+        QgsVectorLayer or QgsRasterLayer named as theSafeLayer.
+
+    Raises:
+        MemoryLayerCreationError if the layer could not be created.
+    """
+    myName = theSafeLayer.get_name()
+    myUUID = str(uuid.uuid4())
+    if theSafeLayer.is_raster:
+        myFilename = '/vsimem/%s.tif' % myUUID
+        myData = theSafeLayer.get_data()
+        myRows, myColumns = myData.shape
+        myDriver = gdal.GetDriverByName('GTiff')
+        myDataset = myDriver.Create(myFilename, myColumns, myRows, 1,
+                                    gdal.GDT_Float64)
+        if myDataset is None:
+            raise MemoryLayerCreationError(
+                'Could not create in memory raster %s' % myFilename)
+        myDataset.SetProjection(str(theSafeLayer.get_projection()))
+        myDataset.SetGeoTransform(theSafeLayer.get_geotransform())
+        myBand = myDataset.GetRasterBand(1)
+        myBand.WriteArray(myData)
+        myBand.SetNoDataValue(theSafeLayer.get_nodata_value())
+        myDataset = None  # Close
+        myLayer = QgsRasterLayer(myFilename, myName)
+    else:
+        if theSafeLayer.is_point_data:
+            myType = 'Point'
+        elif theSafeLayer.is_line_data:
+            myType = 'LineString'
+        else:
+            myType = 'Polygon'
+        myUri = '%s?crs=epsg:4326&index=yes&uuid=%s' % (myType, myUUID)
+        myLayer = QgsVectorLayer(myUri, myName, 'memory')
+        myProvider = myLayer.dataProvider()
+
+        # Field types are taken from the first value that is set
+        myData = theSafeLayer.get_data()
+        myNames = theSafeLayer.get_attribute_names()
+        myFields = []
+        for myAttribute in myNames:
+            myFieldType = QtCore.QVariant.String
+            for myFeatureData in myData:
+                myValue = myFeatureData[myAttribute]
+                if myValue is None:
+                    continue
+                if isinstance(myValue, (bool, int, long, numpy.integer)):
+                    myFieldType = QtCore.QVariant.Int
+                elif isinstance(myValue, (float, numpy.floating)):
+                    myFieldType = QtCore.QVariant.Double
+                break
+            myFields.append(QgsField(myAttribute, myFieldType))
+        myProvider.addAttributes(myFields)
+
+        myFeatures = []
+        myGeometries = theSafeLayer.get_geometry(
+            as_geometry_objects=theSafeLayer.is_polygon_data)
+        for myGeometry, myFeatureData in zip(myGeometries, myData):
+            if theSafeLayer.is_point_data:
+                myQgsGeometry = QgsGeometry.fromPoint(
+                    QgsPoint(float(myGeometry[0]), float(myGeometry[1])))
+            elif theSafeLayer.is_line_data:
+                myQgsGeometry = QgsGeometry.fromPolyline(
+                    _qgsPoints(myGeometry))
+            else:
+                myRings = [_qgsPoints(myGeometry.outer_ring)]
+                for myRing in myGeometry.inner_rings:
+                    myRings.append(_qgsPoints(myRing))
+                myQgsGeometry = QgsGeometry.fromPolygon(myRings)
+            myFeature = QgsFeature()
+            myFeature.setGeometry(myQgsGeometry)
+            myAttributeMap = {}
+            for myIndex, myAttribute in enumerate(myNames):
+                myValue = myFeatureData[myAttribute]
+                if myValue is None:
+                    myAttributeMap[myIndex] = QtCore.QVariant()
+                elif myFields[myIndex].type() == QtCore.QVariant.Int:
+                    myAttributeMap[myIndex] = QtCore.QVariant(int(myValue))
+                elif myFields[myIndex].type() == QtCore.QVariant.Double:
+                    myAttributeMap[myIndex] = QtCore.QVariant(
+                        float(myValue))
+                else:
+                    myAttributeMap[myIndex] = QtCore.QVariant(
+                        unicode(myValue))
+            myFeature.setAttributeMap(myAttributeMap)
+            myFeatures.append(myFeature)
+        myProvider.addFeatures(myFeatures)
+        myLayer.updateExtents()
+
+    if not myLayer.isValid():
+        raise MemoryLayerCreationError(
+            'Could not create in memory layer %s' % myName)
+    return myLayer
+
+
+def deleteLayerInMemory(theSource):
+    """Free the memory held by a layer made by :func:`safeLayerInMemory`.
+
+    Rasters are removed from the GDAL in-memory file system. Memory provider
+    layers are freed by QGIS with the layer itself.
+
+    Args:
+        theSource - str datasource of the layer.
+
+    Returns:
+        None
+
+    Raises:
+        None
+    """
+    mySource = str(theSource)
+    if mySource.startswith('/vsimem/'):
+        gdal.Unlink(mySource)
+
+
 def mmToPoints(theMM, theDpi):
     """Convert measurement in points to one in mm.
 